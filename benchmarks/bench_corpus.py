@@ -0,0 +1,297 @@
+"""Benchmark the nif format and spells on the synthetic corpus of
+corpus.py: latency percentiles, throughput, and peak memory of
+Data.inspect, Data.read, Data.write, and of the opt_geometry,
+fix_texturepath, and check_readwrite spells. The results are written
+as JSON, and can be compared with the results of an earlier run.
+
+Usage::
+
+    python benchmarks/bench_corpus.py [options]
+
+For instance, to compare a branch with master::
+
+    git checkout master
+    python benchmarks/bench_corpus.py -o master.json
+    git checkout branch
+    python benchmarks/bench_corpus.py -o branch.json --compare master.json
+"""
+
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright (c) 2007-2012, Python File Format Interface
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the Python File Format Interface
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import io
+import json
+import optparse
+import os.path
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pyffi
+from pyffi.formats.nif import NifFormat
+import pyffi.spells.nif
+import pyffi.spells.nif.check
+import pyffi.spells.nif.fix
+import pyffi.spells.nif.optimize
+
+import corpus
+
+
+CORPUS_OPTIONS = ("num_triangles", "num_keys", "num_shapes", "num_nodes",
+                  "num_bones")
+"""Options which describe the corpus."""
+
+
+class BenchToaster(pyffi.spells.nif.NifToaster):
+    SPELLS = [
+        pyffi.spells.nif.optimize.SpellOptimizeGeometry,
+        pyffi.spells.nif.fix.SpellFixTexturePath,
+        pyffi.spells.nif.check.SpellReadWrite,
+        ]
+
+
+def percentile(values, fraction):
+    """Nearest rank percentile of a sorted list of values."""
+    return values[max(0, int(round(fraction * len(values))) - 1)]
+
+
+def read_file(filename):
+    """Data and content of a file."""
+    with open(filename, "rb") as stream:
+        content = stream.read()
+    data = NifFormat.Data()
+    data.read(io.BytesIO(content))
+    return data, content
+
+
+def get_operations(filenames):
+    """Name and function of each benchmarked operation. The function
+    takes a file name, and returns a function which does the
+    operation, along with the number of bytes processed.
+    """
+    def inspect(filename):
+        data, content = read_file(filename)
+        def run():
+            NifFormat.Data().inspect(io.BytesIO(content))
+        return run, len(content)
+
+    def read(filename):
+        data, content = read_file(filename)
+        def run():
+            NifFormat.Data().read(io.BytesIO(content))
+        return run, len(content)
+
+    def write(filename):
+        data, content = read_file(filename)
+        def run():
+            data.write(io.BytesIO())
+        return run, len(content)
+
+    def spell(spellname):
+        toaster = BenchToaster(
+            options=dict(verbose=0, jobs=1, dryrun=True, interactive=False),
+            spellnames=[spellname])
+        toaster.spellclass.toastentry(toaster)
+
+        def prepare(filename):
+            data, content = read_file(filename)
+            stream = io.BytesIO(content)
+            stream.name = filename
+            spell = toaster.spellclass(toaster=toaster, data=data,
+                                       stream=stream)
+            def run():
+                if spell._datainspect() and spell.datainspect():
+                    spell.recurse()
+            return run, len(content)
+        return prepare
+
+    operations = [("inspect", inspect), ("read", read), ("write", write)]
+    for spellclass in BenchToaster.SPELLS:
+        operations.append(("spell " + spellclass.SPELLNAME,
+                           spell(spellclass.SPELLNAME)))
+    return operations
+
+
+def measure(prepare, filenames, repeat):
+    """Latencies, throughput, and peak memory of an operation on all
+    files. Every run is prepared anew, as spells change the data.
+    """
+    latencies = []
+    total_bytes = 0
+    for filename in filenames:
+        for i in range(repeat):
+            run, num_bytes = prepare(filename)
+            start = time.perf_counter()
+            run()
+            latencies.append(time.perf_counter() - start)
+            total_bytes += num_bytes
+    # memory is traced in a separate run, as tracing is slow
+    peak_memory = 0
+    for filename in filenames:
+        run, num_bytes = prepare(filename)
+        tracemalloc.start()
+        try:
+            run()
+            peak_memory = max(peak_memory,
+                              tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    latencies.sort()
+    seconds = sum(latencies)
+    return dict(
+        runs=len(latencies), bytes=total_bytes, seconds=seconds,
+        throughput=total_bytes / seconds if seconds else 0.0,
+        p50=percentile(latencies, 0.5),
+        p90=percentile(latencies, 0.9),
+        p99=percentile(latencies, 0.99),
+        peak_memory=peak_memory)
+
+
+def get_commit():
+    """The current git commit, if any."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, old_results=None):
+    """Print a table of the results, and return the largest ratio of a
+    median latency to the old one.
+    """
+    max_ratio = 0.0
+    print("%-24s %8s %10s %10s %10s %10s %10s"
+          % ("operation", "runs", "MB/s", "p50 ms", "p90 ms", "p99 ms",
+             "peak MB"))
+    for name, result in results.items():
+        line = ("%-24s %8i %10.2f %10.3f %10.3f %10.3f %10.2f"
+                % (name, result["runs"], result["throughput"] / 1e6,
+                   1000 * result["p50"], 1000 * result["p90"],
+                   1000 * result["p99"], result["peak_memory"] / 1e6))
+        if old_results and name in old_results:
+            old_p50 = old_results[name]["p50"]
+            if old_p50:
+                ratio = result["p50"] / old_p50
+                max_ratio = max(max_ratio, ratio)
+                line += " %7.2fx" % ratio
+        print(line)
+    return max_ratio
+
+
+def main():
+    parser = optparse.OptionParser(
+        "%prog [options]", description=__doc__.split("\n\n")[0])
+    parser.add_option(
+        "-o", "--output", dest="output", metavar="FILE",
+        help="write the results to FILE as JSON")
+    parser.add_option(
+        "--compare", dest="compare", metavar="FILE",
+        help="print the ratio of each median latency to the one in FILE")
+    parser.add_option(
+        "--max-ratio", dest="max_ratio", type="float", metavar="RATIO",
+        help="with --compare, exit with status 1 if any median latency"
+             " is more than RATIO times the one in FILE")
+    parser.add_option(
+        "--corpus", dest="corpus", metavar="FOLDER",
+        help="write the corpus to FOLDER and keep it"
+             " [default: a temporary folder]")
+    parser.add_option(
+        "-r", "--repeat", dest="repeat", type="int", default=5,
+        help="number of runs on each file [default: %default]")
+    parser.add_option(
+        "--triangles", dest="num_triangles", type="int", default=1000,
+        help="number of triangles of each shape [default: %default]")
+    parser.add_option(
+        "--keys", dest="num_keys", type="int", default=100,
+        help="number of keys of each animated bone [default: %default]")
+    parser.add_option(
+        "--shapes", dest="num_shapes", type="int", default=4,
+        help="number of shapes of each static scene [default: %default]")
+    parser.add_option(
+        "--nodes", dest="num_nodes", type="int", default=8,
+        help="number of nodes of each static scene [default: %default]")
+    parser.add_option(
+        "--bones", dest="num_bones", type="int", default=8,
+        help="number of bones of each skinned mesh and animation"
+             " [default: %default]")
+    options, args = parser.parse_args()
+    corpus_options = dict(
+        (name, getattr(options, name)) for name in CORPUS_OPTIONS)
+    folder = options.corpus or tempfile.mkdtemp()
+    try:
+        filenames = corpus.write_corpus(folder, **corpus_options)
+        results = {}
+        for name, prepare in get_operations(filenames):
+            results[name] = measure(prepare, filenames, options.repeat)
+    finally:
+        if not options.corpus:
+            shutil.rmtree(folder)
+    old_results = None
+    if options.compare:
+        with open(options.compare) as stream:
+            old = json.load(stream)
+        old_results = old["results"]
+        if any(old["corpus"].get(name) != value
+               for name, value in corpus_options.items()):
+            print("warning: %s was run on a different corpus"
+                  % options.compare)
+    max_ratio = print_results(results, old_results)
+    if options.output:
+        with open(options.output, "w") as stream:
+            json.dump(dict(
+                pyffi=pyffi.__version__, commit=get_commit(),
+                python=platform.python_version(),
+                corpus=dict(files=[os.path.basename(filename)
+                                   for filename in filenames],
+                            **corpus_options),
+                repeat=options.repeat, results=results),
+                stream, indent=1, sort_keys=True)
+    if options.max_ratio and max_ratio > options.max_ratio:
+        print("regression: median latency up to %.2f times slower"
+              % max_ratio)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
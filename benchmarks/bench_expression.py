@@ -0,0 +1,113 @@
+"""Benchmark evaluation of the xml expressions of nif.xml: compiled
+expressions versus walking the expression tree.
+
+Usage::
+
+    python benchmarks/bench_expression.py [repeat]
+"""
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright (c) 2007-2012, Python File Format Interface
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the Python File Format Interface
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import sys
+import timeit
+
+from pyffi.formats.nif import NifFormat
+
+
+def get_corpus():
+    """Return a list of (expression, object) pairs: the cond, arr1,
+    and arr2 expressions of all nif.xml structs evaluated on a default
+    instance, and the vercond expressions evaluated on nif data.
+    """
+    corpus = []
+    data = NifFormat.Data(version=0x14020007, user_version=11,
+                          user_version_2=34)
+    for klass in NifFormat.xml_struct:
+        try:
+            instance = klass()
+        except TypeError:
+            # needs a template or argument
+            continue
+        for attr in klass._attrs:
+            for expr in (attr.cond, attr.arr1, attr.arr2):
+                if expr is not None:
+                    corpus.append((expr, instance))
+            if attr.vercond is not None:
+                corpus.append((attr.vercond, data))
+    # only keep expressions that can be evaluated
+    result = []
+    for expr, obj in corpus:
+        try:
+            expr._eval_tree(obj)
+        except Exception:
+            continue
+        result.append((expr, obj))
+    return result
+
+
+def run_tree(corpus):
+    for expr, obj in corpus:
+        expr._eval_tree(obj)
+
+
+def run_eval(corpus):
+    for expr, obj in corpus:
+        expr.eval(obj)
+
+
+def run_function(functions):
+    for func, obj in functions:
+        func(obj)
+
+
+def main(repeat=200):
+    corpus = get_corpus()
+    # compile outside of the timing loop
+    functions = [(expr.compile(), obj) for expr, obj in corpus]
+    print("%i expressions, %i evaluations per run" % (len(corpus), repeat))
+    for name, func, arg in (("tree", run_tree, corpus),
+                            ("eval", run_eval, corpus),
+                            ("function", run_function, functions)):
+        timer = timeit.Timer(lambda: func(arg))
+        best = min(timer.repeat(repeat=5, number=repeat))
+        print("%-10s %8.3f us per expression"
+              % (name, 1e6 * best / (repeat * len(corpus))))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
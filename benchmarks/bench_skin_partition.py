@@ -0,0 +1,152 @@
+"""Benchmark skin partitioning on dense character-like meshes: a
+cylinder whose vertices are each influenced by up to four of the bones
+arranged in rings around it, with the settings used by opt_geometry
+(for Oblivion, and for Fallout 3 body parts) and by
+fix_ffvt3rskinpartition.
+
+Usage::
+
+    python benchmarks/bench_skin_partition.py [max_num_triangles]
+"""
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright (c) 2007-2012, Python File Format Interface
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the Python File Format Interface
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import sys
+import time
+
+from pyffi.formats.nif import NifFormat
+
+
+def get_skinned_shape(num_triangles, num_levels=8, num_columns=6,
+                      dismember=False):
+    """A skinned cylinder with about C{num_triangles} triangles and
+    C{num_levels} rings of C{num_columns} bones. Each vertex is
+    influenced by the two nearest bones of the two nearest rings. If
+    C{dismember} is set, then the skin instance is a
+    BSDismemberSkinInstance, and a body part map is returned as well.
+    The skeleton root, which holds the shape and the bones, is returned
+    too, as the skin instance only keeps weak references to it.
+    """
+    segments = 4 * num_columns
+    rings = max(2, num_triangles // (2 * segments))
+    shape = NifFormat.NiTriShape()
+    shape.data = NifFormat.NiTriShapeData()
+    if dismember:
+        shape.skin_instance = NifFormat.BSDismemberSkinInstance()
+    else:
+        shape.skin_instance = NifFormat.NiSkinInstance()
+    shape.skin_instance.data = NifFormat.NiSkinData()
+    skelroot = NifFormat.NiNode()
+    skelroot.add_child(shape)
+    shape.skin_instance.skeleton_root = skelroot
+    shape.data.num_vertices = (rings + 1) * segments
+    shape.data.vertices.update_size()
+    bone_weights = [{} for i in range(num_levels * num_columns)]
+    for i in range(rings + 1):
+        level = (num_levels - 1) * i / rings
+        level0 = min(int(level), num_levels - 2)
+        level_weight = level - level0
+        for j in range(segments):
+            v = i * segments + j
+            shape.data.vertices[v].x = j
+            shape.data.vertices[v].z = i
+            column = num_columns * j / segments
+            column0 = int(column)
+            column1 = (column0 + 1) % num_columns
+            column_weight = column - column0
+            for lev, lev_weight in ((level0, 1 - level_weight),
+                                    (level0 + 1, level_weight)):
+                for col, col_weight in ((column0, 1 - column_weight),
+                                        (column1, column_weight)):
+                    weight = lev_weight * col_weight
+                    if weight > 0:
+                        bone_weights[lev * num_columns + col][v] = weight
+    triangles = []
+    for i in range(rings):
+        for j in range(segments):
+            v0 = i * segments + j
+            v1 = i * segments + (j + 1) % segments
+            triangles.append((v0, v1, v0 + segments))
+            triangles.append((v1, v1 + segments, v0 + segments))
+    shape.data.set_triangles(triangles)
+    for weights in bone_weights:
+        bone = NifFormat.NiNode()
+        skelroot.add_child(bone)
+        shape.add_bone(bone, weights)
+    if dismember:
+        # one body part per ring of bones
+        trianglepartmap = [
+            min(num_levels - 1, num_levels * (t // (2 * segments)) // rings)
+            for t in range(len(triangles))]
+        return skelroot, shape, triangles, trianglepartmap
+    return skelroot, shape
+
+
+def main(max_num_triangles=60000):
+    print("%-10s %10s %10s %10s"
+          % ("settings", "triangles", "partitions", "seconds"))
+    # the number of triangles of a nif shape is at most 65535
+    for num_triangles in (1000, 10000, 60000):
+        if num_triangles > max_num_triangles:
+            break
+        for name, kwargs in (
+            ("oblivion", dict(maxbonesperpartition=18,
+                              maxbonespervertex=4, stripify=False)),
+            ("ffvt3r", dict(maxbonesperpartition=4, maxbonespervertex=4,
+                            stripify=False, padbones=True)),
+            ("fallout3", dict(maxbonesperpartition=18,
+                              maxbonespervertex=4, stripify=False,
+                              maximize_bone_sharing=True)),
+            ):
+            if name == "fallout3":
+                skelroot, shape, triangles, trianglepartmap = get_skinned_shape(
+                    num_triangles, dismember=True)
+                kwargs.update(triangles=triangles,
+                              trianglepartmap=trianglepartmap)
+            else:
+                skelroot, shape = get_skinned_shape(num_triangles)
+            start = time.time()
+            shape.update_skin_partition(**kwargs)
+            seconds = time.time() - start
+            print("%-10s %10i %10i %10.2f"
+                  % (name, shape.data.num_triangles,
+                     shape.get_skin_partition().num_skin_partition_blocks,
+                     seconds))
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,103 @@
+"""Benchmark the vertex cache optimizer on grid meshes (with shuffled
+triangles) and on meshes made of many small islands, of 1k up to 500k
+triangles, and report the average transform to vertex ratio (ATVR)
+before and after optimizing.
+
+Usage::
+
+    python benchmarks/bench_vertex_cache.py [max_num_triangles]
+"""
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright (c) 2007-2012, Python File Format Interface
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the Python File Format Interface
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import random
+import sys
+import time
+
+from pyffi.utils.vertex_cache import (
+    average_transform_to_vertex_ratio, get_cache_optimized_triangles)
+
+
+def get_grid(num_triangles):
+    """A square grid with about C{num_triangles} triangles, in random
+    order."""
+    size = max(1, int((num_triangles // 2) ** 0.5))
+    triangles = []
+    for i in range(size):
+        for j in range(size):
+            v0 = i * (size + 1) + j
+            v1 = v0 + 1
+            v2 = v0 + size + 1
+            v3 = v2 + 1
+            triangles.append((v0, v1, v2))
+            triangles.append((v1, v3, v2))
+    random.shuffle(triangles)
+    return triangles
+
+
+def get_islands(num_triangles):
+    """Quads which do not share any vertices, in random order."""
+    triangles = []
+    for i in range(num_triangles // 2):
+        v0 = 4 * i
+        triangles.append((v0, v0 + 1, v0 + 2))
+        triangles.append((v0 + 1, v0 + 3, v0 + 2))
+    random.shuffle(triangles)
+    return triangles
+
+
+def main(max_num_triangles=500000):
+    random.seed(0)
+    print("%-8s %10s %8s %8s %10s"
+          % ("mesh", "triangles", "ATVR", "new ATVR", "seconds"))
+    for num_triangles in (1000, 10000, 100000, 500000):
+        if num_triangles > max_num_triangles:
+            break
+        for name, get_mesh in (("grid", get_grid), ("islands", get_islands)):
+            triangles = get_mesh(num_triangles)
+            start = time.time()
+            new_triangles = get_cache_optimized_triangles(triangles)
+            seconds = time.time() - start
+            print("%-8s %10i %8.3f %8.3f %10.2f"
+                  % (name, len(triangles),
+                     average_transform_to_vertex_ratio(triangles),
+                     average_transform_to_vertex_ratio(new_triangles),
+                     seconds))
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,290 @@
+"""Generate a synthetic corpus of nif and kf files for the benchmarks:
+static and skinned meshes, and keyframe animations, for each of the
+nif versions in L{VERSIONS}, built from the NifFormat classes.
+
+Usage::
+
+    python benchmarks/corpus.py folder [num_triangles] [num_keys]
+        [num_shapes] [num_nodes] [num_bones]
+"""
+
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright (c) 2007-2012, Python File Format Interface
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the Python File Format Interface
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import math
+import os
+import sys
+
+from pyffi.formats.nif import NifFormat
+
+VERSIONS = {
+    "morrowind": (0x04000002, 0, 0),
+    "oblivion": (0x14000005, 11, 11),
+    "fallout3": (0x14020007, 11, 34),
+    }
+"""Nif version, user version, and user version 2 of each game."""
+
+
+def get_data(game, roots):
+    """Nif data of a game with given roots."""
+    version, user_version, user_version_2 = VERSIONS[game]
+    data = NifFormat.Data(version=version, user_version=user_version,
+                          user_version_2=user_version_2)
+    # a new header is big endian
+    data.header.endian_type = NifFormat.EndianType.ENDIANLITTLE
+    data.roots = roots
+    return data
+
+
+def get_shape(name, num_triangles, texture):
+    """A NiTriShape with a textured, wavy, square grid of about
+    C{num_triangles} triangles, with normals and uv coordinates.
+    """
+    size = max(1, int((num_triangles // 2) ** 0.5))
+    shape = NifFormat.NiTriShape()
+    shape.name = name
+    shape.data = NifFormat.NiTriShapeData()
+    data = shape.data
+    data.num_vertices = (size + 1) ** 2
+    data.has_vertices = True
+    data.has_normals = True
+    data.num_uv_sets = 1
+    data.has_uv = True
+    data.vertices.update_size()
+    data.normals.update_size()
+    data.uv_sets.update_size()
+    for i in range(size + 1):
+        for j in range(size + 1):
+            v = i * (size + 1) + j
+            height = 0.25 * math.sin(i) * math.cos(j)
+            data.vertices[v].x = j
+            data.vertices[v].y = i
+            data.vertices[v].z = height
+            data.normals[v].z = 1.0
+            data.uv_sets[0][v].u = j / size
+            data.uv_sets[0][v].v = i / size
+    triangles = []
+    for i in range(size):
+        for j in range(size):
+            v0 = i * (size + 1) + j
+            v1 = v0 + 1
+            v2 = v0 + size + 1
+            v3 = v2 + 1
+            triangles.append((v0, v1, v2))
+            triangles.append((v1, v3, v2))
+    data.set_triangles(triangles)
+    data.update_center_radius()
+    material = NifFormat.NiMaterialProperty()
+    material.name = "Material"
+    material.alpha = 1.0
+    material.glossiness = 10.0
+    shape.add_property(material)
+    texturing = NifFormat.NiTexturingProperty()
+    texturing.has_base_texture = True
+    texturing.base_texture.source = NifFormat.NiSourceTexture()
+    texturing.base_texture.source.use_external = 1
+    texturing.base_texture.source.file_name = texture
+    shape.add_property(texturing)
+    return shape
+
+
+def get_nif(game, num_shapes=4, num_triangles=1000, num_nodes=8,
+            num_bones=0):
+    """Nif data of a scene with C{num_nodes} nodes, holding
+    C{num_shapes} shapes of about C{num_triangles} triangles each. If
+    C{num_bones} is set, then the shapes are skinned on a chain of
+    bones, each vertex being influenced by the two nearest bones.
+    """
+    root = NifFormat.NiNode()
+    root.name = "Scene Root"
+    nodes = [root]
+    for i in range(num_nodes - 1):
+        node = NifFormat.NiNode()
+        node.name = "Node%i" % i
+        node.translation.x = i
+        nodes[i // 2].add_child(node)
+        nodes.append(node)
+    bones = []
+    for i in range(num_bones):
+        bone = NifFormat.NiNode()
+        bone.name = "Bip01 Bone%i" % i
+        (bones[-1] if bones else root).add_child(bone)
+        bones.append(bone)
+    for i in range(num_shapes):
+        shape = get_shape(
+            "Shape%i" % i, num_triangles,
+            # mixed case and separators, for fix_texturepath
+            "Textures/Bench\\shape%i.DDS" % i)
+        nodes[i % num_nodes].add_child(shape)
+        if not bones:
+            continue
+        shape.skin_instance = NifFormat.NiSkinInstance()
+        shape.skin_instance.data = NifFormat.NiSkinData()
+        shape.skin_instance.skeleton_root = root
+        # the grid is split in slabs along y, one per bone
+        size = max(1, int((num_triangles // 2) ** 0.5))
+        bone_weights = [{} for bone in bones]
+        for v, vert in enumerate(shape.data.vertices):
+            position = (num_bones - 1) * vert.y / size
+            bone0 = min(int(position), max(0, num_bones - 2))
+            weight = min(1.0, position - bone0)
+            bone_weights[bone0][v] = 1.0 - weight
+            if bone0 + 1 < num_bones and weight > 0:
+                bone_weights[bone0 + 1][v] = weight
+        for bone, weights in zip(bones, bone_weights):
+            shape.add_bone(bone, weights)
+        shape.update_skin_center_radius()
+    return get_data(game, [root])
+
+
+def get_transform_data(keyframe_data, bone, num_keys):
+    """Fill keyframe data with C{num_keys} linear rotation and
+    translation keys, one per frame at 30 frames per second.
+    """
+    keyframe_data.rotation_type = 1
+    keyframe_data.num_rotation_keys = num_keys
+    keyframe_data.quaternion_keys.update_size()
+    keyframe_data.translations.interpolation = 1
+    keyframe_data.translations.num_keys = num_keys
+    keyframe_data.translations.keys.update_size()
+    for i in range(num_keys):
+        angle = 0.01 * i * (bone + 1)
+        key = keyframe_data.quaternion_keys[i]
+        key.time = i / 30.0
+        key.value.w = math.cos(angle)
+        key.value.z = math.sin(angle)
+        key = keyframe_data.translations.keys[i]
+        key.time = i / 30.0
+        key.value.x = bone
+        key.value.z = 0.1 * math.sin(angle)
+    return keyframe_data
+
+
+def get_kf(game, num_bones=8, num_keys=100):
+    """Kf data animating C{num_bones} bones with C{num_keys} keys
+    each: a NiSequenceStreamHelper with keyframe controllers for
+    Morrowind, and a NiControllerSequence for later games.
+    """
+    stop_time = (num_keys - 1) / 30.0
+    if game == "morrowind":
+        root = NifFormat.NiSequenceStreamHelper()
+        text_keys = NifFormat.NiTextKeyExtraData()
+        text_keys.num_text_keys = 2
+        text_keys.text_keys.update_size()
+        text_keys.text_keys[0].value = "start"
+        text_keys.text_keys[1].time = stop_time
+        text_keys.text_keys[1].value = "end"
+        root.add_extra_data(text_keys)
+        for bone in range(num_bones):
+            name = NifFormat.NiStringExtraData()
+            name.string_data = "Bip01 Bone%i" % bone
+            root.add_extra_data(name)
+            controller = NifFormat.NiKeyframeController()
+            controller.flags = 12
+            controller.frequency = 1.0
+            controller.stop_time = stop_time
+            controller.data = get_transform_data(
+                NifFormat.NiKeyframeData(), bone, num_keys)
+            root.add_controller(controller)
+        return get_data(game, [root])
+    root = NifFormat.NiControllerSequence()
+    root.name = "Idle"
+    root.weight = 1.0
+    root.frequency = 1.0
+    root.stop_time = stop_time
+    root.cycle_type = NifFormat.CycleType.CYCLELOOP
+    palette = NifFormat.NiStringPalette()
+    if game == "oblivion":
+        # blocks share a string palette before 20.1.0.3
+        root.string_palette = palette
+    for bone in range(num_bones):
+        block = root.add_controlled_block()
+        if game == "oblivion":
+            block.string_palette = palette
+        block.priority = 26
+        block.set_node_name("Bip01 Bone%i" % bone)
+        block.set_controller_type("NiTransformController")
+        block.interpolator = NifFormat.NiTransformInterpolator()
+        block.interpolator.rotation.w = 1.0
+        block.interpolator.scale = 1.0
+        block.interpolator.data = get_transform_data(
+            NifFormat.NiTransformData(), bone, num_keys)
+    return get_data(game, [root])
+
+
+def get_corpus(num_triangles=1000, num_keys=100, num_shapes=4,
+               num_nodes=8, num_bones=8):
+    """Name and data of all files of the corpus: for every game a
+    static scene of C{num_shapes} shapes on C{num_nodes} nodes, a
+    mesh skinned on C{num_bones} bones, and an animation of
+    C{num_bones} bones.
+    """
+    corpus = []
+    for game in sorted(VERSIONS):
+        corpus.append(("%s_static.nif" % game,
+                       get_nif(game, num_shapes=num_shapes,
+                               num_triangles=num_triangles,
+                               num_nodes=num_nodes)))
+        corpus.append(("%s_skinned.nif" % game,
+                       get_nif(game, num_shapes=1, num_nodes=1,
+                               num_triangles=num_triangles,
+                               num_bones=num_bones)))
+        corpus.append(("%s.kf" % game,
+                       get_kf(game, num_bones=num_bones,
+                              num_keys=num_keys)))
+    return corpus
+
+
+def write_corpus(folder, num_triangles=1000, num_keys=100, num_shapes=4,
+                 num_nodes=8, num_bones=8):
+    """Write the corpus to C{folder}, and return the file names."""
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    filenames = []
+    for name, data in get_corpus(num_triangles, num_keys, num_shapes,
+                                 num_nodes, num_bones):
+        filename = os.path.join(folder, name)
+        with open(filename, "wb") as stream:
+            data.write(stream)
+        filenames.append(filename)
+    return filenames
+
+if __name__ == "__main__":
+    for filename in write_corpus(sys.argv[1],
+                                 *(int(arg) for arg in sys.argv[2:])):
+        print(filename)
@@ -10,6 +10,12 @@
 A .bsa file is an archive format used by Bethesda (Morrowind, Oblivion,
 Fallout 3).
 
+Reading an archive only reads its folder and file records, and indexes
+its members by name and by hash. The data of a member is read from the
+stream (and decompressed, if needed) only when it is asked for, so
+members can be extracted from large archives without unpacking them.
+Writing an archive copies all unchanged members as they are stored.
+
 Implementation
 --------------
 
@@ -43,8 +49,13 @@ Read a BSA file
 1
 >>> data.num_files
 7
->>> #data.read(stream)
->>> # TODO check something else...
+>>> data.read(stream)
+>>> data.get_member_names() # doctest: +ELLIPSIS
+['mmouthxivilai.egm', 'mmouthxivilai.tri', 'test.dds', 'test.kfm', ...]
+>>> data.has_member("TEST.NIF")
+True
+>>> bytes(data.read_member("test.nif")[:20])
+b'Gamebryo File Format'
 
 Parse all BSA files in a directory tree
 ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
@@ -66,10 +77,18 @@ Create an BSA file from scratch and write to file
 ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 
 >>> data = BsaFormat.Data()
->>> # TODO store something...
+>>> data.set_member("meshes/test.nif", b"some nif")
+>>> data.set_member("textures/test.dds", b"some dds")
 >>> from tempfile import TemporaryFile
 >>> stream = TemporaryFile()
->>> #data.write(stream)
+>>> data.write(stream)
+>>> _ = stream.seek(0)
+>>> data = BsaFormat.Data()
+>>> data.read(stream)
+>>> data.get_member_names()
+['meshes\\\\test.nif', 'textures\\\\test.dds']
+>>> data.read_member("meshes/test.nif")
+b'some nif'
 """
 
 # ***** BEGIN LICENSE BLOCK *****
@@ -110,15 +129,18 @@ Create an BSA file from scratch and write to file
 # ***** END LICENSE BLOCK *****
 
 
+from io import BytesIO
 import logging
 import struct
 import os
 import re
+import zlib
 
 import pyffi.object_models.xml
 import pyffi.object_models.common
 from pyffi.object_models.xml.basic import BasicBase
 import pyffi.object_models
+import pyffi.utils.mmapstream
 from pyffi.utils.graph import EdgeFilter
 
 
@@ -130,6 +152,16 @@ class BsaFormat(pyffi.object_models.xml.FileFormat):
     xml_file_path = [os.getenv('BSAXMLPATH'), os.path.dirname(__file__)]
     # file name regular expression match
     RE_FILENAME = re.compile(r'^.*\.bsa$', re.IGNORECASE)
+    # extra bits in the file name hash for some extensions
+    _EXTENSION_HASH_BITS = {
+        '.kf': 0x80, '.nif': 0x8000, '.dds': 0x8080, '.wav': 0x80000000}
+    # file flags set for each extension
+    _EXTENSION_FILE_FLAGS = {
+        '.nif': 'has_nif', '.dds': 'has_dds', '.xml': 'has_xml',
+        '.wav': 'has_wav', '.mp3': 'has_mp_3', '.txt': 'has_txt_html_bat_scc',
+        '.html': 'has_txt_html_bat_scc', '.bat': 'has_txt_html_bat_scc',
+        '.scc': 'has_txt_html_bat_scc', '.spt': 'has_spt',
+        '.tex': 'has_tex_fnt', '.fnt': 'has_tex_fnt', '.ctl': 'has_ctl'}
 
     # basic types
     UInt32 = pyffi.object_models.common.UInt
@@ -145,6 +177,60 @@ class BsaFormat(pyffi.object_models.xml.FileFormat):
         def get_detail_display(self):
             return self.__str__()
 
+        @staticmethod
+        def from_name(name, version, is_folder=False):
+            """Calculate the hash of a file or folder name, as used
+            by the given archive version.
+
+            :param name: The (normalized) name.
+            :type name: ``str``
+            :param version: The archive version.
+            :type version: ``int``
+            :param is_folder: Whether the name is a folder name.
+            :type is_folder: ``bool``
+            :return: The hash.
+            :rtype: ``int``
+
+            >>> "0x%016X" % BsaFormat.Hash.from_name("test.dds", 103)
+            '0x8DDBAA2A7404F3F4'
+            >>> BsaFormat.Hash.from_name("", 103, is_folder=True)
+            0
+            """
+            if version == 0:
+                # morrowind: low and high 32 bits from both halves
+                half = len(name) >> 1
+                low = 0
+                for i, char in enumerate(name[:half]):
+                    low ^= ord(char) << ((8 * i) & 0x1F)
+                high = 0
+                for i, char in enumerate(name[half:]):
+                    temp = (ord(char) << ((8 * i) & 0x1F)) & 0xFFFFFFFF
+                    high ^= temp
+                    # rotate right
+                    num_bits = temp & 0x1F
+                    high = ((high >> num_bits)
+                            | (high << (32 - num_bits))) & 0xFFFFFFFF
+                return (high << 32) | (low & 0xFFFFFFFF)
+            # oblivion and up
+            if is_folder:
+                root, ext = name, ""
+            else:
+                root, ext = os.path.splitext(name)
+            if not root:
+                return 0
+            low = (ord(root[-1])
+                   | ((ord(root[-2]) << 8) if len(root) > 2 else 0)
+                   | (len(root) << 16)
+                   | (ord(root[0]) << 24))
+            low |= BsaFormat._EXTENSION_HASH_BITS.get(ext, 0)
+            high = 0
+            for char in root[1:-2]:
+                high = (high * 0x1003F + ord(char)) & 0xFFFFFFFF
+            ext_high = 0
+            for char in ext:
+                ext_high = (ext_high * 0x1003F + ord(char)) & 0xFFFFFFFF
+            return (((high + ext_high) & 0xFFFFFFFF) << 32) | low
+
     class BZString(pyffi.object_models.common.SizedString):
 
         def get_size(self, data=None):
@@ -155,7 +241,8 @@ class BsaFormat(pyffi.object_models.xml.FileFormat):
             self._value = stream.read(length)[:-1] # strip trailing null byte
 
         def write(self, stream, data=None):
-            stream.write(struct.pack('<B', len(self._value)))
+            # length includes the trailing null byte
+            stream.write(struct.pack('<B', len(self._value) + 1))
             stream.write(self._value)
             stream.write(struct.pack('<B', 0))
 
@@ -164,6 +251,8 @@ class BsaFormat(pyffi.object_models.xml.FileFormat):
 
         def __init__(self, **kwargs):
             BasicBase.__init__(self, **kwargs)
+            # new archives are oblivion style
+            self._value = 103
 
         def read(self, stream, data):
             """Read header string from stream and check it.
@@ -256,7 +345,11 @@ class BsaFormat(pyffi.object_models.xml.FileFormat):
                 stream.seek(pos)
 
         def read(self, stream):
-            """Read a bsa file.
+            """Read the header and the folder and file records of a bsa
+            file, and index its members. The file data itself is not
+            read: members are read from *stream* when they are needed,
+            so the stream must remain open for as long as members are
+            read, or the archive is written.
 
             :param stream: The stream from which to read.
             :type stream: ``file``
@@ -319,14 +412,382 @@ class BsaFormat(pyffi.object_models.xml.FileFormat):
                 raise ValueError(
                     'end of file not reached: corrupt bsa file?')
 
+            self._stream = stream
+            self._build_index()
+
         def write(self, stream):
-            """Write a bsa file.
+            """Write a bsa file. Folders and files are sorted by hash,
+            and all counts and offsets are recalculated. Members which
+            were not changed through :meth:`set_member` are copied as
+            they are stored in the original archive, without
+            decompressing them.
 
             :param stream: The stream to which to write.
             :type stream: ``file``
             """
-            # write the file
-            raise NotImplementedError
+            if stream is self._stream:
+                raise ValueError("cannot write back to the same stream")
+            if self.version == 0:
+                self._write_morrowind(stream)
+            else:
+                self._write_oblivion(stream)
+
+        # member access
+
+        def __init__(self, *args, **kwargs):
+            BsaFormat._Header.__init__(self, *args, **kwargs)
+            self._stream = None
+            self._members = {}
+            self._hashes = {}
+            self._changed = {}
+
+        _stream = None
+        """The stream from which the archive was read."""
+
+        _members = None
+        """Maps normalized member names to (name, record) pairs, where
+        record is a :class:`BsaFormat.File` or
+        :class:`BsaFormat.OldFile` for members stored in :attr:`_stream`,
+        and ``None`` for new members.
+        """
+
+        _hashes = None
+        """Maps hashes to normalized member names. Keys are
+        (folder hash, file hash) pairs, or just the name hash for
+        morrowind archives.
+        """
+
+        _changed = None
+        """Maps normalized member names to their new data."""
+
+        _stored_compressed = False
+        """Whether members in :attr:`_stream` are compressed by
+        default.
+        """
+
+        _stored_embedded_names = False
+        """Whether members in :attr:`_stream` have their name in front
+        of their data.
+        """
+
+        @staticmethod
+        def _normalize(name):
+            """Normalize a member name: lower case, and backslashes as
+            path separator.
+
+            >>> BsaFormat.Data._normalize("Meshes/Test.NIF")
+            'meshes\\\\test.nif'
+            """
+            name = pyffi.object_models.common._as_str(name)
+            return name.replace("/", "\\").strip("\\").lower()
+
+        def _hash_key(self, name):
+            """Get the key in :attr:`_hashes` of a normalized name."""
+            if self.version == 0:
+                return BsaFormat.Hash.from_name(name, self.version)
+            folder_name, sep, file_name = name.rpartition("\\")
+            return (BsaFormat.Hash.from_name(
+                        folder_name, self.version, is_folder=True),
+                    BsaFormat.Hash.from_name(file_name, self.version))
+
+        def _build_index(self):
+            """Index all members by name and by hash."""
+            self._members = {}
+            self._hashes = {}
+            self._changed = {}
+            # flags may be changed before writing, so keep how the
+            # data in the stream is stored
+            self._stored_compressed = bool(
+                self.version != 0 and self.archive_flags.is_compressed)
+            self._stored_embedded_names = self._has_embedded_names()
+            if self.version == 0:
+                for old_file in self.old_files:
+                    name = pyffi.object_models.common._as_str(
+                        old_file.name)
+                    key = self._normalize(name)
+                    self._members[key] = (name, old_file)
+                    self._hashes[old_file.name_hash] = key
+            else:
+                for folder in self.folders:
+                    folder_name = pyffi.object_models.common._as_str(
+                        folder.name)
+                    for file_ in folder.files:
+                        name = pyffi.object_models.common._as_str(file_.name)
+                        if folder_name:
+                            name = folder_name + "\\" + name
+                        key = self._normalize(name)
+                        self._members[key] = (name, file_)
+                        self._hashes[
+                            (folder.name_hash, file_.name_hash)] = key
+
+        def _find_member(self, name):
+            """Get the normalized name under which a member is
+            stored, or ``None`` if there is no such member.
+            """
+            key = self._normalize(name)
+            if key in self._members:
+                return key
+            # names stored in the archive may differ in ways that
+            # normalizing does not catch, but their hash matches
+            return self._hashes.get(self._hash_key(key))
+
+        def _is_compressed(self, record):
+            """Whether the data of a record is stored compressed in
+            :attr:`_stream`.
+            """
+            if self.version == 0:
+                return False
+            return self._stored_compressed != bool(
+                record.file_size.is_compressed_override)
+
+        def _has_embedded_names(self):
+            """Whether the full name of each member is stored in front
+            of its data (fallout 3 and up).
+            """
+            return bool(self.version >= 104 and self.archive_flags.unknown_9)
+
+        def _get_raw_location(self, record):
+            """Get offset and size of the data of a record in
+            :attr:`_stream`, as it is stored.
+            """
+            if self.version == 0:
+                return (12 + self.old_file_hashes_offset
+                        + 8 * self.num_old_files + record.data_offset,
+                        record.data_size)
+            return record.offset, record.file_size.num_bytes
+
+        def _read_raw(self, record):
+            """Read the data of a record, as it is stored."""
+            offset, size = self._get_raw_location(record)
+            self._stream.seek(offset)
+            raw = pyffi.utils.mmapstream.read_view(self._stream, size)
+            if len(raw) != size:
+                raise ValueError("member data truncated: corrupt bsa file?")
+            return raw
+
+        def get_member_names(self):
+            """Get the names of all members, in archive order, followed
+            by the names of new members.
+
+            :return: The names of the members.
+            :rtype: ``list`` of ``str``
+            """
+            return [name for name, record in self._members.values()]
+
+        def has_member(self, name):
+            """Check whether the archive has a member with the given
+            name. Names are case insensitive, and either forward or
+            backward slashes can be used.
+
+            :param name: The name of the member.
+            :type name: ``str``
+            :rtype: ``bool``
+            """
+            return self._find_member(name) is not None
+
+        def read_member(self, name):
+            """Get the (decompressed) data of a member. Uncompressed
+            members read from a memory mapped stream are not copied.
+
+            :param name: The name of the member.
+            :type name: ``str``
+            :return: The data.
+            :rtype: ``bytes`` or ``memoryview``
+            """
+            key = self._find_member(name)
+            if key is None:
+                raise KeyError("no member %s in archive" % name)
+            if key in self._changed:
+                return self._changed[key]
+            record = self._members[key][1]
+            raw = self._read_raw(record)
+            if self._stored_embedded_names:
+                raw = raw[1 + raw[0]:]
+            if self._is_compressed(record):
+                size, = struct.unpack("<I", raw[:4])
+                raw = zlib.decompress(raw[4:])
+                if len(raw) != size:
+                    raise ValueError(
+                        "member %s decompressed to %i bytes"
+                        " but expected %i bytes" % (name, len(raw), size))
+            return raw
+
+        def set_member(self, name, data):
+            """Replace the data of a member, or add a new member. The
+            change only affects the archive once it is written.
+
+            :param name: The name of the member.
+            :type name: ``str``
+            :param data: The new data.
+            :type data: ``bytes``
+            """
+            key = self._find_member(name)
+            if key is None:
+                key = self._normalize(name)
+                self._members[key] = (
+                    pyffi.object_models.common._as_str(name)
+                    .replace("/", "\\").strip("\\"), None)
+                self._hashes[self._hash_key(key)] = key
+            self._changed[key] = bytes(data)
+
+        def get_changed_member_names(self):
+            """Get the names of all members that were changed or added
+            through :meth:`set_member`.
+
+            :rtype: ``list`` of ``str``
+            """
+            return [self._members[key][0] for key in self._changed]
+
+        def get_members(self):
+            """Generator for all members of the archive. Members are
+            extracted one at a time, when the generator gets to them.
+
+            :return: Generator of members, whose stream is a
+                ``BytesIO`` named after the member.
+            :rtype: generator of
+                :class:`pyffi.object_models.ArchiveMember`
+            """
+            for name in self.get_member_names():
+                member = pyffi.object_models.ArchiveMember()
+                member.name = name
+                member.stream = BytesIO(self.read_member(name))
+                member.stream.name = name
+                yield member
+
+        # writing
+
+        def _get_stored(self, key, name, record):
+            """Get the data of a member as it must be stored, along
+            with whether it is compressed.
+            """
+            if key in self._changed:
+                data = self._changed[key]
+            elif self._stored_embedded_names == self._has_embedded_names():
+                return self._read_raw(record), self._is_compressed(record)
+            else:
+                data = self.read_member(name)
+            compressed = (self.version != 0
+                          and bool(self.archive_flags.is_compressed))
+            if compressed:
+                data = struct.pack("<I", len(data)) + zlib.compress(data)
+            if self._has_embedded_names():
+                embedded_name = pyffi.object_models.common._as_bytes(name)
+                data = (struct.pack("<B", len(embedded_name))
+                        + embedded_name + data)
+            return data, compressed
+
+        def _write_morrowind(self, stream):
+            """Write a morrowind style archive."""
+            # sorted by low, then by high 32 bits of the hash
+            members = sorted(
+                ((BsaFormat.Hash.from_name(key, 0), key)
+                 for key in self._members),
+                key=lambda hash_key: (hash_key[0] & 0xFFFFFFFF,
+                                      hash_key[0] >> 32))
+            stored = []
+            header = BsaFormat.Data()
+            header.version = 0
+            header.num_old_files = len(members)
+            header.old_files.update_size()
+            data_offset = 0
+            name_offset = 0
+            for old_file, (name_hash, key) in zip(header.old_files, members):
+                name, record = self._members[key]
+                data, compressed = self._get_stored(key, name, record)
+                stored.append(data)
+                old_file.data_size = len(data)
+                old_file.data_offset = data_offset
+                old_file.name_offset = name_offset
+                old_file.name = pyffi.object_models.common._as_bytes(name)
+                old_file.name_hash = name_hash
+                data_offset += len(data)
+                name_offset += len(old_file.name) + 1
+            header.old_file_hashes_offset = 12 * len(members) + name_offset
+            # write, in the same order as read
+            BsaFormat._Header.write(header, stream, data=header)
+            header.old_files.write(stream, data=header)
+            for old_file in header.old_files:
+                old_file._name_offset_value_.write(stream, data=header)
+            for old_file in header.old_files:
+                old_file._name_value_.write(stream, data=header)
+            for old_file in header.old_files:
+                old_file._name_hash_value_.write(stream, data=header)
+            for data in stored:
+                stream.write(data)
+
+        def _write_oblivion(self, stream):
+            """Write an oblivion style archive."""
+            # group members by folder, and sort by hash
+            folders = {}
+            for key in self._members:
+                folder_key, sep, file_key = key.rpartition("\\")
+                folders.setdefault(folder_key, []).append(
+                    (BsaFormat.Hash.from_name(file_key, self.version), key))
+            folders = sorted(
+                (BsaFormat.Hash.from_name(
+                    folder_key, self.version, is_folder=True),
+                 folder_key, sorted(files))
+                for folder_key, files in folders.items())
+            # create the header
+            header = BsaFormat.Data()
+            header.version = self.version
+            header.archive_flags.deepcopy(self.archive_flags)
+            header.file_flags.deepcopy(self.file_flags)
+            header.num_folders = len(folders)
+            header.folders.update_size()
+            stored = []
+            for folder, (folder_hash, folder_key, files) in zip(
+                    header.folders, folders):
+                folder.name_hash = folder_hash
+                folder.num_files = len(files)
+                folder.files.update_size()
+                for file_, (file_hash, key) in zip(folder.files, files):
+                    name, record = self._members[key]
+                    folder_name, sep, file_name = name.rpartition("\\")
+                    data, compressed = self._get_stored(key, name, record)
+                    stored.append(data)
+                    file_.name_hash = file_hash
+                    file_.name = pyffi.object_models.common._as_bytes(
+                        file_name)
+                    file_.file_size.num_bytes = len(data)
+                    file_.file_size.is_compressed_override = int(
+                        compressed != bool(header.archive_flags.is_compressed))
+                    flag = BsaFormat._EXTENSION_FILE_FLAGS.get(
+                        os.path.splitext(key)[1])
+                    if flag:
+                        setattr(header.file_flags, flag, 1)
+                folder.name = pyffi.object_models.common._as_bytes(
+                    folder_name)
+            header.num_files = len(stored)
+            header.total_folder_name_length = sum(
+                len(folder.name) + 1 for folder in header.folders)
+            header.total_file_name_length = sum(
+                len(file_.name) + 1
+                for folder in header.folders for file_ in folder.files)
+            # calculate offsets
+            header.folders_offset = 36
+            offset = 36 + 16 * len(folders)
+            for folder in header.folders:
+                folder.offset = offset + header.total_file_name_length
+                offset += len(folder.name) + 2 + 16 * folder.num_files
+            offset += header.total_file_name_length
+            file_index = 0
+            for folder in header.folders:
+                for file_ in folder.files:
+                    file_.offset = offset
+                    offset += len(stored[file_index])
+                    file_index += 1
+            # write, in the same order as read
+            BsaFormat._Header.write(header, stream, data=header)
+            header.folders.write(stream, data=header)
+            for folder in header.folders:
+                folder._name_value_.write(stream, data=header)
+                folder._files_value_.write(stream, data=header)
+            for folder in header.folders:
+                for file_ in folder.files:
+                    file_._name_value_.write(stream, data=header)
+            for data in stored:
+                stream.write(data)
 
 if __name__ == '__main__':
     import doctest
@@ -415,7 +415,8 @@ class CgfFormat(pyffi.object_models.xml.FileFormat, metaclass=_MetaCgfFormat):
             :type block_dct: dict
             """
             logger = logging.getLogger("pyffi.cgf.data")
-            block_index = data._link_stack.pop(0)
+            block_index = data._link_stack[data._link_index]
+            data._link_index += 1
             # case when there's no link
             if block_index == -1:
                 self._value = None
@@ -542,6 +543,7 @@ but got instance of %s""" % (self._template, block.__class__))
         :type versions: ``list`` of L{int}
         """
         _link_stack = None
+        _link_index = 0
         _block_index_dct = None
         _block_dct = None
 
@@ -740,6 +742,7 @@ but got instance of %s""" % (self._template, block.__class__))
 
             # read the chunks
             self._link_stack = [] # list of chunk identifiers, as added to the stack
+            self._link_index = 0 # index of the next link to fix
             self._block_dct = {} # maps chunk index to actual chunk
             self.chunks = [] # records all chunks as read from cgf file in proper order
             self.versions = [] # records all chunk versions as read from cgf file
@@ -866,7 +869,7 @@ chunk size mismatch when reading %s at 0x%08X
                     chunk.fix_links(self)
                 finally:
                     self.version = self.header.version
-            if self._link_stack != []:
+            if self._link_index != len(self._link_stack):
                 raise CgfFormat.CgfError(
                     'not all links have been popped from the stack (bug?)')
 
@@ -987,18 +990,20 @@ chunk size mismatch when reading %s at 0x%08X
 
             :param block_type: If not ``None``, yield only blocks of the type C{block_type}.
             :param follow_all: If C{block_type} is not ``None``, then if this is ``True`` the function will parse the whole tree. Otherwise, the function will not follow branches that start by a non-C{block_type} block."""
-            # yield self
-            if not block_type:
-                yield self
-            elif isinstance(self, block_type):
-                yield self
-            elif not follow_all:
-                return # don't recurse further
-
-            # yield tree attached to each child
-            for child in self.get_refs():
-                for block in child.tree(block_type = block_type, follow_all = follow_all):
+            # walk the tree depth first with a stack of the blocks
+            # still to visit, so deep trees do not hit the recursion limit
+            stack = [self]
+            while stack:
+                block = stack.pop()
+                # yield block
+                if not block_type:
                     yield block
+                elif isinstance(block, block_type):
+                    yield block
+                elif not follow_all:
+                    continue # don't recurse further
+                # visit the tree attached to each child, in order
+                stack.extend(reversed(block.get_refs()))
 
         def apply_scale(self, scale):
             """Apply scale factor on data."""
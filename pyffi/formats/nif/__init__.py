@@ -348,13 +348,17 @@ end
 #
 # ***** END LICENSE BLOCK *****
 
+from io import BytesIO
 from itertools import repeat, chain
+import bisect
+import heapq
 import logging
 import math # math.pi
 import os
 import re
 import struct
 import sys
+import time
 import warnings
 import weakref
 
@@ -364,14 +368,19 @@ import pyffi.object_models.common
 import pyffi.object_models
 from pyffi.object_models.xml import FileFormat
 import pyffi.utils.inertia
+from pyffi.utils.mmapstream import read_view
 from pyffi.utils.mathutils import * # XXX todo get rid of from XXX import *
 import pyffi.utils.mopp
 import pyffi.utils.tristrip
 import pyffi.utils.vertex_cache
 import pyffi.utils.quickhull
+import pyffi.utils.skinning
+import pyffi.utils.tangentspace
+import pyffi.utils.weld
 # XXX convert the following to absolute imports
 from pyffi.object_models.editable import EditableBoolComboBox
 from pyffi.utils.graph import EdgeFilter
+from pyffi.object_models.xml.array import Array
 from pyffi.object_models.xml.basic import BasicBase
 from pyffi.object_models.xml.struct_ import StructBase
 
@@ -488,15 +497,23 @@ class NifFormat(FileFormat):
         _is_template = True
         _has_links = True
         _has_refs = True
+
+        _referrer_index = None
+        """The :class:`NifFormat.Data.ReferrerIndex` which keeps track of
+        this reference, if any."""
+
         def __init__(self, **kwargs):
             BasicBase.__init__(self, **kwargs)
             self._template = kwargs.get("template")
-            self.set_value(None)
+            self._value = None
 
         def get_value(self):
             return self._value
 
         def set_value(self, value):
+            index = self._referrer_index
+            if index is not None:
+                index.discard(self)
             if value is None:
                 self._value = None
             else:
@@ -505,7 +522,12 @@ class NifFormat(FileFormat):
                         raise TypeError(
                             'expected an instance of %s but got instance of %s'
                             % (self._template, value.__class__))
-                self._value = value
+                self._set_value(value)
+                if index is not None:
+                    index.add(self, value)
+
+        def _set_value(self, value):
+            self._value = value
 
         def get_size(self, data=None):
             return 4
@@ -542,7 +564,8 @@ class NifFormat(FileFormat):
 
         def fix_links(self, data):
             """Fix block links."""
-            block_index = data._link_stack.pop(0)
+            block_index = data._link_stack[data._link_index]
+            data._link_index += 1
             # case when there's no link
             if data.version >= 0x0303000D:
                 if block_index == -1: # link by block number
@@ -622,16 +645,8 @@ class NifFormat(FileFormat):
         def get_value(self):
             return self._value() if self._value is not None else None
 
-        def set_value(self, value):
-            if value is None:
-                self._value = None
-            else:
-                if self._template != None:
-                    if not isinstance(value, self._template):
-                        raise TypeError(
-                            'expected an instance of %s but got instance of %s'
-                            % (self._template, value.__class__))
-                self._value = weakref.ref(value)
+        def _set_value(self, value):
+            self._value = weakref.ref(value)
 
         def __str__(self):
             # avoid infinite recursion
@@ -907,12 +922,14 @@ class NifFormat(FileFormat):
                         struct.pack(data._byte_order + 'i', -1))
                 else:
                     try:
-                        stream.write(struct.pack(
-                            data._byte_order + 'i',
-                            data._string_list.index(self._value)))
-                    except ValueError:
+                        if data._string_index_dct is not None:
+                            index = data._string_index_dct[self._value]
+                        else:
+                            index = data._string_list.index(self._value)
+                    except (KeyError, ValueError):
                         raise ValueError(
                             "string '%s' not in string list" % self._value)
+                    stream.write(struct.pack(data._byte_order + 'i', index))
             else:
                 stream.write(struct.pack(data._byte_order + 'I',
                                          len(self._value)))
@@ -943,6 +960,10 @@ class NifFormat(FileFormat):
             self.set_value("".encode()) # b'' for > py25
 
         def get_value(self):
+            # data read from a memory mapped file is a view on the file,
+            # until it is first used
+            if isinstance(self._value, memoryview):
+                self._value = self._value.tobytes()
             return self._value
 
         def set_value(self, value):
@@ -957,7 +978,7 @@ class NifFormat(FileFormat):
         def read(self, stream, data):
             size, = struct.unpack(data._byte_order + 'I',
                                   stream.read(4))
-            self._value = stream.read(size)
+            self._value = read_view(stream, size)
 
         def write(self, stream, data):
             stream.write(struct.pack(data._byte_order + 'I',
@@ -975,6 +996,10 @@ class NifFormat(FileFormat):
             self.set_value([])
 
         def get_value(self):
+            # data read from a memory mapped file are views on the file,
+            # until they are first used
+            if self._value and isinstance(self._value[0], memoryview):
+                self._value = [x.tobytes() for x in self._value]
             return self._value
 
         def set_value(self, value):
@@ -1003,7 +1028,7 @@ class NifFormat(FileFormat):
                                    stream.read(4))
             self._value = []
             for i in range(size2):
-                self._value.append(stream.read(size1))
+                self._value.append(read_view(stream, size1))
 
         def write(self, stream, data):
             if self._value:
@@ -1088,9 +1113,296 @@ class NifFormat(FileFormat):
         """
 
         _link_stack = None
+        _link_index = 0
         _block_dct = None
         _string_list = None
+        _string_index_dct = None
         _block_index_dct = None
+        _lazy_blocks = None
+        _referrer_index = None
+        _transform_cache = None
+
+        class ReferrerIndex(object):
+            """Index of the references (:class:`NifFormat.Ref` and
+            :class:`NifFormat.Ptr` instances) in a nif tree, by the block
+            that they refer to. References that are tracked by the index
+            update it whenever their value is set, and so do arrays of
+            references when they grow. Blocks which are no longer
+            referred to (other than through a :class:`NifFormat.Ptr`) by
+            any tracked block or by a root are no longer tracked.
+            """
+
+            num_changes = 0
+            """Number of times that a tracked reference was set."""
+
+            def __init__(self, data):
+                self._data = weakref.ref(data)
+                self._referrers = weakref.WeakKeyDictionary()
+                self._blocks = weakref.WeakSet()
+
+            def has_block(self, block):
+                """Whether the references of a block are tracked."""
+                return block in self._blocks
+
+            def add_block(self, block):
+                """Track all references of a block, and of all blocks
+                that it refers to.
+                """
+                blocks = [block]
+                while blocks:
+                    block = blocks.pop()
+                    if block in self._blocks:
+                        continue
+                    self._blocks.add(block)
+                    for ref in self._set_index(block, self):
+                        value = ref.get_value()
+                        if value is not None:
+                            self._add(ref, value)
+                            blocks.append(value)
+
+            def add_element(self, element):
+                """Called when a new element is added to a tracked array.
+
+                :param element: The element.
+                :type element: :class:`NifFormat.Ref`, or a struct or
+                    array with references
+                """
+                for ref in self._set_index(element, self):
+                    value = ref.get_value()
+                    if value is not None:
+                        self.add(ref, value)
+
+            def remove_element(self, element):
+                """Called when an element is removed from a tracked
+                array.
+                """
+                for ref in self._set_index(element, None):
+                    self.discard(ref)
+
+            @staticmethod
+            def _set_index(value, index):
+                """Set the index of all references of a block (or of any
+                other value), and of all arrays of references, and list
+                the references.
+                """
+                refs = []
+                values = [value]
+                while values:
+                    value = values.pop()
+                    if isinstance(value, NifFormat.Ref):
+                        value._referrer_index = index
+                        refs.append(value)
+                    elif isinstance(value, Array):
+                        if value._elementType._has_links:
+                            if value._count2 is None:
+                                value._referrer_index = index
+                            values.extend(value._elementList())
+                    elif isinstance(value, StructBase):
+                        values.extend(
+                            getattr(value, "_%s_value_" % attr.name)
+                            for attr in value._get_filtered_attribute_list()
+                            if attr.type_ is type(None)
+                            or attr.type_._has_links)
+                return refs
+
+            def _add(self, ref, block):
+                refs = self._referrers.get(block)
+                if refs is None:
+                    refs = self._referrers[block] = weakref.WeakSet()
+                refs.add(ref)
+
+            def add(self, ref, block):
+                """Called when a tracked reference is set to a block."""
+                self._add(ref, block)
+                if block not in self._blocks:
+                    self.add_block(block)
+
+            def discard(self, ref):
+                """Called before a tracked reference is set."""
+                self.num_changes += 1
+                block = ref.get_value()
+                if block is not None:
+                    refs = self._referrers.get(block)
+                    if refs is not None:
+                        refs.discard(ref)
+                    if not isinstance(ref, NifFormat.Ptr):
+                        self._remove_block(block)
+
+            def _remove_block(self, block):
+                """Stop tracking a block, and the blocks it refers to,
+                if they are no longer referred to.
+                """
+                roots = self._data().roots
+                blocks = [block]
+                while blocks:
+                    block = blocks.pop()
+                    if (block not in self._blocks
+                            or any(block is root for root in roots)
+                            or any(not isinstance(ref, NifFormat.Ptr)
+                                   for ref in self.get_referrers(block))):
+                        continue
+                    self._blocks.discard(block)
+                    for ref in self._set_index(block, None):
+                        value = ref.get_value()
+                        if value is not None:
+                            self._referrers[value].discard(ref)
+                            if not isinstance(ref, NifFormat.Ptr):
+                                blocks.append(value)
+
+            def get_referrers(self, block):
+                """Get all tracked references to a block."""
+                refs = self._referrers.get(block)
+                if not refs:
+                    return []
+                return [ref for ref in refs if ref.get_value() is block]
+
+        class TransformCache(object):
+            """Cache of the parents of the :class:`NifFormat.NiAVObject`
+            blocks in a nif tree. The tree is walked once, depth first in
+            the same order as :meth:`NifFormat.NiObject.find_chain`, to
+            record the parent of every block, so a transform relative to
+            an ancestor is calculated in O(depth) without searching the
+            tree. Local transforms are kept as lists of rows, along with
+            the scale, rotation, and translation they were calculated
+            from, so changes to the transform of a block are always
+            taken into account.
+
+            The cache is no longer valid as soon as a reference in the
+            tree is set, or the roots change. Changes to other trees do
+            not matter.
+            """
+
+            def __init__(self, data):
+                self._data = weakref.ref(data)
+                self._roots = list(data.roots)
+                # every change to a reference in the tree goes through
+                # its referrer index
+                self._referrer_index = data._get_referrer_index()
+                self._num_changes = self._referrer_index.num_changes
+                # blocks in depth first order, and for each block, the
+                # index of its parent and of its root
+                self._blocks = []
+                self._index = {}
+                self._parents = []
+                self._root_indices = []
+                # blocks which are reached along more than one chain
+                self._shared = set()
+                stack = [(root, -1) for root in reversed(self._roots)
+                         if isinstance(root, NifFormat.NiAVObject)]
+                while stack:
+                    block, parent = stack.pop()
+                    index = self._index.get(block)
+                    if index is not None:
+                        self._shared.add(index)
+                        continue
+                    index = len(self._blocks)
+                    self._index[block] = index
+                    self._blocks.append(block)
+                    self._parents.append(parent)
+                    self._root_indices.append(
+                        index if parent == -1 else self._root_indices[parent])
+                    block._transform_cache = self
+                    stack.extend(
+                        (child, index) for child in reversed(block.get_refs())
+                        if isinstance(child, NifFormat.NiAVObject))
+                self._locals = [None] * len(self._blocks)
+
+            def is_valid(self):
+                """Whether the tree is still the tree that was cached."""
+                data = self._data()
+                return (data is not None
+                        and data._referrer_index is self._referrer_index
+                        and self._num_changes
+                        == self._referrer_index.num_changes
+                        and len(self._roots) == len(data.roots)
+                        and all(root is cached_root for root, cached_root
+                                in zip(data.roots, self._roots)))
+
+            def has_block(self, block):
+                """Whether the parent of a block is cached."""
+                return block in self._index
+
+            def detach(self):
+                """Stop the blocks of the tree from using the cache."""
+                for block in self._blocks:
+                    if block._transform_cache is self:
+                        block._transform_cache = None
+
+            def get_parent(self, block):
+                """Get the parent of a block, along the chain from the root
+                of its tree, or ``None`` for a root.
+                """
+                parent = self._parents[self._index[block]]
+                return self._blocks[parent] if parent != -1 else None
+
+            def get_transform(self, block, relative_to=None):
+                """Get the transform of a block relative to another block,
+                like :meth:`NifFormat.NiAVObject.get_transform`.
+
+                :param block: The block.
+                :type block: :class:`NifFormat.NiAVObject`
+                :param relative_to: The block relative to which the
+                    transform must be calculated. If ``None``, the local
+                    transform is returned.
+                :return: The transform, or ``None`` if the cache cannot
+                    tell the chain between both blocks.
+                :rtype: :class:`NifFormat.Matrix44`
+                """
+                index = self._index.get(block)
+                if index is None:
+                    return None
+                if relative_to is None or relative_to is block:
+                    return block.get_transform()
+                # the chain from the root is the chain that find_chain
+                # finds; for other blocks, this is only sure if no block
+                # can be reached along another chain
+                if relative_to is self._blocks[self._root_indices[index]]:
+                    shared = ()
+                else:
+                    shared = self._shared
+                # multiply the local transforms up to relative_to
+                rows = None
+                while index != -1 and index not in shared:
+                    local = self._get_local(index)
+                    rows = local if rows is None else self._multiply(rows, local)
+                    index = self._parents[index]
+                    if index != -1 and self._blocks[index] is relative_to:
+                        break
+                else:
+                    return None
+                transform = NifFormat.Matrix44()
+                transform.set_rows(*rows)
+                return transform
+
+            def _get_local(self, index):
+                """Get the local transform of a block, as list of rows."""
+                block = self._blocks[index]
+                rotation = block.rotation
+                translation = block.translation
+                key = (block.scale,
+                       rotation.m_11, rotation.m_12, rotation.m_13,
+                       rotation.m_21, rotation.m_22, rotation.m_23,
+                       rotation.m_31, rotation.m_32, rotation.m_33,
+                       translation.x, translation.y, translation.z)
+                cached = self._locals[index]
+                if cached is not None and cached[0] == key:
+                    return cached[1]
+                rows = block.get_transform().as_list()
+                self._locals[index] = (key, rows)
+                return rows
+
+            @staticmethod
+            def _multiply(rows, other_rows):
+                """Multiply two matrices, given as lists of rows, in the
+                same way as :meth:`NifFormat.Matrix44.__mul__`.
+                """
+                (m11, m12, m13, m14), (m21, m22, m23, m24), \
+                    (m31, m32, m33, m34), (m41, m42, m43, m44) = other_rows
+                return [[x1 * m11 + x2 * m21 + x3 * m31 + x4 * m41,
+                         x1 * m12 + x2 * m22 + x3 * m32 + x4 * m42,
+                         x1 * m13 + x2 * m23 + x3 * m33 + x4 * m43,
+                         x1 * m14 + x2 * m24 + x3 * m34 + x4 * m44]
+                        for x1, x2, x3, x4 in rows]
 
         class VersionUInt(pyffi.object_models.common.UInt):
             def set_value(self, value):
@@ -1246,12 +1558,135 @@ class NifFormat(FileFormat):
 
         def replace_global_node(self, oldbranch, newbranch,
                               edge_filter=EdgeFilter()):
+            """Replace every reference to *oldbranch*, in all blocks
+            of the tree, by a reference to *newbranch* (which can be
+            ``None``). Only the references found by
+            :meth:`get_referrers` are visited, rather than the whole
+            tree, unless an *edge_filter* other than the default one is
+            given: as the index does not know about edge types, the
+            whole tree is visited then.
+
+            >>> from pyffi.formats.nif import NifFormat
+            >>> data = NifFormat.Data()
+            >>> root = NifFormat.NiNode()
+            >>> child = NifFormat.NiNode()
+            >>> prop = NifFormat.NiAlphaProperty()
+            >>> root.add_child(child)
+            >>> root.add_property(prop)
+            >>> child.add_property(prop)
+            >>> data.roots = [root]
+            >>> len(data.get_referrers(prop))
+            2
+            >>> newprop = NifFormat.NiAlphaProperty()
+            >>> data.replace_global_node(prop, newprop)
+            >>> root.properties[0] is newprop, child.properties[0] is newprop
+            (True, True)
+            >>> data.get_referrers(prop)
+            []
+            >>> data.replace_global_node(child, None)
+            >>> root.children[0] is None
+            True
+            """
+            if edge_filter != EdgeFilter():
+                for i, root in enumerate(self.roots):
+                    if root is oldbranch:
+                        self.roots[i] = newbranch
+                    else:
+                        root.replace_global_node(oldbranch, newbranch,
+                                                 edge_filter=edge_filter)
+                return
+            index = self._get_referrer_index()
             for i, root in enumerate(self.roots):
                 if root is oldbranch:
                     self.roots[i] = newbranch
-                else:
-                    root.replace_global_node(oldbranch, newbranch,
-                                           edge_filter=edge_filter)
+                    if newbranch is not None:
+                        index.add_block(newbranch)
+            for ref in index.get_referrers(oldbranch):
+                ref.set_value(newbranch)
+
+        def get_referrers(self, block):
+            """Get all references to a block, in all blocks of the tree.
+
+            The references are found through an index which is built
+            when it is first needed, and which is kept up to date as
+            references are set.
+
+            :param block: The block.
+            :type block: :class:`NifFormat.NiObject`
+            :return: The references to the block.
+            :rtype: ``list`` of :class:`NifFormat.Ref` (and
+                :class:`NifFormat.Ptr`)
+            """
+            return self._get_referrer_index().get_referrers(block)
+
+        def _get_referrer_index(self):
+            """Get the :class:`ReferrerIndex` of the tree, building it
+            if needed.
+            """
+            index = self._referrer_index
+            if index is None:
+                index = self._referrer_index = NifFormat.Data.ReferrerIndex(
+                    self)
+            for root in self.roots:
+                if root is not None and not index.has_block(root):
+                    index.add_block(root)
+            return index
+
+        def get_transform_cache(self):
+            """Get the :class:`TransformCache` of the tree, building it
+            if needed. Once built, and until :meth:`remove_transform_cache`
+            is called, transforms of the blocks in the tree relative to
+            their ancestors are calculated through the cache.
+
+            >>> from pyffi.formats.nif import NifFormat
+            >>> data = NifFormat.Data()
+            >>> root = NifFormat.NiNode()
+            >>> child = NifFormat.NiNode()
+            >>> grandchild = NifFormat.NiNode()
+            >>> root.add_child(child)
+            >>> child.add_child(grandchild)
+            >>> data.roots = [root]
+            >>> cache = data.get_transform_cache()
+            >>> cache.get_parent(grandchild) is child
+            True
+            >>> child.translation.x = 1.0
+            >>> grandchild.translation.x = 2.0
+            >>> grandchild.get_transform(root).get_translation().x
+            3.0
+            >>> other = NifFormat.Data()
+            >>> other.roots = [NifFormat.NiNode()]
+            >>> other.roots[0].add_child(NifFormat.NiNode())
+            >>> cache.is_valid()
+            True
+            >>> child.remove_child(grandchild)
+            >>> cache.is_valid()
+            False
+            >>> data.get_transform_cache() is cache
+            False
+            >>> data.remove_transform_cache()
+            >>> child._transform_cache is None
+            True
+
+            :return: The transform cache.
+            :rtype: :class:`NifFormat.Data.TransformCache`
+            """
+            cache = self._transform_cache
+            if cache is None or not cache.is_valid():
+                if cache is not None:
+                    cache.detach()
+                cache = self._transform_cache = NifFormat.Data.TransformCache(
+                    self)
+            return cache
+
+        def remove_transform_cache(self):
+            """Remove the :class:`TransformCache` of the tree, if any, so
+            transforms relative to other blocks are found by searching the
+            tree again.
+            """
+            cache = self._transform_cache
+            if cache is not None:
+                cache.detach()
+                self._transform_cache = None
 
         def get_detail_child_nodes(self, edge_filter=EdgeFilter()):
             yield self._version_value_
@@ -1305,12 +1740,22 @@ class NifFormat(FileFormat):
 
             # read the blocks
             self._link_stack = [] # list of indices, as they are added to the stack
+            self._link_index = 0 # index of the next link to fix
             self._string_list = [s for s in self.header.strings]
+            self._string_index_dct = None
             self._block_dct = {} # maps block index to actual block
             self.blocks = [] # records all blocks as read from file in order
+            self._lazy_blocks = None
             block_num = 0 # the current block numner
 
-            while True:
+            # block sizes are stored in the header from 20.2.0.7 onwards,
+            # so decoding of the blocks can be deferred until they are used
+            lazy = self.lazy and self.version >= 0x14020007
+            if lazy:
+                self._read_lazy_blocks(stream)
+            profile = self.profile
+
+            while not lazy:
                 if self.version < 0x0303000D:
                     # check if this is a 'Top Level Object'
                     pos = stream.tell()
@@ -1378,6 +1823,8 @@ class NifFormat(FileFormat):
                         "Unknown block type '%s'." % block_type)
                 logger.debug("Reading %s block at 0x%08X"
                              % (block_type, stream.tell()))
+                if profile is not None:
+                    start = time.perf_counter()
                 # read the block
                 try:
                     block.read(stream, self)
@@ -1387,6 +1834,8 @@ class NifFormat(FileFormat):
                     #logger.error("block that failed:")
                     #logger.error("%s" % block)
                     raise
+                if profile is not None:
+                    self._profile_block(block_type, start)
                 # complete NiDataStream data
                 if block_type == "NiDataStream":
                     block.usage = data_stream_usage
@@ -1426,41 +1875,313 @@ class NifFormat(FileFormat):
                     'End of file not reached: corrupt NIF file?')
 
             # fix links in blocks and footer (header has no links)
-            for block in self.blocks:
-                block.fix_links(self)
+            # (lazy blocks fix their links when they are decoded)
+            if profile is not None:
+                start = time.perf_counter()
+            if not lazy:
+                for block in self.blocks:
+                    block.fix_links(self)
             ftr.fix_links(self)
-            # the link stack should be empty now
-            if self._link_stack:
+            if profile is not None:
+                profile["links"] = (profile.get("links", 0.0)
+                                    + time.perf_counter() - start)
+            # all links should be fixed now
+            if self._link_index != len(self._link_stack):
                 raise NifFormat.NifError('not all links have been popped from the stack (bug?)')
             # add root objects in footer to roots list
             if self.version >= 0x0303000D:
                 for root in ftr.roots:
                     self.roots.append(root)
+            if lazy:
+                self._lazy_roots = list(self.roots)
+
+        def _profile_block(self, block_type, start):
+            """Record the time spent reading a block in L{profile}.
+
+            :param block_type: The type of the block.
+            :type block_type: ``str``
+            :param start: The value of ``time.perf_counter()`` before the
+                block was read.
+            :type start: ``float``
+            """
+            stats = self.profile.setdefault("blocks", {}).setdefault(
+                block_type, [0, 0.0])
+            stats[0] += 1
+            stats[1] += time.perf_counter() - start
+
+        def _read_lazy_blocks(self, stream):
+            """Read the raw bytes of all blocks, and set up a placeholder
+            for every block. A placeholder is decoded by
+            L{_decode_lazy_block} as soon as any of its attributes is
+            accessed. Only possible if the header stores the block sizes.
+
+            :param stream: The stream from which to read, positioned
+                right after the header.
+            :type stream: ``file``
+            """
+            size = sum(self.header.block_size)
+            # copy the data: it is kept after the stream is closed,
+            # which would keep memory mapped files mapped
+            self._lazy_buffer = stream.read(size)
+            if len(self._lazy_buffer) != size:
+                raise NifFormat.NifError(
+                    'unexpected end of file while reading blocks')
+            self._lazy_strings = list(self._string_list)
+            self._lazy_version = (
+                self.version, self.user_version, self.user_version_2)
+            self._lazy_links = {}
+            self._lazy_block_strings = {}
+            offset = 0
+            for block_num, size in enumerate(self.header.block_size):
+                # note the 0xfff mask: required for the NiPhysX blocks
+                block_type = self.header.block_types[
+                    self.header.block_type_index[block_num] & 0xfff]
+                block_type = block_type.decode("ascii")
+                data_stream = None
+                if block_type.startswith("NiDataStream\x01"):
+                    block_type, data_stream_usage, data_stream_access = block_type.split("\x01")
+                    data_stream = (int(data_stream_usage),
+                                   int(data_stream_access))
+                try:
+                    block_class = getattr(NifFormat, block_type)
+                except AttributeError:
+                    raise ValueError(
+                        "Unknown block type '%s'." % block_type)
+                # create the block without initializing it
+                lazy_class = self._get_lazy_block_class(block_class)
+                block = lazy_class.__new__(lazy_class)
+                block._lazy_source = (self, block_num, offset, size,
+                                      data_stream)
+                self._block_dct[block_num] = block
+                self.blocks.append(block)
+                offset += size
+            self._lazy_blocks = list(self.blocks)
+
+        class LazyBlock(object):
+            """Base class of placeholder blocks, which decodes the block
+            as soon as one of its attributes is missing.
+            """
+
+            _block_class = None
+            """The class of the block, once it is decoded."""
+
+            def __getattr__(self, name):
+                # only called if the attribute is not found
+                if name.startswith("__"):
+                    raise AttributeError(name)
+                self._lazy_source[0]._decode_lazy_block(self)
+                return getattr(self, name)
+
+        _lazy_block_classes = {}
+
+        @classmethod
+        def _get_lazy_block_class(cls, block_class):
+            """Get the placeholder class for a block class."""
+            lazy_class = cls._lazy_block_classes.get(block_class)
+            if lazy_class is None:
+                lazy_class = cls._lazy_block_classes[block_class] = type(
+                    block_class.__name__,
+                    (NifFormat.Data.LazyBlock, block_class),
+                    {"_block_class": block_class})
+            return lazy_class
+
+        @staticmethod
+        def decode_block(block):
+            """Decode a block if it is a placeholder of lazily read data
+            (see L{lazy}), so it has its real class. Other blocks are
+            left as they are.
+
+            :param block: The block.
+            :type block: L{NifFormat.NiObject}
+            """
+            source = getattr(block, "_lazy_source", None)
+            if source is not None:
+                source[0]._decode_lazy_block(block)
+
+        def _decode_lazy_block(self, block):
+            """Decode a placeholder block that was set up by
+            L{_read_lazy_blocks}.
+
+            :param block: The block to decode.
+            :type block: L{NifFormat.NiObject}
+            """
+            logger = logging.getLogger("pyffi.nif.data")
+            _, block_num, offset, size, data_stream = block._lazy_source
+            del block._lazy_source
+            # the block is no longer a placeholder
+            block.__class__ = block._block_class
+            block.__init__()
+            logger.debug("Decoding %s block at 0x%08X"
+                         % (block.__class__.__name__, offset))
+            stream = BytesIO(self._lazy_buffer[offset:offset + size])
+            # the block has its own links, and its strings index the
+            # string list as it was read from the file
+            link_stack, link_index = self._link_stack, self._link_index
+            string_list = self._string_list
+            self._link_stack = []
+            self._link_index = 0
+            self._string_list = self._lazy_strings
+            if self.profile is not None:
+                start = time.perf_counter()
+            try:
+                try:
+                    block.read(stream, self)
+                except:
+                    logger.exception("Reading %s failed" % block.__class__)
+                    raise
+                # complete NiDataStream data
+                if data_stream is not None:
+                    block.usage = data_stream[0]
+                    block.access.populate_attribute_values(
+                        data_stream[1], self)
+                if stream.tell() != size:
+                    logger.error(
+                        "Block size check failed: corrupt NIF file "
+                        "or bad nif.xml?")
+                    logger.error("Skipping %i bytes in %s"
+                                 % (size - stream.tell(),
+                                    block.__class__.__name__))
+                block.fix_links(self)
+            finally:
+                self._link_stack = link_stack
+                self._link_index = link_index
+                self._string_list = string_list
+            if self.profile is not None:
+                self._profile_block(block.__class__.__name__, start)
+            self._lazy_links[block] = block.get_links(self)
+            self._lazy_block_strings[block] = block.get_strings(self)
+
+        def _decode_lazy_blocks(self):
+            """Decode all remaining placeholder blocks, and forget the
+            raw block data.
+            """
+            for block in self._lazy_blocks:
+                if hasattr(block, "_lazy_source"):
+                    self._decode_lazy_block(block)
+            self._lazy_blocks = None
+            self._lazy_buffer = None
+            self._lazy_links = None
+            self._lazy_block_strings = None
+
+        def _can_write_lazy(self):
+            """Check whether the blocks can be written in the order in
+            which they were read, without decoding the blocks that have
+            not been used: this requires that no links and no strings
+            have changed, as the blocks which were not decoded still
+            index the original string list.
+            """
+            if self._lazy_version != (
+                self.version, self.user_version, self.user_version_2):
+                return False
+            if (len(self.roots) != len(self._lazy_roots)
+                or any(root is not old_root for root, old_root
+                       in zip(self.roots, self._lazy_roots))):
+                return False
+            for block, links in self._lazy_links.items():
+                # type string depends on the data stream attributes
+                if isinstance(block, NifFormat.NiDataStream):
+                    return False
+                new_links = block.get_links(self)
+                if (len(new_links) != len(links)
+                    or any(link is not old_link for link, old_link
+                           in zip(new_links, links))):
+                    return False
+            for block, strings in self._lazy_block_strings.items():
+                if block.get_strings(self) != strings:
+                    return False
+            return True
+
+        def _write_lazy(self, stream):
+            """Write the blocks in the order in which they were read,
+            copying the raw data of blocks which were never decoded.
+
+            :param stream: The stream to which to write.
+            :type stream: file
+            """
+            logger = logging.getLogger("pyffi.nif.data")
+            self.blocks = list(self._lazy_blocks)
+            self._block_index_dct = dict(
+                (block, i) for i, block in enumerate(self.blocks))
+            # keep the original string indices
+            self._string_list = list(self._lazy_strings)
+
+            self.header.user_version = self.user_version
+            self.header.user_version_2 = self.user_version_2
+            self.header.num_strings = len(self._string_list)
+            if self._string_list:
+                self.header.max_string_length = max([len(s) for s in self._string_list])
+            else:
+                self.header.max_string_length = 0
+            self._string_index_dct = dict(
+                (s, i) for i, s in enumerate(self._string_list))
+            self.header.strings.update_size()
+            for i, s in enumerate(self._string_list):
+                self.header.strings[i] = s
+
+            ftr = NifFormat.Footer()
+            ftr.num_roots = len(self.roots)
+            ftr.roots.update_size()
+            for i, root in enumerate(self.roots):
+                ftr.roots[i] = root
+
+            # write the blocks to a buffer, recording their sizes for
+            # the header as they are written
+            block_stream = BytesIO()
+            for i, block in enumerate(self.blocks):
+                source = getattr(block, "_lazy_source", None)
+                if source is not None:
+                    _, _, offset, size, _ = source
+                    block_stream.write(self._lazy_buffer[offset:offset + size])
+                    self.header.block_size[i] = size
+                else:
+                    logger.debug("Writing %s block" % block.__class__.__name__)
+                    offset = block_stream.tell()
+                    block.write(block_stream, self)
+                    self.header.block_size[i] = block_stream.tell() - offset
+            ftr.write(block_stream, self)
+
+            logger.debug("Writing header")
+            header_stream = BytesIO()
+            self.header.write(header_stream, self)
+            stream.write(header_stream.getvalue())
+            stream.write(block_stream.getvalue())
 
         def write(self, stream):
             """Write a NIF file. The L{header} and the L{blocks} are recalculated
             from the tree at L{roots} (e.g. list of block types, number of blocks,
             list of block types, list of strings, list of block sizes etc.).
 
+            If the data was read lazily, and no links or strings have changed,
+            then the blocks are written in their original order, and
+            blocks which were never used are copied without decoding
+            them.
+
             :param stream: The stream to which to write.
             :type stream: file
             """
             logger = logging.getLogger("pyffi.nif.data")
+            if self._lazy_blocks is not None:
+                if self._can_write_lazy():
+                    self._write_lazy(stream)
+                    return
+                self._decode_lazy_blocks()
             # set up index and type dictionary
             self.blocks = [] # list of all blocks to be written
             self._block_index_dct = {} # maps block to block index
             block_type_list = [] # list of all block type strings
             block_type_dct = {} # maps block to block type string index
-            self._string_list = []
+            block_type_index_dct = {} # maps block type string to its index
             for root in self.roots:
                 self._makeBlockList(root,
                                     self._block_index_dct,
-                                    block_type_list, block_type_dct)
-                for block in root.tree():
-                    self._string_list.extend(
-                        block.get_strings(self))
-            self._string_list = list(set(self._string_list)) # ensure unique elements
-            #print(self._string_list) # debug
+                                    block_type_list, block_type_dct,
+                                    block_type_index_dct)
+            strings = set()
+            for block in self.blocks:
+                strings.update(block.get_strings(self))
+            self._string_list = list(strings)
+            self._string_index_dct = dict(
+                (s, i) for i, s in enumerate(self._string_list))
 
             self.header.user_version = self.user_version # TODO dedicated type for user_version similar to FileVersion
             # for oblivion CS; apparently this is the version of the bhk blocks
@@ -1482,10 +2203,6 @@ class NifFormat(FileFormat):
             for i, s in enumerate(self._string_list):
                 self.header.strings[i] = s
             self.header.block_size.update_size()
-            for i, block in enumerate(self.blocks):
-                self.header.block_size[i] = block.get_size(data=self)
-            #if verbose >= 2:
-            #    print(hdr)
 
             # set up footer
             ftr = NifFormat.Footer()
@@ -1494,42 +2211,53 @@ class NifFormat(FileFormat):
             for i, root in enumerate(self.roots):
                 ftr.roots[i] = root
 
-            # write the file
-            logger.debug("Writing header")
-            #logger.debug("%s" % self.header)
-            self.header.write(stream, self)
-            for block in self.blocks:
+            # write the blocks to a buffer, recording their sizes for
+            # the header as they are written
+            roots = set(id(root) for root in self.roots)
+            block_stream = BytesIO()
+            for i, block in enumerate(self.blocks):
                 # signal top level object if block is a root object
-                if self.version < 0x0303000D and block in self.roots:
+                if self.version < 0x0303000D and id(block) in roots:
                     s = NifFormat.SizedString()
                     s.set_value("Top Level Object")
-                    s.write(stream, self)
+                    s.write(block_stream, self)
                 if self.version >= 0x05000001:
                     if self.version <= 0x0A01006A:
                         # write zero dummy separator
-                        stream.write('\x00\x00\x00\x00'.encode("ascii"))
+                        block_stream.write('\x00\x00\x00\x00'.encode("ascii"))
                 else:
                     # write block type string
                     s = NifFormat.SizedString()
                     assert(block_type_list[block_type_dct[block]]
                            == block.__class__.__name__) # debug
                     s.set_value(block.__class__.__name__)
-                    s.write(stream, self)
+                    s.write(block_stream, self)
                 # write block index
                 logger.debug("Writing %s block" % block.__class__.__name__)
                 if self.version < 0x0303000D:
-                    stream.write(struct.pack(self._byte_order + 'i',
-                                             self._block_index_dct[block]))
+                    block_stream.write(struct.pack(self._byte_order + 'i',
+                                                   self._block_index_dct[block]))
                 # write block
-                block.write(stream, self)
+                offset = block_stream.tell()
+                block.write(block_stream, self)
+                self.header.block_size[i] = block_stream.tell() - offset
             if self.version < 0x0303000D:
                 s = NifFormat.SizedString()
                 s.set_value("End Of File")
-                s.write(stream, self)
-            ftr.write(stream, self)
+                s.write(block_stream, self)
+            ftr.write(block_stream, self)
+
+            # write the file
+            logger.debug("Writing header")
+            #logger.debug("%s" % self.header)
+            header_stream = BytesIO()
+            self.header.write(header_stream, self)
+            stream.write(header_stream.getvalue())
+            stream.write(block_stream.getvalue())
 
         def _makeBlockList(
-            self, root, block_index_dct, block_type_list, block_type_dct):
+            self, root, block_index_dct, block_type_list, block_type_dct,
+            block_type_index_dct=None):
             """This is a helper function for write to set up the list of all blocks,
             the block index map, and the block type map.
 
@@ -1544,6 +2272,9 @@ class NifFormat(FileFormat):
             :param block_type_dct: Dictionary mapping blocks in self.blocks to
                 their block type index.
             :type block_type_dct: dict
+            :param block_type_index_dct: Dictionary mapping block types in
+                block_type_list to their index.
+            :type block_type_index_dct: dict
             """
 
             def _blockChildBeforeParent(block):
@@ -1559,50 +2290,67 @@ class NifFormat(FileFormat):
                 return (isinstance(block, NifFormat.bhkRefObject)
                         and not isinstance(block, NifFormat.bhkConstraint))
 
-            # block already listed? if so, return
-            if root in self.blocks:
-                return
-            # add block type to block type dictionary
-            block_type = root.__class__.__name__
-            # special case: NiDataStream stores part of data in block type list
-            if block_type == "NiDataStream":
-                block_type = ("NiDataStream\x01%i\x01%i"
-                              % (root.usage, root.access.get_attributes_values(self)))
-            try:
-                block_type_dct[root] = block_type_list.index(block_type)
-            except ValueError:
-                block_type_dct[root] = len(block_type_list)
-                block_type_list.append(block_type)
-
-            # special case: add bhkConstraint entities before bhkConstraint
-            # (these are actually links, not refs)
-            if isinstance(root, NifFormat.bhkConstraint):
-                for entity in root.entities:
-                    if entity is not None:
-                        self._makeBlockList(
-                            entity, block_index_dct, block_type_list, block_type_dct)
-
-            children_left = []
-            # add children that come before the block
-            # store any remaining children in children_left (processed later)
-            for child in root.get_refs(data=self):
-                if _blockChildBeforeParent(child):
-                    self._makeBlockList(
-                        child, block_index_dct, block_type_list, block_type_dct)
-                else:
-                    children_left.append(child)
+            def _addBlock(block):
+                """Add a block to the block list, yielding each child
+                that must be added (along with its own children) at
+                that point.
+                """
+                # block already listed? if so, return
+                if block in block_index_dct:
+                    return
+                # add block type to block type dictionary
+                block_type = block.__class__.__name__
+                # special case: NiDataStream stores part of data in block type list
+                if block_type == "NiDataStream":
+                    block_type = ("NiDataStream\x01%i\x01%i"
+                                  % (block.usage, block.access.get_attributes_values(self)))
+                try:
+                    block_type_dct[block] = block_type_index_dct[block_type]
+                except KeyError:
+                    block_type_dct[block] = len(block_type_list)
+                    block_type_index_dct[block_type] = len(block_type_list)
+                    block_type_list.append(block_type)
+
+                # special case: add bhkConstraint entities before bhkConstraint
+                # (these are actually links, not refs)
+                if isinstance(block, NifFormat.bhkConstraint):
+                    for entity in block.entities:
+                        if entity is not None:
+                            yield entity
+
+                children_left = []
+                # add children that come before the block
+                # store any remaining children in children_left (processed later)
+                for child in block.get_refs(data=self):
+                    if _blockChildBeforeParent(child):
+                        yield child
+                    else:
+                        children_left.append(child)
 
-            # add the block
-            if self.version >= 0x0303000D:
-                block_index_dct[root] = len(self.blocks)
-            else:
-                block_index_dct[root] = id(root)
-            self.blocks.append(root)
+                # add the block
+                if self.version >= 0x0303000D:
+                    block_index_dct[block] = len(self.blocks)
+                else:
+                    block_index_dct[block] = id(block)
+                self.blocks.append(block)
 
-            # add children that come after the block
-            for child in children_left:
-                self._makeBlockList(
-                    child, block_index_dct, block_type_list, block_type_dct)
+                # add children that come after the block
+                for child in children_left:
+                    yield child
+
+            if block_type_index_dct is None:
+                block_type_index_dct = dict(
+                    (block_type, i)
+                    for i, block_type in enumerate(block_type_list))
+            # walk the tree with a stack rather than by recursion, so
+            # long chains of blocks do not hit the recursion limit
+            stack = [_addBlock(root)]
+            while stack:
+                for child in stack[-1]:
+                    stack.append(_addBlock(child))
+                    break
+                else:
+                    stack.pop()
 
     # extensions of generated structures
 
@@ -2459,54 +3207,20 @@ class NifFormat(FileFormat):
                 raise ValueError(
                     "expected bhkPackedNiTriStripsShape on mopp"
                     " but got %s instead" % self.shape.__class__.__name__)
-            # first try with pyffi.utils.mopp
-            failed = False
+            self.update_origin_scale()
             try:
-                print(pyffi.utils.mopp.getMopperCredits())
-            except (OSError, RuntimeError):
-                failed = True
-            else:
-                # find material indices per triangle
-                material_per_vertex = []
-                for subshape in self.shape.get_sub_shapes():
-                    material_per_vertex += (
-                        [subshape.material] * subshape.num_vertices)
-                material_per_triangle = [
-                    material_per_vertex[hktri.triangle.v_1]
-                    for hktri in self.shape.data.triangles]
-                # compute havok info
-                try:
-                    origin, scale, mopp, welding_infos \
-                    = pyffi.utils.mopp.getMopperOriginScaleCodeWelding(
-                        [vert.as_tuple() for vert in self.shape.data.vertices],
-                        [(hktri.triangle.v_1,
-                          hktri.triangle.v_2,
-                          hktri.triangle.v_3)
-                         for hktri in self.shape.data.triangles],
-                        material_per_triangle)
-                except (OSError, RuntimeError):
-                    failed = True
-                else:
-                    # must use calculated scale and origin
-                    self.scale = scale
-                    self.origin.x = origin[0]
-                    self.origin.y = origin[1]
-                    self.origin.z = origin[2]
-            # if havok's mopper failed, do a simple mopp
-            if failed:
+                mopp = self._makeMopp()
+            except ValueError:
                 logger.exception(
-                    "Havok mopp generator failed, falling back on simple mopp "
-                    "(but collisions may be flawed in-game!)."
-                    "If you are using the PyFFI that was shipped with Blender, "
-                    "and you are on Windows, then you may wish to install the "
-                    "full version of PyFFI from "
-                    "https://github.com/niftools/pyffi "
-                    "instead, which includes the (closed source) "
-                    "Havok mopp generator.")
-                self.update_origin_scale()
+                    "Mopp tree generation failed, falling back on simple mopp "
+                    "(but collisions may be slow in-game!).")
                 mopp = self._makeSimpleMopp()
-                # no welding info
-                welding_infos = []
+            welding_infos = pyffi.utils.mopp.getWeldingInfo(
+                [vert.as_tuple() for vert in self.shape.data.vertices],
+                [(hktri.triangle.v_1,
+                  hktri.triangle.v_2,
+                  hktri.triangle.v_3)
+                 for hktri in self.shape.data.triangles])
 
             # delete mopp and replace with new data
             self.mopp_data_size = len(mopp)
@@ -2518,6 +3232,33 @@ class NifFormat(FileFormat):
             for hktri, welding_info in zip(self.shape.data.triangles, welding_infos):
                 hktri.welding_info = welding_info
 
+        def _makeMopp(self):
+            """Make a mopp from a tree of quantized bounding box tests,
+            which splits the triangles until each leaf holds a single
+            triangle.
+            """
+            self._q = 256*256 / self.scale # quantization factor
+            self._vertsceil  = [ self._moppCeil(v) for v in self.shape.data.vertices ]
+            self._vertsfloor = [ self._moppFloor(v) for v in self.shape.data.vertices ]
+            if min(min(v) for v in self._vertsfloor) < 0:
+                raise ValueError("cannot update mopp tree with invalid origin")
+            if max(max(v) for v in self._vertsceil) > 255:
+                raise ValueError("cannot update mopp tree with invalid scale")
+            # quantized bounds of each triangle
+            self._trisfloor = []
+            self._trisceil = []
+            for hktri in self.shape.data.triangles:
+                verts = (hktri.triangle.v_1, hktri.triangle.v_2, hktri.triangle.v_3)
+                self._trisfloor.append(
+                    [min(self._vertsfloor[v][i] for v in verts) for i in range(3)])
+                self._trisceil.append(
+                    [max(self._vertsceil[v][i] for v in verts) for i in range(3)])
+            tris = list(range(len(self.shape.data.triangles)))
+            if not tris:
+                raise ValueError("cannot make mopp tree without triangles")
+            tree = self.split_triangles(tris, [[0, 255], [0, 255], [0, 255]], None)
+            return self.mopp_from_tree(tree)
+
         def _makeSimpleMopp(self):
             """Make a simple mopp."""
             mopp = [] # the mopp 'assembly' script
@@ -2546,12 +3287,6 @@ class NifFormat(FileFormat):
             mopp.extend([BOUNDY, miny, maxy])
             mopp.extend([BOUNDX, minx, maxx])
 
-            # add tree using subsequent X-Y-Z splits
-            # (slow and no noticable difference from other simple tree so deactivated)
-            #tris = range(len(self.shape.data.triangles))
-            #tree = self.split_triangles(tris, [[minx,maxx],[miny,maxy],[minz,maxz]])
-            #mopp += self.mopp_from_tree(tree)
-
             # add a trivial tree
             # this prevents the player of walking through the model
             # but arrows may still fly through
@@ -2579,83 +3314,163 @@ class NifFormat(FileFormat):
             moppz = int((v.z - 0.1 - self.origin.z) / self._q)
             return [moppx, moppy, moppz]
 
-        def split_triangles(self, ts, bbox, dir=0):
-            """Direction 0=X, 1=Y, 2=Z"""
+        def split_triangles(self, ts, bbox, dir=0, toffset=0):
+            """Build a tree of bounding box tests and branches over the
+            triangles ts, which lie in the quantized bounding box bbox.
+            Triangles are split in two halves along direction dir
+            (0=X, 1=Y, 2=Z), which alternates in subtrees; if dir is None,
+            every split is along the direction in which the halves overlap
+            least. The triangle offset toffset is increased where this
+            shortens the triangle indices of the tree.
+            """
             btest = [] # for bounding box tests
             test = [] # for branch command
             # check bounding box
-            tris = [ t.triangle for t in self.shape.data.triangles ]
-            tsverts = [ tris[t].v_1 for t in ts] + [ tris[t].v_2 for t in ts] + [ tris[t].v_3 for t in ts]
-            minx = min([self._vertsfloor[v][0] for v in tsverts])
-            miny = min([self._vertsfloor[v][1] for v in tsverts])
-            minz = min([self._vertsfloor[v][2] for v in tsverts])
-            maxx = max([self._vertsceil[v][0] for v in tsverts])
-            maxy = max([self._vertsceil[v][1] for v in tsverts])
-            maxz = max([self._vertsceil[v][2] for v in tsverts])
+            bounds = [[min(self._trisfloor[t][i] for t in ts),
+                       max(self._trisceil[t][i] for t in ts)]
+                      for i in range(3)]
             # add bounding box checks if it's reduced in a direction
-            if (maxx - minx < bbox[0][1] - bbox[0][0]):
-                btest += [ 0x26, minx, maxx ]
-                bbox[0][0] = minx
-                bbox[0][1] = maxx
-            if (maxy - miny < bbox[1][1] - bbox[1][0]):
-                btest += [ 0x27, miny, maxy ]
-                bbox[1][0] = miny
-                bbox[1][1] = maxy
-            if (maxz - minz < bbox[2][1] - bbox[2][0]):
-                btest += [ 0x28, minz, maxz ]
-                bbox[2][0] = minz
-                bbox[2][1] = maxz
+            for i, (minv, maxv) in enumerate(bounds):
+                if maxv - minv < bbox[i][1] - bbox[i][0]:
+                    btest += [ 0x26 + i, minv, maxv ]
+                    bbox[i][0] = minv
+                    bbox[i][1] = maxv
+            # increase triangle offset if it saves bytes
+            tmin = min(ts)
+            tsize = self._moppTriangleSize
+            saved = len(ts) * (tsize(max(ts) - toffset) - tsize(max(ts) - tmin))
+            if tmin - toffset < 256 and saved > 2:
+                btest += [ 0x09, tmin - toffset ]
+                toffset = tmin
+            elif tmin - toffset < 65536 and saved > 3:
+                btest += [ 0x0A, (tmin - toffset) >> 8, (tmin - toffset) & 255 ]
+                toffset = tmin
             # if only one triangle, no further split needed
             if len(ts) == 1:
-                if ts[0] < 32:
-                    return [ btest, [ 0x30 + ts[0] ], [], [] ]
-                elif ts[0] < 256:
-                    return [ btest, [ 0x50, ts[0] ], [], [] ]
+                t = ts[0] - toffset
+                if t < 32:
+                    return [ btest, [ 0x30 + t ], [], [] ]
+                elif t < 256:
+                    return [ btest, [ 0x50, t ], [], [] ]
+                elif t < 65536:
+                    return [ btest, [ 0x51, t >> 8, t & 255 ], [], [] ]
                 else:
-                    return [ btest, [ 0x51, ts[0] >> 8, ts[0] & 255 ], [], [] ]
-            # sort triangles in required direction
-            ts.sort(key = lambda t: max(self._vertsceil[tris[t].v_1][dir], self._vertsceil[tris[t].v_2][dir], self._vertsceil[tris[t].v_3][dir]))
-            # split into two
-            ts1 = ts[:len(ts)/2]
-            ts2 = ts[len(ts)/2:]
-            # get maximum coordinate of small group
-            ts1verts = [ tris[t].v_1 for t in ts1] + [ tris[t].v_2 for t in ts1] + [ tris[t].v_3 for t in ts1]
-            ts2verts = [ tris[t].v_1 for t in ts2] + [ tris[t].v_2 for t in ts2] + [ tris[t].v_3 for t in ts2]
-            ts1max = max([self._vertsceil[v][dir] for v in ts1verts])
-            # get minimum coordinate of large group
-            ts2min = min([self._vertsfloor[v][dir] for v in ts2verts])
+                    raise ValueError("too many triangles for mopp")
+            splits = []
+            for splitdir in (range(3) if dir is None else [dir]):
+                # sort triangles by their center in required direction
+                ts = sorted(ts, key=lambda t: self._trisfloor[t][splitdir] + self._trisceil[t][splitdir])
+                # split into two
+                ts1 = ts[:len(ts) // 2]
+                ts2 = ts[len(ts) // 2:]
+                # get maximum coordinate of small group
+                ts1max = max(self._trisceil[t][splitdir] for t in ts1)
+                # get minimum coordinate of large group
+                ts2min = min(self._trisfloor[t][splitdir] for t in ts2)
+                splits.append((ts1max - ts2min, splitdir, ts1, ts2, ts1max, ts2min))
+            overlap, splitdir, ts1, ts2, ts1max, ts2min = min(
+                splits, key=lambda split: split[:2])
+            nextdir = None if dir is None else (dir + 1) % 3
             # set up test
-            test += [0x10+dir, ts1max, ts2min]
+            test += [0x10+splitdir, ts1max, ts2min]
             # set up new bounding boxes for each subtree
             # make copy
             bbox1 = [[bbox[0][0],bbox[0][1]],[bbox[1][0],bbox[1][1]],[bbox[2][0],bbox[2][1]]]
             bbox2 = [[bbox[0][0],bbox[0][1]],[bbox[1][0],bbox[1][1]],[bbox[2][0],bbox[2][1]]]
             # update bound in test direction
-            bbox1[dir][1] = ts1max
-            bbox2[dir][0] = ts2min
+            bbox1[splitdir][1] = ts1max
+            bbox2[splitdir][0] = ts2min
             # return result
-            nextdir = dir+1
-            if nextdir == 3: nextdir = 0
-            return [btest, test, self.split_triangles(ts1, bbox1, nextdir), self.split_triangles(ts2, bbox2, nextdir)]
+            return [btest, test, self.split_triangles(ts1, bbox1, nextdir, toffset), self.split_triangles(ts2, bbox2, nextdir, toffset)]
 
-        def mopp_from_tree(self, tree):
-            if tree[1][0] in range(0x30, 0x52):
-                return tree[0] + tree[1]
-            mopp = tree[0] + tree[1]
-            submopp1 = self.mopp_from_tree(tree[2])
-            submopp2 = self.mopp_from_tree(tree[3])
-            if len(submopp1) < 256:
-                mopp += [ len(submopp1) ]
-                mopp += submopp1
-                mopp += submopp2
+        @staticmethod
+        def _moppTriangleSize(t):
+            """Number of bytes to store triangle index t in a mopp."""
+            if t < 32:
+                return 1
+            elif t < 256:
+                return 2
             else:
-                jump = len(submopp2)
-                if jump <= 255:
-                    mopp += [2, 0x05, jump]
+                return 3
+
+        def mopp_from_tree(self, tree):
+            """Return the mopp code of a tree from split_triangles.
+
+            Branches jump over their first subtree to their second
+            subtree, through a short jump if it is too far for the branch
+            itself, or through a chain of short jumps placed between leafs
+            if it is too far for a single jump.
+            """
+            # flatten the tree into a list of items [code, target, long],
+            # where target is the item to jump to (if any), and long is
+            # True if the jump does not fit in the branch command
+            items = []
+            def flatten(tree):
+                item = [tree[0] + tree[1], None, False]
+                items.append(item)
+                if tree[1][0] not in range(0x30, 0x52):
+                    flatten(tree[2])
+                    item[1] = flatten(tree[3])
+                return item
+            flatten(tree)
+            def size(item):
+                if item[1] is None:
+                    return len(item[0])
+                elif not item[0]:
+                    return 3
+                elif item[2]:
+                    return len(item[0]) + 6
+                else:
+                    return len(item[0]) + 1
+            # lengthen jumps until they all fit
+            changed = True
+            while changed:
+                changed = False
+                ends = []
+                end = 0
+                for item in items:
+                    end += size(item)
+                    ends.append(end)
+                starts = dict((id(item), end - size(item))
+                              for item, end in zip(items, ends))
+                # code after a leaf or a jump is only reached by jumping
+                slots = [index for index in range(1, len(items))
+                         if items[index - 1][1] is None
+                         or not items[index - 1][0]]
+                slot_starts = [ends[index - 1] for index in slots]
+                relays = []
+                for item, end in zip(items, ends):
+                    if item[1] is None:
+                        continue
+                    jump = starts[id(item[1])] - end
+                    if item[0] and not item[2] and jump > 255:
+                        item[2] = True
+                        changed = True
+                    elif jump > 65535:
+                        index = bisect.bisect_right(
+                            slot_starts, end + 65535 - 4096) - 1
+                        if index < 0 or slot_starts[index] <= end:
+                            raise ValueError("mopp tree too large")
+                        # jump to the target via an extra jump
+                        relay = [[], item[1], True]
+                        relays.append((slots[index], relay))
+                        item[1] = relay
+                        changed = True
+                for index, relay in sorted(relays, key=lambda x: -x[0]):
+                    items.insert(index, relay)
+            # get the code
+            mopp = []
+            for item, end in zip(items, ends):
+                mopp += item[0]
+                if item[1] is None:
+                    continue
+                jump = starts[id(item[1])] - end
+                if item[0] and not item[2]:
+                    mopp += [ jump ]
+                elif item[0]:
+                    mopp += [ 2, 0x05, 3, 0x06, jump >> 8, jump & 255 ]
                 else:
-                    mopp += [3, 0x06, jump >> 8, jump & 255]
-                mopp += submopp2
-                mopp += submopp1
+                    mopp += [ 0x06, jump >> 8, jump & 255 ]
             return mopp
 
         # ported and extended from NifVis/bhkMoppBvTreeShape.py
@@ -3055,6 +3870,54 @@ class NifFormat(FileFormat):
                                 for value
                                 in self.data.vertices[vert_index].as_list())
 
+        def get_vertex_map(self, vertexprecision=3, subshape_index=None):
+            """Return a map and inverse map to identify unique vertices,
+            as :func:`pyffi.utils.unique_map` does for
+            :meth:`get_vertex_hash_generator` with the same arguments,
+            but faster, as all vertices are compared at once if numpy
+            is available.
+
+            >>> shape = NifFormat.bhkPackedNiTriStripsShape()
+            >>> data = NifFormat.hkPackedNiTriStripsData()
+            >>> shape.data = data
+            >>> shape.num_sub_shapes = 2
+            >>> shape.sub_shapes.update_size()
+            >>> data.num_vertices = 3
+            >>> shape.sub_shapes[0].num_vertices = 2
+            >>> shape.sub_shapes[1].num_vertices = 1
+            >>> data.vertices.update_size()
+            >>> shape.get_vertex_map()
+            ([0, 0, 1], [0, 2])
+            >>> shape.get_vertex_map(subshape_index=0)
+            ([0, 0], [0])
+
+            :param vertexprecision: Precision to be used for vertices.
+            :type vertexprecision: float
+            :return: The map from old to new vertex index, and its
+                inverse, as lists.
+            """
+            if pyffi.utils.weld.numpy is None:
+                return pyffi.utils.unique_map(self.get_vertex_hash_generator(
+                    vertexprecision=vertexprecision,
+                    subshape_index=subshape_index))
+            num_vertices = [sub_shape.num_vertices
+                            for sub_shape in self.get_sub_shapes()]
+            vertices = self.data.vertices.get_attribute_values("x", "y", "z")
+            if subshape_index is None:
+                matids = [[matid] for matid, num in enumerate(num_vertices)
+                          for i in range(num)]
+                # vertices not in any subshape are not yielded
+                # by get_vertex_hash_generator
+                vertices = vertices[:len(matids)]
+                matids = matids[:len(vertices)]
+                return pyffi.utils.weld.weld_map(
+                    (matids, 0), (vertices, vertexprecision))
+            else:
+                first_vertex = sum(num_vertices[:subshape_index])
+                vertices = vertices[
+                    first_vertex:first_vertex + num_vertices[subshape_index]]
+                return pyffi.utils.weld.weld_map((vertices, vertexprecision))
+
         def get_triangle_hash_generator(self):
             """Generator which produces a tuple of integers, or None
             in degenerate case, for each triangle to ease detection of
@@ -3964,6 +4827,11 @@ class NifFormat(FileFormat):
         >>> [prop.name for prop in node.properties]
         [b'hello', b'world']
         """
+
+        _transform_cache = None
+        """The :class:`NifFormat.Data.TransformCache` which keeps track of
+        the transform of this block, if any."""
+
         def add_property(self, prop):
             """Add the given property to the property list.
 
@@ -4013,6 +4881,13 @@ class NifFormat(FileFormat):
             :param relative_to: The block relative to which the transform must
                 be calculated. If ``None``, the local transform is returned.
             """
+            if relative_to:
+                # follow the parents recorded in the transform cache, if any
+                cache = self._transform_cache
+                if cache is not None and cache.is_valid():
+                    m = cache.get_transform(self, relative_to)
+                    if m is not None:
+                        return m
             m = NifFormat.Matrix44()
             m.set_scale_rotation_translation(self.scale, self.rotation, self.translation)
             if not relative_to: return m
@@ -4027,6 +4902,48 @@ class NifFormat(FileFormat):
                 m *= block.get_transform()
             return m
 
+        def get_transform_table(self):
+            """Return a dictionary which maps every NiAVObject in the tree
+            below this block to its transform relative to this block, that
+            is, to C{block.get_transform(self)}, calculated in a single
+            traversal of the tree instead of a search for every block.
+
+            >>> from pyffi.formats.nif import NifFormat
+            >>> root = NifFormat.NiNode()
+            >>> child = NifFormat.NiNode()
+            >>> grandchild = NifFormat.NiNode()
+            >>> root.add_child(child)
+            >>> child.add_child(grandchild)
+            >>> child.translation.x = 1.0
+            >>> grandchild.translation.x = 2.0
+            >>> transforms = root.get_transform_table()
+            >>> transforms[grandchild].get_translation().x
+            3.0
+            >>> transforms[grandchild] == grandchild.get_transform(root)
+            True
+
+            :return: The transform of every block in the tree.
+            :rtype: ``dict`` mapping L{NifFormat.NiAVObject} to
+                L{NifFormat.Matrix44}
+            """
+            transforms = {self: self.get_transform()}
+            identity = NifFormat.Matrix44()
+            identity.set_identity()
+            # depth first, so blocks that occur more than once get the
+            # transform along the chain that find_chain finds
+            stack = [(self, identity)]
+            while stack:
+                block, transform = stack.pop()
+                if block is not self:
+                    if block in transforms:
+                        continue
+                    transform = block.get_transform() * transform
+                    transforms[block] = transform
+                stack.extend(
+                    (child, transform) for child in reversed(block.get_refs())
+                    if isinstance(child, NifFormat.NiAVObject))
+            return transforms
+
         def set_transform(self, m):
             """Set rotation, translation, and scale, from a 4x4 matrix.
 
@@ -4433,6 +5350,41 @@ class NifFormat(FileFormat):
             self.center.z *= scale
             self.radius *= scale
 
+        def apply_transform(self, m):
+            """Multiply all vertices with the matrix, and all normals with
+            its 3x3 part.
+
+            >>> from pyffi.formats.nif import NifFormat
+            >>> geomdata = NifFormat.NiGeometryData()
+            >>> geomdata.num_vertices = 1
+            >>> geomdata.has_vertices = True
+            >>> geomdata.has_normals = True
+            >>> geomdata.vertices.update_size()
+            >>> geomdata.normals.update_size()
+            >>> geomdata.vertices[0].x = 1.0
+            >>> geomdata.normals[0].z = 1.0
+            >>> m = NifFormat.Matrix44()
+            >>> m.set_identity()
+            >>> m.m_11 = 2.0
+            >>> m.m_43 = 5.0
+            >>> geomdata.apply_transform(m)
+            >>> geomdata.vertices[0].as_tuple()
+            (2.0, 0.0, 5.0)
+            >>> geomdata.normals[0].as_tuple()
+            (0.0, 0.0, 1.0)
+
+            :param m: The matrix.
+            :type m: L{NifFormat.Matrix44}
+            """
+            for vectors, matrix in ((self.vertices, m.as_list()),
+                                    (self.normals, m.get_matrix_33().as_list())):
+                if vectors:
+                    vectors.set_attribute_values(
+                        ("x", "y", "z"),
+                        pyffi.utils.skinning.transform_vertices(
+                            vectors.get_attribute_values("x", "y", "z"),
+                            matrix))
+
         def get_vertex_hash_generator(
             self,
             vertexprecision=3, normalprecision=3,
@@ -4488,6 +5440,61 @@ class NifFormat(FileFormat):
                                         vcols[i].b, vcols[i].a]])
                 yield tuple(h)
 
+        def get_vertex_map(
+            self,
+            vertexprecision=3, normalprecision=3,
+            uvprecision=5, vcolprecision=3):
+            """Return a map and inverse map to identify unique vertices,
+            as :func:`pyffi.utils.unique_map` does for
+            :meth:`get_vertex_hash_generator` with the same precisions,
+            but faster, as all vertices are compared at once if numpy
+            is available.
+
+            >>> from pyffi.formats.nif import NifFormat
+            >>> geomdata = NifFormat.NiTriShapeData()
+            >>> geomdata.num_vertices = 4
+            >>> geomdata.has_vertices = True
+            >>> geomdata.has_normals = True
+            >>> geomdata.vertices.update_size()
+            >>> geomdata.normals.update_size()
+            >>> geomdata.vertices[1].x = 1.0
+            >>> geomdata.vertices[2].x = 1.0001
+            >>> geomdata.normals[3].z = 1.0
+            >>> geomdata.get_vertex_map()
+            ([0, 1, 1, 2], [0, 1, 3])
+
+            :return: The map from old to new vertex index, and its
+                inverse, as lists.
+            """
+            if pyffi.utils.weld.numpy is None:
+                return pyffi.utils.unique_map(self.get_vertex_hash_generator(
+                    vertexprecision=vertexprecision,
+                    normalprecision=normalprecision,
+                    uvprecision=uvprecision,
+                    vcolprecision=vcolprecision))
+            columns = []
+            if self.has_vertices:
+                columns.append((
+                    self.vertices.get_attribute_values("x", "y", "z"),
+                    vertexprecision))
+            if self.has_normals:
+                columns.append((
+                    self.normals.get_attribute_values("x", "y", "z"),
+                    normalprecision))
+            for uvset in self.uv_sets:
+                columns.append((
+                    uvset.get_attribute_values("u", "v"), uvprecision))
+            if self.has_vertex_colors:
+                columns.append((
+                    self.vertex_colors.get_attribute_values(
+                        "r", "g", "b", "a"),
+                    vcolprecision))
+            if not columns:
+                # nothing to compare: all vertices are the same
+                return pyffi.utils.unique_map(
+                    () for i in range(self.num_vertices))
+            return pyffi.utils.weld.weld_map(*columns)
+
     class NiGeometry:
         """
         >>> from pyffi.formats.nif import NifFormat
@@ -4687,23 +5694,39 @@ class NifFormat(FileFormat):
             skindata = skininst.data
             skelroot = skininst.skeleton_root
 
-            vertices = [ NifFormat.Vector3() for i in range(self.data.num_vertices) ]
-            normals = [ NifFormat.Vector3() for i in range(self.data.num_vertices) ]
-            sumweights = [ 0.0 for i in range(self.data.num_vertices) ]
+            # transforms of all bones, calculated in a single traversal
+            transforms = skelroot.get_transform_table()
             skin_offset = skindata.get_transform()
+            bone_weights = []
+            vertex_matrices = []
+            normal_matrices = []
             for i, bone_block in enumerate(skininst.bones):
                 bonedata = skindata.bone_list[i]
                 bone_offset = bonedata.get_transform()
-                bone_matrix = bone_block.get_transform(skelroot)
+                bone_matrix = transforms.get(bone_block)
+                if bone_matrix is None:
+                    bone_matrix = bone_block.get_transform(skelroot)
                 transform = bone_offset * bone_matrix * skin_offset
                 scale, rotation, translation = transform.get_scale_rotation_translation()
-                for skinweight in bonedata.vertex_weights:
-                    index = skinweight.index
-                    weight = skinweight.weight
-                    vertices[index] += weight * (self.data.vertices[index] * transform)
-                    if self.data.has_normals:
-                        normals[index] += weight * (self.data.normals[index] * rotation)
-                    sumweights[index] += weight
+                bone_weights.append(
+                    bonedata.vertex_weights.get_attribute_values(
+                        "index", "weight"))
+                vertex_matrices.append(transform.as_list())
+                normal_matrices.append(rotation.as_list())
+
+            skinned, sumweights = pyffi.utils.skinning.skin_vertices(
+                self.data.vertices.get_attribute_values("x", "y", "z"),
+                bone_weights, vertex_matrices)
+            vertices = [NifFormat.Vector3() for vertex in skinned]
+            for vector, (x, y, z) in zip(vertices, skinned):
+                vector.x, vector.y, vector.z = x, y, z
+            normals = [NifFormat.Vector3() for vertex in skinned]
+            if self.data.has_normals:
+                skinned = pyffi.utils.skinning.skin_vertices(
+                    self.data.normals.get_attribute_values("x", "y", "z"),
+                    bone_weights, normal_matrices)[0]
+                for vector, (x, y, z) in zip(normals, skinned):
+                    vector.x, vector.y, vector.z = x, y, z
 
             for i, s in enumerate(sumweights):
                 if abs(s - 1.0) > 0.01: 
@@ -4765,13 +5788,21 @@ class NifFormat(FileFormat):
             skindata = skininst.data
             skelroot = skininst.skeleton_root
 
+            # transforms relative to the skeleton root, in a single traversal
+            transforms = skelroot.get_transform_table()
+            def get_transform(block):
+                transform = transforms.get(block)
+                if transform is None:
+                    transform = block.get_transform(skelroot)
+                return transform
+
             # calculate overall offset
-            geomtransform = self.get_transform(skelroot)
+            geomtransform = get_transform(self)
             skindata.set_transform(geomtransform.get_inverse())
 
             # calculate bone offsets
             for i, bone in enumerate(skininst.bones):
-                 skindata.bone_list[i].set_transform(geomtransform * bone.get_transform(skelroot).get_inverse())
+                 skindata.bone_list[i].set_transform(geomtransform * get_transform(bone).get_inverse())
 
         def get_skin_partition(self):
             """Return the skin partition block."""
@@ -5146,16 +6177,24 @@ class NifFormat(FileFormat):
             bone_bind_transform = {}
             # find all skinned geometries with self as skeleton root
             geoms = list(self.get_skinned_geometries())
+            # geometry transforms relative to self, in a single traversal
+            transforms = self.get_transform_table()
+            geomtransforms = {}
+            for geom in geoms:
+                geomtransforms[geom] = transforms.get(geom)
+                if geomtransforms[geom] is None:
+                    geomtransforms[geom] = geom.get_transform(self)
             # sort geometries by bone level
             # this ensures that "parent" geometries serve as reference for "child"
             # geometries
+            geombones = [(geom, set(geom.skin_instance.bones)) for geom in geoms]
             sorted_geoms = []
             for bone in self.get_global_iterator():
                 if not isinstance(bone, NifFormat.NiNode):
                     continue
-                for geom in geoms:
+                for geom, bones in geombones:
                     if not geom in sorted_geoms:
-                        if bone in geom.skin_instance.bones:
+                        if bone in bones:
                             sorted_geoms.append(geom)
             geoms = sorted_geoms
             # now go over all geometries and synchronize their relative bind poses
@@ -5176,7 +6215,7 @@ class NifFormat(FileFormat):
                         # (see explanation below)
                         diff = (bonedata.get_transform()
                                 * bone_bind_transform[bonenode.name]
-                                * geom.get_transform(self).get_inverse(fast=False))
+                                * geomtransforms[geom].get_inverse(fast=False))
                         break
 
                 if diff.is_identity():
@@ -5209,16 +6248,7 @@ class NifFormat(FileFormat):
                                                * bonedata.get_transform())
                     # transform geometry
                     logger.debug("transforming vertices and normals")
-                    for vert in geom.data.vertices:
-                        newvert = vert * diff
-                        vert.x = newvert.x
-                        vert.y = newvert.y
-                        vert.z = newvert.z
-                    for norm in geom.data.normals:
-                        newnorm = norm * diff.get_matrix_33()
-                        norm.x = newnorm.x
-                        norm.y = newnorm.y
-                        norm.z = newnorm.z
+                    geom.data.apply_transform(diff)
 
                 # store updated bind position for future reference
                 for bonenode, bonedata in zip(skininst.bones, skindata.bone_list):
@@ -5227,7 +6257,7 @@ class NifFormat(FileFormat):
                         continue
                     bone_bind_transform[bonenode.name] = (
                         bonedata.get_transform().get_inverse(fast=False)
-                        * geom.get_transform(self))
+                        * geomtransforms[geom])
 
             # validation: check that bones share bind position
             bone_bind_transform = {}
@@ -5244,7 +6274,7 @@ class NifFormat(FileFormat):
                     if bonenode.name in bone_bind_transform:
                         # calculate difference
                         diff = ((bonedata.get_transform().get_inverse(fast=False)
-                                 * geom.get_transform(self))
+                                 * geomtransforms[geom])
                                 - bone_bind_transform[bonenode.name])
                         # calculate error (sup norm)
                         error = max(error,
@@ -5253,7 +6283,7 @@ class NifFormat(FileFormat):
                     else:
                         bone_bind_transform[bonenode.name] = (
                             bonedata.get_transform().get_inverse(fast=False)
-                            * geom.get_transform(self))
+                            * geomtransforms[geom])
 
             logger.debug("Geometry bind position error is %f" % error)
             if error > 1e-3:
@@ -5382,16 +6412,7 @@ class NifFormat(FileFormat):
                                               * bonedata.get_transform())
                     # transform geometry
                     logger.debug("transforming vertices and normals")
-                    for vert in geom.data.vertices:
-                        newvert = vert * diff
-                        vert.x = newvert.x
-                        vert.y = newvert.y
-                        vert.z = newvert.z
-                    for norm in geom.data.normals:
-                        newnorm = norm * diff.get_matrix_33()
-                        norm.x = newnorm.x
-                        norm.y = newnorm.y
-                        norm.z = newnorm.z
+                    geom.data.apply_transform(diff)
 
         def send_bones_to_bind_position(self):
             """This function will send all bones of geometries of this skeleton root
@@ -5404,8 +6425,15 @@ class NifFormat(FileFormat):
             """
             # get logger
             logger = logging.getLogger("pyffi.nif.ninode")
+            # transforms relative to self, in a single traversal
+            transforms = self.get_transform_table()
+            def get_transform(block):
+                transform = transforms.get(block)
+                if transform is None:
+                    transform = block.get_transform(self)
+                return transform
             # check all bones and bone datas to see if a bind position exists
-            bonelist = []
+            bonedict = {}
             error = 0.0
             geoms = list(self.get_skinned_geometries())
             for geom in geoms:
@@ -5416,24 +6444,21 @@ class NifFormat(FileFormat):
                     if not bonenode:
                         continue
                     # make sure all bone data of shared bones coincides
-                    for othergeom, otherbonenode, otherbonedata in bonelist:
-                        if bonenode is otherbonenode:
-                            diff = ((otherbonedata.get_transform().get_inverse(fast=False)
-                                     *
-                                     othergeom.get_transform(self))
-                                    -
-                                    (bonedata.get_transform().get_inverse(fast=False)
-                                     *
-                                     geom.get_transform(self)))
-                            if diff.sup_norm() > 1e-3:
-                                logger.warning("Geometries %s and %s do not share the same bind position: bone %s will be sent to a position matching only one of these" % (geom.name, othergeom.name, bonenode.name))
-                            # break the loop
-                            break
+                    if bonenode in bonedict:
+                        othergeom, otherbonedata = bonedict[bonenode]
+                        diff = ((otherbonedata.get_transform().get_inverse(fast=False)
+                                 *
+                                 get_transform(othergeom))
+                                -
+                                (bonedata.get_transform().get_inverse(fast=False)
+                                 *
+                                 get_transform(geom)))
+                        if diff.sup_norm() > 1e-3:
+                            logger.warning("Geometries %s and %s do not share the same bind position: bone %s will be sent to a position matching only one of these" % (geom.name, othergeom.name, bonenode.name))
                     else:
-                        # the loop did not break, so the bone was not yet added
-                        # add it now
+                        # the bone was not yet added, add it now
                         logger.debug("Found bind position data for %s" % bonenode.name)
-                        bonelist.append((geom, bonenode, bonedata))
+                        bonedict[bonenode] = (geom, bonedata)
 
             # the algorithm simply makes all transforms correct by changing
             # each local bone matrix in such a way that the global matrix
@@ -5441,14 +6466,13 @@ class NifFormat(FileFormat):
 
             # this algorithm is numerically most stable if bones are traversed
             # in hierarchical order, so first sort the bones
-            sorted_bonelist = []
+            bonelist = []
             for node in self.tree():
                 if not isinstance(node, NifFormat.NiNode):
                     continue
-                for geom, bonenode, bonedata in bonelist:
-                    if node is bonenode:
-                        sorted_bonelist.append((geom, bonenode, bonedata))
-            bonelist = sorted_bonelist
+                if node in bonedict:
+                    geom, bonedata = bonedict[node]
+                    bonelist.append((geom, node, bonedata))
             # now reposition the bones
             for geom, bonenode, bonedata in bonelist:
                 # explanation:
@@ -5459,9 +6483,9 @@ class NifFormat(FileFormat):
                 # calculate desired transform relative to skeleton root
                 # transform is DIFF * PARENT
                 transform = (bonedata.get_transform().get_inverse(fast=False)
-                             * geom.get_transform(self))
+                             * get_transform(geom))
                 # calculate difference
-                diff = transform * bonenode.get_transform(self).get_inverse(fast=False)
+                diff = transform * get_transform(bonenode).get_inverse(fast=False)
                 if not diff.is_identity():
                     logger.info("Sending %s to bind position"
                                 % bonenode.name)
@@ -5472,18 +6496,22 @@ class NifFormat(FileFormat):
                     for childnode in bonenode.children:
                         if childnode:
                             childnode.set_transform(childnode.get_transform() * diff_inv)
+                    # only the transform of this node has changed, the
+                    # transforms of its children are kept
+                    transforms[bonenode] = diff * get_transform(bonenode)
                 else:
                     logger.debug("%s is already in bind position"
                                  % bonenode.name)
 
             # validate
+            transforms = self.get_transform_table()
             error = 0.0
             diff_error = 0.0
             for geom in geoms:
                 skininst = geom.skin_instance
                 skindata = skininst.data
                 # calculate geometry transform
-                geomtransform = geom.get_transform(self)
+                geomtransform = get_transform(geom)
                 # check skin data fields (also see NiGeometry.update_bind_position)
                 for i, bone in enumerate(skininst.bones):
                     # bone can be None; see pyffi issue #3114079
@@ -5491,7 +6519,7 @@ class NifFormat(FileFormat):
                         continue
                     diff = ((skindata.bone_list[i].get_transform().get_inverse(fast=False)
                              * geomtransform)
-                            - bone.get_transform(self))
+                            - get_transform(bone))
                     # calculate error (sup norm)
                     diff_error = max(max(abs(elem) for elem in row)
                                      for row in diff.as_list())
@@ -5709,27 +6737,27 @@ class NifFormat(FileFormat):
             :param follow_all: If C{block_type} is not ``None``, then if this is ``True`` the function will parse the whole tree. Otherwise, the function will not follow branches that start by a non-C{block_type} block.
 
             :param unique: Whether the generator can return the same block twice or not."""
-            # unique blocks: reduce this to the case of non-unique blocks
-            if unique:
-                block_list = []
-                for block in self.tree(block_type = block_type, follow_all = follow_all, unique = False):
-                    if not block in block_list:
-                        yield block
-                        block_list.append(block)
-                return
-
-            # yield self
-            if not block_type:
-                yield self
-            elif isinstance(self, block_type):
-                yield self
-            elif not follow_all:
-                return # don't recurse further
-
-            # yield tree attached to each child
-            for child in self.get_refs():
-                for block in child.tree(block_type = block_type, follow_all = follow_all):
+            # walk the tree depth first with a stack of the blocks
+            # still to visit, so deep trees do not hit the recursion limit
+            visited = set()
+            stack = [self]
+            while stack:
+                block = stack.pop()
+                if unique:
+                    # skip blocks that were visited already, along with
+                    # their tree (which was visited as well)
+                    if id(block) in visited:
+                        continue
+                    visited.add(id(block))
+                # yield block
+                if not block_type:
+                    yield block
+                elif isinstance(block, block_type):
                     yield block
+                elif not follow_all:
+                    continue # don't recurse further
+                # visit the tree attached to each child, in order
+                stack.extend(reversed(block.get_refs()))
 
         def _validateTree(self):
             """Raises ValueError if there is a cycle in the tree."""
@@ -5738,11 +6766,11 @@ class NifFormat(FileFormat):
             # will visit some child more than once (and as a consequence, infinitely
             # many times). So, walk the reference tree and check that every block is
             # only visited once.
-            children = []
+            children = set()
             for child in self.tree():
-                if child in children:
+                if id(child) in children:
                     raise ValueError('cyclic references detected')
-                children.append(child)
+                children.add(id(child))
 
         def is_interchangeable(self, other):
             """Are the two blocks interchangeable?
@@ -5751,27 +6779,65 @@ class NifFormat(FileFormat):
             """
             if isinstance(self, (NifFormat.NiProperty, NifFormat.NiSourceTexture)):
                 # use hash for properties and source textures
+                NifFormat.Data.decode_block(self)
+                NifFormat.Data.decode_block(other)
                 return ((self.__class__ is other.__class__)
                         and (self.get_hash() == other.get_hash()))
             else:
                 # for blocks with references: quick check only
                 return self is other
 
+        def get_fingerprint(self):
+            """Get a hashable value such that interchangeable blocks
+            (see :meth:`is_interchangeable`) have the same fingerprint,
+            so candidates for merging can be found with a dictionary.
+
+            >>> from pyffi.formats.nif import NifFormat
+            >>> prop1 = NifFormat.NiAlphaProperty()
+            >>> prop2 = NifFormat.NiAlphaProperty()
+            >>> prop1.get_fingerprint() == prop2.get_fingerprint()
+            True
+            >>> prop2.threshold = 128
+            >>> prop1.get_fingerprint() == prop2.get_fingerprint()
+            False
+            >>> print(NifFormat.NiNode().get_fingerprint())
+            None
+
+            :return: The fingerprint, or ``None`` if the block is only
+                interchangeable with itself.
+            """
+            if isinstance(self, (NifFormat.NiProperty, NifFormat.NiSourceTexture)):
+                NifFormat.Data.decode_block(self)
+                return (self.__class__, self.get_hash())
+            else:
+                return None
+
     class NiMaterialProperty:
         def is_interchangeable(self, other):
             """Are the two material blocks interchangeable?"""
             specialnames = (b"envmap2", b"envmap", b"skin", b"hair",
                             b"dynalpha", b"hidesecret", b"lava")
+            NifFormat.Data.decode_block(self)
+            NifFormat.Data.decode_block(other)
             if self.__class__ is not other.__class__:
                 return False
-            if (self.name.lower() in specialnames
-                or other.name.lower() in specialnames):
+            names = (self.name.lower(), other.name.lower())
+            if (names[0] in specialnames
+                or names[1] in specialnames):
                 # do not ignore name
                 return self.get_hash() == other.get_hash()
             else:
                 # ignore name
                 return self.get_hash()[1:] == other.get_hash()[1:]
 
+        def get_fingerprint(self):
+            specialnames = (b"envmap2", b"envmap", b"skin", b"hair",
+                            b"dynalpha", b"hidesecret", b"lava")
+            if self.name.lower() in specialnames:
+                return (self.__class__, True, self.get_hash())
+            else:
+                return (self.__class__, False, self.get_hash()[1:])
+
     class ATextureRenderData:
         def save_as_dds(self, stream):
             """Save image as DDS file."""
@@ -6013,6 +7079,8 @@ class NifFormat(FileFormat):
                 return False
 
             # check class
+            NifFormat.Data.decode_block(self)
+            NifFormat.Data.decode_block(other)
             if (not isinstance(self, other.__class__)
                 or not isinstance(other, self.__class__)):
                 return False
@@ -6026,29 +7094,52 @@ class NifFormat(FileFormat):
                     return False
 
             # check vertices (this includes uvs, vcols and normals)
-            verthashes1 = [hsh for hsh in self.get_vertex_hash_generator()]
-            verthashes2 = [hsh for hsh in other.get_vertex_hash_generator()]
-            for hash1 in verthashes1:
-                if not hash1 in verthashes2:
-                    return False
-            for hash2 in verthashes2:
-                if not hash2 in verthashes1:
-                    return False
+            # and triangles
+            return self.get_fingerprint() == other.get_fingerprint()
 
-            # check triangle list
-            triangles1 = [tuple(verthashes1[i] for i in tri)
-                          for tri in self.get_triangles()]
-            triangles2 = [tuple(verthashes2[i] for i in tri)
-                          for tri in other.get_triangles()]
-            for tri1 in triangles1:
-                if not tri1 in triangles2:
-                    return False
-            for tri2 in triangles2:
-                if not tri2 in triangles1:
-                    return False
+        def get_fingerprint(self):
+            """Get a hashable value such that interchangeable geometries
+            have the same fingerprint. It does not depend on the order
+            of the vertices and of the triangles.
 
-            # looks pretty identical!
-            return True
+            >>> from pyffi.formats.nif import NifFormat
+            >>> data1 = NifFormat.NiTriShapeData()
+            >>> data1.num_vertices = 3
+            >>> data1.has_vertices = True
+            >>> data1.vertices.update_size()
+            >>> for i, vert in enumerate(data1.vertices):
+            ...     vert.x = i
+            >>> data1.set_triangles([(0, 1, 2)])
+            >>> data2 = NifFormat.NiTriShapeData()
+            >>> data2.num_vertices = 3
+            >>> data2.has_vertices = True
+            >>> data2.vertices.update_size()
+            >>> for i, vert in enumerate(data2.vertices):
+            ...     vert.x = 2 - i
+            >>> data2.set_triangles([(2, 1, 0)])
+            >>> data1.get_fingerprint() == data2.get_fingerprint()
+            True
+            >>> data2.set_triangles([(2, 0, 1)])
+            >>> data1.get_fingerprint() == data2.get_fingerprint()
+            False
+            >>> data1.is_interchangeable(data2)
+            False
+            """
+            # center and radius are left out: they follow from the
+            # vertices, and are compared with a tolerance
+            fingerprint = [self.__class__]
+            for attribute in (
+                "num_vertices", "keep_flags", "compress_flags", "has_vertices",
+                "num_uv_sets", "has_normals", "has_vertex_colors", "has_uv",
+                "consistency_flags"):
+                fingerprint.append(getattr(self, attribute))
+            verthashes = list(self.get_vertex_hash_generator())
+            fingerprint.append(frozenset(verthashes))
+            # triangles, in terms of their vertices
+            fingerprint.append(frozenset(
+                tuple(verthashes[i] for i in tri)
+                for tri in self.get_triangles()))
+            return tuple(fingerprint)
 
         def get_triangle_indices(self, triangles):
             """Yield list of triangle indices (relative to
@@ -6176,138 +7267,39 @@ class NifFormat(FileFormat):
             # check that shape has norms and uvs
             if len(uvs) == 0 or len(norms) == 0: return
 
+            # normalize the normals; zero normals are replaced by the y axis
+            # (only for the calculation)
+            normals = norms.get_attribute_values("x", "y", "z")
+            normalized = []
+            for x, y, z in normals:
+                norm = math.sqrt(x * x + y * y + z * z)
+                if norm:
+                    normalized.append((x / norm, y / norm, z / norm))
+                else:
+                    normalized.append(None)
+            norms.set_attribute_values(
+                ("x", "y", "z"),
+                [n if n else normal
+                 for n, normal in zip(normalized, normals)])
+            normalized = [n if n else (0.0, 1.0, 0.0) for n in normalized]
+
             # identify identical (vertex, normal) pairs to avoid issues along
             # uv seams due to vertex duplication
             # implementation note: uvprecision and vcolprecision 0
             # should be enough, but use -2 just to be really sure
             # that this is ignored
-            v_hash_map = list(
-                self.data.get_vertex_hash_generator(
-                    vertexprecision=vertexprecision,
-                    normalprecision=normalprecision,
-                    uvprecision=-2,
-                    vcolprecision=-2))
-
-            # tangent and binormal dictionaries by vertex hash
-            bin = dict((h, NifFormat.Vector3()) for h in v_hash_map)
-            tan = dict((h, NifFormat.Vector3()) for h in v_hash_map)
-
-            # calculate tangents and binormals from vertex and texture coordinates
-            for t1, t2, t3 in self.data.get_triangles():
-                # find hash values
-                h1 = v_hash_map[t1]
-                h2 = v_hash_map[t2]
-                h3 = v_hash_map[t3]
-                # skip degenerate triangles
-                if h1 == h2 or h2 == h3 or h3 == h1:
-                    continue
-
-                v_1 = verts[t1]
-                v_2 = verts[t2]
-                v_3 = verts[t3]
-                w1 = uvs[t1]
-                w2 = uvs[t2]
-                w3 = uvs[t3]
-                v_2v_1 = v_2 - v_1
-                v_3v_1 = v_3 - v_1
-                w2w1 = w2 - w1
-                w3w1 = w3 - w1
-
-                # surface of triangle in texture space
-                r = w2w1.u * w3w1.v - w3w1.u * w2w1.v
-
-                # sign of surface
-                r_sign = (1 if r >= 0 else -1)
-
-                # contribution of this triangle to tangents and binormals
-                sdir = NifFormat.Vector3()
-                sdir.x = (w3w1.v * v_2v_1.x - w2w1.v * v_3v_1.x) * r_sign
-                sdir.y = (w3w1.v * v_2v_1.y - w2w1.v * v_3v_1.y) * r_sign
-                sdir.z = (w3w1.v * v_2v_1.z - w2w1.v * v_3v_1.z) * r_sign
-                try:
-                    sdir.normalize()
-                except ZeroDivisionError: # catches zero vector
-                    continue # skip triangle
-                except ValueError: # catches invalid data
-                    continue # skip triangle
-
-                tdir = NifFormat.Vector3()
-                tdir.x = (w2w1.u * v_3v_1.x - w3w1.u * v_2v_1.x) * r_sign
-                tdir.y = (w2w1.u * v_3v_1.y - w3w1.u * v_2v_1.y) * r_sign
-                tdir.z = (w2w1.u * v_3v_1.z - w3w1.u * v_2v_1.z) * r_sign
-                try:
-                    tdir.normalize()
-                except ZeroDivisionError: # catches zero vector
-                    continue # skip triangle
-                except ValueError: # catches invalid data
-                    continue # skip triangle
-
-                # vector combination algorithm could possibly be improved
-                for h in [h1, h2, h3]:
-                    # addition inlined for speed
-                    tanh = tan[h]
-                    tanh.x += tdir.x
-                    tanh.y += tdir.y
-                    tanh.z += tdir.z
-                    binh = bin[h]
-                    binh.x += sdir.x
-                    binh.y += sdir.y
-                    binh.z += sdir.z
-
-            xvec = NifFormat.Vector3()
-            xvec.x = 1.0
-            xvec.y = 0.0
-            xvec.z = 0.0
-            yvec = NifFormat.Vector3()
-            yvec.x = 0.0
-            yvec.y = 1.0
-            yvec.z = 0.0
-            for n, h in zip(norms, v_hash_map):
-                binh = bin[h]
-                tanh = tan[h]
-                try:
-                    n.normalize()
-                except (ValueError, ZeroDivisionError):
-                    # this happens if the normal has NAN values or is zero
-                    # just pick something in that case
-                    n = yvec
-                try:
-                    # turn n, bin, tan into a base via Gram-Schmidt
-                    # bin[h] -= n * (n * bin[h])
-                    # inlined for speed
-                    scalar = n * binh
-                    binh.x -= n.x * scalar
-                    binh.y -= n.y * scalar
-                    binh.z -= n.z * scalar
-                    binh.normalize()
-
-                    # tan[h] -= n * (n * tan[h])
-                    # tan[h] -= bin[h] * (bin[h] * tan[h])
-                    # inlined for speed
-                    scalar = n * tanh
-                    tanh.x -= n.x * scalar
-                    tanh.y -= n.y * scalar
-                    tanh.z -= n.z * scalar
-                    
-                    scalar = binh * tanh
-                    tanh.x -= binh.x * scalar
-                    tanh.y -= binh.y * scalar
-                    tanh.z -= binh.z * scalar
-                    tanh.normalize()
-                except ZeroDivisionError:
-                    # insuffient data to set tangent space for this vertex
-                    # in that case pick a space
-                    binh = xvec.crossproduct(n)
-                    try:
-                        binh.normalize()
-                    except ZeroDivisionError:
-                        binh = yvec.crossproduct(n)
-                        binh.normalize() # should work now
-                    tanh = n.crossproduct(binh)
-
-            # tangent and binormal lists by vertex index
-            tan = [tan[h] for h in v_hash_map]
-            bin = [bin[h] for h in v_hash_map]
+            v_map = self.data.get_vertex_map(
+                vertexprecision=vertexprecision,
+                normalprecision=normalprecision,
+                uvprecision=-2,
+                vcolprecision=-2)[0]
+
+            tan, bin = pyffi.utils.tangentspace.getTangentSpace(
+                vertices=verts.get_attribute_values("x", "y", "z"),
+                normals=normalized,
+                uvs=uvs.get_attribute_values("u", "v"),
+                triangles=list(self.data.get_triangles()),
+                vertex_groups=v_map)
 
             # find possible extra data block
             for extra in self.get_extra_datas():
@@ -6333,11 +7325,10 @@ class NifFormat(FileFormat):
                     self.add_extra_data(extra)
 
                 # write the data
-                binarydata = bytearray()
-                for vec in tan + bin:
-                    # XXX _byte_order!! assuming little endian
-                    binarydata += struct.pack('<fff', vec.x, vec.y, vec.z)
-                extra.binary_data = bytes(binarydata)
+                # XXX _byte_order!! assuming little endian
+                extra.binary_data = struct.pack(
+                    '<%if' % (6 * len(tan)),
+                    *chain.from_iterable(tan + bin))
             else:
                 # set tangent space flag
                 self.data.extra_vectors_flags = 16
@@ -6345,16 +7336,8 @@ class NifFormat(FileFormat):
                 # XXX from Sid Meier's Railroad
                 self.data.tangents.update_size()
                 self.data.bitangents.update_size()
-                for vec, data_tans in zip(tan, self.data.tangents):
-                    data_tans.x = vec.x
-                    data_tans.y = vec.y
-                    data_tans.z = vec.z
-                for vec, data_bins in zip(bin, self.data.bitangents):
-                    data_bins.x = vec.x
-                    data_bins.y = vec.y
-                    data_bins.z = vec.z
-                    
-                
+                self.data.tangents.set_attribute_values(("x", "y", "z"), tan)
+                self.data.bitangents.set_attribute_values(("x", "y", "z"), bin)
 
         # ported from nifskope/skeleton.cpp:spSkinPartition
         def update_skin_partition(self,
@@ -6452,6 +7435,10 @@ class NifFormat(FileFormat):
                 triangles = geomdata.get_triangles()
 
             for tri in triangles:
+                # quick check: each vertex has few enough bones
+                if (sum(len(weights[t]) for t in tri)
+                    <= maxbonesperpartition):
+                    continue
                 while True:
                     # find the bones influencing this triangle
                     tribones = []
@@ -6511,76 +7498,114 @@ class NifFormat(FileFormat):
 
             # split triangles into partitions
             logger.info("Creating partitions")
+            # the bones of every triangle, as a bit set
+            vertexbones = []
+            for weight in weights:
+                bits = 0
+                for bonenum, boneweight in weight:
+                    bits |= 1 << bonenum
+                vertexbones.append(bits)
+            # faces beyond the length of trianglepartmap are dropped
+            triangles_partindices = list(zip(triangles, trianglepartmap))
+            triangles = [tri for tri, partindex in triangles_partindices]
+            partindices = [partindex
+                           for tri, partindex in triangles_partindices]
+            tribones = [vertexbones[t1] | vertexbones[t2] | vertexbones[t3]
+                        for t1, t2, t3 in triangles]
+            # maps partition index and bone set to the triangles with
+            # those bones, and vertices to their triangles
+            bonesettriangles = {}
+            vertextriangles = {}
+            for i, (tri, partindex, bones) in enumerate(
+                zip(triangles, partindices, tribones)):
+                bonesettriangles.setdefault(
+                    partindex, {}).setdefault(bones, []).append(i)
+                for t in tri:
+                    vertextriangles.setdefault(t, []).append(i)
+            remaining = bytearray(b"\x01") * len(triangles)
+            first = 0 # all triangles before first have a partition
             parts = []
             # keep creating partitions as long as there are triangles left
-            while triangles:
+            while True:
+                while first < len(triangles) and not remaining[first]:
+                    first += 1
+                if first == len(triangles):
+                    break
                 # create a partition
-                part = [set(), [], None] # bones, triangles, partition index
+                part = [0, [], None] # bones, triangles, partition index
                 usedverts = set()
-                addtriangles = True
+                # triangles which are adjacent to the partition, which
+                # have its index, and which may still fit in it
+                adjacent = set()
+                # triangles which do not fit anymore
+                rejected = set()
+
+                def add_triangle(i, adjacent):
+                    """Add triangle i to the partition, and add the new
+                    adjacent triangles to C{adjacent}.
+                    """
+                    remaining[i] = 0
+                    part[0] |= tribones[i]
+                    part[1].append(triangles[i])
+                    for t in triangles[i]:
+                        if t not in usedverts:
+                            usedverts.add(t)
+                            for j in vertextriangles[t]:
+                                if (remaining[j] and j not in rejected
+                                    and partindices[j] == part[2]):
+                                    adjacent.add(j)
+
+                # the first triangles go into the partition until it
+                # has bones
+                while first < len(triangles) and not part[0]:
+                    if remaining[first]:
+                        if part[2] is None:
+                            part[2] = partindices[first]
+                        add_triangle(first, adjacent)
+                    first += 1
+                bonesets = bonesettriangles[part[2]]
                 # keep adding triangles to it as long as the flag is set
+                addtriangles = True
                 while addtriangles:
-                    # newtriangles is a list of triangles that have not been added to
-                    # the partition, similar for newtrianglepartmap
+                    # add all triangles whose bones are in the partition
+                    # and whose index coincides
                     newtriangles = []
-                    newtrianglepartmap = []
-                    for tri, partindex in zip(triangles, trianglepartmap):
-                        # find the bones influencing this triangle
-                        tribones = []
-                        for t in tri:
-                            tribones.extend([
-                                bonenum for bonenum, boneweight in weights[t]])
-                        tribones = set(tribones)
-                        # if part has no bones,
-                        # or if part has all bones of tribones and index coincides
-                        # then add this triangle to this part
-                        if ((not part[0])
-                            or ((part[0] >= tribones) and (part[2] == partindex))):
-                            part[0] |= tribones
-                            part[1].append(tri)
-                            usedverts |= set(tri)
-                            # if part was empty, assign it the index
-                            if part[2] is None:
-                                part[2] = partindex
-                        else:
-                            newtriangles.append(tri)
-                            newtrianglepartmap.append(partindex)
-                    triangles = newtriangles
-                    trianglepartmap = newtrianglepartmap
+                    for bones in list(bonesets):
+                        if not bones & ~part[0]:
+                            newtriangles.extend(
+                                i for i in bonesets.pop(bones)
+                                if remaining[i])
+                    newtriangles.sort()
+                    for i in newtriangles:
+                        add_triangle(i, adjacent)
 
                     # if we have room left in the partition
-                    # then add adjacent triangles
+                    # then add adjacent triangles, in order; triangles
+                    # which become adjacent to the partition before the
+                    # last added triangle are tried on the next run
                     addtriangles = False
-                    newtriangles = []
-                    newtrianglepartmap = []
-                    if len(part[0]) < maxbonesperpartition:
-                        for tri, partindex in zip(triangles, trianglepartmap):
-                            # if triangle is adjacent, and has same index
-                            # then check if it can be added to the partition
-                            if (usedverts & set(tri)) and (part[2] == partindex):
-                                # find the bones influencing this triangle
-                                tribones = []
-                                for t in tri:
-                                    tribones.extend([
-                                        bonenum for bonenum, boneweight in weights[t]])
-                                tribones = set(tribones)
-                                # and check if we exceed the maximum number of allowed
-                                # bones
-                                if len(part[0] | tribones) <= maxbonesperpartition:
-                                    part[0] |= tribones
-                                    part[1].append(tri)
-                                    usedverts |= set(tri)
-                                    # signal another try in adding triangles to
-                                    # the partition
-                                    addtriangles = True
-                                else:
-                                    newtriangles.append(tri)
-                                    newtrianglepartmap.append(partindex)
-                            else:
-                                newtriangles.append(tri)
-                                newtrianglepartmap.append(partindex)
-                        triangles = newtriangles
-                        trianglepartmap = newtrianglepartmap
+                    if bin(part[0]).count("1") < maxbonesperpartition:
+                        queue = [i for i in adjacent if remaining[i]]
+                        heapq.heapify(queue)
+                        queued = adjacent
+                        adjacent = set()
+                        while queue:
+                            i = heapq.heappop(queue)
+                            if bin(part[0] | tribones[i]).count("1") \
+                               > maxbonesperpartition:
+                                rejected.add(i)
+                                continue
+                            newadjacent = set()
+                            add_triangle(i, newadjacent)
+                            for j in newadjacent:
+                                if j < i:
+                                    adjacent.add(j)
+                                elif j not in queued:
+                                    queued.add(j)
+                                    heapq.heappush(queue, j)
+                            # signal another try in adding triangles to
+                            # the partition
+                            addtriangles = True
 
                 parts.append(part)
 
@@ -6610,7 +7635,8 @@ class NifFormat(FileFormat):
                         # if partition indices are the same, and bone limit is not
                         # exceeded, merge them
                         if ((parta[2] == partb[2])
-                            and (len(parta[0] | partb[0]) <= maxbonesperpartition)):
+                            and (bin(parta[0] | partb[0]).count("1")
+                                 <= maxbonesperpartition)):
                             parta[0] |= partb[0]
                             parta[1] += partb[1]
                             addedparts.add(b)
@@ -6655,7 +7681,8 @@ class NifFormat(FileFormat):
                     parts = []
                     for otherpart in oldparts:
                         # check if bones can be added
-                        if len(sharedboneset | otherpart[0]) <= maxbonesperpartition:
+                        if (bin(sharedboneset | otherpart[0]).count("1")
+                            <= maxbonesperpartition):
                             # ok, we can share bones!
                             # update set of shared bones
                             sharedboneset |= otherpart[0]
@@ -6693,12 +7720,16 @@ class NifFormat(FileFormat):
                     # store part for next iteration
                     lastpart = part
 
-            for skinpartblock, part in zip(skinpart.skin_partition_blocks, parts):
+            for partnum, (skinpartblock, part) in enumerate(
+                zip(skinpart.skin_partition_blocks, parts)):
                 # get sorted list of bones
-                bones = sorted(list(part[0]))
+                bones = [bonenum for bonenum in range(part[0].bit_length())
+                         if part[0] >> bonenum & 1]
+                bone_index = dict(
+                    (bonenum, i) for i, bonenum in enumerate(bones))
                 triangles = part[1]
                 logger.info("Optimizing triangle ordering in partition %i"
-                            % parts.index(part))
+                            % partnum)
                 # optimize triangles for vertex cache and calculate strips
                 triangles = pyffi.utils.vertex_cache.get_cache_optimized_triangles(
                     triangles)
@@ -6707,6 +7738,7 @@ class NifFormat(FileFormat):
                 triangles_size = 3 * len(triangles)
                 strips_size = len(strips) + sum(len(strip) for strip in strips)
                 vertices = []
+                vertex_index = {} # maps vertex to its index in vertices
                 # decide whether to use strip or triangles as primitive
                 if stripify is None:
                     stripifyblock = (
@@ -6725,7 +7757,8 @@ class NifFormat(FileFormat):
                     for strip in strips:
                         numtriangles += len(strip) - 2
                         for t in strip:
-                            if t not in vertices:
+                            if t not in vertex_index:
+                                vertex_index[t] = len(vertices)
                                 vertices.append(t)
                 else:
                     numtriangles = len(triangles)
@@ -6734,7 +7767,8 @@ class NifFormat(FileFormat):
                     # by triangle
                     for tri in triangles:
                         for t in tri:
-                            if t not in vertices:
+                            if t not in vertex_index:
+                                vertex_index[t] = len(vertices)
                                 vertices.append(t)
                 # set all the data
                 skinpartblock.num_vertices = len(vertices)
@@ -6768,12 +7802,6 @@ class NifFormat(FileFormat):
                     skinpartblock.vertex_map[i] = v
                 skinpartblock.has_vertex_weights = True
                 skinpartblock.vertex_weights.update_size()
-                for i, v in enumerate(vertices):
-                    for j in range(skinpartblock.num_weights_per_vertex):
-                        if j < len(weights[v]):
-                            skinpartblock.vertex_weights[i][j] = weights[v][j][1]
-                        else:
-                            skinpartblock.vertex_weights[i][j] = 0.0
                 if stripifyblock:
                     skinpartblock.has_faces = True
                     skinpartblock.strip_lengths.update_size()
@@ -6782,7 +7810,7 @@ class NifFormat(FileFormat):
                     skinpartblock.strips.update_size()
                     for i, strip in enumerate(strips):
                         for j, v in enumerate(strip):
-                            skinpartblock.strips[i][j] = vertices.index(v)
+                            skinpartblock.strips[i][j] = vertex_index[v]
                 else:
                     skinpartblock.has_faces = True
                     # clear strip lengths array
@@ -6791,43 +7819,40 @@ class NifFormat(FileFormat):
                     skinpartblock.strips.update_size()
                     skinpartblock.triangles.update_size()
                     for i, (v_1,v_2,v_3) in enumerate(triangles):
-                        skinpartblock.triangles[i].v_1 = vertices.index(v_1)
-                        skinpartblock.triangles[i].v_2 = vertices.index(v_2)
-                        skinpartblock.triangles[i].v_3 = vertices.index(v_3)
+                        skinpartblock.triangles[i].v_1 = vertex_index[v_1]
+                        skinpartblock.triangles[i].v_2 = vertex_index[v_2]
+                        skinpartblock.triangles[i].v_3 = vertex_index[v_3]
                 skinpartblock.has_bone_indices = True
                 skinpartblock.bone_indices.update_size()
+                num_weights_per_vertex = skinpartblock.num_weights_per_vertex
                 for i, v in enumerate(vertices):
+                    vweights = [[bone_index[bonenum], boneweight]
+                                for bonenum, boneweight in weights[v]]
                     # the boneindices set keeps track of indices that have not been
                     # used yet
                     boneindices = set(range(skinpartblock.num_bones))
-                    for j in range(len(weights[v])):
-                        skinpartblock.bone_indices[i][j] = bones.index(weights[v][j][0])
-                        boneindices.remove(skinpartblock.bone_indices[i][j])
-                    for j in range(len(weights[v]),skinpartblock.num_weights_per_vertex):
+                    for bonenum, boneweight in vweights:
+                        boneindices.remove(bonenum)
+                    for j in range(len(vweights), num_weights_per_vertex):
                         if padbones:
                             # if padbones is True then we have enforced
                             # num_bones == num_weights_per_vertex so this will not trigger
                             # a KeyError
-                            skinpartblock.bone_indices[i][j] = boneindices.pop()
+                            vweights.append([boneindices.pop(), 0.0])
                         else:
-                            skinpartblock.bone_indices[i][j] = 0
-
-                # sort weights
-                for i, v in enumerate(vertices):
-                    vweights = []
-                    for j in range(skinpartblock.num_weights_per_vertex):
-                        vweights.append([
-                            skinpartblock.bone_indices[i][j],
-                            skinpartblock.vertex_weights[i][j]])
+                            vweights.append([0, 0.0])
+                    # sort weights
                     if padbones:
                         # by bone index (for ffvt3r)
                         vweights.sort(key=lambda w: w[0])
                     else:
                         # by weight (for fallout 3, largest weight first)
                         vweights.sort(key=lambda w: -w[1])
-                    for j in range(skinpartblock.num_weights_per_vertex):
-                        skinpartblock.bone_indices[i][j] = vweights[j][0]
-                        skinpartblock.vertex_weights[i][j] = vweights[j][1]
+                    bone_indices = skinpartblock.bone_indices[i]
+                    vertex_weights = skinpartblock.vertex_weights[i]
+                    for j, (bonenum, boneweight) in enumerate(vweights):
+                        bone_indices[j] = bonenum
+                        vertex_weights[j] = boneweight
 
             return lostweight
 
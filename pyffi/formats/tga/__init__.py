@@ -98,14 +98,21 @@ Create a TGA file from scratch and write to file
 #
 # ***** END LICENSE BLOCK *****
 
+import hashlib
 import struct, os, re
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 import pyffi.object_models.xml
 import pyffi.object_models.common
 import pyffi.object_models.xml.basic
 import pyffi.object_models.xml.struct_
 import pyffi.object_models
 import pyffi.utils.graph
+import pyffi.utils.mmapstream
 from pyffi.utils.graph import EdgeFilter
 
 class TgaFormat(pyffi.object_models.xml.FileFormat):
@@ -186,44 +193,205 @@ class TgaFormat(pyffi.object_models.xml.FileFormat):
             return self.__str__()
 
     class Image(pyffi.utils.graph.GlobalNode):
+        """The pixels of the image. Pixels are read and written in bulk,
+        and run length encoded images are decoded packet by packet,
+        so no object is created per pixel.
+        """
+
+        pixels = None
+        """The decoded pixels, in the order in which they are stored in
+        the file: by row (bottom to top, unless the image has its origin
+        at the top), and with channels in BGRA order. This is a
+        ``numpy`` array of unsigned bytes of shape
+        (height, width, bytes per pixel) if numpy is available, and a
+        ``bytearray`` otherwise.
+        """
+
         def __init__(self):
-            # children are either individual pixels, or RLE packets
-            self.children = []
+            self.pixels = TgaFormat.Image._new_pixels(0, 0, 0)
+            # packets and hash of the pixels of a run length encoded
+            # image, to write back unchanged images as they were read
+            self._rle_packets = None
+            self._rle_hash = None
+
+        @staticmethod
+        def _new_pixels(width, height, bytes_per_pixel):
+            """Allocate the pixel buffer."""
+            if numpy:
+                return numpy.zeros((height, width, bytes_per_pixel),
+                                   dtype=numpy.uint8)
+            return bytearray(width * height * bytes_per_pixel)
+
+        @staticmethod
+        def _is_rle(data):
+            return data.header.image_type not in (
+                TgaFormat.ImageType.INDEXED,
+                TgaFormat.ImageType.RGB,
+                TgaFormat.ImageType.GREY)
 
         def read(self, stream, data):
-            data = data
-            if data.header.image_type in (TgaFormat.ImageType.INDEXED,
-                                          TgaFormat.ImageType.RGB,
-                                          TgaFormat.ImageType.GREY):
-                self.children = [
-                    TgaFormat.Pixel(argument=data.header.pixel_size)
-                    for i in range(data.header.width
-                                    * data.header.height)]
-                for pixel in self.children:
-                    pixel.read(stream, data)
-            else:
-                self.children = []
-                count = 0
-                while count < data.header.width * data.header.height:
-                    pixel = TgaFormat.RLEPixels(
-                        argument=data.header.pixel_size)
-                    pixel.read(stream, data)
-                    self.children.append(pixel)
-                    count += pixel.header.count + 1
+            width = data.header.width
+            height = data.header.height
+            bytes_per_pixel = data.header.pixel_size // 8
+            self.pixels = self._new_pixels(width, height, bytes_per_pixel)
+            self._rle_packets = None
+            self._rle_hash = None
+            if not self._is_rle(data):
+                # read straight into the pixel buffer
+                if stream.readinto(self.pixels) != len(memoryview(
+                        self.pixels).cast("B")):
+                    raise ValueError("end of file: truncated tga image")
+                return
+            pos = stream.tell()
+            packets = pyffi.utils.mmapstream.read_view(stream)
+            size = self._decode_rle(
+                packets, memoryview(self.pixels).cast("B"), bytes_per_pixel)
+            stream.seek(pos + size)
+            self._rle_packets = bytes(packets[:size])
+            self._rle_hash = self._get_pixel_hash()
 
         def write(self, stream, data):
-            data = data
-            for child in self.children:
-                child.arg = data.header.pixel_size
-                child.write(stream, data)
-
-        def get_detail_child_nodes(self, edge_filter=EdgeFilter()):
-            for child in self.children:
-                yield child
-
-        def get_detail_child_names(self, edge_filter=EdgeFilter()):
-            for i in range(len(self.children)):
-                yield str(i)
+            if not self._is_rle(data):
+                stream.write(self.pixels)
+            elif self._rle_hash == self._get_pixel_hash():
+                stream.write(self._rle_packets)
+            else:
+                stream.write(self._encode_rle(
+                    memoryview(self.pixels).cast("B"),
+                    data.header.width, data.header.pixel_size // 8))
+
+        def _get_pixel_hash(self):
+            return hashlib.sha1(memoryview(self.pixels).cast("B")).digest()
+
+        @staticmethod
+        def _decode_rle(packets, pixels, bytes_per_pixel):
+            """Decode run length encoded packets into the pixel buffer.
+
+            :param packets: The encoded packets.
+            :type packets: ``bytes`` or ``memoryview``
+            :param pixels: Byte view on the pixel buffer.
+            :type pixels: ``memoryview``
+            :param bytes_per_pixel: Number of bytes per pixel.
+            :type bytes_per_pixel: ``int``
+            :return: Number of bytes of *packets* that were decoded.
+            :rtype: ``int``
+
+            >>> pixels = bytearray(6)
+            >>> TgaFormat.Image._decode_rle(
+            ...     b"\\x82\\x07\\x02\\x03\\x04\\x05\\x00",
+            ...     memoryview(pixels), 1)
+            6
+            >>> list(pixels)
+            [7, 7, 7, 3, 4, 5]
+            """
+            pos = 0
+            end = len(pixels)
+            index = 0
+            try:
+                while index < end:
+                    header = packets[pos]
+                    num_bytes = ((header & 0x7f) + 1) * bytes_per_pixel
+                    if index + num_bytes > end:
+                        raise ValueError("tga packet beyond end of image")
+                    if header & 0x80:
+                        pixel = bytes(packets[pos + 1:pos + 1 + bytes_per_pixel])
+                        pixels[index:index + num_bytes] = (
+                            pixel * ((header & 0x7f) + 1))
+                        pos += 1 + bytes_per_pixel
+                    else:
+                        pixels[index:index + num_bytes] = (
+                            packets[pos + 1:pos + 1 + num_bytes])
+                        pos += 1 + num_bytes
+                    index += num_bytes
+            except (IndexError, ValueError) as err:
+                # also raised if the packets are truncated
+                raise ValueError("corrupt tga image data: %s" % err)
+            return pos
+
+        @staticmethod
+        def _get_runs(pixels, width, bytes_per_pixel):
+            """Start and length of every run of identical pixels. Runs
+            do not cross rows.
+            """
+            num_pixels = len(pixels) // bytes_per_pixel
+            if not num_pixels:
+                return [], []
+            if numpy:
+                flat = numpy.frombuffer(pixels, dtype=numpy.uint8).reshape(
+                    num_pixels, bytes_per_pixel)
+                is_start = numpy.ones(num_pixels, dtype=bool)
+                is_start[1:] = numpy.any(flat[1:] != flat[:-1], axis=1)
+                is_start[::width] = True
+                starts = numpy.flatnonzero(is_start)
+                lengths = numpy.diff(numpy.append(starts, num_pixels))
+                return starts.tolist(), lengths.tolist()
+            starts = []
+            pixel = None
+            for index in range(num_pixels):
+                next_pixel = pixels[index * bytes_per_pixel:
+                                    (index + 1) * bytes_per_pixel]
+                if index % width == 0 or next_pixel != pixel:
+                    starts.append(index)
+                pixel = next_pixel
+            lengths = [
+                end - start for start, end in zip(starts,
+                                                   starts[1:] + [num_pixels])]
+            return starts, lengths
+
+        @staticmethod
+        def _encode_rle(pixels, width, bytes_per_pixel):
+            """Run length encode the pixel buffer, one row at a time.
+            Runs of two or more identical pixels become run length
+            packets, all other pixels are grouped in raw packets.
+
+            :param pixels: Byte view on the pixel buffer.
+            :type pixels: ``memoryview``
+            :param width: Number of pixels per row.
+            :type width: ``int``
+            :param bytes_per_pixel: Number of bytes per pixel.
+            :type bytes_per_pixel: ``int``
+            :return: The encoded packets.
+            :rtype: ``bytes``
+
+            >>> pixels = bytearray([7, 7, 7, 3, 4, 5])
+            >>> TgaFormat.Image._encode_rle(memoryview(pixels), 6, 1)
+            b'\\x82\\x07\\x02\\x03\\x04\\x05'
+            """
+            result = bytearray()
+            raw_start = raw_end = 0
+
+            def write_raw(start, end):
+                # raw packets of at most 128 pixels
+                for packet_start in range(start, end, 128):
+                    packet_end = min(packet_start + 128, end)
+                    result.append(packet_end - packet_start - 1)
+                    result.extend(pixels[packet_start * bytes_per_pixel:
+                                         packet_end * bytes_per_pixel])
+
+            for start, length in zip(*TgaFormat.Image._get_runs(
+                    pixels, width, bytes_per_pixel)):
+                if length == 1 and start % width and start == raw_end:
+                    raw_end += 1
+                    continue
+                write_raw(raw_start, raw_end)
+                if length == 1:
+                    raw_start, raw_end = start, start + 1
+                    continue
+                raw_start = raw_end = start + length
+                pixel = pixels[start * bytes_per_pixel:
+                               (start + 1) * bytes_per_pixel]
+                # run length packets of at most 128 pixels
+                while length:
+                    count = min(length, 128)
+                    result.append(0x80 | (count - 1))
+                    result.extend(pixel)
+                    length -= count
+            write_raw(raw_start, raw_end)
+            return bytes(result)
+
+        def get_detail_display(self):
+            return "%i bytes of pixel data" % len(
+                memoryview(self.pixels).cast("B"))
 
     class Data(pyffi.object_models.FileFormat.Data):
 
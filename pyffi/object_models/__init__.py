@@ -82,6 +82,7 @@ import sys # version_info
 
 import pyffi.utils
 import pyffi.utils.graph
+import pyffi.utils.mmapstream
 
 
 class MetaFileFormat(type):
@@ -179,6 +180,20 @@ class FileFormat(object):
         user_version = None
         """User version (additional version field) of the data."""
 
+        lazy = False
+        """If ``True``, then :meth:`read` may defer decoding parts of
+        the data until they are accessed. Formats which do not support
+        this read everything regardless."""
+
+        profile = None
+        """If set to a ``dict``, then :meth:`read` records the time it
+        spends on the different parts of the data in it:
+        ``profile["blocks"]`` maps each block type to a list with the
+        number of blocks of that type and the time spent reading them
+        (in seconds), and ``profile["links"]`` is the time spent on
+        resolving references between blocks. Formats without blocks
+        leave it untouched."""
+
         def inspect(self, stream):
             """Quickly checks whether the stream appears to contain
             data of a particular format. Resets stream to original position.
@@ -316,8 +331,15 @@ class FileFormat(object):
         return ''.join(part.capitalize()
                        for part in cls.name_parts(name))
 
+    @staticmethod
+    def _open(filename, mode, use_mmap):
+        """Open a file for :meth:`walk` and :meth:`walkData`."""
+        if use_mmap:
+            return pyffi.utils.mmapstream.MmapStream(filename)
+        return open(filename, mode)
+
     @classmethod
-    def walkData(cls, top, topdown=True, mode='rb'):
+    def walkData(cls, top, topdown=True, mode='rb', use_mmap=False):
         """A generator which yields the data of all files in
         directory top whose filename matches the regular expression
         :attr:`RE_FILENAME`. The argument top can also be a file instead of a
@@ -335,11 +357,15 @@ class FileFormat(object):
         :type topdown: ``bool``
         :param mode: The mode in which to open files.
         :type mode: ``str``
+        :param use_mmap: Whether to open files as a read only
+            :class:`~pyffi.utils.mmapstream.MmapStream` instead (the mode
+            is ignored in that case).
+        :type use_mmap: ``bool``
         """
         # now walk over all these files in directory top
         for filename in pyffi.utils.walk(top, topdown, onerror=None,
                                          re_filename=cls.RE_FILENAME):
-            stream = open(filename, mode)
+            stream = cls._open(filename, mode, use_mmap)
             try:
                 # return data for the stream
                 # the caller can call data.read(stream),
@@ -349,7 +375,7 @@ class FileFormat(object):
                 stream.close()
 
     @classmethod
-    def walk(cls, top, topdown=True, mode='rb'):
+    def walk(cls, top, topdown=True, mode='rb', use_mmap=False):
         """A generator which yields all files in
         directory top whose filename matches the regular expression
         :attr:`RE_FILENAME`. The argument top can also be a file instead of a
@@ -367,11 +393,15 @@ class FileFormat(object):
         :type topdown: ``bool``
         :param mode: The mode in which to open files.
         :type mode: ``str``
+        :param use_mmap: Whether to open files as a read only
+            :class:`~pyffi.utils.mmapstream.MmapStream` instead (the mode
+            is ignored in that case).
+        :type use_mmap: ``bool``
         """
         # now walk over all these files in directory top
         for filename in pyffi.utils.walk(top, topdown, onerror=None,
                                          re_filename=cls.RE_FILENAME):
-            stream = open(filename, mode)
+            stream = cls._open(filename, mode, use_mmap)
             try:
                 yield stream
             finally:
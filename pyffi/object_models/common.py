@@ -45,6 +45,7 @@ from pyffi.object_models.editable import EditableSpinBox
 from pyffi.object_models.editable import EditableFloatSpinBox
 from pyffi.object_models.editable import EditableLineEdit
 from pyffi.object_models.editable import EditableBoolComboBox
+from pyffi.utils.mmapstream import read_view
 
 # TODO get rid of these
 _b = b''
@@ -177,6 +178,21 @@ class Int(BasicBase, EditableSpinBox):
     def __str__(self):
         return str(self.get_value())
 
+    @classmethod
+    def get_struct_format(cls, data):
+        """Return struct format string, unless read or write are
+        overridden.
+
+        >>> from pyffi.object_models import FileFormat
+        >>> UShort.get_struct_format(FileFormat.Data())
+        '<H'
+        >>> print(ULittle32.get_struct_format(FileFormat.Data()))
+        None
+        """
+        if cls.read is not Int.read or cls.write is not Int.write:
+            return None
+        return data._byte_order + cls._struct
+
     @classmethod
     def get_size(cls, data=None):
         """Return number of bytes this type occupies in a file.
@@ -399,6 +415,15 @@ class Float(BasicBase, EditableFloatSpinBox):
             stream.write(struct.pack(data._byte_order + 'I',
                                      0x7fc00000))
 
+    @classmethod
+    def get_struct_format(cls, data):
+        """Return struct format string, unless read or write are
+        overridden.
+        """
+        if cls.read is not Float.read or cls.write is not Float.write:
+            return None
+        return data._byte_order + 'f'
+
     def get_size(self, data=None):
         """Return number of bytes this type occupies in a file.
 
@@ -688,7 +713,12 @@ class UndecodedData(BasicBase):
         """Return stored value.
 
         :return: The stored value.
+        :rtype: ``bytes``
         """
+        # data read from a memory mapped file is a view on the file,
+        # until it is first used
+        if isinstance(self._value, memoryview):
+            self._value = self._value.tobytes()
         return self._value
 
     def set_value(self, value):
@@ -720,12 +750,15 @@ class UndecodedData(BasicBase):
 
     def read(self, stream, data):
         """Read data from stream. Note that this function simply
-        reads until the end of the stream.
+        reads until the end of the stream. On a
+        :class:`~pyffi.utils.mmapstream.MmapStream`, the data is kept as
+        a ``memoryview`` on the file rather than a copy, until
+        :meth:`get_value` is called.
 
         :param stream: The stream to read from.
         :type stream: file
         """
-        self._value = stream.read(-1)
+        self._value = read_view(stream)
 
     def write(self, stream, data):
         """Write data to stream.
@@ -39,13 +39,19 @@ file, and xml handler for converting the xml description into Python classes.
 #
 # ***** END LICENSE BLOCK *****
 
+import hashlib
+import io
 import logging
+import os
+import os.path
+import pickle
+import tempfile
 import time # for timing stuff
 import types
-import os.path
 import sys
 import xml.sax
 
+import pyffi
 import pyffi.object_models
 from pyffi.object_models.xml.struct_    import StructBase
 from pyffi.object_models.xml.basic      import BasicBase
@@ -90,24 +96,85 @@ class MetaFileFormat(pyffi.object_models.MetaFileFormat):
         # the hierarchy
         xml_file_name = dct.get('xml_file_name')
         if xml_file_name:
-            # set up XML parser
-            parser = xml.sax.make_parser()
-            parser.setContentHandler(XmlSaxHandler(cls, name, bases, dct))
-
-            # open XML file
+            # read XML file
             xml_file = cls.openfile(xml_file_name, cls.xml_file_path)
-
-            # parse the XML file: control is now passed on to XmlSaxHandler
-            # which takes care of the class creation
-            cls.logger.debug("Parsing %s and generating classes."
-                             % xml_file_name)
-            start = time.clock()
             try:
-                parser.parse(xml_file)
+                xml_text = xml_file.read()
             finally:
                 xml_file.close()
+
+            handler = XmlSaxHandler(cls, name, bases, dct)
+            start = time.perf_counter()
+            cache_file = cls._get_xml_cache_file(xml_text)
+            events = cls._load_xml_cache(cache_file)
+            if events is not None:
+                # replay the cached description of the XML file
+                cls.logger.debug("Generating classes from %s." % cache_file)
+                handler.replay(events)
+            else:
+                # parse the XML file: control is now passed on to
+                # XmlSaxHandler which takes care of the class creation
+                cls.logger.debug("Parsing %s and generating classes."
+                                 % xml_file_name)
+                parser = xml.sax.make_parser()
+                parser.setContentHandler(handler)
+                parser.parse(io.StringIO(xml_text))
+                cls._save_xml_cache(cache_file, handler.events_data)
             cls.logger.debug("Parsing finished in %.3f seconds."
-                             % (time.clock() - start))
+                             % (time.perf_counter() - start))
+
+    def _get_xml_cache_file(cls, xml_text):
+        """Name of the file which caches the parsed XML description,
+        or ``None`` if caching is disabled. The name depends on the
+        contents of the XML file, and on the pyffi and Python versions.
+        """
+        if not cls.xml_cache_dir:
+            return None
+        key = hashlib.sha1()
+        for part in (xml_text, cls.__module__, pyffi.__version__,
+                     str(XmlSaxHandler.cache_version), sys.version):
+            key.update(part.encode("utf-8"))
+            key.update(b"\x00")
+        return os.path.join(
+            cls.xml_cache_dir,
+            "%s-%s.pickle" % (cls.__name__, key.hexdigest()))
+
+    def _load_xml_cache(cls, cache_file):
+        """Load the events stored in the cache file, or return ``None``
+        if there is no usable cache file.
+        """
+        if cache_file is None:
+            return None
+        try:
+            with open(cache_file, "rb") as stream:
+                return pickle.load(stream)
+        except IOError:
+            return None
+        except Exception:
+            cls.logger.warn("Ignoring corrupt cache file %s." % cache_file)
+            return None
+
+    def _save_xml_cache(cls, cache_file, events_data):
+        """Store the events recorded while parsing in the cache file.
+        Failure to do so is not an error.
+        """
+        if cache_file is None or events_data is None:
+            return
+        try:
+            if not os.path.isdir(cls.xml_cache_dir):
+                os.makedirs(cls.xml_cache_dir)
+            # write to a temporary file first so other processes never
+            # see a partially written cache file
+            fd, temp_name = tempfile.mkstemp(dir=cls.xml_cache_dir)
+            try:
+                with os.fdopen(fd, "wb") as stream:
+                    stream.write(events_data)
+                os.replace(temp_name, cache_file)
+            except:
+                os.remove(temp_name)
+                raise
+        except (IOError, OSError):
+            cls.logger.debug("Could not write cache file %s." % cache_file)
 
 
 class FileFormat(pyffi.object_models.FileFormat, metaclass=MetaFileFormat):
@@ -115,6 +182,10 @@ class FileFormat(pyffi.object_models.FileFormat, metaclass=MetaFileFormat):
     described by an xml file."""
     xml_file_name = None #: Override.
     xml_file_path = None #: Override.
+    #: Directory where the parsed xml description is cached, to speed
+    #: up subsequent imports. The cache is disabled unless the
+    #: PYFFI_CACHE_DIR environment variable is set.
+    xml_cache_dir = os.getenv('PYFFI_CACHE_DIR')
     logger = logging.getLogger("pyffi.object_models.xml")
 
     # We also keep an ordered list of all classes that have been created.
@@ -328,6 +399,16 @@ class XmlSaxHandler(xml.sax.handler.ContentHandler):
     "niobject": tag_struct,
     "bitflags": tag_bit_struct}
 
+    # kinds of recorded events, see replay
+    event_start = 1
+    event_end = 2
+    event_characters = 3
+    event_struct_attribute = 4
+    event_bit_struct_attribute = 5
+
+    cache_version = 1
+    """Increase when the format of the recorded events changes."""
+
     def __init__(self, cls, name, bases, dct):
         """Set up the xml parser.
 
@@ -376,6 +457,11 @@ class XmlSaxHandler(xml.sax.handler.ContentHandler):
         # elements for versions
         self.version_string = None
 
+        # events recorded while parsing, for caching
+        self.events = []
+        # the pickled events, set at the end of the document
+        self.events_data = None
+
     def pushTag(self, tag):
         """Push tag C{tag} on the stack and make it the current tag.
 
@@ -422,6 +508,14 @@ class XmlSaxHandler(xml.sax.handler.ContentHandler):
             except KeyError:
                 raise XmlError("error unknown element '%s'" % name)
 
+        if self.events is not None:
+            # attributes of add, bits, and bitflags option tags are
+            # recorded separately, when the attribute has been created
+            if self._creates_attributes(tag):
+                self.events.append((self.event_start, name, None))
+            else:
+                self.events.append((self.event_start, name, dict(attrs)))
+
         # Check the stack, if the stack does not exist then we must be
         # at the root of the xml file, and the tag must be "fileformat".
         # The fileformat tag has no further attributes of interest,
@@ -452,8 +546,8 @@ class XmlSaxHandler(xml.sax.handler.ContentHandler):
             # struct -> attribute
             if tag == self.tag_attribute:
                 # add attribute to class dictionary
-                self.class_dict["_attrs"].append(
-                    StructAttribute(self.cls, attrs))
+                self._add_attribute(
+                    StructAttribute(self.cls, attrs), attrs["type"])
             # struct -> version
             elif tag == self.tag_version:
                 # set the version string
@@ -595,8 +689,7 @@ but got %s instead""" % name)
             self.pushTag(tag)
             if tag == self.tag_bits:
                 # mandatory parameters
-                self.class_dict["_attrs"].append(
-                    BitStructAttribute(self.cls, attrs))
+                self._add_attribute(BitStructAttribute(self.cls, attrs))
             elif tag == self.tag_option:
                 # niftools compatibility, we have a bitflags field
                 # so convert value into numbits
@@ -608,14 +701,14 @@ but got %s instead""" % name)
                 if numextrabits < 0:
                     raise XmlError("values of bitflags must be increasing")
                 if numextrabits > 0:
-                    self.class_dict["_attrs"].append(
+                    self._add_attribute(
                         BitStructAttribute(
                             self.cls,
                             dict(name="Reserved Bits %i"
                                  % len(self.class_dict["_attrs"]),
                                  numbits=numextrabits)))
                 # add the actual attribute
-                self.class_dict["_attrs"].append(
+                self._add_attribute(
                     BitStructAttribute(
                         self.cls,
                         dict(name=attrs["name"], numbits=1)))
@@ -626,10 +719,76 @@ but got %s instead""" % name)
         else:
             raise XmlError("unhandled tag %s" % name)
 
+    def _creates_attributes(self, tag):
+        """Does the tag, as child of the current tag, create attributes?"""
+        return (tag == self.tag_attribute
+                or (self.current_tag == self.tag_bit_struct
+                    and tag in (self.tag_bits, self.tag_option)))
+
+    def _add_attribute(self, attr, type_name=None):
+        """Add attribute to the class that is being created.
+
+        :param attr: The attribute.
+        :type attr: :class:`StructAttribute` or :class:`BitStructAttribute`
+        :param type_name: For struct attributes, the name of the type.
+        :type type_name: ``str``
+        """
+        self.class_dict["_attrs"].append(attr)
+        if self.events is not None:
+            state = dict(attr.__dict__)
+            if isinstance(attr, StructAttribute):
+                # types are looked up again when replaying
+                state["type_"] = type_name
+                self.events.append((self.event_struct_attribute, state))
+            else:
+                self.events.append((self.event_bit_struct_attribute, state))
+
+    def replay(self, events):
+        """Generate the classes from events that were recorded while
+        parsing the xml file, skipping the parsing of attributes,
+        expressions, and versions.
+
+        :param events: The events, as recorded by a previous parse.
+        :type events: ``list``
+        """
+        self.events = None
+        for event in events:
+            kind = event[0]
+            if kind == self.event_characters:
+                self.characters(event[1])
+            elif kind == self.event_start:
+                name, attrs = event[1], event[2]
+                if attrs is None:
+                    # attributes are created from the next event(s)
+                    tag = self.tags.get(name) or self.tags_niftools[name]
+                    self.pushTag(tag)
+                else:
+                    self.startElement(name, attrs)
+            elif kind == self.event_end:
+                self.endElement(event[1])
+            elif kind == self.event_struct_attribute:
+                attr = StructAttribute.__new__(StructAttribute)
+                attr.__dict__.update(event[1])
+                if attr.type_ != "TEMPLATE":
+                    # string for forward declaration, resolved at endDocument
+                    attr.type_ = getattr(self.cls, attr.type_, attr.type_)
+                else:
+                    attr.type_ = type(None) # type determined at runtime
+                self.class_dict["_attrs"].append(attr)
+            elif kind == self.event_bit_struct_attribute:
+                attr = BitStructAttribute.__new__(BitStructAttribute)
+                attr.__dict__.update(event[1])
+                self.class_dict["_attrs"].append(attr)
+            else:
+                raise XmlError("unknown event %s" % kind)
+        self.endDocument()
+
     def endElement(self, name):
         """Called at the end of each xml tag.
 
         Creates classes."""
+        if self.events is not None:
+            self.events.append((self.event_end, name))
         if not self.stack:
             raise XmlError("mismatching end element tag for element %s" % name)
         try:
@@ -711,6 +870,13 @@ but got %s instead""" % name)
         Searches and adds class customized functions.
         For version tags, adds version to version and game lists.
         """
+        if self.events is not None:
+            # store the events before the attributes are modified below
+            try:
+                self.events_data = pickle.dumps(
+                    self.events, pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                self.events_data = None
         # get 'name_attribute' for all classes
         # we need this to fix them in cond="..." later
         klass_filter = {}
@@ -740,6 +906,8 @@ but got %s instead""" % name)
     def characters(self, chars):
         """Add the string C{chars} to the docstring.
         For version tags, updates the game version list."""
+        if self.events is not None:
+            self.events.append((self.event_characters, chars))
         if self.current_tag in (self.tag_attribute, self.tag_bits):
             self.class_dict["_attrs"][-1].doc += str(chars.strip())
         elif self.current_tag in (self.tag_struct, self.tag_enum,
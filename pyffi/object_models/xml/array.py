@@ -40,18 +40,111 @@
 # --------------------------------------------------------------------------
 
 # note: some imports are defined at the end to avoid problems with circularity
+import array
 import logging
+import operator
+import struct
+import sys
 import weakref
 
 from pyffi.utils.graph import DetailNode, EdgeFilter
+from pyffi.utils.mmapstream import read_view
+
+def _repeat_format(fmt, count):
+    """Return struct format string for C{count} consecutive items of
+    struct format C{fmt}.
+
+    >>> _repeat_format('<fff', 2)
+    '<6f'
+    >>> _repeat_format('>Hf', 2)
+    '>HfHf'
+    """
+    codes = fmt[1:]
+    if len(set(codes)) == 1:
+        return "%s%i%s" % (fmt[0], count * len(codes), codes[0])
+    return fmt[0] + codes * count
+
+_typecodes = {}
+
+def _get_typecode(fmt):
+    """Return the :class:`array.array` type code which can hold the
+    values of struct format C{fmt}, or ``None`` if these values do not
+    all have the same type.
+
+    >>> _get_typecode('<fff')
+    'f'
+    >>> print(_get_typecode('>Hf'))
+    None
+    """
+    codes = fmt[1:]
+    try:
+        return _typecodes[codes]
+    except KeyError:
+        pass
+    typecode = None
+    if len(set(codes)) == 1:
+        code = codes[0]
+        if code in "fd":
+            candidates = code
+        elif code in "bhilq":
+            candidates = "bhilq"
+        elif code in "BHILQ":
+            candidates = "BHILQ"
+        else:
+            candidates = ""
+        # struct formats with a byte order use standard sizes, array
+        # type codes have native sizes
+        size = struct.calcsize("<" + code)
+        for candidate in candidates:
+            if array.array(candidate).itemsize == size:
+                typecode = candidate
+                break
+    _typecodes[codes] = typecode
+    return typecode
+
+def _needs_byteswap(fmt):
+    """Whether values of struct format C{fmt} have a byte order which
+    differs from the native one."""
+    return fmt[0] == ("<" if sys.byteorder == "big" else ">")
+
+def _materialized(method):
+    """Wrap a list method, so that it first creates the elements of
+    lists that store their values in bulk (see L{_ListWrap._materialize})."""
+    def wrapper(self, *args, **kwargs):
+        self._materialize()
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
 
 class _ListWrap(list, DetailNode):
     """A wrapper for list, which uses get_value and set_value for
-    getting and setting items of the basic type."""
+    getting and setting items of the basic type.
+
+    The values of elements with a fixed binary layout can also be kept
+    in an :class:`array.array`, without creating the elements (see
+    L{_set_storage}). The elements are created as soon as they are
+    needed, that is, when an element, rather than the value of a basic
+    element, is requested, or when the list is changed.
+
+    Until then, the underlying list is empty: code which bypasses the
+    methods of this class, such as C{list.__iter__(arr)},
+    C{list.__getitem__(arr, i)}, or C{list.__len__(arr)}, sees no
+    elements. Call L{get_detail_child_nodes} first, which creates
+    them."""
+
+    # values of all elements, as an array.array, for lists whose elements
+    # have not been created yet; ``None`` otherwise
+    _storage = None
 
     def __init__(self, element_type, parent = None):
         self._parent = weakref.ref(parent) if parent else None
         self._elementType = element_type
+        self._set_item_hooks(element_type)
+
+    def _set_item_hooks(self, element_type):
+        """Set the item getter, setter, and iterator for elements of
+        type C{element_type}."""
         # we link to the unbound methods (that is, self.__class__.xxx
         # instead of self.xxx) to avoid circular references!!
         if issubclass(element_type, BasicBase):
@@ -109,22 +202,215 @@ class _ListWrap(list, DetailNode):
         elements."""
         return list.__getitem__(self, index)
 
+    def __len__(self):
+        """Return the number of elements, also if they are stored in
+        bulk."""
+        if self._storage is not None:
+            return len(self._storage) // (len(self._storage_format) - 1)
+        return list.__len__(self)
+
+    # list methods which need the elements
+    __add__ = _materialized(list.__add__)
+    __delitem__ = _materialized(list.__delitem__)
+    __eq__ = _materialized(list.__eq__)
+    __ge__ = _materialized(list.__ge__)
+    __gt__ = _materialized(list.__gt__)
+    __iadd__ = _materialized(list.__iadd__)
+    __imul__ = _materialized(list.__imul__)
+    __le__ = _materialized(list.__le__)
+    __lt__ = _materialized(list.__lt__)
+    __mul__ = _materialized(list.__mul__)
+    __ne__ = _materialized(list.__ne__)
+    __repr__ = _materialized(list.__repr__)
+    __reversed__ = _materialized(list.__reversed__)
+    __rmul__ = _materialized(list.__rmul__)
+    append = _materialized(list.append)
+    clear = _materialized(list.clear)
+    copy = _materialized(list.copy)
+    count = _materialized(list.count)
+    extend = _materialized(list.extend)
+    index = _materialized(list.index)
+    insert = _materialized(list.insert)
+    pop = _materialized(list.pop)
+    remove = _materialized(list.remove)
+    reverse = _materialized(list.reverse)
+    sort = _materialized(list.sort)
+
+    def get_stored_item(self, index):
+        """Item getter which calls C{get_value()} on an element holding
+        the stored value. Applies when the list stores the values of its
+        BasicBase elements in bulk."""
+        if isinstance(index, slice):
+            return self.get_materialized_item(index)
+        elem = self._get_storage_element()
+        elem._value = self._storage[index]
+        return elem.get_value()
+
+    def iter_stored_item(self):
+        """Iterator which calls C{get_value()} on an element holding each
+        stored value. Applies when the list stores the values of its
+        BasicBase elements in bulk."""
+        elem = self._get_storage_element()
+        for value in self._storage:
+            elem._value = value
+            yield elem.get_value()
+
+    def get_materialized_item(self, index):
+        """Item getter which creates the elements first. Applies when the
+        list stores the values of its elements in bulk."""
+        self._materialize()
+        return self[index]
+
+    def set_materialized_item(self, index, value):
+        """Item setter which creates the elements first. Applies when the
+        list stores the values of its elements in bulk."""
+        self._materialize()
+        self[index] = value
+
+    def iter_materialized_item(self):
+        """Iterator which creates the elements first. Applies when the
+        list stores the values of its elements in bulk."""
+        self._materialize()
+        return iter(self)
+
+    def get_attribute_values(self, *names):
+        """Return a list with, for every element, the tuple of the
+        values of its basic attributes C{names} (for instance, C{"x",
+        "y", "z"} for vectors). This bypasses the attribute properties,
+        which makes it a lot faster for large arrays; it only applies to
+        basic types which store their value as is, such as numbers.
+        Values stored in bulk are returned without creating the
+        elements.
+        """
+        if (self._storage is not None
+            and self._storage_names is not None
+            and all(name in self._storage_names for name in names)):
+            width = len(self._storage_names)
+            columns = [
+                self._storage[self._storage_names.index(name)::width]
+                for name in names]
+            return list(zip(*columns))
+        self._materialize()
+        getter = operator.attrgetter(
+            *("_%s_value_._value" % name for name in names))
+        if len(names) == 1:
+            return [(getter(elem),) for elem in list.__iter__(self)]
+        return [getter(elem) for elem in list.__iter__(self)]
+
+    def set_attribute_values(self, names, values):
+        """Set, for every element, the values of its basic attributes
+        C{names} from the matching tuple of C{values}. This is the
+        counterpart of L{get_attribute_values}.
+        """
+        self._materialize()
+        getter = operator.attrgetter(
+            *("_%s_value_" % name for name in names))
+        if len(names) == 1:
+            for elem, value in zip(list.__iter__(self), values):
+                getter(elem).set_value(value[0])
+        else:
+            for elem, value in zip(list.__iter__(self), values):
+                for attr, attr_value in zip(getter(elem), value):
+                    attr.set_value(attr_value)
+
     # DetailNode
 
     def get_detail_child_nodes(self, edge_filter=EdgeFilter()):
         """Yield children."""
+        self._materialize()
         return (item for item in list.__iter__(self))
 
     def get_detail_child_names(self, edge_filter=EdgeFilter()):
         """Yield child names."""
+        self._materialize()
         return ("[%i]" % row for row in range(list.__len__(self)))
 
+    def _set_storage(self, storage, fmt, names, template, argument):
+        """Keep the values of all elements in C{storage}, an
+        :class:`array.array` with the values of struct format C{fmt},
+        instead of creating the elements. For structures, C{names} are
+        the names of the basic attributes of every element in C{fmt};
+        it is ``None`` for basic elements. The elements are created with
+        C{template} and C{argument} once they are needed."""
+        self._storage = None
+        list.__delitem__(self, slice(None))
+        self._storage = storage
+        self._storage_format = fmt
+        self._storage_names = names
+        self._storage_arguments = (template, argument)
+        if names is None:
+            self._get_item_hook = self.__class__.get_stored_item
+            self._iter_item_hook = self.__class__.iter_stored_item
+        else:
+            self._get_item_hook = self.__class__.get_materialized_item
+            self._iter_item_hook = self.__class__.iter_materialized_item
+        self._set_item_hook = self.__class__.set_materialized_item
+
+    def _write_storage(self, stream, fmt):
+        """Write the stored values, with the byte order of struct format
+        C{fmt}."""
+        storage = self._storage
+        if _needs_byteswap(fmt):
+            storage = array.array(storage.typecode, storage)
+            storage.byteswap()
+        stream.write(storage.tobytes())
+
+    def _get_storage_element(self):
+        """Return an element which converts stored values, see
+        L{get_stored_item}."""
+        try:
+            return self._storage_element
+        except AttributeError:
+            template, argument = self._storage_arguments
+            self._storage_element = self._elementType(
+                template=template, argument=argument)
+            return self._storage_element
+
+    def _append_elements(self, rows, getters, template, argument):
+        """Create elements from C{rows}, which are values for basic
+        elements, or tuples of values of the basic attributes returned
+        by C{getters} for structures, and append them."""
+        element_type = self._elementType
+        if getters is None:
+            for value in rows:
+                elem = element_type(
+                    template=template, argument=argument, parent=self)
+                elem._value = value
+                list.append(self, elem)
+        else:
+            for values in rows:
+                elem = element_type(
+                    template=template, argument=argument, parent=self)
+                for getter, value in zip(getters, values):
+                    getter(elem)._value = value
+                list.append(self, elem)
+
+    def _materialize(self):
+        """Create the elements from the stored values, if any."""
+        storage = self._storage
+        if storage is None:
+            return
+        self._storage = None
+        self._set_item_hooks(self._elementType)
+        template, argument = self._storage_arguments
+        if self._storage_names is None:
+            self._append_elements(storage, None, template, argument)
+        else:
+            getters = [operator.attrgetter("_%s_value_" % name)
+                       for name in self._storage_names]
+            self._append_elements(zip(*[iter(storage)] * len(getters)),
+                                  getters, template, argument)
+
 class Array(_ListWrap):
     """A general purpose class for 1 or 2 dimensional arrays consisting of
     either BasicBase or StructBase elements."""
 
     logger = logging.getLogger("pyffi.nif.data.array")
     arg = None # default argument
+    # index which keeps track of the links in the array, if any (see
+    # pyffi.formats.nif.NifFormat.Data.ReferrerIndex); new elements
+    # are added to it
+    _referrer_index = None
 
     def __init__(
         self,
@@ -164,7 +450,7 @@ class Array(_ListWrap):
                         template = self._elementTypeTemplate,
                         argument = self._elementTypeArgument,
                         parent = self)
-                self.append(elem_instance)
+                list.append(self, elem_instance)
         else:
             for i in range(self._len1()):
                 elem = _ListWrap(element_type = element_type, parent = self)
@@ -173,16 +459,16 @@ class Array(_ListWrap):
                             template = self._elementTypeTemplate,
                             argument = self._elementTypeArgument,
                             parent = elem)
-                    elem.append(elem_instance)
-                self.append(elem)
+                    list.append(elem, elem_instance)
+                list.append(self, elem)
 
     def _len1(self):
         """The length the array should have, obtained by evaluating
         the count1 expression."""
         if self._parent is None:
-            return self._count1.eval()
+            return self._count1.compile()(None)
         else:
-            return self._count1.eval(self._parent())
+            return self._count1.compile()(self._parent())
 
     def _len2(self, index1):
         """The length the array should have, obtained by evaluating
@@ -190,9 +476,9 @@ class Array(_ListWrap):
         if self._count2 is None:
             raise ValueError('single array treated as double array (bug?)')
         if self._parent is None:
-            expr = self._count2.eval()
+            expr = self._count2.compile()(None)
         else:
-            expr = self._count2.eval(self._parent())
+            expr = self._count2.compile()(self._parent())
         if isinstance(expr, int):
             return expr
         else:
@@ -225,6 +511,7 @@ class Array(_ListWrap):
 
     # string of the array
     def __str__(self):
+        self._materialize()
         text = '%s instance at 0x%08X\n' % (self.__class__, id(self))
         if self._count2 is None:
             for i, element in enumerate(list.__iter__(self)):
@@ -237,7 +524,7 @@ class Array(_ListWrap):
         else:
             k = 0
             for i, elemlist in enumerate(list.__iter__(self)):
-                for j, elem in enumerate(list.__iter__(elemlist)):
+                for j, elem in enumerate(elemlist.get_detail_child_nodes()):
                     if k > 16:
                         text += "etc...\n"
                         break
@@ -256,14 +543,29 @@ class Array(_ListWrap):
         old_size = len(self)
         new_size = self._len1()
         if self._count2 is None:
+            if new_size != old_size:
+                self._materialize()
             if new_size < old_size:
+                # clear links before removing them, so anything that keeps
+                # track of links notices
+                if (self._elementType._has_links
+                        and issubclass(self._elementType, BasicBase)):
+                    for elem in list.__getitem__(self,
+                                                 slice(new_size, old_size)):
+                        elem.set_value(None)
+                elif self._referrer_index is not None:
+                    for elem in list.__getitem__(self,
+                                                 slice(new_size, old_size)):
+                        self._referrer_index.remove_element(elem)
                 del self[new_size:old_size]
             else:
                 for i in range(new_size-old_size):
                     elem = self._elementType(
                         template = self._elementTypeTemplate,
                         argument = self._elementTypeArgument)
-                    self.append(elem)
+                    list.append(self, elem)
+                    if self._referrer_index is not None:
+                        self._referrer_index.add_element(elem)
         else:
             if new_size < old_size:
                 del self[new_size:old_size]
@@ -292,10 +594,24 @@ class Array(_ListWrap):
         self.logger.debug("Reading array of size " + str(len1))
         if len1 > 0x10000000:
             raise ValueError('array too long (%i)' % len1)
+        if self._storage is not None:
+            self._storage = None
+            self._set_item_hooks(self._elementType)
         del self[0:self.__len__()]
 
+        # elements with a fixed binary layout are read all at once, and
+        # their values are stored in bulk if they all have the same type
+        fmt = self._elementType.get_struct_format(data)
+        typecode = _get_typecode(fmt) if fmt is not None else None
+
         # read array
         if self._count2 is None:
+            if typecode is not None:
+                self._read_storage(stream, data, fmt, typecode, self, len1)
+                return
+            if fmt is not None:
+                self._read_elements(stream, data, fmt, self, len1)
+                return
             for i in range(len1):
                 elem = self._elementType(
                     template = self._elementTypeTemplate,
@@ -309,13 +625,19 @@ class Array(_ListWrap):
                 if len2i > 0x10000000:
                     raise ValueError('array too long (%i)' % len2i)
                 elemlist = _ListWrap(self._elementType, parent = self)
-                for j in range(len2i):
-                    elem = self._elementType(
-                        template = self._elementTypeTemplate,
-                        argument = self._elementTypeArgument,
-                        parent = elemlist)
-                    elem.read(stream, data)
-                    elemlist.append(elem)
+                if typecode is not None:
+                    self._read_storage(
+                        stream, data, fmt, typecode, elemlist, len2i)
+                elif fmt is not None:
+                    self._read_elements(stream, data, fmt, elemlist, len2i)
+                else:
+                    for j in range(len2i):
+                        elem = self._elementType(
+                            template = self._elementTypeTemplate,
+                            argument = self._elementTypeArgument,
+                            parent = elemlist)
+                        elem.read(stream, data)
+                        elemlist.append(elem)
                 self.append(elemlist)
 
     def write(self, stream, data):
@@ -327,7 +649,14 @@ class Array(_ListWrap):
 describing number of elements (%i)'%(self.__len__(),len1))
         if len1 > 0x10000000:
             raise ValueError('array too long (%i)' % len1)
+        # elements with a fixed binary layout are written all at once
+        fmt = self._elementType.get_struct_format(data)
         if self._count2 is None:
+            if self._write_stored(stream, fmt, self):
+                return
+            if fmt is not None:
+                self._write_elements(stream, data, fmt, self)
+                return
             for elem in list.__iter__(self):
                 elem.write(stream, data)
         else:
@@ -338,9 +667,96 @@ describing number of elements (%i)'%(self.__len__(),len1))
 describing number of elements (%i)"%(elemlist.__len__(),len2i))
                 if len2i > 0x10000000:
                     raise ValueError('array too long (%i)' % len2i)
+                if self._write_stored(stream, fmt, elemlist):
+                    continue
+                if fmt is not None:
+                    self._write_elements(stream, data, fmt, elemlist)
+                    continue
                 for elem in list.__iter__(elemlist):
                     elem.write(stream, data)
 
+    def _get_value_getters(self, data):
+        """Return getters for the basic attribute instances of an element
+        with a fixed binary layout, or ``None`` if the elements are basic
+        types themselves."""
+        if issubclass(self._elementType, BasicBase):
+            return None
+        return [entry[1]
+                for entry in self._elementType._get_attribute_plan(data)]
+
+    @staticmethod
+    def _read_buffer(stream, fmt, count):
+        """Read the data of C{count} elements with struct format C{fmt}
+        from C{stream}."""
+        size = struct.calcsize(fmt) * count
+        buf = read_view(stream, size)
+        if len(buf) != size:
+            raise struct.error("unpack requires a buffer of %i bytes" % size)
+        return buf
+
+    def _read_elements(self, stream, data, fmt, elemlist, count):
+        """Read C{count} elements with struct format C{fmt} with a single
+        read from C{stream}, and append them to C{elemlist}."""
+        buf = self._read_buffer(stream, fmt, count)
+        getters = self._get_value_getters(data)
+        if getters is None:
+            rows = struct.unpack(_repeat_format(fmt, count), buf)
+        else:
+            rows = struct.iter_unpack(fmt, buf)
+        elemlist._append_elements(rows, getters, self._elementTypeTemplate,
+                                  self._elementTypeArgument)
+
+    def _read_storage(self, stream, data, fmt, typecode, elemlist, count):
+        """Read C{count} elements with struct format C{fmt}, whose
+        values all have type C{typecode}, into an :class:`array.array`
+        which C{elemlist} keeps instead of the elements. The elements are
+        only created once they are needed, so arrays that are just read
+        and written again (as most vertex lists, for instance) do not
+        need an instance for every value."""
+        storage = array.array(typecode)
+        storage.frombytes(self._read_buffer(stream, fmt, count))
+        if _needs_byteswap(fmt):
+            storage.byteswap()
+        if issubclass(self._elementType, BasicBase):
+            names = None
+        else:
+            names = [entry[0].name
+                     for entry in self._elementType._get_attribute_plan(data)]
+        elemlist._set_storage(storage, fmt, names, self._elementTypeTemplate,
+                              self._elementTypeArgument)
+
+    @staticmethod
+    def _write_stored(stream, fmt, elemlist):
+        """Write the values that C{elemlist} stores in bulk, if any, and
+        if they still have struct format C{fmt}. Otherwise, create the
+        elements of C{elemlist}, and return ``False``."""
+        if elemlist._storage is None:
+            return False
+        if fmt is not None and fmt[1:] == elemlist._storage_format[1:]:
+            elemlist._write_storage(stream, fmt)
+            return True
+        elemlist._materialize()
+        return False
+
+    def _write_elements(self, stream, data, fmt, elemlist):
+        """Write all elements of C{elemlist}, which have struct format
+        C{fmt}, with a single write to C{stream}."""
+        getters = self._get_value_getters(data)
+        if getters is None:
+            values = [elem._value for elem in list.__iter__(elemlist)]
+        else:
+            values = [getter(elem)._value
+                      for elem in list.__iter__(elemlist)
+                      for getter in getters]
+        try:
+            buf = struct.pack(_repeat_format(fmt, len(elemlist)), *values)
+        except (struct.error, OverflowError):
+            # let the elements deal with (or report) bad values
+            for elem in list.__iter__(elemlist):
+                elem.write(stream, data)
+        else:
+            stream.write(buf)
+
     def fix_links(self, data):
         """Fix the links in the array by calling C{fix_links} on all elements
         of the array."""
@@ -381,6 +797,17 @@ describing number of elements (%i)"%(elemlist.__len__(),len2i))
 
     def get_size(self, data=None):
         """Calculate the sum of the size of all elements in the array."""
+        if data is not None:
+            fmt = self._elementType.get_struct_format(data)
+            if fmt is not None:
+                if self._count2 is None:
+                    count = len(self)
+                else:
+                    count = sum(len(elemlist)
+                                for elemlist in list.__iter__(self))
+                return struct.calcsize(fmt) * count
+        if self._storage is not None:
+            return struct.calcsize(self._storage_format) * len(self)
         return sum(
             (elem.get_size(data) for elem in self._elementList()), 0)
 
@@ -398,11 +825,13 @@ describing number of elements (%i)"%(elemlist.__len__(),len2i))
 
     def _elementList(self, **kwargs):
         """Generator for listing all elements."""
+        self._materialize()
         if self._count2 is None:
             for elem in list.__iter__(self):
                 yield elem
         else:
             for elemlist in list.__iter__(self):
+                elemlist._materialize()
                 for elem in list.__iter__(elemlist):
                     yield elem
 
@@ -142,6 +142,15 @@ class BasicBase(DetailNode):
         identify the object uniquely."""
         raise NotImplementedError
 
+    @classmethod
+    def get_struct_format(cls, data):
+        """Returns the :mod:`struct` format string (including byte
+        order) of this type, if its value is stored in the C{_value}
+        instance variable and read and written by plain packing and
+        unpacking. Returns ``None`` otherwise, which is the default.
+        Arrays use this to read and write all their elements at once."""
+        return None
+
     def replace_global_node(self, oldbranch, newbranch, **kwargs):
         """Replace a given branch."""
         pass
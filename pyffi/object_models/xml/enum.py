@@ -169,6 +169,15 @@ class EnumBase(BasicBase, EditableComboBox, metaclass=_MetaEnumBase):
         stream.write(struct.pack(data._byte_order + self._struct,
                                  self._value))
 
+    @classmethod
+    def get_struct_format(cls, data):
+        """Return struct format string, unless read or write are
+        overridden.
+        """
+        if cls.read is not EnumBase.read or cls.write is not EnumBase.write:
+            return None
+        return data._byte_order + cls._struct
+
     def __str__(self):
         try:
             return self._enumkeys[self._enumvalues.index(self.get_value())]
@@ -40,6 +40,8 @@
 # ***** END LICENSE BLOCK *****
 # --------------------------------------------------------------------------
 
+import keyword
+from operator import attrgetter
 import re
 import sys  # stderr (for debugging)
 
@@ -73,11 +75,24 @@ class Expression(object):
     True
     >>> bool(Expression('1 != 1').eval())
     False
+
+    Expressions are compiled into a Python function on first use:
+
+    >>> f = Expression('(x || y) && 99 & 15').compile()
+    >>> f(a)
+    3
+    >>> print(Expression('(x || y) && 99 & 15').source())
+    lambda data: ((data.x) or (data.y)) and ((99) & (15))
     """
 
     operators = set(('==', '!=', '>=', '<=', '&&', '||', '&', '|', '-', '!',
                      '<', '>', '/', '*', '+'))
 
+    # python equivalents of the operators
+    _python_operators = {'&&': 'and', '||': 'or', '!': 'not', '/': '//'}
+
+    _compiled = None
+
     def __init__(self, expr_str, name_filter=None):
         try:
             left, self._op, right = self._partition(expr_str)
@@ -88,10 +103,80 @@ class Expression(object):
             raise
 
     def eval(self, data=None):
-        """Evaluate the expression to an integer."""
+        """Evaluate the expression to an integer. This calls the
+        compiled expression, see :meth:`compile`."""
+        return (self._compiled or self.compile())(data)
+
+    def compile(self):
+        """Return a function which takes a single argument (the object
+        on which names are looked up) and evaluates the expression. The
+        function is generated once, and reused until the expression is
+        changed by :meth:`map_`.
+        """
+        if self._compiled is None:
+            namespace = {}
+            source = self.source(namespace)
+            self._compiled = eval(source, namespace)
+        return self._compiled
+
+    def source(self, namespace=None):
+        """Python source code of a lambda function which evaluates the
+        expression.
+
+        :param namespace: Dictionary where the objects are stored that
+            the source refers to (such as types and attribute getters).
+        :type namespace: ``dict``
+        """
+        if namespace is None:
+            namespace = {}
+        return "lambda data: " + self._source(namespace)
+
+    def _source(self, namespace):
+        """Python source of the expression body, see :meth:`source`."""
+        if not self._op:
+            return self._operand_source(self._left, namespace, True)
+        right = self._operand_source(self._right, namespace, False)
+        op = self._python_operators.get(self._op, self._op)
+        if self._op == '!':
+            return "not (%s)" % right
+        left = self._operand_source(self._left, namespace, True)
+        return "(%s) %s (%s)" % (left, op, right)
+
+    @staticmethod
+    def _operand_source(operand, namespace, is_left):
+        """Python source for the left or right operand."""
+        if isinstance(operand, Expression):
+            return operand._source(namespace)
+        elif isinstance(operand, str):
+            if operand == '""' or not operand:
+                return '""'
+            # note: only names on the left hand side can have components
+            if is_left and "." in operand:
+                getter = "_get%i" % len(namespace)
+                namespace[getter] = attrgetter(operand)
+                return "%s(data)" % getter
+            elif operand.isidentifier() and not keyword.iskeyword(operand):
+                return "data.%s" % operand
+            else:
+                return "getattr(data, %r)" % operand
+        elif isinstance(operand, type):
+            type_name = "_type%i" % len(namespace)
+            namespace[type_name] = operand
+            return "isinstance(data, %s)" % type_name
+        elif operand is None:
+            return "None"
+        else:
+            assert (isinstance(operand, int))  # debug
+            return repr(operand)
+
+    def _eval_tree(self, data=None):
+        """Evaluate the expression by walking the expression tree.
+        This is much slower than the compiled expression, and is only
+        kept as reference implementation.
+        """
 
         if isinstance(self._left, Expression):
-            left = self._left.eval(data)
+            left = self._left._eval_tree(data)
         elif isinstance(self._left, str):
             if self._left == '""':
                 left = ""
@@ -111,7 +196,7 @@ class Expression(object):
             return left
 
         if isinstance(self._right, Expression):
-            right = self._right.eval(data)
+            right = self._right._eval_tree(data)
         elif isinstance(self._right, str):
             if (not self._right) or self._right == '""':
                 right = ""
@@ -150,7 +235,8 @@ class Expression(object):
         elif self._op == '<':
             return left < right
         elif self._op == '/':
-            return left / right
+            # integer division, as in the file format descriptions
+            return left // right
         elif self._op == '*':
             return left * right
         elif self._op == '+':
@@ -338,7 +424,14 @@ class Expression(object):
                 raise ValueError("expression syntax error (non-matching brackets?)")
         return start_pos, end_pos
 
+    def __getstate__(self):
+        # the compiled function cannot be pickled
+        state = self.__dict__.copy()
+        state.pop("_compiled", None)
+        return state
+
     def map_(self, func):
+        self._compiled = None
         if isinstance(self._left, Expression):
             self._left.map_(func)
         else:
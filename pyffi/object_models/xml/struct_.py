@@ -42,6 +42,7 @@
 # note: some imports are defined at the end to avoid problems with circularity
 import logging
 from functools import partial
+from operator import attrgetter
 
 
 from pyffi.utils.graph import DetailNode, GlobalNode, EdgeFilter
@@ -134,6 +135,11 @@ class _MetaStructBase(type):
         # precalculate the attribute name list
         cls._names = cls._get_names()
 
+        # attribute plans, compiled on demand for every version triple
+        # (see StructBase._get_attribute_plan)
+        cls._attribute_plans = {}
+        cls._struct_formats = {}
+
     def __repr__(cls):
         return "<struct '%s'>"%(cls.__name__)
 
@@ -356,62 +362,81 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
 
     def read(self, stream, data):
         """Read structure from stream."""
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        names = None
         # read all attributes
-        for attr in self._get_filtered_attribute_list(data):
+        for attr, getter, cond, dup, arg_getter in self._get_attribute_plan(
+                data):
+            # check runtime conditions and duplicate names
+            if cond is not None and not cond(self):
+                continue
+            if dup:
+                if names is None:
+                    names = set()
+                elif attr.name in names:
+                    continue
+                names.add(attr.name)
             # skip abstract attributes
             if attr.is_abstract:
                 continue
-            # get attribute argument (can only be done at runtime)
-            rt_arg = attr.arg if isinstance(attr.arg, (int, type(None))) \
-                else getattr(self, attr.arg)
             # read the attribute
-            attr_value = getattr(self, "_%s_value_" % attr.name)
-            attr_value.arg = rt_arg
-            # if hasattr(attr, "type_"):
-            #     attr_value._elementType = attr.type_
-            self._log_struct(stream, attr)
+            attr_value = getter(self)
+            # get attribute argument (can only be done at runtime)
+            attr_value.arg = (attr.arg if arg_getter is None
+                              else arg_getter(self))
+            if debug:
+                self._log_struct(stream, attr)
             attr_value.read(stream, data)
 
-
     def write(self, stream, data):
         """Write structure to stream."""
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        names = None
         # write all attributes
-        for attr in self._get_filtered_attribute_list(data):
+        for attr, getter, cond, dup, arg_getter in self._get_attribute_plan(
+                data):
+            # check runtime conditions and duplicate names
+            if cond is not None and not cond(self):
+                continue
+            if dup:
+                if names is None:
+                    names = set()
+                elif attr.name in names:
+                    continue
+                names.add(attr.name)
             # skip abstract attributes
             if attr.is_abstract:
                 continue
-            # get attribute argument (can only be done at runtime)
-            rt_arg = attr.arg if isinstance(attr.arg, (int, type(None))) \
-                     else getattr(self, attr.arg)
             # write the attribute
-            attr_value = getattr(self, "_%s_value_" % attr.name)
-            attr_value.arg = rt_arg
-            getattr(self, "_%s_value_" % attr.name).write(stream, data)
-            self._log_struct(stream, attr)
+            attr_value = getter(self)
+            # get attribute argument (can only be done at runtime)
+            attr_value.arg = (attr.arg if arg_getter is None
+                              else arg_getter(self))
+            attr_value.write(stream, data)
+            if debug:
+                self._log_struct(stream, attr)
 
     def fix_links(self, data):
         """Fix links in the structure."""
-        # parse arguments
         # fix links in all attributes
-        for attr in self._get_filtered_attribute_list(data):
+        for attr, attr_value in self._get_filtered_attribute_values(data):
             # check if there are any links at all, commonly this speeds things up considerably
             if not attr.type_._has_links:
                 continue
             self.logger.debug("fixlinks %s" % attr.name)
             # fix the links in the attribute
-            getattr(self, "_%s_value_" % attr.name).fix_links(data)
+            attr_value.fix_links(data)
 
     def get_links(self, data=None):
         """Get list of all links in the structure."""
         # get all links
         links = []
-        for attr in self._get_filtered_attribute_list(data):
+        for attr, attr_value in self._get_filtered_attribute_values(data):
             # check if there are any links at all, this speeds things up considerably
             if not attr.type_._has_links:
                 continue
             # extend list of links
-            links.extend(
-                getattr(self, "_" + attr.name + "_value_").get_links(data))
+            links.extend(attr_value.get_links(data))
         # return the list of all links in all attributes
         return links
 
@@ -419,13 +444,12 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
         """Get list of all strings in the structure."""
         # get all strings
         strings = []
-        for attr in self._get_filtered_attribute_list(data):
+        for attr, attr_value in self._get_filtered_attribute_values(data):
             # check if there are any strings at all, this speeds things up considerably
             if (not attr.type_ is type(None)) and (not attr.type_._has_strings):
                 continue
             # extend list of strings
-            strings.extend(
-                getattr(self, "_%s_value_" % attr.name).get_strings(data))
+            strings.extend(attr_value.get_strings(data))
         # return the list of all strings in all attributes
         return strings
 
@@ -436,14 +460,13 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
         get_links, as get_links could result in infinite recursion."""
         # get all refs
         refs = []
-        for attr in self._get_filtered_attribute_list(data):
+        for attr, attr_value in self._get_filtered_attribute_values(data):
             # check if there are any links at all
             # (this speeds things up considerably)
             if (not attr.type_ is type(None)) and (not attr.type_._has_links):
                 continue
             # extend list of refs
-            refs.extend(
-                getattr(self, "_%s_value_" % attr.name).get_refs(data))
+            refs.extend(attr_value.get_refs(data))
         # return the list of all refs in all attributes
         return refs
 
@@ -451,20 +474,19 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
         """Calculate the structure size in bytes."""
         # calculate size
         size = 0
-        for attr in self._get_filtered_attribute_list(data):
+        for attr, attr_value in self._get_filtered_attribute_values(data):
             # skip abstract attributes
             if attr.is_abstract:
                 continue
-            size += getattr(self, "_%s_value_" % attr.name).get_size(data)
+            size += attr_value.get_size(data)
         return size
 
     def get_hash(self, data=None):
         """Calculate a hash for the structure, as a tuple."""
         # calculate hash
         hsh = []
-        for attr in self._get_filtered_attribute_list(data):
-            hsh.append(
-                getattr(self, "_%s_value_" % attr.name).get_hash(data))
+        for attr, attr_value in self._get_filtered_attribute_values(data):
+            hsh.append(attr_value.get_hash(data))
         return tuple(hsh)
 
     def replace_global_node(self, oldbranch, newbranch, **kwargs):
@@ -517,61 +539,154 @@ class StructBase(GlobalNode, metaclass=_MetaStructBase):
                 names.append(attr.name)
         return names
 
-    def _get_filtered_attribute_list(self, data=None):
-        """Generator for listing all 'active' attributes, that is,
-        attributes whose condition evaluates ``True``, whose version
-        interval contains C{version}, and whose user version is
-        C{user_version}. ``None`` for C{version} or C{user_version} means
-        that these checks are ignored. Duplicate names are skipped as
-        well.
-
-        Note: version and user_version arguments are deprecated, use
-        the data argument instead.
+    @classmethod
+    def _get_attribute_plan(cls, data=None):
+        """Return the attribute plan of this structure for the versions
+        of C{data}. The plan is compiled only once for every (version,
+        user version, user version 2) triple, and lists, in order, all
+        attributes whose version interval, user version, and version
+        condition match, so only the conditions that depend on the
+        actual instance remain to be checked at runtime.
+
+        Each entry of the plan is a tuple C{(attr, getter, cond, dup,
+        arg_getter)}, where C{getter} gets the attribute value from
+        the instance, C{cond} is the compiled runtime condition, called
+        with the instance (or ``None``),
+        C{dup} flags names that occur more than once in the plan, and
+        C{arg_getter} gets the runtime argument from the instance (or
+        is ``None`` if the argument is constant).
+
+        >>> from pyffi.formats.nif import NifFormat
+        >>> data = NifFormat.Data(version=0x14000005)
+        >>> plan = NifFormat.NiNode._get_attribute_plan(data)
+        >>> plan is NifFormat.NiNode._get_attribute_plan(data)
+        True
+        >>> [entry[0].name for entry in plan][:3]
+        ['name', 'num_extra_data_list', 'extra_data_list']
         """
         if data is not None:
-            version = data.version
-            user_version = data.user_version
+            key = (data.version, data.user_version,
+                   getattr(data, "user_version_2", None))
         else:
-            version = None
-            user_version = None
-        names = set()
-        for attr in self._attribute_list:
-            #print(attr.name, version, attr.ver1, attr.ver2) # debug
-
+            key = (None, None, None)
+        try:
+            return cls._attribute_plans[key]
+        except KeyError:
+            pass
+        version, user_version = key[0], key[1]
+        # names of attributes that are always present, any later
+        # attribute with the same name can never be active
+        static_names = set()
+        attrs = []
+        for attr in cls._attribute_list:
             # check version
             if version is not None:
                 if attr.ver1 is not None and version < attr.ver1:
                     continue
                 if attr.ver2 is not None and version > attr.ver2:
                     continue
-            #print("version check passed") # debug
-
             # check user version
             if (attr.userver is not None and user_version is not None
                 and user_version != attr.userver):
                 continue
-            #print("user version check passed") # debug
-
-            # check conditions
-            if attr.cond is not None and not attr.cond.eval(self):
-                continue
-
+            # check version condition (only depends on the data versions)
             if (version is not None and user_version is not None
                 and attr.vercond is not None):
-                if not attr.vercond.eval(data):
+                if not attr.vercond.compile()(data):
                     continue
+            # skip duplicate names that can never be active
+            if attr.name in static_names:
+                continue
+            if attr.cond is None:
+                static_names.add(attr.name)
+            attrs.append(attr)
+        counts = {}
+        for attr in attrs:
+            counts[attr.name] = counts.get(attr.name, 0) + 1
+        plan = tuple(
+            (attr,
+             attrgetter("_%s_value_" % attr.name),
+             attr.cond.compile() if attr.cond is not None else None,
+             counts[attr.name] > 1,
+             attrgetter(attr.arg) if isinstance(attr.arg, str) else None)
+            for attr in attrs)
+        cls._attribute_plans[key] = plan
+        return plan
 
-            #print("condition passed") # debug
-
-            # skip dupiclate names
-
-            if attr.name in names:
+    @classmethod
+    def get_struct_format(cls, data):
+        """Return the :mod:`struct` format string of this structure, if
+        its attributes have a fixed binary layout for the versions of
+        C{data}, that is, if all attributes are unconditional basic
+        types which have a struct format themselves. Returns ``None``
+        otherwise.
+
+        >>> from pyffi.formats.nif import NifFormat
+        >>> data = NifFormat.Data()
+        >>> NifFormat.Vector3.get_struct_format(data)
+        '<fff'
+        >>> print(NifFormat.NiNode.get_struct_format(data))
+        None
+        """
+        key = (data.version, data.user_version,
+               getattr(data, "user_version_2", None), data._byte_order)
+        try:
+            return cls._struct_formats[key]
+        except KeyError:
+            pass
+        fmt = None
+        if cls.read is StructBase.read and cls.write is StructBase.write:
+            fmt = data._byte_order
+            for attr, getter, cond, dup, arg_getter in (
+                    cls._get_attribute_plan(data)):
+                if (cond is not None or dup or attr.is_abstract
+                    or attr.arr1 is not None or attr.arg is not None
+                    or not issubclass(attr.type_, BasicBase)):
+                    fmt = None
+                    break
+                attr_fmt = attr.type_.get_struct_format(data)
+                if attr_fmt is None:
+                    fmt = None
+                    break
+                fmt += attr_fmt[1:]
+            else:
+                # structure without attributes
+                if fmt == data._byte_order:
+                    fmt = None
+        cls._struct_formats[key] = fmt
+        return fmt
+
+    def _get_filtered_attribute_values(self, data=None):
+        """Generator for listing all 'active' attributes along with
+        their value, as C{(attr, value)} pairs. See
+        L{_get_filtered_attribute_list}."""
+        names = None
+        for attr, getter, cond, dup, arg_getter in self._get_attribute_plan(
+                data):
+            # check conditions
+            if cond is not None and not cond(self):
                 continue
-            #print("duplicate check passed") # debug
+            # skip duplicate names
+            if dup:
+                if names is None:
+                    names = set()
+                elif attr.name in names:
+                    continue
+                names.add(attr.name)
+            yield attr, getter(self)
 
-            names.add(attr.name)
-            # passed all tests
-            # so yield the attribute
+    def _get_filtered_attribute_list(self, data=None):
+        """Generator for listing all 'active' attributes, that is,
+        attributes whose condition evaluates ``True``, whose version
+        interval contains C{version}, and whose user version is
+        C{user_version}. ``None`` for C{version} or C{user_version} means
+        that these checks are ignored. Duplicate names are skipped as
+        well.
+
+        Note: version and user_version arguments are deprecated, use
+        the data argument instead.
+        """
+        for attr, attr_value in self._get_filtered_attribute_values(data):
             yield attr
 
     def get_attribute(self, name):
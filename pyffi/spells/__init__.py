@@ -138,20 +138,31 @@ the file format class of the files it can toast.
 from configparser import ConfigParser
 from copy import deepcopy
 import gc
+import hashlib  # sha1
+import io  # BytesIO
 
 import logging  # Logger
 import concurrent.futures  # ProcessPoolExecutor
+import csv  # writer
+import json  # dump
 import multiprocessing  # current_process, cpu_count
+import multiprocessing.util  # Finalize
 import optparse
 import os  # remove
 import os.path  # getsize, split, join
+import pickle  # dumps, loads
 import re  # for regex parsing (--skip, --only)
 import shlex  # shlex.split for parsing option lists in ini files
+import shutil  # copyfileobj
+import sqlite3  # connect
 import subprocess
 import tempfile
+import time  # perf_counter
+import tracemalloc  # peak memory of --profile
 
 import pyffi  # for pyffi.__version__
 import pyffi.object_models  # pyffi.object_models.FileFormat
+import pyffi.utils.mmapstream  # MmapStream
 
 
 class Spell(object):
@@ -604,36 +615,436 @@ class fake_logger:
         cls.level = level
 
 
-def _toaster_job(args):
-    """For multiprocessing. This function creates a new toaster, with the
-    given options and spells, and calls the toaster on filename.
+class _multiprocessing_fake_logger(fake_logger):
+    """Simple logger which works well along with multiprocessing on all platforms."""
+    @classmethod
+    def _log(cls, level, level_str, msg):
+        # do not actually log, just print
+        if level >= cls.level:
+            print("pyffi.toaster:%i:%s:%s"
+                  % (multiprocessing.current_process().pid,
+                     level_str, msg))
+
+_worker_toaster = None
+"""The toaster of the current worker process, created by
+:func:`_toaster_init`."""
+
+def _toaster_init(toasterclass, options, spellnames):
+    """For multiprocessing. Initializes a worker process: this function
+    creates the toaster, with the given options and spells, which is
+    used for all files that are sent to this worker.
     """
-
-    class multiprocessing_fake_logger(fake_logger):
-        """Simple logger which works well along with multiprocessing on all platforms."""
-        @classmethod
-        def _log(cls, level, level_str, msg):
-            # do not actually log, just print
-            if level >= cls.level:
-                print("pyffi.toaster:%i:%s:%s"
-                      % (multiprocessing.current_process().pid,
-                         level_str, msg))
-
-    toasterclass, filename, options, spellnames = args
+    global _worker_toaster
     toaster = toasterclass(options=options, spellnames=spellnames,
-                           logger=multiprocessing_fake_logger)
+                           logger=_multiprocessing_fake_logger)
+    if options.get("profile"):
+        toaster._profile = ToasterProfile()
 
     # toast entry code
     if not toaster.spellclass.toastentry(toaster):
         print("pyffi.toaster:%s" % "Spell does not apply! quiting early...")
         return
+    _worker_toaster = toaster
+
+    # toast exit code, when the worker process shuts down
+    multiprocessing.util.Finalize(
+        None, toaster.spellclass.toastexit, args=(toaster,), exitpriority=10)
+
+def _toaster_job(filename):
+    """For multiprocessing. This function calls the toaster of the
+    worker process on filename, and returns the results for this file
+    as a tuple (files_done, files_skipped, files_failed, profile), where
+    profile is the list of records of :class:`ToasterProfile`.
+    """
+    toaster = _worker_toaster
+    if toaster is None:
+        return {}, set(), set(), []
+    toaster.files_done = {}
+    toaster.files_skipped = set()
+    toaster.files_failed = set()
+    if toaster._profile is not None:
+        toaster._profile.files = []
 
     # toast single file
-    stream = open(filename, mode='rb' if toaster.spellclass.READONLY else 'r+b')
-    toaster._toast(stream)
+    with toaster._open(filename) as stream:
+        toaster._toast(stream)
+    if toaster.options["gccollect"]:
+        # force free memory (helps when parsing many files)
+        gc.collect()
+    profile = toaster._profile.files if toaster._profile is not None else []
+    return (toaster.files_done, toaster.files_skipped, toaster.files_failed,
+            profile)
+
+class ToasterCache(object):
+    """Persistent record of the outcome of toasting files, stored in an
+    sqlite database. Outcomes are keyed on the hash of the content of
+    the input file, along with a hash of the toaster configuration
+    (pyffi version, spells, and options) and the file the toaster
+    writes to, so files are toasted again as soon as either changes,
+    and files with the same content but another destination are
+    toasted separately. Failures are not stored, so files which failed
+    are toasted again on every run.
+
+    >>> cache = ToasterCache(":memory:", "config")
+    >>> key = cache.get_key(b"file content")
+    >>> cache.get(key) is None
+    True
+    >>> cache.set(key, ToasterCache.DONE, reports=["some report"])
+    >>> cache.get(key)
+    ('done', ['some report'], None, None)
+    >>> cache.get(cache.get_key(b"other content")) is None
+    True
+    >>> cache.get(cache.get_key(b"file content", "other.nif")) is None
+    True
+    >>> cache.close()
+    """
+
+    DONE = "done"
+    """Outcome of a file which was toasted, but not written."""
+
+    WRITTEN = "written"
+    """Outcome of a file which was toasted and written."""
+
+    IGNORED_OPTIONS = frozenset([
+        "cache", "gccollect", "inifile", "interactive", "jobs", "lazy",
+        "only", "pause", "profile", "refresh", "resume", "skip",
+        "verbose"])
+    """Options which do not affect the outcome of toasting a file,
+    such as those which only select the files to toast."""
+
+    def __init__(self, filename, config):
+        """Open the cache.
+
+        :param filename: The file of the sqlite database; it is created
+            if it does not exist.
+        :type filename: ``str``
+        :param config: Description of the toaster configuration.
+        :type config: ``str``
+        """
+        self.config = hashlib.sha1(config.encode("utf-8")).hexdigest()
+        # wait for other worker processes when they write
+        self.connection = sqlite3.connect(filename, timeout=60)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS outcomes ("
+                " key TEXT PRIMARY KEY, outcome TEXT, reports BLOB,"
+                " output TEXT, output_hash TEXT)")
+
+    @classmethod
+    def get_config(cls, toaster):
+        """Describe the configuration of a toaster that affects the
+        outcome of toasting a file.
+
+        :param toaster: The toaster.
+        :type toaster: :class:`Toaster`
+        :rtype: ``str``
+        """
+        options = sorted(
+            (key, value) for key, value in toaster.options.items()
+            if key not in cls.IGNORED_OPTIONS)
+        return repr((pyffi.__version__, toaster.FILEFORMAT.__name__,
+                     sorted(toaster.spellnames), options))
+
+    @staticmethod
+    def get_hash(content):
+        """Hash of the content of a file.
+
+        :param content: The content.
+        :type content: ``bytes`` or ``memoryview``
+        :rtype: ``str``
+        """
+        return hashlib.sha1(content).hexdigest()
+
+    def get_key(self, content, output=None):
+        """Get the key of the outcome of toasting a file.
+
+        :param content: The content of the file.
+        :type content: ``bytes`` or ``memoryview``
+        :param output: The name of the file that the toaster writes to,
+            if any.
+        :type output: ``str``
+        :rtype: ``str``
+        """
+        key = self.get_hash(content) + ":" + self.config
+        if output is not None:
+            key += ":" + output
+        return key
+
+    def get(self, key):
+        """Get the outcome stored for a key.
+
+        :param key: The key, from :meth:`get_key`.
+        :type key: ``str``
+        :return: ``None`` if there is no outcome for this key, and
+            otherwise a tuple with the outcome (:attr:`DONE` or
+            :attr:`WRITTEN`), the reports of the spell, and the name and
+            hash of the written file.
+        """
+        row = self.connection.execute(
+            "SELECT outcome, reports, output, output_hash FROM outcomes"
+            " WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        outcome, reports, output, output_hash = row
+        try:
+            reports = pickle.loads(reports)
+        except Exception:
+            # reports of an incompatible version, toast again
+            return None
+        return outcome, reports, output, output_hash
+
+    def set(self, key, outcome, reports=None, output=None, output_hash=None):
+        """Store the outcome of toasting a file.
+
+        :param key: The key, from :meth:`get_key`.
+        :type key: ``str``
+        :param outcome: :attr:`DONE` or :attr:`WRITTEN`.
+        :type outcome: ``str``
+        :param reports: The reports of the spell.
+        :param output: The name of the written file, if any.
+        :type output: ``str``
+        :param output_hash: The hash of the written file, if any.
+        :type output_hash: ``str``
+        """
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO outcomes VALUES (?, ?, ?, ?, ?)",
+                (key, outcome, pickle.dumps(reports), output, output_hash))
+
+    def close(self):
+        """Close the cache."""
+        self.connection.close()
+
+class ToasterProfile(object):
+    """Time and memory spent on toasting files, for the ``profile``
+    option. There is a record for every file, which is a ``dict`` with
+    the following keys:
+
+    * ``"file"``: the name of the file,
+    * ``"bytes_read"``, ``"bytes_written"``: the size of the file, and
+      of the written file (zero if it was not written),
+    * ``"read"``, ``"links"``, ``"spell"``, ``"write"``: seconds spent
+      on reading the file (without resolving links), on resolving
+      links, on casting the spells, and on writing the file,
+    * ``"spells"``: seconds spent in each spell, by spell name,
+    * ``"blocks"``: the number of blocks and seconds spent reading
+      them, by block type (only for formats that record it, see
+      :attr:`pyffi.object_models.FileFormat.Data.profile`),
+    * ``"peak_memory"``: the peak memory allocated while toasting the
+      file, in bytes, as traced by :mod:`tracemalloc`.
+
+    Records are plain data, so the records of worker processes can be
+    merged into the profile of the main process.
+
+    >>> profile = ToasterProfile()
+    >>> record = profile.start_file("test.nif")
+    >>> record["bytes_read"] = 100
+    >>> record["spells"]["fix_strip"] = 0.5
+    >>> record["blocks"]["NiNode"] = [2, 0.25]
+    >>> profile.end_file()
+    >>> profile.close()
+    >>> profile.merge([dict(record, file="other.nif")])
+    >>> totals = profile.get_totals()
+    >>> totals["files"], totals["bytes_read"]
+    (2, 200)
+    >>> totals["spells"], totals["blocks"]
+    ({'fix_strip': 1.0}, {'NiNode': [4, 0.5]})
+    """
+
+    STAGES = ("read", "links", "spell", "write")
+    """Stages of toasting a file, timed separately."""
+
+    SPELL_METHODS = ("datainspect", "dataentry", "branchinspect",
+                     "branchentry", "branchexit", "dataexit")
+    """Methods of a spell which are timed by :meth:`time_spell`."""
+
+    def __init__(self):
+        self.files = []
+        self.record = None
+        self._memory = 0
+        self._lap = 0.0
+        self._tracing = False
 
-    # toast exit code
-    toaster.spellclass.toastexit(toaster)
+    def start_file(self, filename):
+        """Start the record of a file. Memory tracing is started
+        as well, if it was not yet started.
+
+        :param filename: The name of the file.
+        :type filename: ``str``
+        :return: The record.
+        :rtype: ``dict``
+        """
+        self.record = dict(
+            file=filename, bytes_read=0, bytes_written=0,
+            spells={}, blocks={}, peak_memory=0,
+            **dict.fromkeys(self.STAGES, 0.0))
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.clear_traces()
+        self._memory = tracemalloc.get_traced_memory()[0]
+        self._lap = time.perf_counter()
+        return self.record
+
+    def lap(self, stage):
+        """Add the time since the previous lap, or since the start of
+        the file, to a stage of the current file.
+
+        :param stage: One of :attr:`STAGES`.
+        :type stage: ``str``
+        """
+        now = time.perf_counter()
+        self.record[stage] += now - self._lap
+        self._lap = now
+
+    def end_file(self):
+        """Finish the record of the current file. The time spent on
+        resolving links, which is recorded by the data while reading,
+        is taken out of the time spent on reading.
+        """
+        record = self.record
+        record["read"] = max(0.0, record["read"] - record["links"])
+        record["peak_memory"] = max(
+            0, tracemalloc.get_traced_memory()[1] - self._memory)
+        self.files.append(record)
+        self.record = None
+
+    def close(self):
+        """Stop memory tracing, if it was started by this profile."""
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def time_spell(self, spell):
+        """Time the methods of a spell instance, and of all spells in
+        it if it is a group, in the record of the current file.
+
+        :param spell: The spell.
+        :type spell: :class:`Spell`
+        """
+        if isinstance(spell, SpellGroupBase):
+            for subspell in spell.spells:
+                self.time_spell(subspell)
+            return
+        times = self.record["spells"]
+        times.setdefault(spell.SPELLNAME, 0.0)
+        for name in self.SPELL_METHODS:
+            setattr(spell, name,
+                    self._timed(getattr(spell, name), spell.SPELLNAME, times))
+
+    @staticmethod
+    def _timed(method, spellname, times):
+        def timed(*args):
+            start = time.perf_counter()
+            try:
+                return method(*args)
+            finally:
+                times[spellname] += time.perf_counter() - start
+        return timed
+
+    def merge(self, files):
+        """Add the records of files toasted elsewhere, such as in a
+        worker process.
+
+        :param files: The records.
+        :type files: ``list`` of ``dict``
+        """
+        self.files.extend(files)
+
+    def get_totals(self):
+        """Sum the records of all files.
+
+        :return: The totals, with the same keys as a record, except
+            that ``"file"`` is replaced by ``"files"``, the number of
+            files, and that ``"peak_memory"`` is the largest peak of
+            all files.
+        :rtype: ``dict``
+        """
+        totals = dict(
+            files=len(self.files), bytes_read=0, bytes_written=0,
+            spells={}, blocks={}, peak_memory=0,
+            **dict.fromkeys(self.STAGES, 0.0))
+        for record in self.files:
+            for key in ("bytes_read", "bytes_written") + self.STAGES:
+                totals[key] += record[key]
+            totals["peak_memory"] = max(totals["peak_memory"],
+                                        record["peak_memory"])
+            for spellname, seconds in record["spells"].items():
+                totals["spells"][spellname] = (
+                    totals["spells"].get(spellname, 0.0) + seconds)
+            for block_type, (count, seconds) in record["blocks"].items():
+                stats = totals["blocks"].setdefault(block_type, [0, 0.0])
+                stats[0] += count
+                stats[1] += seconds
+        return totals
+
+    def write(self, filename):
+        """Write the report to a file: JSON with the totals and the
+        records of all files, or, if the file name ends with ``.csv``,
+        a table with a row per file and per stage, spell, or block
+        type, with columns file, stage, name, count, seconds, and
+        bytes.
+
+        :param filename: The name of the report.
+        :type filename: ``str``
+        """
+        if filename.lower().endswith(".csv"):
+            with open(filename, "w", newline="") as stream:
+                writer = csv.writer(stream)
+                writer.writerow(
+                    ("file", "stage", "name", "count", "seconds", "bytes"))
+                writer.writerows(self._get_rows())
+        else:
+            with open(filename, "w") as stream:
+                json.dump(dict(totals=self.get_totals(), files=self.files),
+                          stream, indent=1, sort_keys=True)
+
+    def _get_rows(self):
+        """Rows of the CSV report."""
+        for record in self.files:
+            filename = record["file"]
+            yield filename, "read", "", "", record["read"], record["bytes_read"]
+            yield filename, "links", "", "", record["links"], ""
+            for block_type, (count, seconds) in sorted(
+                    record["blocks"].items()):
+                yield filename, "block", block_type, count, seconds, ""
+            yield filename, "spell", "", "", record["spell"], ""
+            for spellname, seconds in sorted(record["spells"].items()):
+                yield filename, "spell", spellname, "", seconds, ""
+            yield (filename, "write", "", "", record["write"],
+                   record["bytes_written"])
+            yield filename, "memory", "", "", "", record["peak_memory"]
+
+    def get_summary(self, num_block_types=10):
+        """A table with the totals, the time spent in each spell, and
+        the block types which took longest to read.
+
+        :param num_block_types: Number of block types in the table.
+        :type num_block_types: ``int``
+        :rtype: ``str``
+        """
+        totals = self.get_totals()
+        lines = [
+            "profile of %i files: %i bytes read, %i bytes written,"
+            " peak memory %i bytes"
+            % (totals["files"], totals["bytes_read"],
+               totals["bytes_written"], totals["peak_memory"]),
+            "%-40s %10s %10s" % ("stage", "count", "seconds")]
+        for stage in self.STAGES:
+            lines.append("%-40s %10s %10.3f" % (stage, "", totals[stage]))
+        for spellname, seconds in sorted(
+                totals["spells"].items(), key=lambda item: -item[1]):
+            lines.append("%-40s %10s %10.3f"
+                         % ("spell " + spellname, "", seconds))
+        for block_type, (count, seconds) in sorted(
+                totals["blocks"].items(),
+                key=lambda item: -item[1][1])[:num_block_types]:
+            lines.append("%-40s %10i %10.3f"
+                         % ("read " + block_type, count, seconds))
+        return "\n".join(lines)
 
 # CPU_COUNT is used for default number of jobs
 if multiprocessing:
@@ -677,6 +1088,9 @@ class Toaster(object):
         archives=False,
         resume=False,
         gccollect=False,
+        lazy=False,
+        cache="",
+        profile="",
         inifile="")
     """List of spell classes of the particular :class:`Toaster` instance."""
 
@@ -701,6 +1115,12 @@ class Toaster(object):
     exclude_types = []
     """Tuple of types corresponding to the exclude key of :attr:`options`."""
 
+    _cache = None
+    """The :class:`ToasterCache`, opened when it is first needed."""
+
+    _profile = None
+    """The :class:`ToasterProfile`, if the ``profile`` option is set."""
+
     only_regexs = []
     """Tuple of regular expressions corresponding to the only key of :attr:`options`."""
 
@@ -923,6 +1343,14 @@ class Toaster(object):
             type="string",
             metavar="ARG",
             help="pass argument ARG to each spell")
+        parser.add_option(
+            "--cache", dest="cache",
+            type="string",
+            metavar="FILE",
+            help="keep track of the outcome of every file in the database"
+            " FILE (for instance, in the destination folder),"
+            " and skip files that were toasted before with the same"
+            " content, spells, and options")
         parser.add_option(
             "--dest-dir", dest="destdir",
             type="string",
@@ -982,6 +1410,12 @@ class Toaster(object):
             type="int",
             metavar="JOBS",
             help="allow JOBS jobs at once [default: %default]")
+        parser.add_option(
+            "--lazy", dest="lazy",
+            action="store_true",
+            help="only decode those parts of a file that are used by the"
+                 " spells, if the file format supports it"
+                 " [default: %default]")
         parser.add_option(
             "--noninteractive", dest="interactive",
             action="store_false",
@@ -1019,6 +1453,16 @@ class Toaster(object):
             metavar="PREFIX",
             help="prepend PREFIX to file name when saving modification"
                  " instead of overwriting the original")
+        parser.add_option(
+            "--profile", dest="profile",
+            type="string",
+            metavar="FILE",
+            help="record the time spent on reading, resolving links,"
+                 " spells, and writing, the bytes read and written, and"
+                 " the peak memory of every file, and the time spent on"
+                 " every block type, and write the report to FILE"
+                 " (csv if FILE ends with .csv, json otherwise);"
+                 " tracing memory slows down toasting considerably")
         parser.add_option(
             "-r", "--raise", dest="raisetesterror",
             action="store_true",
@@ -1027,10 +1471,10 @@ class Toaster(object):
             "--refresh", dest="refresh",
             type="int",
             metavar="REFRESH",
-            help="start new process pool every JOBS * REFRESH files"
-                 " if JOBS is 2 or more"
-                 " (when processing a large number of files, this prevents"
-                 " leaking memory on some operating systems) [default: %default]")
+            help="queue at most JOBS * REFRESH files for the worker"
+                 " processes if JOBS is 2 or more"
+                 " (when processing a large number of files, this bounds"
+                 " the memory used for the queue) [default: %default]")
         parser.add_option(
             "--resume", dest="resume",
             action="store_true",
@@ -1172,25 +1616,6 @@ class Toaster(object):
         :type top: str
         """
 
-        def file_pools(chunksize):
-            """Helper function which generates list of files, sorted by size,
-            in chunks of given size.
-            """
-            all_files = pyffi.utils.walk(
-                top, onerror=None,
-                re_filename=self.FILEFORMAT.RE_FILENAME)
-            while True:
-                # fetch chunksize files from all files
-                file_pool = [
-                    filename for i, filename in zip(
-                        range(chunksize), all_files)]
-                if not file_pool:
-                    # done!
-                    break
-                # sort files by size
-                file_pool.sort(key=os.path.getsize, reverse=True)
-                yield file_pool
-
         # toast entry code
         if not self.spellclass.toastentry(self):
             self.msg("spell does not apply! quiting early...")
@@ -1246,64 +1671,211 @@ class Toaster(object):
                     input("Press enter...")
                 return
 
+        if self.options.get("profile"):
+            self._profile = ToasterProfile()
+
         # walk over all streams, and create a data instance for each of them
         # inspect the file but do not yet read in full
         if jobs == 1:
-            for stream in self.FILEFORMAT.walk(top, mode='rb' if self.spellclass.READONLY else 'r+b'):
+            for stream in self.FILEFORMAT.walk(
+                    top, mode='rb' if self.spellclass.READONLY else 'r+b',
+                    use_mmap=self.spellclass.READONLY):
                 self._toast(stream)
                 if self.options["gccollect"]:
                     # force free memory (helps when parsing many files)
                     gc.collect()
         else:
-            chunksize = self.options["refresh"] * self.options["jobs"]
-            self.msg("toasting with %i threads in chunks of %i files"
-                     % (jobs, chunksize))
-            for file_pool in file_pools(chunksize):
-                self.logger.debug("process file pool:")
-                for filename in file_pool:
-                    self.logger.debug("  " + filename)
-                with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
-                    list(executor.map(
-                        _toaster_job,
-                        ((self.__class__, filename, self.options, self.spellnames)
-                         for filename in file_pool)))
+            queuesize = self.options["refresh"] * jobs
+            self.msg("toasting with %i processes, queueing up to %i files"
+                     % (jobs, queuesize))
+            self._toast_parallel(top, jobs, queuesize)
 
         # toast exit code
         self.spellclass.toastexit(self)
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
+        self._write_profile()
+
+    def _write_profile(self):
+        """Write the report of the ``profile`` option, if any, and log
+        its summary.
+        """
+        if self._profile is None:
+            return
+        self._profile.close()
+        self._profile.write(self.options["profile"])
+        self.msg(self._profile.get_summary())
+        self._profile = None
+
+    def _get_cache(self):
+        """Get the :class:`ToasterCache` of the ``cache`` option, or
+        ``None`` if no cache is used.
+        """
+        if self._cache is None and self.options.get("cache"):
+            self._cache = ToasterCache(
+                self.options["cache"], ToasterCache.get_config(self))
+        return self._cache
+
+    def _get_cache_output(self, filename):
+        """Get the name of the file that toasting *filename* writes to,
+        or ``None`` for dry runs.
+        """
+        head, root, ext = self.get_toast_head_root_ext(filename)
+        if head is None:
+            return None
+        return os.path.join(head, root + ext)
+
+    def _toast_cached(self, filename, cached):
+        """Take the results of a file from the outcome stored in the
+        cache, if any. Outcomes of written files are only used if they
+        were written to the destination of this file, and if the
+        written file has not changed since.
+
+        :return: Whether the results were taken from the cache.
+        :rtype: ``bool``
+        """
+        if cached is None:
+            return False
+        outcome, reports, output, output_hash = cached
+        if outcome == ToasterCache.WRITTEN:
+            if (output != self._get_cache_output(filename)
+                    or not os.path.exists(output)):
+                return False
+            with open(output, "rb") as stream:
+                if ToasterCache.get_hash(stream.read()) != output_hash:
+                    return False
+        self.msg("=== %s (cached) ===" % filename)
+        self.files_done[filename] = reports
+        return True
+
+    def _cache_written(self, cache, cache_key, filename, reports):
+        """Store the outcome of a file that was written. Nothing is
+        stored for dry runs and patches, as their output cannot be
+        checked on later runs.
+        """
+        if self.options["dryrun"] or self.options["createpatch"]:
+            return
+        output = self._get_cache_output(filename)
+        with open(output, "rb") as stream:
+            output_hash = cache.get_hash(stream.read())
+        cache.set(cache_key, cache.WRITTEN, reports, output, output_hash)
+
+    def _open(self, filename):
+        """Open a file for toasting. Files are memory mapped for read
+        only spells, and opened for reading and writing otherwise.
+        """
+        if self.spellclass.READONLY:
+            return pyffi.utils.mmapstream.MmapStream(filename)
+        return open(filename, mode='r+b')
+
+    def _toast_parallel(self, top, jobs, queuesize):
+        """Toast all files in a directory tree with a pool of worker
+        processes. The pool is kept alive for all files, and files are
+        fed to it as they are found, keeping at most *queuesize* files
+        queued. The results of every file are merged into
+        :attr:`files_done`, :attr:`files_skipped`, and
+        :attr:`files_failed`.
+
+        :param top: The directory or file to toast.
+        :type top: str
+        :param jobs: Number of worker processes.
+        :type jobs: int
+        :param queuesize: Maximal number of files queued.
+        :type queuesize: int
+        """
+        all_files = pyffi.utils.walk(
+            top, onerror=None,
+            re_filename=self.FILEFORMAT.RE_FILENAME)
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=jobs,
+                initializer=_toaster_init,
+                initargs=(self.__class__, self.options, self.spellnames)
+                ) as executor:
+            pending = set()
+            for filename in all_files:
+                self.logger.debug("queue %s" % filename)
+                pending.add(executor.submit(_toaster_job, filename))
+                if len(pending) >= queuesize:
+                    done, pending = concurrent.futures.wait(
+                        pending,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+                    self._merge_results(done)
+            self._merge_results(concurrent.futures.as_completed(pending))
+
+    def _merge_results(self, futures):
+        """Merge the results of finished :func:`_toaster_job` calls."""
+        for future in futures:
+            files_done, files_skipped, files_failed, profile = (
+                future.result())
+            self.files_done.update(files_done)
+            self.files_skipped.update(files_skipped)
+            self.files_failed.update(files_failed)
+            if self._profile is not None:
+                self._profile.merge(profile)
 
     def toast_archives(self, top):
-        """Toast all files in all archives."""
+        """Toast all files in all archives. Members are extracted one
+        at a time, and an archive is only written if the spell changed
+        any of its members.
+        """
         if not self.FILEFORMAT.ARCHIVE_CLASSES:
             self.logger.info("No known archives contain this file format.")
+            return
+        if not self.spellclass.toastentry(self):
+            self.msg("spell does not apply! quiting early...")
+            return
+        if self.options.get("profile"):
+            self._profile = ToasterProfile()
         # walk over all files, and pick archives as we go
         for filename_in in pyffi.utils.walk(top):
             for ARCHIVE_CLASS in self.FILEFORMAT.ARCHIVE_CLASSES:
                 # check if extension matches
-                if not ARCHIVE_CLASS.RE_FILENAME.match(filename_in):
-                    continue
-                # open the archive
+                if ARCHIVE_CLASS.RE_FILENAME.match(filename_in):
+                    self._toast_archive(ARCHIVE_CLASS, filename_in)
+        self.spellclass.toastexit(self)
+        self._write_profile()
+
+    def _toast_archive(self, ARCHIVE_CLASS, filename):
+        """Toast all members of a single archive, and write the
+        archive if any of its members changed.
+        """
+        # archives are never changed in place, so map them
+        stream = pyffi.utils.mmapstream.MmapStream(filename)
+        try:
+            archive = ARCHIVE_CLASS.Data()
+            try:
+                archive.read(stream)
+            except ValueError:
+                self.logger.warn("archive format not recognized, skipped")
+                return
+            for member in archive.get_members():
+                if self.FILEFORMAT.RE_FILENAME.match(member.name):
+                    member.stream.name = os.path.join(filename, member.name)
+                    self._toast(member.stream, archive=archive,
+                                member_name=member.name)
+            if not archive.get_changed_member_names():
+                return
+            # write to a temporary file first, as the original
+            # archive may be overwritten
+            with tempfile.TemporaryFile() as tmp:
+                archive.write(tmp)
+                stream.close()
+                tmp.seek(0)
+                outstream = self.spellclass.get_toast_stream(self, filename)
                 try:
-                    archive_in = ARCHIVE_CLASS.Data(name=filename_in, mode='r')
-                except ValueError:
-                    self.logger.warn("archive format not recognized, skipped")
-                    continue
-                # toast all members in the archive
-                # and save them to a temporary archive as we go
-                if not self.spellclass.READONLY:
-                    for member in archive_in.get_members():
-                        self._toast_member(member)
-                else:
-                    file_out = tempfile.TemporaryFile()
-                    archive_out = ARCHIVE_CLASS.Data(fileobj=file_out, mode='w')
-                    for member in archive_in.get_members():
-                        self._toast(member)
-                        archive_out.add(member)
-                    archive_out.close()
-                archive_in.close()
-
-    def _toast(self, stream):
+                    shutil.copyfileobj(tmp, outstream)
+                finally:
+                    outstream.close()
+        finally:
+            stream.close()
+
+    def _toast(self, stream, archive=None, member_name=None):
         """Run toaster on particular stream and data.
         Used as helper function.
+
+        If *archive* is given, then *stream* contains the archive
+        member *member_name*, and changes are stored in the archive.
         """
         # inspect the file name
         if not self.inspect_filename(stream.name):
@@ -1312,37 +1884,78 @@ class Toaster(object):
             return
 
         # check if file exists
-        if self.options["resume"]:
+        if self.options["resume"] and archive is None:
             if self.spellclass.get_toast_stream(self, stream.name, test_exists=True):
                 self.msg("=== %s (already done) ===" % stream.name)
                 return
 
+        # check if file was toasted before
+        cache = self._get_cache() if archive is None else None
+        if cache:
+            cache_key = cache.get_key(
+                pyffi.utils.mmapstream.read_view(stream),
+                self._get_cache_output(stream.name))
+            stream.seek(0)
+            if self._toast_cached(stream.name, cache.get(cache_key)):
+                return
+
         data = self.FILEFORMAT.Data()
+        data.lazy = self.options.get("lazy", False)
+        profile = self._profile
+        if profile is not None:
+            data.profile = profile.start_file(stream.name)
 
         self.msgblockbegin("=== %s ===" % stream.name)
         try:
             # inspect the file (reads only the header)
             data.inspect(stream)
+            if profile is not None:
+                profile.lap("read")
 
             # create spell instance
             spell = self.spellclass(toaster=self, data=data, stream=stream)
+            if profile is not None:
+                profile.time_spell(spell)
             
             # inspect the spell instance
-            if spell._datainspect() and spell.datainspect():
+            inspected = spell._datainspect() and spell.datainspect()
+            if profile is not None:
+                profile.lap("spell")
+            if inspected:
                 # read the full file
                 data.read(stream)
+                if profile is not None:
+                    profile.lap("read")
+                    profile.record["bytes_read"] = stream.tell()
                 
                 # cast the spell on the data tree
                 spell.recurse()
+                if profile is not None:
+                    profile.lap("spell")
 
                 # save file back to disk if not readonly and the spell
                 # changed the file
                 if (not self.spellclass.READONLY) and spell.changed:
-                    if self.options["createpatch"]:
+                    if archive is not None:
+                        outstream = io.BytesIO()
+                        data.write(outstream)
+                        archive.set_member(
+                            member_name, outstream.getvalue())
+                        if profile is not None:
+                            profile.record["bytes_written"] = outstream.tell()
+                    elif self.options["createpatch"]:
                         self.writepatch(stream, data)
                     else:
                         self.write(stream, data)
+                    if cache:
+                        self._cache_written(cache, cache_key, stream.name,
+                                            spell.reports)
+                        cache = None
+                    if profile is not None:
+                        profile.lap("write")
             self.files_done[stream.name] = spell.reports
+            if cache:
+                cache.set(cache_key, cache.DONE, spell.reports)
 
         except Exception as expt:
             self.files_failed.add(stream.name)
@@ -1355,6 +1968,8 @@ class Toaster(object):
                 raise
         finally:
             self.msgblockend()
+            if profile is not None:
+                profile.end_file()
 
     def get_toast_head_root_ext(self, filename):
         """Get the name of where the input file *filename* would
@@ -1455,6 +2070,8 @@ class Toaster(object):
                 raise
             if stream is outstream:
                 stream.truncate()
+            if self._profile is not None:
+                self._profile.record["bytes_written"] = outstream.tell()
         finally:
             outstream.close()
 
@@ -1473,6 +2090,8 @@ class Toaster(object):
         except: # not just Exception, also CTRL-C
             self.msg("write failed!!!")
             raise
+        if self._profile is not None:
+            self._profile.record["bytes_written"] = newfile.tell()
         # use external diff command
         oldfile = stream
         oldfilename = oldfile.name
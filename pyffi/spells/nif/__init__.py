@@ -124,10 +124,16 @@ class SpellVisitSkeletonRoots(NifSpell):
                         self._skelroots.add(id(skelroot))
         # only apply spell if there are skeleton roots
         if self._skelroots:
+            # bone transforms are looked up relative to the skeleton
+            # roots, so cache the parents of all blocks
+            self.data.get_transform_cache()
             return True
         else:
             return False
 
+    def dataexit(self):
+        self.data.remove_transform_cache()
+
     def branchinspect(self, branch):
         # only inspect the NiNode branch
         return isinstance(branch, NifFormat.NiNode)
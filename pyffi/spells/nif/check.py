@@ -165,6 +165,9 @@ class SpellCompareSkinData(pyffi.spells.nif.NifSpell):
         toaster.refdata = NifFormat.Data()
         with closing(open(toaster.options["arg"], "rb")) as reffile:
             toaster.refdata.read(reffile)
+        # bone transforms in the reference nif are looked up for every
+        # bone of every nif, so cache them
+        toaster.refdata.get_transform_cache()
         # find bone data in reference nif
         toaster.refbonedata = []
         for refgeom in toaster.refdata.get_global_iterator():
@@ -178,6 +181,10 @@ class SpellCompareSkinData(pyffi.spells.nif.NifSpell):
         # only apply spell if the reference nif has bone data
         return bool(toaster.refbonedata)
 
+    @classmethod
+    def toastexit(cls, toaster):
+        toaster.refdata.remove_transform_cache()
+
     def datainspect(self):
         return self.inspectblocktype(NifFormat.NiSkinData)
 
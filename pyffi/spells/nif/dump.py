@@ -66,7 +66,7 @@ def dumpArray(arr):
     """
     text = ""
     if arr._count2 == None:
-        for i, element in enumerate(list.__iter__(arr)):
+        for i, element in enumerate(arr.get_detail_child_nodes()):
             if i > 16:
                 text += "etc...\n"
                 break
@@ -74,7 +74,7 @@ def dumpArray(arr):
     else:
         k = 0
         for i, elemlist in enumerate(list.__iter__(arr)):
-            for j, elem in enumerate(list.__iter__(elemlist)):
+            for j, elem in enumerate(elemlist.get_detail_child_nodes()):
                 if k > 16:
                     text += "etc...\n"
                     break
@@ -443,14 +443,15 @@ class SpellDumpPython(NifSpell):
             if _value:
                 self.print_("%s.update_size()" % name)
                 if _value._count2 is None:
-                    for i, elem in enumerate(list.__iter__(_value)):
+                    for i, elem in enumerate(_value.get_detail_child_nodes()):
                         if self.print_instance(
                             "%s[%i]" % (name, i), elem):
 
                             result = True
                 else:
                     for i, elemlist in enumerate(list.__iter__(_value)):
-                        for j, elem in enumerate(list.__iter__(elemlist)):
+                        for j, elem in enumerate(
+                                elemlist.get_detail_child_nodes()):
                             if self.print_instance(
                                 "%s[%i][%i]" % (name, i, j), elem):
 
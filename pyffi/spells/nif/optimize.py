@@ -164,8 +164,8 @@ class SpellMergeDuplicates(pyffi.spells.nif.NifSpell):
 
     def __init__(self, *args, **kwargs):
         pyffi.spells.nif.NifSpell.__init__(self, *args, **kwargs)
-        # list of all branches visited so far
-        self.branches = []
+        # all branches visited so far, by fingerprint
+        self.branches = {}
 
     def datainspect(self):
         # see MadCat221's metstaff.nif:
@@ -186,29 +186,32 @@ class SpellMergeDuplicates(pyffi.spells.nif.NifSpell):
                                    NifFormat.NiGeometryData))
 
     def branchentry(self, branch):
-        for otherbranch in self.branches:
-            if (branch is not otherbranch and
-                branch.is_interchangeable(otherbranch)):
-                # skip properties that have controllers (the
-                # controller data cannot always be reliably checked,
-                # see also issue #2106668)
-                if (isinstance(branch, NifFormat.NiProperty)
-                    and branch.controller):
-                    continue
-                # skip BSShaderProperty blocks (see niftools issue #3009832)
-                if isinstance(branch, NifFormat.BSShaderProperty):
-                    continue
-                # interchangeable branch found!
-                self.toaster.msg("removing duplicate branch")
-                self.data.replace_global_node(branch, otherbranch)
-                self.changed = True
-                # branch has been replaced, so no need to recurse further
-                return False
-        else:
-            # no duplicate found, add to list of visited branches
-            self.branches.append(branch)
-            # continue recursion
+        fingerprint = branch.get_fingerprint()
+        if fingerprint is None:
+            # branch is only interchangeable with itself
             return True
+        # only branches with the same fingerprint can be interchangeable
+        otherbranches = self.branches.setdefault(fingerprint, [])
+        # skip properties that have controllers (the
+        # controller data cannot always be reliably checked,
+        # see also issue #2106668)
+        # skip BSShaderProperty blocks (see niftools issue #3009832)
+        if not ((isinstance(branch, NifFormat.NiProperty)
+                 and branch.controller)
+                or isinstance(branch, NifFormat.BSShaderProperty)):
+            for otherbranch in otherbranches:
+                if (branch is not otherbranch and
+                    branch.is_interchangeable(otherbranch)):
+                    # interchangeable branch found!
+                    self.toaster.msg("removing duplicate branch")
+                    self.data.replace_global_node(branch, otherbranch)
+                    self.changed = True
+                    # branch has been replaced, so no need to recurse further
+                    return False
+        # no duplicate found, add to visited branches
+        otherbranches.append(branch)
+        # continue recursion
+        return True
 
 class SpellOptimizeGeometry(pyffi.spells.nif.NifSpell):
     """Optimize all geometries:
@@ -250,13 +253,11 @@ class SpellOptimizeGeometry(pyffi.spells.nif.NifSpell):
     def optimize_vertices(self, data):
         self.toaster.msg("removing duplicate vertices")
         # get map, deleting unused vertices
-        return unique_map(
-            vhash
-            for i, vhash in enumerate(data.get_vertex_hash_generator(
-                vertexprecision=self.VERTEXPRECISION,
-                normalprecision=self.NORMALPRECISION,
-                uvprecision=self.UVPRECISION,
-                vcolprecision=self.VCOLPRECISION)))
+        return data.get_vertex_map(
+            vertexprecision=self.VERTEXPRECISION,
+            normalprecision=self.NORMALPRECISION,
+            uvprecision=self.UVPRECISION,
+            vcolprecision=self.VCOLPRECISION)
 
     def branchentry(self, branch):
         """Optimize a NiTriStrips or NiTriShape block:
@@ -971,10 +972,9 @@ class SpellOptimizeCollisionGeometry(pyffi.spells.nif.NifSpell):
         for subshape_index in range(len(shape.get_sub_shapes())):
             self.toaster.msg(_("(processing subshape %i)")
                              % subshape_index)
-            v_map, v_map_inverse = unique_map(
-                shape.get_vertex_hash_generator(
-                    vertexprecision=self.VERTEXPRECISION,
-                    subshape_index=subshape_index))
+            v_map, v_map_inverse = shape.get_vertex_map(
+                vertexprecision=self.VERTEXPRECISION,
+                subshape_index=subshape_index)
             self.toaster.msg(
                 _("(num vertices in collision shape was %i and is now %i)")
                 % (len(v_map), len(v_map_inverse)))
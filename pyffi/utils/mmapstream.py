@@ -0,0 +1,205 @@
+"""A read only stream on a memory mapped file.
+
+Reading a file through a :class:`MmapStream` does not need a system
+call for every read, and large chunks of data can be taken from the
+stream as a ``memoryview`` on the mapped file, without copying them
+(see :func:`read_view`). Such views keep the file mapped: if any of
+them is still in use when the stream is closed, a warning is logged,
+and the file is unmapped only once the last view is gone.
+
+>>> import os, tempfile
+>>> fd, filename = tempfile.mkstemp()
+>>> _ = os.write(fd, b"line one\\nline two\\n")
+>>> os.close(fd)
+>>> stream = MmapStream(filename)
+>>> stream.readline()
+b'line one\\n'
+>>> stream.tell()
+9
+>>> view = read_view(stream, 4)
+>>> view.tobytes()
+b'line'
+>>> stream.read()
+b' two\\n'
+>>> _ = stream.seek(-4, 2)
+>>> stream.read(2)
+b'tw'
+>>> stream[0:4].tobytes()
+b'line'
+>>> del view
+>>> stream.close()
+>>> os.remove(filename)
+"""
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright (c) 2007-2012, Python File Format Interface
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the Python File Format Interface
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import io
+import logging
+import mmap
+import os
+
+class MmapStream(io.RawIOBase):
+    """Read only stream on a memory mapped file. Slicing the stream
+    gives a ``memoryview`` on the file contents, independent of the
+    stream position.
+    """
+
+    def __init__(self, filename):
+        """Map the file with the given name.
+
+        :param filename: The name of the file.
+        :type filename: ``str``
+        """
+        io.RawIOBase.__init__(self)
+        self.name = filename
+        with open(filename, "rb") as stream:
+            size = os.fstat(stream.fileno()).st_size
+            if size:
+                self._buffer = mmap.mmap(
+                    stream.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                # empty files cannot be mapped
+                self._buffer = b""
+        self._view = memoryview(self._buffer)
+        self._size = size
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError("invalid whence (%r)" % whence)
+        if pos < 0:
+            raise ValueError("negative seek position %i" % pos)
+        self._pos = pos
+        return pos
+
+    def _end(self, size):
+        """Position where a read of size bytes ends."""
+        if size is None or size < 0:
+            return self._size
+        return min(self._pos + size, self._size)
+
+    def read(self, size=-1):
+        end = self._end(size)
+        if end <= self._pos:
+            return b""
+        result = self._buffer[self._pos:end]
+        self._pos = end
+        return result
+
+    def readall(self):
+        return self.read()
+
+    def readinto(self, buffer):
+        end = self._end(len(buffer))
+        size = max(end - self._pos, 0)
+        buffer[:size] = self._view[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def readline(self, size=-1):
+        end = self._end(size)
+        if end <= self._pos:
+            return b""
+        newline = self._buffer.find(b"\n", self._pos, end)
+        if newline != -1:
+            end = newline + 1
+        result = self._buffer[self._pos:end]
+        self._pos = end
+        return result
+
+    def read_view(self, size=-1):
+        """Read at most size bytes, as a ``memoryview`` on the mapped
+        file. If size is negative or omitted, read until the end of
+        the file.
+        """
+        end = self._end(size)
+        start = min(self._pos, end)
+        self._pos = max(self._pos, end)
+        return self._view[start:end]
+
+    def __getitem__(self, key):
+        return self._view[key]
+
+    def __len__(self):
+        return self._size
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+            if isinstance(self._buffer, mmap.mmap):
+                try:
+                    self._buffer.close()
+                except BufferError:
+                    # views are still in use: the mapping is closed
+                    # when the last of them is gone
+                    logging.getLogger("pyffi.utils.mmapstream").warning(
+                        "%s is still mapped: views on it are in use"
+                        % self.name)
+        io.RawIOBase.close(self)
+
+def read_view(stream, size=-1):
+    """Read at most size bytes from stream. This gives a ``memoryview``
+    on the stream's data, without copying it, if the stream supports it
+    (such as :class:`MmapStream`), and ``bytes`` otherwise.
+
+    :param stream: The stream to read from.
+    :type stream: file
+    :param size: The number of bytes to read, or -1 to read until the
+        end of the stream.
+    :type size: ``int``
+    """
+    try:
+        stream_read_view = stream.read_view
+    except AttributeError:
+        return stream.read(size)
+    return stream_read_view(size)
@@ -1,4 +1,4 @@
-"""Create mopps using mopper.exe"""
+"""Create mopps using mopper.exe, and calculate welding info."""
 
 # ***** BEGIN LICENSE BLOCK *****
 #
@@ -37,11 +37,15 @@
 #
 # ***** END LICENSE BLOCK *****
 
+import math
 import os.path
 import tempfile
 import subprocess
 import sys
 
+from pyffi.utils.mathutils import (
+    vecCrossProduct, vecDotProduct, vecNorm, vecNormal, vecSub)
+
 def _skip_terminal_chars(stream):
     """Skip initial terminal characters (happens when mopper runs via wine)."""
     firstline = stream.readline()
@@ -193,6 +197,65 @@ def getMopperOriginScaleCodeWelding(vertices, triangles, material_indices=None):
         outfile.close()
     return origin, scale, moppcode, welding_info
 
+def getWeldingInfo(vertices, triangles):
+    """Calculate the welding info of every triangle. For each edge, the
+    welding info stores the angle between the triangle and its neighbour
+    along that edge, in 31 sectors of 12 degrees, where 15 means flat,
+    higher values mean convex, and lower values mean concave. Triangles
+    are neighbours if they share an edge in opposite direction, comparing
+    vertices by position. Edges without a neighbour are considered flat.
+    The three sectors are packed into five bits each, starting from the
+    edge from the first to the second vertex.
+
+    For example, for the standard cube, this gives the same welding info
+    as the havok mopper:
+
+    >>> getWeldingInfo(
+    ...     [(1, 1, 1), (0, 0, 0), (0, 0, 1), (0, 1, 0),
+    ...      (1, 0, 1), (0, 1, 1), (1, 1, 0), (1, 0, 0)],
+    ...     [(0, 4, 6), (1, 6, 7), (2, 1, 4), (3, 1, 2),
+    ...      (0, 2, 4), (4, 1, 7), (6, 4, 7), (3, 0, 6),
+    ...      (0, 3, 5), (3, 2, 5), (2, 0, 5), (1, 3, 6)])
+    [23030, 23247, 23030, 16086, 23247, 23247, 23247, 23247, 23247, 23247, 23247, 16086]
+
+    :param vertices: List of vertices.
+    :type vertices: list of tuples of floats
+    :param triangles: List of triangles (indices referring back to vertex list).
+    :type triangles: list of tuples of ints
+    :return: The welding info as a list of ints.
+    :rtype: ``list`` of ``int``\ s
+    """
+    # weld vertices by position
+    positions = {}
+    indices = [positions.setdefault(tuple(vert), len(positions))
+               for vert in vertices]
+    edges = {}
+    for i, tri in enumerate(triangles):
+        v0, v1, v2 = (indices[v] for v in tri)
+        for edge in ((v0, v1), (v1, v2), (v2, v0)):
+            edges.setdefault(edge, i)
+    normals = [vecNormal(*(vertices[v] for v in tri)) for tri in triangles]
+    welding_info = []
+    for i, tri in enumerate(triangles):
+        normal = normals[i]
+        info = 0
+        for k in range(3):
+            v0, v1 = tri[k], tri[(k + 1) % 3]
+            other = edges.get((indices[v1], indices[v0]))
+            if other is None:
+                sector = 15
+            else:
+                # signed angle between the normals, around the edge
+                edge = vecSub(vertices[v1], vertices[v0])
+                other_normal = normals[other]
+                angle = math.atan2(
+                    vecDotProduct(vecCrossProduct(normal, other_normal), edge),
+                    vecDotProduct(normal, other_normal) * vecNorm(edge))
+                sector = 15 + int(angle / (math.pi / 15))
+            info |= sector << (5 * k)
+        welding_info.append(info)
+    return welding_info
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
@@ -149,6 +149,11 @@ from pyffi.utils.mathutils import *
 
 import operator
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # adapted from
 # http://en.literateprograms.org/Quickhull_(Python,_arrays)
 def qdome2d(vertices, base, normal, precision = 0.0001):
@@ -258,6 +263,9 @@ def basesimplex3d(vertices, precision = 0.0001):
     :return: A list of one, two, three, or four vertices, depending on the
         the configuration of the vertices.
     """
+    if numpy is not None:
+        points = numpy.array(vertices, dtype=numpy.float64).reshape(-1, 3)
+        return [vertices[i] for i in _basesimplex3d_numpy(points, precision)]
     # sort axes by their extent in vertices
     extents = sorted(list(range(3)),
                      key=lambda i:
@@ -294,11 +302,59 @@ def basesimplex3d(vertices, precision = 0.0001):
         # coplanar
         return [ vert0, vert1, vert2 ]
 
+def _basesimplex3d_numpy(points, precision):
+    """Numpy implementation of L{basesimplex3d}. Returns indices of
+    the extreme points, rather than the points themselves.
+
+    :param points: The vertices, as array of shape (n, 3).
+    :param precision: See L{basesimplex3d}.
+    :return: A list of one, two, three, or four indices into
+        C{points}.
+    """
+    extents = sorted(list(range(3)),
+                     key=lambda i:
+                     points[:, i].max() - points[:, i].min())
+    # lexsort takes its most significant key last
+    order = numpy.lexsort(tuple(points[:, i] for i in reversed(extents)))
+    index0 = int(order[0])
+    index1 = int(order[-1])
+    vert0 = points[index0]
+    axis = points[index1] - vert0
+    axis_length = numpy.sqrt(axis.dot(axis))
+    # check if all vertices coincide
+    if axis_length < precision:
+        return [index0]
+    # as a third extreme point select that one which maximizes the distance
+    # from the vert0 - vert1 axis
+    cross = numpy.cross(axis, points - vert0)
+    dists = numpy.sqrt((cross * cross).sum(axis=1)) / axis_length
+    index2 = int(numpy.argmax(dists))
+    # check if all vertices are colinear
+    if dists[index2] < precision:
+        return [index0, index1]
+    # as a fourth extreme point select one which maximizes the distance from
+    # the v0, v1, v2 triangle
+    normal = numpy.cross(axis, points[index2] - vert0)
+    dists = (points - vert0).dot(normal) / numpy.sqrt(normal.dot(normal))
+    index3 = int(numpy.argmax(numpy.abs(dists)))
+    # ensure positive orientation and check if all vertices are coplanar
+    orientation = dists[index3]
+    if orientation > precision:
+        return [index0, index1, index2, index3]
+    elif orientation < -precision:
+        return [index1, index0, index2, index3]
+    else:
+        # coplanar
+        return [index0, index1, index2]
+
 def qhull3d(vertices, precision = 0.0001, verbose = False):
     """Return the triangles making up the convex hull of C{vertices}.
     Considers distances less than C{precision} to be zero (useful to simplify
     the hull of a complex mesh, at the expense of exactness of the hull).
 
+    If numpy is available, the distances from outside vertices to the
+    hull are calculated for all vertices at once.
+
     :param vertices: The vertices to find the hull of.
     :param precision: Distance used to decide whether points lie outside of
         the hull or not. Larger numbers mean fewer triangles, but some vertices
@@ -311,7 +367,12 @@ def qhull3d(vertices, precision = 0.0001, verbose = False):
         all extreme points.
     """
     # find a simplex to start from
-    hull_vertices = basesimplex3d(vertices, precision)
+    if numpy is not None:
+        points = numpy.array(vertices, dtype=numpy.float64).reshape(-1, 3)
+        base = _basesimplex3d_numpy(points, precision)
+        hull_vertices = [vertices[i] for i in base]
+    else:
+        hull_vertices = basesimplex3d(vertices, precision)
 
     # handle degenerate cases
     if len(hull_vertices) == 3:
@@ -324,6 +385,15 @@ def qhull3d(vertices, precision = 0.0001, verbose = False):
         # no triangles for these cases
         return hull_vertices, []
 
+    if numpy is not None:
+        return _qhull3d_numpy(vertices, points, base, precision, verbose)
+    else:
+        return _qhull3d_python(vertices, hull_vertices, precision, verbose)
+
+def _qhull3d_python(vertices, hull_vertices, precision, verbose):
+    """Pure python implementation of L{qhull3d}, starting from the
+    simplex C{hull_vertices}.
+    """
     # construct list of triangles of this simplex
     hull_triangles = set([ operator.itemgetter(i,j,k)(hull_vertices)
                          for i, j, k in ((1,0,2), (0,1,3), (0,3,2), (3,1,2)) ])
@@ -408,6 +478,183 @@ def qhull3d(vertices, precision = 0.0001, verbose = False):
                                   for vert in triangle)
                             for triangle in hull_triangles ]
 
+def _get_outer_vertices_numpy(points, candidates, normals, offsets,
+                              precision, chunk_size=4096):
+    """Find which of the C{candidates} lie outside any of the faces
+    given by their unit C{normals} and C{offsets}, and for each such
+    vertex, the face from which it is furthest.
+
+    :return: The indices of the outer vertices, and the index of their
+        furthest face.
+    """
+    outer_vertices = [numpy.zeros(0, dtype=numpy.intp)]
+    outer_faces = [numpy.zeros(0, dtype=numpy.intp)]
+    for start in range(0, len(candidates), chunk_size):
+        chunk = candidates[start:start + chunk_size]
+        dists = points[chunk].dot(normals.T) - offsets[numpy.newaxis, :]
+        furthest = numpy.argmax(dists, axis=1)
+        outer = dists[numpy.arange(len(chunk)), furthest] > precision
+        outer_vertices.append(chunk[outer])
+        outer_faces.append(furthest[outer])
+    return numpy.concatenate(outer_vertices), numpy.concatenate(outer_faces)
+
+def _qhull3d_numpy(vertices, points, base, precision, verbose):
+    """Numpy implementation of L{qhull3d}, starting from the simplex
+    with indices C{base} into C{points}.
+
+    Every vertex outside the hull is assigned to the face from which it
+    is furthest, and the distances of all vertices to all new faces are
+    calculated at once. Faces are stored by index in arrays, and the
+    faces visible from a pivot are found by walking across edges, so
+    the horizon is simply the boundary of the visible faces.
+    """
+    vert0, vert1, vert2, vert3 = base
+    # face arrays, which double in size when full
+    num_faces = 0
+    face_verts = numpy.zeros((16, 3), dtype=numpy.intp)
+    normals = numpy.zeros((16, 3), dtype=numpy.float64)
+    offsets = numpy.zeros(16, dtype=numpy.float64)
+    alive = numpy.zeros(16, dtype=bool)
+    # maps each face to the indices of the vertices assigned to it
+    outer_vertices = {}
+    # maps each directed edge to the face which has it
+    edge_faces = {}
+    # faces which may have outer vertices
+    pending = []
+    hull_vertices = list(base)
+    is_hull_vertex = numpy.zeros(len(points), dtype=bool)
+    is_hull_vertex[base] = True
+
+    if verbose:
+        print("starting set", [vertices[i] for i in base])
+
+    new_faces = numpy.array([(vert1, vert0, vert2), (vert0, vert1, vert3),
+                             (vert0, vert3, vert2), (vert3, vert1, vert2)],
+                            dtype=numpy.intp)
+    candidates = numpy.arange(len(points))
+    while True:
+        # add new faces, with outward unit normals
+        first_face = num_faces
+        num_faces += len(new_faces)
+        while num_faces > len(alive):
+            face_verts = numpy.concatenate(
+                (face_verts, numpy.zeros_like(face_verts)))
+            normals = numpy.concatenate((normals, numpy.zeros_like(normals)))
+            offsets = numpy.concatenate((offsets, numpy.zeros_like(offsets)))
+            alive = numpy.concatenate((alive, numpy.zeros_like(alive)))
+        corners = points[new_faces]
+        new_normals = numpy.cross(corners[:, 1] - corners[:, 0],
+                                  corners[:, 2] - corners[:, 0])
+        lengths = numpy.sqrt((new_normals * new_normals).sum(axis=1))
+        # a face with zero area keeps a zero normal
+        lengths[lengths == 0] = 1
+        new_normals /= lengths[:, numpy.newaxis]
+        new_offsets = (new_normals * corners[:, 0]).sum(axis=1)
+        face_verts[first_face:num_faces] = new_faces
+        normals[first_face:num_faces] = new_normals
+        offsets[first_face:num_faces] = new_offsets
+        alive[first_face:num_faces] = True
+        for face, (i, j, k) in enumerate(new_faces.tolist(), first_face):
+            edge_faces[(i, j)] = face
+            edge_faces[(j, k)] = face
+            edge_faces[(k, i)] = face
+            if verbose:
+                print("adding", (vertices[i], vertices[j], vertices[k]))
+        # assign each candidate vertex to the furthest new face
+        candidates, furthest = _get_outer_vertices_numpy(
+            points, candidates, new_normals, new_offsets, precision)
+        for face in numpy.unique(furthest).tolist():
+            outer_vertices[first_face + face] = candidates[furthest == face]
+            pending.append(first_face + face)
+
+        # grab a face with outer vertices
+        face = None
+        while pending and face is None:
+            face = pending.pop()
+            if not alive[face]:
+                face = None
+        if face is None:
+            # vertices were only checked against the faces that
+            # replaced their face, so check all vertices against all
+            # faces before accepting the hull; vertices inside a ball
+            # which fits in the hull are skipped
+            faces = numpy.flatnonzero(alive[:num_faces])
+            center = points[hull_vertices].mean(axis=0)
+            radius = (offsets[faces] - normals[faces].dot(center)).min()
+            offsets_from_center = points - center
+            candidates = numpy.flatnonzero(
+                ~is_hull_vertex
+                & ((offsets_from_center * offsets_from_center).sum(axis=1)
+                   >= radius * radius))
+            candidates, furthest = _get_outer_vertices_numpy(
+                points, candidates, normals[faces], offsets[faces],
+                precision)
+            if not len(candidates):
+                # no face has outer vertices anymore
+                # so the convex hull is complete!
+                break
+            for face in numpy.unique(furthest).tolist():
+                outer_vertices[faces[face]] = candidates[furthest == face]
+                pending.append(faces[face])
+            face = pending.pop()
+        outer = outer_vertices[face]
+        pivot = int(outer[numpy.argmax(
+            points[outer].dot(normals[face]) - offsets[face])])
+        pivot_vert = points[pivot]
+        if verbose:
+            print("pivot", vertices[pivot])
+        hull_vertices.append(pivot)
+        is_hull_vertex[pivot] = True
+        # walk from face across edges to find all visible faces,
+        # and construct the horizon from the edges to invisible faces
+        # note: precision only decides which vertices are outside;
+        # a face which the pivot lies just above must be replaced
+        # anyway, else the new faces may fold over it
+        visible_faces = [face]
+        visited_faces = set(visible_faces)
+        horizon_edges = []
+        for visible_face in visible_faces:
+            i, j, k = face_verts[visible_face].tolist()
+            for edge in ((i, j), (j, k), (k, i)):
+                other_face = edge_faces.get((edge[1], edge[0]))
+                if other_face in visited_faces:
+                    continue
+                if (other_face is not None
+                    and normals[other_face].dot(pivot_vert)
+                    > offsets[other_face]):
+                    visible_faces.append(other_face)
+                    visited_faces.add(other_face)
+                else:
+                    horizon_edges.append(edge)
+        # remove visible faces, and gather their outer vertices
+        candidates = [numpy.zeros(0, dtype=numpy.intp)]
+        for visible_face in visible_faces:
+            i, j, k = face_verts[visible_face].tolist()
+            if verbose:
+                print("removing", (vertices[i], vertices[j], vertices[k]))
+            alive[visible_face] = False
+            for edge in ((i, j), (j, k), (k, i)):
+                if edge_faces.get(edge) == visible_face:
+                    del edge_faces[edge]
+            if visible_face in outer_vertices:
+                candidates.append(outer_vertices.pop(visible_face))
+        candidates = numpy.concatenate(candidates)
+        candidates = candidates[candidates != pivot]
+        # close the hull by a cone from the horizon to the pivot
+        new_faces = numpy.array([edge + (pivot,) for edge in horizon_edges],
+                                dtype=numpy.intp)
+
+    # remap the triangles to indices that point into the extreme points
+    # skipping faces with zero area
+    triangles = face_verts[:num_faces][
+        alive[:num_faces] & normals[:num_faces].any(axis=1)]
+    used = set(triangles.ravel().tolist())
+    hull_vertices = [i for i in hull_vertices if i in used]
+    hull_index = dict((i, index) for index, i in enumerate(hull_vertices))
+    return ([vertices[i] for i in hull_vertices],
+            [tuple(hull_index[i] for i in triangle)
+             for triangle in triangles.tolist()])
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
@@ -0,0 +1,169 @@
+"""Transform and skin vertices in batches.
+
+With numpy, all vertices of a mesh are transformed with a single matrix
+product, and skinning gathers the (vertex index, weight) pairs of all
+bones into flat arrays, so all weights are applied at once.
+"""
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright (c) 2007-2012, Python File Format Interface
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the Python File Format Interface
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def transform_vertices(vertices, matrix):
+    """Multiply every vertex, as row vector, with the matrix, which is
+    either a 3x3 matrix, or a 4x4 matrix with the translation in its last
+    row (as returned by ``as_list`` of
+    :class:`pyffi.formats.nif.NifFormat.Matrix44`).
+
+    >>> transform_vertices(
+    ...     [(1, 2, 3), (0, 0, 1)],
+    ...     [[0, 1, 0, 0], [-1, 0, 0, 0], [0, 0, 2, 0], [1, 1, 1, 1]])
+    [(-1.0, 2.0, 7.0), (1.0, 1.0, 3.0)]
+    >>> transform_vertices([(1, 2, 3)], [[0, 1, 0], [-1, 0, 0], [0, 0, 2]])
+    [(-2.0, 1.0, 6.0)]
+
+    :param vertices: The vertices.
+    :type vertices: ``list`` of triples of ``float``\\ s
+    :param matrix: The matrix, as list of rows.
+    :return: The transformed vertices.
+    :rtype: ``list`` of triples of ``float``\\ s
+    """
+    if numpy is not None:
+        return _transform_vertices_numpy(vertices, matrix)
+    else:
+        return _transform_vertices_python(vertices, matrix)
+
+
+def _transform_vertices_python(vertices, matrix):
+    """Transform the vertices one at a time."""
+    (m11, m12, m13), (m21, m22, m23), (m31, m32, m33) = (
+        row[:3] for row in matrix[:3])
+    if len(matrix) == 4:
+        t1, t2, t3 = (float(value) for value in matrix[3][:3])
+    else:
+        t1 = t2 = t3 = 0.0
+    return [(x * m11 + y * m21 + z * m31 + t1,
+             x * m12 + y * m22 + z * m32 + t2,
+             x * m13 + y * m23 + z * m33 + t3)
+            for x, y, z in vertices]
+
+
+def _transform_vertices_numpy(vertices, matrix):
+    """Transform all vertices with a single matrix product."""
+    vertices = numpy.asarray(vertices, dtype=numpy.float64).reshape(-1, 3)
+    matrix = numpy.asarray(matrix, dtype=numpy.float64)
+    result = vertices.dot(matrix[:3, :3])
+    if len(matrix) == 4:
+        result += matrix[3, :3]
+    return [tuple(vertex) for vertex in result.tolist()]
+
+
+def skin_vertices(vertices, bone_weights, matrices):
+    """Skin the vertices: for every bone, transform the vertices it
+    influences with the bone's matrix (see :func:`transform_vertices`),
+    and add the result times the weight.
+
+    >>> identity = [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]]
+    >>> lift = [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 2, 1]]
+    >>> skin_vertices([(1, 0, 0), (0, 1, 0), (0, 0, 1)],
+    ...               [[(0, 1.0), (1, 0.5)], [(1, 0.5)]],
+    ...               [identity, lift])
+    ([(1.0, 0.0, 0.0), (0.0, 1.0, 1.0), (0.0, 0.0, 0.0)], [1.0, 1.0, 0.0])
+
+    :param vertices: The vertices.
+    :type vertices: ``list`` of triples of ``float``\\ s
+    :param bone_weights: For every bone, the list of (vertex index,
+        weight) pairs of the vertices it influences.
+    :param matrices: For every bone, its matrix, as list of rows.
+    :return: The skinned vertices, and the sum of the weights of every
+        vertex.
+    :rtype: ``list`` of triples of ``float``\\ s, and ``list`` of
+        ``float``\\ s
+    """
+    if numpy is not None:
+        return _skin_vertices_numpy(vertices, bone_weights, matrices)
+    else:
+        return _skin_vertices_python(vertices, bone_weights, matrices)
+
+
+def _skin_vertices_python(vertices, bone_weights, matrices):
+    """Skin the vertices, one bone at a time."""
+    skinned = [[0.0, 0.0, 0.0] for vertex in vertices]
+    sumweights = [0.0 for vertex in vertices]
+    for weights, matrix in zip(bone_weights, matrices):
+        transformed = _transform_vertices_python(
+            [vertices[index] for index, weight in weights], matrix)
+        for (index, weight), vertex in zip(weights, transformed):
+            skinned_vertex = skinned[index]
+            skinned_vertex[0] += weight * vertex[0]
+            skinned_vertex[1] += weight * vertex[1]
+            skinned_vertex[2] += weight * vertex[2]
+            sumweights[index] += weight
+    return [tuple(vertex) for vertex in skinned], sumweights
+
+
+def _skin_vertices_numpy(vertices, bone_weights, matrices):
+    """Skin the vertices with a single batched matrix product over all
+    weights.
+    """
+    vertices = numpy.asarray(vertices, dtype=numpy.float64).reshape(-1, 3)
+    pairs = numpy.array(
+        [pair for weights in bone_weights for pair in weights],
+        dtype=numpy.float64).reshape(-1, 2)
+    if not len(pairs):
+        return ([(0.0, 0.0, 0.0) for vertex in vertices],
+                [0.0 for vertex in vertices])
+    indices = pairs[:, 0].astype(numpy.intp)
+    weights = pairs[:, 1]
+    bones = numpy.repeat(numpy.arange(len(bone_weights)),
+                         [len(weights) for weights in bone_weights])
+    matrices = numpy.asarray(matrices, dtype=numpy.float64)
+    matrices = matrices.reshape(len(bone_weights), *matrices.shape[-2:])
+    # transform every influenced vertex with the matrix of its bone
+    transformed = numpy.einsum(
+        "ij,ijk->ik", vertices[indices], matrices[bones, :3, :3])
+    if matrices.shape[1] == 4:
+        transformed += matrices[bones, 3, :3]
+    skinned = numpy.zeros_like(vertices)
+    numpy.add.at(skinned, indices, weights[:, None] * transformed)
+    sumweights = numpy.bincount(indices, weights, minlength=len(vertices))
+    return ([tuple(vertex) for vertex in skinned.tolist()],
+            sumweights.tolist())
@@ -39,9 +39,14 @@
 
 from pyffi.utils.mathutils import *
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 def getTangentSpace(vertices = None, normals = None, uvs = None,
                     triangles = None, orientation = False,
-                    orthogonal = True):
+                    orthogonal = True, vertex_groups = None):
     """Calculate tangent space data.
 
     >>> vertices = [(0,0,0), (0,1,0), (1,0,0)]
@@ -51,12 +56,24 @@ def getTangentSpace(vertices = None, normals = None, uvs = None,
     >>> getTangentSpace(vertices = vertices, normals = normals, uvs = uvs, triangles = triangles)
     ([(0.0, 1.0, 0.0), (0.0, 1.0, 0.0), (0.0, 1.0, 0.0)], [(1.0, 0.0, 0.0), (1.0, 0.0, 0.0), (1.0, 0.0, 0.0)])
 
+    Vertices without tangent space (here, vertex 3) get an arbitrary
+    binormal orthogonal to their normal:
+
+    >>> getTangentSpace(vertices = vertices + [(0,0,1)],
+    ...                 normals = normals + [(0,0,1)],
+    ...                 uvs = uvs + [(0,0)], triangles = triangles)[1][3]
+    (0.0, -1.0, 0.0)
+
     :param vertices: A list of vertices (triples of floats/ints).
     :param normals: A list of normals (triples of floats/ints).
     :param uvs: A list of uvs (pairs of floats/ints).
     :param triangles: A list of triangle indices (triples of ints).
     :param orientation: Set to ``True`` to return orientation (this is used by
         for instance Crysis).
+    :param vertex_groups: Optional list with, for each vertex, a group
+        index. Vertices of the same group (for instance, vertices which
+        only differ in their uvs) share their tangent space, and
+        triangles with two vertices of the same group are skipped.
     :return: Two lists of vectors, tangents and binormals. If C{orientation}
         is ``True``, then returns an extra list with orientations (containing
         floats which describe the total signed surface of all faces sharing
@@ -67,15 +84,37 @@ def getTangentSpace(vertices = None, normals = None, uvs = None,
     if len(vertices) != len(normals) or len(vertices) != len(uvs):
         raise ValueError(
             "lists of vertices, normals, and uvs must have the same length")
+    if vertex_groups is None:
+        vertex_groups = range(len(vertices))
+
+    if numpy is not None:
+        tan, bin, orientations = _get_tangent_space_numpy(
+            vertices, normals, uvs, triangles, vertex_groups)
+    else:
+        tan, bin, orientations = _get_tangent_space_python(
+            vertices, normals, uvs, triangles, vertex_groups)
+
+    # return result
+    if orientation:
+        return tan, bin, orientations
+    else:
+        return tan, bin
 
-    bin = [(0,0,0) for i in range(len(vertices)) ]
-    tan = [(0,0,0) for i in range(len(vertices)) ]
+def _get_tangent_space_python(vertices, normals, uvs, triangles,
+                              vertex_groups):
+    """Calculate tangent space data, one triangle at a time."""
+    num_groups = max(vertex_groups) + 1 if vertex_groups else 0
+    bin = [(0,0,0) for i in range(num_groups) ]
+    tan = [(0,0,0) for i in range(num_groups) ]
     orientations = [0 for i in range(len(vertices))]
 
     # calculate tangents and binormals from vertex and texture coordinates
     for t1, t2, t3 in triangles:
+        g1 = vertex_groups[t1]
+        g2 = vertex_groups[t2]
+        g3 = vertex_groups[t3]
         # skip degenerate triangles
-        if t1 == t2 or t2 == t3 or t3 == t1:
+        if g1 == g2 or g2 == g3 or g3 == g1:
             continue
 
         # get vertices, uvs, and directions of the triangle
@@ -120,50 +159,144 @@ def getTangentSpace(vertices = None, normals = None, uvs = None,
             continue # skip triangle
 
         # vector combination algorithm could possibly be improved
+        for g in (g1, g2, g3):
+            tan[g] = vecAdd(tan[g], tdir)
+            bin[g] = vecAdd(bin[g], sdir)
         for i in (t1, t2, t3):
-            tan[i] = vecAdd(tan[i], tdir)
-            bin[i] = vecAdd(bin[i], sdir)
             orientations[i] += r
 
     # convert into orthogonal space
     xvec = (1, 0, 0)
     yvec = (0, 1, 0)
-    for i, norm in enumerate(normals):
+    tangents = []
+    binormals = []
+    for norm, g in zip(normals, vertex_groups):
         if abs(1-vecNorm(norm)) > 0.01:
             raise ValueError(
                 "tangentspace: unnormalized normal in list of normals (%s, norm is %f)" % (norm, vecNorm(norm)))
         try:
             # turn norm, bin, tan into a base via Gram-Schmidt
-            bin[i] = vecSub(bin[i],
-                            vecscalarMul(
-                                norm,
-                                vecDotProduct(norm, bin[i])))
-            bin[i] = vecNormalized(bin[i])
-            tan[i] = vecSub(tan[i],
-                            vecscalarMul(
-                                norm,
-                                vecDotProduct(norm, tan[i])))
-            tan[i] = vecSub(tan[i],
-                            vecscalarMul(
-                                bin[i],
-                                vecDotProduct(norm, bin[i])))
-            tan[i] = vecNormalized(tan[i])
+            bin_i = vecSub(bin[g],
+                           vecscalarMul(
+                               norm,
+                               vecDotProduct(norm, bin[g])))
+            bin_i = vecNormalized(bin_i)
+            tan_i = vecSub(tan[g],
+                           vecscalarMul(
+                               norm,
+                               vecDotProduct(norm, tan[g])))
+            tan_i = vecSub(tan_i,
+                           vecscalarMul(
+                               bin_i,
+                               vecDotProduct(bin_i, tan_i)))
+            tan_i = vecNormalized(tan_i)
         except ZeroDivisionError:
             # insuffient data to set tangent space for this vertex
             # in that case pick a space
-            bin[i] = vecCrossProduct(xvec, norm)
+            bin_i = vecCrossProduct(xvec, norm)
             try:
-                bin[i] = vecNormalized(bin[i])
+                bin_i = vecNormalized(bin_i)
             except ZeroDivisionError:
-                bin[i] = vecCrossProduct(yvec, norm)
-                bin[i] = vecNormalized(bin[i])
-            tan[i] = vecCrossProduct(norm, bin[i])
+                bin_i = vecCrossProduct(yvec, norm)
+                bin_i = vecNormalized(bin_i)
+            tan_i = vecCrossProduct(norm, bin_i)
+        tangents.append(tuple(float(x) for x in tan_i))
+        binormals.append(tuple(float(x) for x in bin_i))
 
-    # return result
-    if orientation:
-        return tan, bin, orientations
-    else:
-        return tan, bin
+    return tangents, binormals, orientations
+
+def _get_tangent_space_numpy(vertices, normals, uvs, triangles,
+                             vertex_groups):
+    """Calculate tangent space data, for all triangles at once."""
+    num_vertices = len(vertices)
+    vertices = numpy.array(vertices, dtype=numpy.float64).reshape(-1, 3)
+    normals = numpy.array(normals, dtype=numpy.float64).reshape(-1, 3)
+    uvs = numpy.array(uvs, dtype=numpy.float64).reshape(-1, 2)
+    triangles = numpy.array(triangles, dtype=numpy.intp).reshape(-1, 3)
+    vertex_groups = numpy.array(vertex_groups, dtype=numpy.intp)
+    num_groups = vertex_groups.max() + 1 if num_vertices else 0
+
+    unnormalized = numpy.flatnonzero(
+        numpy.abs(1 - numpy.sqrt((normals * normals).sum(axis=1))) > 0.01)
+    if len(unnormalized):
+        norm = tuple(normals[unnormalized[0]].tolist())
+        raise ValueError(
+            "tangentspace: unnormalized normal in list of normals (%s, norm is %f)" % (norm, vecNorm(norm)))
+
+    with numpy.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        # skip degenerate triangles
+        groups = vertex_groups[triangles]
+        keep = ((groups[:, 0] != groups[:, 1])
+                & (groups[:, 1] != groups[:, 2])
+                & (groups[:, 2] != groups[:, 0]))
+        triangles = triangles[keep]
+        groups = groups[keep]
+
+        # directions of all triangles
+        v1, v2, v3 = (vertices[triangles[:, i]] for i in range(3))
+        w1, w2, w3 = (uvs[triangles[:, i]] for i in range(3))
+        v2v1 = v2 - v1
+        v3v1 = v3 - v1
+        w2w1 = w2 - w1
+        w3w1 = w3 - w1
+
+        # surface of triangles in texture space, and its sign
+        r = w2w1[:, 0] * w3w1[:, 1] - w3w1[:, 0] * w2w1[:, 1]
+        r_sign = numpy.where(r >= 0, 1.0, -1.0)[:, None]
+
+        # contribution of each triangle to tangents and binormals
+        sdir = r_sign * (w3w1[:, 1, None] * v2v1 - w2w1[:, 1, None] * v3v1)
+        tdir = r_sign * (w2w1[:, 0, None] * v3v1 - w3w1[:, 0, None] * v2v1)
+        sdir_norm = numpy.sqrt((sdir * sdir).sum(axis=1))
+        tdir_norm = numpy.sqrt((tdir * tdir).sum(axis=1))
+        # skip triangles with zero directions
+        keep = (sdir_norm != 0) & (tdir_norm != 0)
+        sdir = sdir[keep] / sdir_norm[keep, None]
+        tdir = tdir[keep] / tdir_norm[keep, None]
+        groups = groups[keep].reshape(-1)
+        triangles = triangles[keep].reshape(-1)
+        r = r[keep]
+
+        # add the contributions to the vertex groups
+        bin = numpy.empty((num_groups, 3))
+        tan = numpy.empty((num_groups, 3))
+        for i in range(3):
+            bin[:, i] = numpy.bincount(
+                groups, numpy.repeat(sdir[:, i], 3), minlength=num_groups)
+            tan[:, i] = numpy.bincount(
+                groups, numpy.repeat(tdir[:, i], 3), minlength=num_groups)
+        orientations = numpy.bincount(
+            triangles, numpy.repeat(r, 3), minlength=num_vertices)
+        bin = bin[vertex_groups]
+        tan = tan[vertex_groups]
+
+        # turn normals, bin, tan into a base via Gram-Schmidt
+        def dot(vec1, vec2):
+            return (vec1 * vec2).sum(axis=1)[:, None]
+        bin -= normals * dot(normals, bin)
+        bin_norm = numpy.sqrt(dot(bin, bin))
+        bin /= bin_norm
+        tan -= normals * dot(normals, tan)
+        tan -= bin * dot(bin, tan)
+        tan_norm = numpy.sqrt(dot(tan, tan))
+        tan /= tan_norm
+
+        # insuffient data to set tangent space for some vertices
+        # in that case pick a space
+        invalid = ((bin_norm == 0) | (tan_norm == 0)).reshape(-1)
+        if invalid.any():
+            norm = normals[invalid]
+            bin_invalid = numpy.cross((1.0, 0.0, 0.0), norm)
+            bin_invalid_norm = numpy.sqrt(dot(bin_invalid, bin_invalid))
+            ynorm = (bin_invalid_norm == 0).reshape(-1)
+            bin_invalid[ynorm] = numpy.cross((0.0, 1.0, 0.0), norm[ynorm])
+            bin_invalid /= numpy.sqrt(dot(bin_invalid, bin_invalid))
+            bin[invalid] = bin_invalid
+            tan[invalid] = numpy.cross(norm, bin_invalid)
+
+    return ([tuple(vec) for vec in tan.tolist()],
+            [tuple(vec) for vec in bin.tolist()],
+            orientations.tolist())
 
 if __name__ == "__main__":
     import doctest
@@ -65,6 +65,7 @@
 # ~ Imports
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
+from array import array
 import operator # itemgetter
 from weakref import WeakSet
 
@@ -339,6 +340,160 @@ class Mesh:
                     #if id(face) in adj_adj_faces.data:
                     #    del adj_adj_faces.data[id(face)]
 
+class HalfEdgeMesh:
+    """A locked mesh of oriented faces, stored in integer arrays.
+
+    Faces are referred to by their index. As in :meth:`Mesh.lock`,
+    the vertices of each face are rotated so the lowest comes first,
+    and faces are sorted. Half-edge ``3 * face + k`` runs from vertex
+    ``k`` to vertex ``k + 1`` of the face, so the edge opposite
+    vertex ``k`` is half-edge ``3 * face + (k + 1) % 3``.
+
+    :ivar verts: Vertex indices, three for each face.
+    :type verts: ``array`` of ``int``
+    :ivar twin: For each half-edge, the first half-edge which runs in
+        the opposite direction, or ``-1`` if there is none.
+    :type twin: ``array`` of ``int``
+    :ivar sibling: For each half-edge, the next half-edge which runs
+        in the same direction, or ``-1`` if there is none. Only
+        non-manifold edges have siblings.
+    :type sibling: ``array`` of ``int``
+    :ivar discarded: Flag for each face removed by
+        :meth:`discard_face`.
+    :type discarded: ``bytearray``
+    """
+    def __init__(self, faces=()):
+        """Initialize a mesh from its faces. Duplicate and degenerate
+        faces are skipped.
+
+        :param faces: An iterator over faces (triples of vertex
+            indices).
+        :type faces: ``Iterable``
+
+        >>> m = HalfEdgeMesh([(0, 1, 2), (2, 1, 3), (1, 2, 0), (4, 4, 5)])
+        >>> len(m)
+        2
+        >>> list(m.verts)
+        [0, 1, 2, 1, 3, 2]
+        >>> list(m.twin)
+        [-1, 5, -1, -1, -1, 1]
+        """
+        unique_faces = set()
+        for v0, v1, v2 in faces:
+            if v0 == v1 or v1 == v2 or v2 == v0:
+                continue
+            if v1 < v0 and v1 < v2:
+                v0, v1, v2 = v1, v2, v0
+            elif v2 < v0 and v2 < v1:
+                v0, v1, v2 = v2, v0, v1
+            unique_faces.add((v0, v1, v2))
+        self.verts = verts = array('i')
+        for face in sorted(unique_faces):
+            verts.extend(face)
+        num_half_edges = len(verts)
+        self.sibling = sibling = array('i', [-1]) * num_half_edges
+        # first and last half-edge of each directed edge
+        edges = [
+            (verts[half_edge],
+             verts[half_edge + 1 if half_edge % 3 != 2 else half_edge - 2])
+            for half_edge in range(num_half_edges)]
+        first = {}
+        last = {}
+        for half_edge, edge in enumerate(edges):
+            try:
+                sibling[last[edge]] = half_edge
+            except KeyError:
+                first[edge] = half_edge
+            last[edge] = half_edge
+        self.twin = array('i', [first.get((ev1, ev0), -1)
+                                for ev0, ev1 in edges])
+        self.discarded = bytearray(num_half_edges // 3)
+
+    def __len__(self):
+        """Number of faces, including discarded ones."""
+        return len(self.verts) // 3
+
+    def __repr__(self):
+        """String representation.
+
+        >>> HalfEdgeMesh()
+        HalfEdgeMesh()
+        >>> HalfEdgeMesh([(1, 2, 3), (3, 2, 4)])
+        HalfEdgeMesh(faces=[(1, 2, 3), (2, 4, 3)])
+        """
+        if not self.verts:
+            return "HalfEdgeMesh()"
+        return ("HalfEdgeMesh(faces=[%s])"
+                % ', '.join(repr(self.get_face_verts(face))
+                            for face in range(len(self))))
+
+    def get_face_verts(self, face):
+        """Get the vertices of a face.
+
+        >>> HalfEdgeMesh([(8, 7, 5)]).get_face_verts(0)
+        (5, 8, 7)
+        """
+        return tuple(self.verts[3 * face:3 * face + 3])
+
+    def get_next_vertex(self, face, vi):
+        """Get next vertex of face.
+
+        >>> HalfEdgeMesh([(8, 7, 5)]).get_next_vertex(0, 8)
+        7
+        """
+        verts = self.verts
+        corner = 3 * face
+        if verts[corner] == vi:
+            return verts[corner + 1]
+        elif verts[corner + 1] == vi:
+            return verts[corner + 2]
+        elif verts[corner + 2] == vi:
+            return verts[corner]
+        raise ValueError("Vertex %i not in face %i." % (vi, face))
+
+    def get_adjacent_faces(self, face, vi):
+        """Get faces which are not discarded, adjacent along the edge
+        opposite a vertex.
+
+        >>> m = HalfEdgeMesh([(0, 1, 2), (1, 3, 2), (2, 3, 4), (2, 3, 5)])
+        >>> list(m.get_adjacent_faces(0, 0))
+        [1]
+        >>> list(m.get_adjacent_faces(1, 1))
+        [2, 3]
+        >>> list(m.get_adjacent_faces(1, 2))
+        []
+        """
+        verts = self.verts
+        corner = 3 * face
+        if verts[corner] == vi:
+            half_edge = self.twin[corner + 1]
+        elif verts[corner + 1] == vi:
+            half_edge = self.twin[corner + 2]
+        elif verts[corner + 2] == vi:
+            half_edge = self.twin[corner]
+        else:
+            raise ValueError("Vertex %i not in face %i." % (vi, face))
+        discarded = self.discarded
+        sibling = self.sibling
+        while half_edge != -1:
+            other_face = half_edge // 3
+            if not discarded[other_face]:
+                yield other_face
+            half_edge = sibling[half_edge]
+
+    def discard_face(self, face):
+        """Remove the face from the mesh. Indices of other faces remain
+        valid.
+
+        >>> m = HalfEdgeMesh([(0, 1, 2), (1, 3, 2), (2, 3, 4)])
+        >>> list(m.get_adjacent_faces(0, 0))
+        [1]
+        >>> m.discard_face(1)
+        >>> list(m.get_adjacent_faces(0, 0))
+        []
+        """
+        self.discarded[face] = 1
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
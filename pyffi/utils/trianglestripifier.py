@@ -47,10 +47,11 @@ output in all circumstances.
 #
 # ***** END LICENSE BLOCK *****
 
+from array import array
 import itertools
 import random # choice
 
-from pyffi.utils.trianglemesh import Face, Mesh
+from pyffi.utils.trianglemesh import HalfEdgeMesh, Mesh
 
 class TriangleStrip(object):
     """A heavily specialized oriented strip of faces.
@@ -61,9 +62,10 @@ class TriangleStrip(object):
     http://techgame.net/projects/Runeblade/browser/trunk/RBRapier/RBRapier/Tools/Geometry/Analysis/TriangleStripifier.py?rev=760
     """
 
-    def __init__(self, stripped_faces=None,
+    def __init__(self, mesh, stripped_faces=None,
                  faces=None, vertices=None, reversed_=False):
         """Initialise the triangle strip."""
+        self.mesh = mesh
         self.faces = faces if faces is not None else []
         self.vertices = vertices if vertices is not None else []
         self.reversed_ = reversed_
@@ -78,50 +80,51 @@ class TriangleStrip(object):
                    repr(self.vertices), repr(self.reversed_)))
 
     def get_unstripped_adjacent_face(self, face, vi):
-        """Get adjacent face which is not yet stripped."""
-        for otherface in face.get_adjacent_faces(vi):
-            if otherface.index not in self.stripped_faces:
+        """Get adjacent face which is not yet stripped, or ``None``."""
+        for otherface in self.mesh.get_adjacent_faces(face, vi):
+            if otherface not in self.stripped_faces:
                 return otherface
+        return None
 
     def traverse_faces(self, start_vertex, start_face, forward):
         """Builds a strip traveral of faces starting from the
         start_face and the edge opposite start_vertex. Returns number
         of faces added.
         """
-        count = 0
+        get_next_vertex = self.mesh.get_next_vertex
+        faces = []
+        vertices = []
         pv0 = start_vertex
-        pv1 = start_face.get_next_vertex(pv0)
-        pv2 = start_face.get_next_vertex(pv1)
+        pv1 = get_next_vertex(start_face, pv0)
+        pv2 = get_next_vertex(start_face, pv1)
+        # forward strips first advance pv1, backward strips pv2
+        advance_pv1 = forward
         next_face = self.get_unstripped_adjacent_face(start_face, pv0)
-        while next_face:
-            self.stripped_faces.add(next_face.index)
-            count += 1
-            if count & 1:
-                if forward:
-                    pv0 = pv1
-                    pv1 = next_face.get_next_vertex(pv0)
-                    self.vertices.append(pv1)
-                    self.faces.append(next_face)
-                else:
-                    pv0 = pv2
-                    pv2 = next_face.get_next_vertex(pv1)
-                    self.vertices.insert(0, pv2)
-                    self.faces.insert(0, next_face)
-                    self.reversed_ = not self.reversed_
+        while next_face is not None:
+            self.stripped_faces.add(next_face)
+            faces.append(next_face)
+            if advance_pv1:
+                pv0 = pv1
+                pv1 = get_next_vertex(next_face, pv0)
+                vertices.append(pv1)
             else:
-                if forward:
-                    pv0 = pv2
-                    pv2 = next_face.get_next_vertex(pv1)
-                    self.vertices.append(pv2)
-                    self.faces.append(next_face)
-                else:
-                    pv0 = pv1
-                    pv1 = next_face.get_next_vertex(pv0)
-                    self.vertices.insert(0, pv1)
-                    self.faces.insert(0, next_face)
-                    self.reversed_ = not self.reversed_
+                pv0 = pv2
+                pv2 = get_next_vertex(next_face, pv1)
+                vertices.append(pv2)
+            advance_pv1 = not advance_pv1
             next_face = self.get_unstripped_adjacent_face(next_face, pv0)
-        return count
+        if forward:
+            self.faces.extend(faces)
+            self.vertices.extend(vertices)
+        else:
+            # faces were found in reverse order
+            faces.reverse()
+            vertices.reverse()
+            self.faces[:0] = faces
+            self.vertices[:0] = vertices
+            if len(faces) & 1:
+                self.reversed_ = not self.reversed_
+        return len(faces)
 
     def build(self, start_vertex, start_face):
         """Builds the face strip forwards, then backwards. Returns
@@ -130,123 +133,107 @@ class TriangleStrip(object):
         Check case of single triangle
         -----------------------------
 
-        >>> m = Mesh()
-        >>> face = m.add_face(0, 1, 2)
-        >>> m.lock()
-        >>> t = TriangleStrip()
-        >>> t.build(0, face)
+        >>> m = HalfEdgeMesh([(0, 1, 2)])
+        >>> t = TriangleStrip(m)
+        >>> t.build(0, 0)
         0
         >>> t
-        TriangleStrip(stripped_faces={0}, faces=[Face(0, 1, 2)], vertices=[0, 1, 2], reversed_=False)
+        TriangleStrip(stripped_faces={0}, faces=[0], vertices=[0, 1, 2], reversed_=False)
         >>> t.get_strip()
         [0, 1, 2]
-        >>> t = TriangleStrip()
-        >>> t.build(1, face)
+        >>> t = TriangleStrip(m)
+        >>> t.build(1, 0)
         0
         >>> t
-        TriangleStrip(stripped_faces={0}, faces=[Face(0, 1, 2)], vertices=[1, 2, 0], reversed_=False)
+        TriangleStrip(stripped_faces={0}, faces=[0], vertices=[1, 2, 0], reversed_=False)
         >>> t.get_strip()
         [1, 2, 0]
-        >>> t = TriangleStrip()
-        >>> t.build(2, face)
+        >>> t = TriangleStrip(m)
+        >>> t.build(2, 0)
         0
         >>> t
-        TriangleStrip(stripped_faces={0}, faces=[Face(0, 1, 2)], vertices=[2, 0, 1], reversed_=False)
+        TriangleStrip(stripped_faces={0}, faces=[0], vertices=[2, 0, 1], reversed_=False)
         >>> t.get_strip()
         [2, 0, 1]
 
         Check case of two triangles, with special strip winding fix
         -----------------------------------------------------------
 
-        >>> m = Mesh()
-        >>> face0 = m.add_face(0, 1, 2)
-        >>> face1 = m.add_face(2, 1, 3)
-        >>> m.lock()
-        >>> t = TriangleStrip()
-        >>> t.build(0, face0)
+        >>> m = HalfEdgeMesh([(0, 1, 2), (2, 1, 3)])
+        >>> m
+        HalfEdgeMesh(faces=[(0, 1, 2), (1, 3, 2)])
+        >>> t = TriangleStrip(m)
+        >>> t.build(0, 0)
         0
         >>> t
-        TriangleStrip(stripped_faces={0, 1}, faces=[Face(0, 1, 2), Face(1, 3, 2)], vertices=[0, 1, 2, 3], reversed_=False)
+        TriangleStrip(stripped_faces={0, 1}, faces=[0, 1], vertices=[0, 1, 2, 3], reversed_=False)
         >>> t.get_strip()
         [0, 1, 2, 3]
-        >>> t = TriangleStrip()
-        >>> t.build(1, face0)
+        >>> t = TriangleStrip(m)
+        >>> t.build(1, 0)
         1
         >>> t
-        TriangleStrip(stripped_faces={0, 1}, faces=[Face(1, 3, 2), Face(0, 1, 2)], vertices=[3, 1, 2, 0], reversed_=True)
+        TriangleStrip(stripped_faces={0, 1}, faces=[1, 0], vertices=[3, 1, 2, 0], reversed_=True)
         >>> t.get_strip()
         [3, 2, 1, 0]
-        >>> t = TriangleStrip()
-        >>> t.build(2, face1)
+        >>> t = TriangleStrip(m)
+        >>> t.build(2, 1)
         1
         >>> t
-        TriangleStrip(stripped_faces={0, 1}, faces=[Face(0, 1, 2), Face(1, 3, 2)], vertices=[0, 2, 1, 3], reversed_=True)
+        TriangleStrip(stripped_faces={0, 1}, faces=[0, 1], vertices=[0, 2, 1, 3], reversed_=True)
         >>> t.get_strip()
         [0, 1, 2, 3]
-        >>> t = TriangleStrip()
-        >>> t.build(3, face1)
+        >>> t = TriangleStrip(m)
+        >>> t.build(3, 1)
         0
         >>> t
-        TriangleStrip(stripped_faces={0, 1}, faces=[Face(1, 3, 2), Face(0, 1, 2)], vertices=[3, 2, 1, 0], reversed_=False)
+        TriangleStrip(stripped_faces={0, 1}, faces=[1, 0], vertices=[3, 2, 1, 0], reversed_=False)
         >>> t.get_strip()
         [3, 2, 1, 0]
 
         Check that extra vertex is appended to fix winding
         --------------------------------------------------
 
-        >>> m = Mesh()
-        >>> face0 = m.add_face(1, 3, 2)
-        >>> face1 = m.add_face(2, 3, 4)
-        >>> face2 = m.add_face(4, 3, 5)
-        >>> face3 = m.add_face(4, 5, 6)
-        >>> m.lock()
-        >>> t = TriangleStrip()
-        >>> t.build(2, face1)
+        >>> m = HalfEdgeMesh([(1, 3, 2), (2, 3, 4), (4, 3, 5), (4, 5, 6)])
+        >>> m
+        HalfEdgeMesh(faces=[(1, 3, 2), (2, 3, 4), (3, 5, 4), (4, 5, 6)])
+        >>> t = TriangleStrip(m)
+        >>> t.build(2, 1)
         1
         >>> t
-        TriangleStrip(stripped_faces={0, 1, 2, 3}, faces=[Face(1, 3, 2), Face(2, 3, 4), Face(3, 5, 4), Face(4, 5, 6)], vertices=[1, 2, 3, 4, 5, 6], reversed_=True)
+        TriangleStrip(stripped_faces={0, 1, 2, 3}, faces=[0, 1, 2, 3], vertices=[1, 2, 3, 4, 5, 6], reversed_=True)
         >>> t.get_strip()
         [1, 1, 2, 3, 4, 5, 6]
 
         Check that strip is reversed to fix winding
         -------------------------------------------
 
-        >>> m = Mesh()
-        >>> face0 = m.add_face(1, 3, 2)
-        >>> face1 = m.add_face(2, 3, 4)
-        >>> face2 = m.add_face(4, 3, 5)
-        >>> m.lock()
-        >>> t = TriangleStrip()
-        >>> t.build(2, face1)
+        >>> m = HalfEdgeMesh([(1, 3, 2), (2, 3, 4), (4, 3, 5)])
+        >>> t = TriangleStrip(m)
+        >>> t.build(2, 1)
         1
         >>> t
-        TriangleStrip(stripped_faces={0, 1, 2}, faces=[Face(1, 3, 2), Face(2, 3, 4), Face(3, 5, 4)], vertices=[1, 2, 3, 4, 5], reversed_=True)
+        TriangleStrip(stripped_faces={0, 1, 2}, faces=[0, 1, 2], vertices=[1, 2, 3, 4, 5], reversed_=True)
         >>> t.get_strip()
         [5, 4, 3, 2, 1]
 
         More complicated mesh
         ---------------------
 
-        >>> m = Mesh()
-        >>> face0 = m.add_face(0, 1, 2)
-        >>> face1 = m.add_face(2, 1, 7)
-        >>> face2 = m.add_face(2, 7, 4)
-        >>> face3 = m.add_face(5, 3, 2)
-        >>> face4 = m.add_face(2, 1, 9)
-        >>> face5 = m.add_face(4, 7, 10)
-        >>> face6 = m.add_face(4, 10, 11)
-        >>> face7 = m.add_face(11, 10, 12)
-        >>> face8 = m.add_face(1, 0, 13)
-        >>> m.lock()
-        >>> t = TriangleStrip()
-        >>> t.build(7, face1)
+        >>> m = HalfEdgeMesh([(0, 1, 2), (2, 1, 7), (2, 7, 4), (5, 3, 2),
+        ...                   (2, 1, 9), (4, 7, 10), (4, 10, 11),
+        ...                   (11, 10, 12), (1, 0, 13)])
+        >>> m
+        HalfEdgeMesh(faces=[(0, 1, 2), (0, 13, 1), (1, 7, 2), (1, 9, 2), (2, 5, 3), (2, 7, 4), (4, 7, 10), (4, 10, 11), (10, 12, 11)])
+        >>> t = TriangleStrip(m)
+        >>> t.build(7, 2)
         4
-        >>> t.faces[4] == face1 # check result from build
-        True
+        >>> t.faces[4] # check result from build
+        2
         >>> t.stripped_faces
         {0, 1, 2, 5, 6, 7, 8}
-        >>> t.faces
-        [Face(10, 12, 11), Face(4, 10, 11), Face(4, 7, 10), Face(2, 7, 4), Face(1, 7, 2), Face(0, 1, 2), Face(0, 13, 1)]
+        >>> [m.get_face_verts(face) for face in t.faces]
+        [(10, 12, 11), (4, 10, 11), (4, 7, 10), (2, 7, 4), (1, 7, 2), (0, 1, 2), (0, 13, 1)]
         >>> t.vertices
         [12, 11, 10, 4, 7, 2, 1, 0, 13]
         >>> t.reversed_
@@ -257,18 +244,16 @@ class TriangleStrip(object):
         Mesh which has more than a single strip
         ---------------------------------------
 
-        >>> m = Mesh()
-        >>> tmp = m.add_face(2, 1, 7) # in strip
-        >>> start_face = m.add_face(0, 1, 2) # in strip
-        >>> tmp = m.add_face(2, 7, 4) # in strip
-        >>> tmp = m.add_face(4, 7, 11) # in strip
-        >>> tmp = m.add_face(5, 3, 2)
-        >>> tmp = m.add_face(1, 0, 8) # in strip
-        >>> tmp = m.add_face(0, 8, 9) # bad orientation!
-        >>> tmp = m.add_face(8, 0, 10) # in strip
-        >>> m.lock()
-        >>> t = TriangleStrip()
-        >>> t.build(0, start_face)
+        >>> m = HalfEdgeMesh([(2, 1, 7), # in strip
+        ...                   (0, 1, 2), # in strip
+        ...                   (2, 7, 4), # in strip
+        ...                   (4, 7, 11), # in strip
+        ...                   (5, 3, 2),
+        ...                   (1, 0, 8), # in strip
+        ...                   (0, 8, 9), # bad orientation!
+        ...                   (8, 0, 10)]) # in strip
+        >>> t = TriangleStrip(m)
+        >>> t.build(0, 0)
         2
         >>> t.vertices
         [10, 8, 0, 1, 2, 7, 4, 11]
@@ -279,9 +264,9 @@ class TriangleStrip(object):
         del self.vertices[:]
         self.reversed_ = False
         v0 = start_vertex
-        v1 = start_face.get_next_vertex(v0)
-        v2 = start_face.get_next_vertex(v1)
-        self.stripped_faces.add(start_face.index)
+        v1 = self.mesh.get_next_vertex(start_face, v0)
+        v2 = self.mesh.get_next_vertex(start_face, v1)
+        self.stripped_faces.add(start_face)
         self.faces.append(start_face)
         self.vertices.append(v0)
         self.vertices.append(v1)
@@ -309,7 +294,8 @@ class Experiment(object):
     adjacent strips.
     """
 
-    def __init__(self, start_vertex, start_face):
+    def __init__(self, mesh, start_vertex, start_face):
+        self.mesh = mesh
         self.stripped_faces = set()
         self.start_vertex = start_vertex
         self.start_face = start_face
@@ -318,29 +304,21 @@ class Experiment(object):
     def build(self):
         """Build strips, starting from start_vertex and start_face.
 
-        >>> m = Mesh()
-        >>> tmp = m.add_face(2, 1, 7)
-        >>> s1_face = m.add_face(0, 1, 2)
-        >>> tmp = m.add_face(2, 7, 4) # in strip
-        >>> tmp = m.add_face(4, 7, 11) # in strip
-        >>> tmp = m.add_face(5, 3, 2)
-        >>> tmp = m.add_face(1, 0, 8) # in strip
-        >>> tmp = m.add_face(0, 8, 9) # bad orientation!
-        >>> tmp = m.add_face(8, 0, 10) # in strip
-        >>> tmp = m.add_face(10, 11, 8) # in strip
-        >>> # parallel strip
-        >>> s2_face = m.add_face(0, 2, 21) # in strip
-        >>> tmp = m.add_face(21, 2, 22) # in strip
-        >>> tmp = m.add_face(2, 4, 22) # in strip
-        >>> tmp = m.add_face(21, 24, 0) # in strip
-        >>> tmp = m.add_face(9, 0, 24) # in strip
-        >>> # parallel strip, further down
-        >>> s3_face = m.add_face(8, 11, 31) # in strip
-        >>> tmp = m.add_face(8, 31, 32) # in strip
-        >>> tmp = m.add_face(31, 11, 33) # in strip
-        >>> m.lock()
+        >>> m = HalfEdgeMesh([(2, 1, 7), (0, 1, 2),
+        ...                   (2, 7, 4), (4, 7, 11), # in strip
+        ...                   (5, 3, 2),
+        ...                   (1, 0, 8), # in strip
+        ...                   (0, 8, 9), # bad orientation!
+        ...                   (8, 0, 10), (10, 11, 8), # in strip
+        ...                   # parallel strip
+        ...                   (0, 2, 21), (21, 2, 22), (2, 4, 22),
+        ...                   (21, 24, 0), (9, 0, 24),
+        ...                   # parallel strip, further down
+        ...                   (8, 11, 31), (8, 31, 32), (31, 11, 33)])
         >>> # build experiment
-        >>> exp = Experiment(0, s1_face)
+        >>> exp = Experiment(m, 0, 0)
+        >>> m.get_face_verts(exp.start_face)
+        (0, 1, 2)
         >>> exp.build()
         >>> len(exp.strips)
         2
@@ -351,7 +329,7 @@ class Experiment(object):
         >>> # note: with current algorithm [32, 8, 31, 11, 33] is not found
         """
         # build initial strip
-        strip = TriangleStrip(stripped_faces=self.stripped_faces)
+        strip = TriangleStrip(self.mesh, stripped_faces=self.stripped_faces)
         strip.build(self.start_vertex, self.start_face)
         self.strips.append(strip)
         # build adjacent strips
@@ -377,11 +355,12 @@ class Experiment(object):
         opposite_vertex = strip.vertices[face_index + 1]
         face = strip.faces[face_index]
         other_face = strip.get_unstripped_adjacent_face(face, opposite_vertex)
-        if other_face:
+        if other_face is not None:
             winding = strip.reversed_
             if face_index & 1:
                 winding = not winding
-            other_strip = TriangleStrip(stripped_faces=self.stripped_faces)
+            other_strip = TriangleStrip(
+                self.mesh, stripped_faces=self.stripped_faces)
             if winding:
                 other_vertex = strip.vertices[face_index]
                 face_index = other_strip.build(other_vertex, other_face)
@@ -419,6 +398,66 @@ class ExperimentSelector(object):
         self.best_score = -1.0
         self.best_experiment = None
 
+class UnstrippedFaces(object):
+    """Sorted sequence of face indices from which faces can be
+    discarded. Both lookup and removal take logarithmic time, as the
+    faces are counted in a binary indexed tree.
+
+    >>> faces = UnstrippedFaces(10)
+    >>> faces.discard(0)
+    >>> faces.discard(4)
+    >>> len(faces)
+    8
+    >>> list(faces)
+    [1, 2, 3, 5, 6, 7, 8, 9]
+    >>> faces[3]
+    5
+    """
+
+    def __init__(self, num_faces):
+        self._num_faces = num_faces
+        self._len = num_faces
+        self._discarded = bytearray(num_faces)
+        # each node counts the faces in a range ending at its index
+        self._tree = tree = array('i', [0]) * (num_faces + 1)
+        for index in range(1, num_faces + 1):
+            tree[index] += 1
+            parent = index + (index & -index)
+            if parent <= num_faces:
+                tree[parent] += tree[index]
+        self._mask = 1
+        while self._mask <= num_faces:
+            self._mask <<= 1
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, rank):
+        if not 0 <= rank < self._len:
+            raise IndexError("face rank out of range")
+        tree = self._tree
+        index = 0
+        mask = self._mask
+        while mask:
+            next_index = index + mask
+            if next_index <= self._num_faces and tree[next_index] <= rank:
+                index = next_index
+                rank -= tree[index]
+            mask >>= 1
+        return index
+
+    def discard(self, face):
+        """Remove a face, if it has not been removed yet."""
+        if self._discarded[face]:
+            return
+        self._discarded[face] = 1
+        self._len -= 1
+        tree = self._tree
+        index = face + 1
+        while index <= self._num_faces:
+            tree[index] -= 1
+            index += index & -index
+
 class TriangleStripifier(object):
     """Implementation of a triangle stripifier.
 
@@ -427,7 +466,16 @@ class TriangleStripifier(object):
     """
 
     def __init__(self, mesh):
+        """Initialize the stripifier.
+
+        :param mesh: The mesh to stripify. A locked :class:`Mesh` is
+            converted.
+        :type mesh: :class:`HalfEdgeMesh` or :class:`Mesh`
+        """
         self.num_samples = 10
+        if isinstance(mesh, Mesh):
+            mesh = HalfEdgeMesh(face.verts for face in mesh.faces
+                                if face is not None)
         self.mesh = mesh
 
     @staticmethod
@@ -473,75 +521,72 @@ class TriangleStripifier(object):
         Empty mesh
         ----------
 
-        >>> m = Mesh()
-        >>> m.lock()
-        >>> ts = TriangleStripifier(m)
+        >>> ts = TriangleStripifier(HalfEdgeMesh())
         >>> ts.find_all_strips()
         []
 
         Full mesh
         ---------
 
-        >>> m = Mesh()
-        >>> tmp = m.add_face(2, 1, 7)
-        >>> tmp = m.add_face(0, 1, 2)
-        >>> tmp = m.add_face(2, 7, 4) # in strip
-        >>> tmp = m.add_face(4, 7, 11) # in strip
-        >>> tmp = m.add_face(5, 3, 2)
-        >>> tmp = m.add_face(1, 0, 8) # in strip
-        >>> tmp = m.add_face(0, 8, 9) # bad orientation!
-        >>> tmp = m.add_face(8, 0, 10) # in strip
-        >>> tmp = m.add_face(10, 11, 8) # in strip
-        >>> # parallel strip
-        >>> tmp = m.add_face(0, 2, 21) # in strip
-        >>> tmp = m.add_face(21, 2, 22) # in strip
-        >>> tmp = m.add_face(2, 4, 22) # in strip
-        >>> tmp = m.add_face(21, 24, 0) # in strip
-        >>> tmp = m.add_face(9, 0, 24) # in strip
-        >>> # parallel strip, further down
-        >>> tmp = m.add_face(8, 11, 31) # in strip
-        >>> tmp = m.add_face(8, 31, 32) # in strip
-        >>> tmp = m.add_face(31, 11, 33) # in strip
-        >>> m.lock()
+        >>> m = HalfEdgeMesh([(2, 1, 7), (0, 1, 2),
+        ...                   (2, 7, 4), (4, 7, 11), # in strip
+        ...                   (5, 3, 2),
+        ...                   (1, 0, 8), # in strip
+        ...                   (0, 8, 9), # bad orientation!
+        ...                   (8, 0, 10), (10, 11, 8), # in strip
+        ...                   # parallel strip
+        ...                   (0, 2, 21), (21, 2, 22), (2, 4, 22),
+        ...                   (21, 24, 0), (9, 0, 24),
+        ...                   # parallel strip, further down
+        ...                   (8, 11, 31), (8, 31, 32), (31, 11, 33)])
         >>> ts = TriangleStripifier(m)
         >>> sorted(ts.find_all_strips())
         [[3, 2, 5], [4, 22, 2, 21, 0, 24, 9], [9, 0, 8], [11, 4, 7, 2, 1, 0, 8, 10, 11], [32, 8, 31, 11, 33]]
         """
         all_strips = []
         selector = ExperimentSelector()
-        unstripped_faces = set(range(len(self.mesh.faces)))
+        unstripped_faces = UnstrippedFaces(len(self.mesh))
+        # experiments from the previous iteration that did not use any
+        # of the faces stripped since, so building them again would
+        # give the same strips
+        cached_experiments = {}
         while True:
             experiments = []
             # note: using deterministic self.sample
             # instead of existing random.sample in python
             # because deterministic version is easier to test
-            for sample in self.sample(list(unstripped_faces),
-                                      min(self.num_samples,
-                                          len(unstripped_faces))):
-                exp_face = self.mesh.faces[sample]
-                for exp_vertex in exp_face.verts:
-                    experiments.append(
-                        Experiment(start_vertex=exp_vertex,
-                                   start_face=exp_face))
+            for exp_face in self.sample(unstripped_faces,
+                                        min(self.num_samples,
+                                            len(unstripped_faces))):
+                for exp_vertex in self.mesh.get_face_verts(exp_face):
+                    key = (exp_face, exp_vertex)
+                    experiment = cached_experiments.get(key)
+                    if experiment is None:
+                        experiment = Experiment(
+                            self.mesh,
+                            start_vertex=exp_vertex, start_face=exp_face)
+                    experiments.append((key, experiment))
             if not experiments:
                 # done!
                 return all_strips
-            # note: use while loop so we only need to keep at most two
-            # built experiments at the same time in memory
-            while experiments:
-                experiment = experiments.pop()
-                experiment.build()
+            # note: experiments are evaluated last to first
+            for key, experiment in reversed(experiments):
+                if not experiment.strips:
+                    experiment.build()
                 selector.update(experiment)
-            unstripped_faces -= selector.best_experiment.stripped_faces
+            stripped_faces = selector.best_experiment.stripped_faces
             # remove stripped faces from mesh
-            for strip in selector.best_experiment.strips:
-                for face in strip.faces:
-                    self.mesh.discard_face(face)
+            for face in stripped_faces:
+                self.mesh.discard_face(face)
+                unstripped_faces.discard(face)
             # calculate actual strips for experiment
             all_strips.extend(
                 (strip.get_strip()
                  for strip in selector.best_experiment.strips))
             selector.clear()
+            cached_experiments = dict(
+                (key, experiment) for key, experiment in experiments
+                if experiment.stripped_faces.isdisjoint(stripped_faces))
 
 if __name__=='__main__':
     import doctest
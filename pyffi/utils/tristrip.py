@@ -44,7 +44,7 @@ try:
 except ImportError:
     pytristrip = None
     from pyffi.utils.trianglestripifier import TriangleStripifier
-    from pyffi.utils.trianglemesh import Mesh
+    from pyffi.utils.trianglemesh import HalfEdgeMesh
 
 def triangulate(strips):
     """A generator for iterating over the faces in a set of
@@ -176,16 +176,8 @@ def stripify(triangles, stitchstrips = False):
     if pytristrip:
         strips = pytristrip.stripify(triangles)
     else:
-        strips = []
-        # build a mesh from triangles
-        mesh = Mesh()
-        for face in triangles:
-            try:
-                mesh.add_face(*face)
-            except ValueError:
-                # degenerate face
-                pass
-        mesh.lock()
+        # build a mesh from triangles, skipping degenerate faces
+        mesh = HalfEdgeMesh(triangles)
 
         # calculate the strip
         stripifier = TriangleStripifier(mesh)
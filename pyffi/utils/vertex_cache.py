@@ -43,8 +43,10 @@ http://home.comcast.net/~tom_forsyth/papers/fast_vert_cache_opt.html
 #
 # ***** END LICENSE BLOCK *****
 
+import array
 import collections
 from functools import reduce
+import heapq
 
 from pyffi.utils.tristrip import OrientedStrip
 
@@ -80,6 +82,18 @@ class VertexScore:
             if valence > 0 else None
             for valence in range(self.MAX_TRIANGLES_PER_VERTEX + 1)]
 
+        # score of a vertex, by cache position (-1 for vertices not in
+        # the cache) and number of triangles
+        # entry (cache_position + 1) * (MAX_TRIANGLES_PER_VERTEX + 1)
+        # + num_triangles
+        self.SCORE_TABLE = [
+            -1 if valence == 0
+            else (self.CACHE_SCORE[cache_position]
+                  if cache_position >= 0 else 0)
+            + self.VALENCE_SCORE[valence]
+            for cache_position in range(-1, self.CACHE_SIZE)
+            for valence in range(self.MAX_TRIANGLES_PER_VERTEX + 1)]
+
     def update_score(self, vertex_info):
         """Update score:
 
@@ -175,18 +189,14 @@ class VertexInfo:
         self.triangle_indices = ([] if triangle_indices is None
                                  else triangle_indices)
 
-class TriangleInfo:
-    def __init__(self, score=0, vertex_indices=None):
-        self.score = score
-        self.vertex_indices = ([] if vertex_indices is None
-                               else vertex_indices)
-
 class Mesh:
     """Simple mesh implementation which keeps track of which triangles
     are used by which vertex, and vertex cache positions.
-    """
 
-    _DEBUG = False # to enable debugging of the algorithm
+    The triangles of all vertices are stored in a single array
+    (compressed sparse row format): the triangles of vertex ``i`` are
+    ``vertex_triangles[vertex_triangle_offsets[i]:vertex_triangle_offsets[i + 1]]``.
+    """
 
     def __init__(self, triangles, vertex_score=None):
         """Initialize mesh from given set of triangles.
@@ -194,144 +204,189 @@ class Mesh:
         Empty mesh
         ----------
 
-        >>> Mesh([]).triangle_infos
+        >>> Mesh([]).triangles
         []
 
         Single triangle mesh (with degenerate)
         --------------------------------------
 
         >>> m = Mesh([(0,1,2), (1,2,0)])
-        >>> [vertex_info.triangle_indices for vertex_info in m.vertex_infos]
+        >>> [m.get_vertex_triangles(vertex) for vertex in range(3)]
         [[0], [0], [0]]
-        >>> [triangle_info.vertex_indices for triangle_info in m.triangle_infos]
+        >>> m.triangles
         [(0, 1, 2)]
 
         Double triangle mesh
         --------------------
 
         >>> m = Mesh([(0,1,2), (2,1,3)])
-        >>> [vertex_info.triangle_indices for vertex_info in m.vertex_infos]
+        >>> [m.get_vertex_triangles(vertex) for vertex in range(4)]
         [[0], [0, 1], [0, 1], [1]]
-        >>> [triangle_info.vertex_indices for triangle_info in m.triangle_infos]
+        >>> m.triangles
         [(0, 1, 2), (1, 3, 2)]
         """
-        # initialize vertex and triangle information, and vertex cache
-        self.vertex_infos = []
-        self.triangle_infos = []
-        # add all vertices
-        if triangles:
-            num_vertices = max(max(verts) for verts in triangles) + 1
-        else:
-            num_vertices = 0
         # scoring algorithm
         if vertex_score is None:
             self.vertex_score = VertexScore()
         else:
             self.vertex_score = vertex_score
-        self.vertex_infos = [VertexInfo() for i in range(num_vertices)]
-        # add all triangles
-        for triangle_index, verts in enumerate(get_unique_triangles(triangles)):
-            self.triangle_infos.append(TriangleInfo(vertex_indices=verts))
+        self.triangles = list(get_unique_triangles(triangles))
+        # count triangles per vertex
+        if self.triangles:
+            num_vertices = max(max(verts) for verts in self.triangles) + 1
+        else:
+            num_vertices = 0
+        valences = array.array("l", [0]) * num_vertices
+        for verts in self.triangles:
+            for vertex in verts:
+                valences[vertex] += 1
+        offsets = array.array("l", [0]) * (num_vertices + 1)
+        for vertex, valence in enumerate(valences):
+            offsets[vertex + 1] = offsets[vertex] + valence
+        # store triangles per vertex
+        vertex_triangles = array.array("l", [0]) * offsets[num_vertices]
+        position = offsets[:num_vertices]
+        for triangle_index, verts in enumerate(self.triangles):
             for vertex in verts:
-                self.vertex_infos[vertex].triangle_indices.append(
-                    triangle_index)
-        # calculate score of all vertices
-        for vertex_info in self.vertex_infos:
-            self.vertex_score.update_score(vertex_info)
-        # calculate score of all triangles
-        for triangle_info in self.triangle_infos:
-            triangle_info.score = sum(
-                self.vertex_infos[vertex].score
-                for vertex in triangle_info.vertex_indices)
+                vertex_triangles[position[vertex]] = triangle_index
+                position[vertex] += 1
+        self.vertex_triangle_offsets = offsets
+        self.vertex_triangles = vertex_triangles
+
+    def get_vertex_triangles(self, vertex):
+        """Indices of all triangles which use the given vertex."""
+        offsets = self.vertex_triangle_offsets
+        return self.vertex_triangles[
+            offsets[vertex]:offsets[vertex + 1]].tolist()
 
     def get_cache_optimized_triangles(self):
         """Reorder triangles in a cache efficient way.
 
+        After the first triangle, the next triangle is the one with
+        highest score among the triangles whose score was updated by
+        the previous one, which is suboptimal, but the difference is
+        usually very small and it is *much* faster (as noted by
+        Forsyth). If no scores were updated, then the triangle with
+        highest score overall is taken from a heap.
+
         >>> m = Mesh([(0,1,2), (7,8,9),(2,3,4)])
         >>> m.get_cache_optimized_triangles()
         [(7, 8, 9), (0, 1, 2), (2, 3, 4)]
         """
-        triangles = []
+        triangles = self.triangles
+        num_triangles = len(triangles)
+        num_vertices = len(self.vertex_triangle_offsets) - 1
+        cache_size = self.vertex_score.CACHE_SIZE
+        offsets = self.vertex_triangle_offsets
+        # triangles[offsets[i]:offsets[i] + valences[i]] are the
+        # triangles of vertex i which have not yet been drawn
+        vertex_triangles = self.vertex_triangles[:]
+        valences = array.array(
+            "l", (offsets[i + 1] - offsets[i] for i in range(num_vertices)))
+        # extend the score table to the highest valence of the mesh
+        # so scores can be looked up without clamping the valence
+        max_valence = self.vertex_score.MAX_TRIANGLES_PER_VERTEX
+        stride = max(max(valences, default=0), max_valence) + 1
+        score_table = []
+        for row in range(cache_size + 1):
+            row_scores = self.vertex_score.SCORE_TABLE[
+                row * (max_valence + 1):(row + 1) * (max_valence + 1)]
+            score_table.extend(row_scores)
+            score_table.extend(
+                row_scores[-1:] * (stride - max_valence - 1))
+        cache_positions = array.array("l", [-1]) * num_vertices
+        in_cache = bytearray(num_vertices)
+        # scores of vertices and triangles, and their scores without
+        # taking the cache into account (which is their actual score if
+        # none of its vertices are in the cache)
+        base_vertex_scores = [score_table[valence] for valence in valences]
+        vertex_scores = base_vertex_scores[:]
+        base_triangle_scores = [
+            base_vertex_scores[v0] + base_vertex_scores[v1]
+            + base_vertex_scores[v2]
+            for v0, v1, v2 in triangles]
+        triangle_scores = base_triangle_scores[:]
+        # heap of base triangle scores, with lazy deletion: an entry is
+        # only valid if the triangle is not drawn and its base score
+        # has not changed since
+        heap = [(-score, triangle_index)
+                for triangle_index, score in enumerate(base_triangle_scores)]
+        heapq.heapify(heap)
+        drawn = bytearray(num_triangles)
+        # vertices in the cache, most recently used first
         cache = collections.deque()
-        # set of vertex indices whose scores were updated in the previous run
-        updated_vertices = set()
-        # set of triangle indices whose scores were updated in the previous run
+        result = []
+        # set of triangle indices whose scores were updated in the
+        # previous run (a set, rather than a list, so ties are broken
+        # in the same way as in earlier versions)
         updated_triangles = set()
-        while (updated_triangles
-               or any(triangle_info for triangle_info in self.triangle_infos)):
+        for step in range(num_triangles):
             # pick triangle with highest score
-            if self._DEBUG or not updated_triangles:
-                # very slow but correct global maximum
-                best_triangle_index, best_triangle_info = max(
-                    (triangle
-                     for triangle in enumerate(self.triangle_infos)
-                     if triangle[1]),
-                    key=lambda triangle: triangle[1].score)
             if updated_triangles:
-                if self._DEBUG:
-                    globally_optimal_score = best_triangle_info.score
-                # if scores of triangles were updated in the previous run
-                # then restrict the search to those
-                # this is suboptimal, but the difference is usually very small
-                # and it is *much* faster (as noted by Forsyth)
-                best_triangle_index = max(
-                    updated_triangles,
-                    key=lambda triangle_index:
-                    self.triangle_infos[triangle_index].score)
-                best_triangle_info = self.triangle_infos[best_triangle_index]
-                if (self._DEBUG and
-                    globally_optimal_score - best_triangle_info.score > 0.01):
-                        print(globally_optimal_score,
-                              globally_optimal_score - best_triangle_info.score,
-                              len(updated_triangles))
+                best_triangle = max(updated_triangles,
+                                    key=triangle_scores.__getitem__)
+            else:
+                # no vertex in the cache has triangles left
+                # so all triangle scores are base scores
+                while True:
+                    score, best_triangle = heapq.heappop(heap)
+                    if (not drawn[best_triangle]
+                        and -score == base_triangle_scores[best_triangle]):
+                        break
             # mark as added
-            self.triangle_infos[best_triangle_index] = None
-            # append to ordered list of triangles
-            triangles.append(best_triangle_info.vertex_indices)
-            # clean lists of vertices and triangles whose score we will update
-            updated_vertices = set()
+            drawn[best_triangle] = 1
+            verts = triangles[best_triangle]
+            result.append(verts)
+            # remove triangle from the triangle list of its vertices,
+            # by moving the last triangle of the list in its place, and
+            # update base scores
             updated_triangles = set()
-            # for each vertex in the just added triangle
-            for vertex in best_triangle_info.vertex_indices:
-                vertex_info = self.vertex_infos[vertex]
-                # remove triangle from the triangle list of the vertex
-                vertex_info.triangle_indices.remove(best_triangle_index)
-                # must update its score
-                updated_vertices.add(vertex)
-                updated_triangles.update(vertex_info.triangle_indices)
+            for vertex in verts:
+                start = offsets[vertex]
+                end = start + valences[vertex]
+                index = vertex_triangles.index(best_triangle, start, end)
+                vertex_triangles[index] = vertex_triangles[end - 1]
+                valences[vertex] -= 1
+                base_vertex_scores[vertex] = score_table[valences[vertex]]
+                updated_triangles.update(vertex_triangles[start:end - 1])
+            for triangle_index in updated_triangles:
+                v0, v1, v2 = triangles[triangle_index]
+                score = (base_vertex_scores[v0] + base_vertex_scores[v1]
+                         + base_vertex_scores[v2])
+                if score != base_triangle_scores[triangle_index]:
+                    base_triangle_scores[triangle_index] = score
+                    heapq.heappush(heap, (-score, triangle_index))
             # add each vertex to cache (score is updated later)
-            for vertex in best_triangle_info.vertex_indices:
-                if vertex not in cache:
+            updated_vertices = []
+            for vertex in verts:
+                if not in_cache[vertex]:
                     cache.appendleft(vertex)
-                    if len(cache) > self.vertex_score.CACHE_SIZE:
+                    in_cache[vertex] = 1
+                    if len(cache) > cache_size:
                         # cache overflow!
                         # remove vertex from cache
                         removed_vertex = cache.pop()
-                        removed_vertex_info = self.vertex_infos[removed_vertex]
-                        # update its cache position
-                        removed_vertex_info.cache_position = -1
+                        in_cache[removed_vertex] = 0
+                        cache_positions[removed_vertex] = -1
                         # must update its score
-                        updated_vertices.add(removed_vertex)
-                        updated_triangles.update(removed_vertex_info.triangle_indices)
-            # for each vertex in the cache (this includes those from the
-            # just added triangle)
-            for i, vertex in enumerate(cache):
-                vertex_info = self.vertex_infos[vertex]
-                # update cache positions
-                vertex_info.cache_position = i
-                # must update its score
-                updated_vertices.add(vertex)
-                updated_triangles.update(vertex_info.triangle_indices)
+                        updated_vertices.append(removed_vertex)
+            # update cache positions
+            for cache_position, vertex in enumerate(cache):
+                cache_positions[vertex] = cache_position
+            updated_vertices.extend(cache)
             # update scores
             for vertex in updated_vertices:
-                self.vertex_score.update_score(self.vertex_infos[vertex])
-            for triangle in updated_triangles:
-                triangle_info = self.triangle_infos[triangle]
-                triangle_info.score = sum(
-                    self.vertex_infos[vertex].score
-                    for vertex in triangle_info.vertex_indices)
-        # return result
-        return triangles
+                valence = valences[vertex]
+                vertex_scores[vertex] = score_table[
+                    (cache_positions[vertex] + 1) * stride + valence]
+                start = offsets[vertex]
+                updated_triangles.update(
+                    vertex_triangles[start:start + valence])
+            for triangle_index in updated_triangles:
+                v0, v1, v2 = triangles[triangle_index]
+                triangle_scores[triangle_index] = (
+                    vertex_scores[v0] + vertex_scores[v1] + vertex_scores[v2])
+        return result
 
 def get_cache_optimized_triangles(triangles):
     """Calculate cache optimized triangles, and return the result as
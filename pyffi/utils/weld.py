@@ -0,0 +1,132 @@
+"""Find duplicate vertices of a mesh (welding), with numpy.
+
+All vertex data (positions, normals, uv sets, vertex colors) is
+quantized as whole arrays, and duplicate rows are found with a single
+sort, instead of building a tuple of integers for every vertex.
+"""
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright (c) 2007-2012, Python File Format Interface
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the Python File Format Interface
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import logging
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def quantize(values, precision):
+    """Round values to integers, with the given number of significant
+    digits behind the comma, just like
+    :func:`pyffi.utils.mathutils.float_to_int` does for a single value
+    (nan is converted to zero, and infinity to plus or minus 2 ** 31).
+
+    >>> quantize([0.1234, -0.1236, 2.0], 3)
+    array([ 123, -124, 2000])
+    >>> quantize([[float('nan'), float('inf')]], 2)
+    pyffi.utils.weld:WARNING:converted nan to 0 and inf to +-2147483648
+    array([[         0, 2147483648]])
+
+    :param values: The values.
+    :type values: sequence of ``float`` (or nested sequences)
+    :param precision: Number of significant digits behind the comma.
+    :type precision: ``int``
+    :return: The rounded values.
+    :rtype: ``numpy.ndarray`` of ``numpy.int64``
+    """
+    values = numpy.asarray(values, dtype=numpy.float64) * 10 ** precision
+    if not numpy.isfinite(values).all():
+        logging.getLogger("pyffi.utils.weld").warning(
+            "converted nan to 0 and inf to +-2147483648")
+        values = numpy.nan_to_num(
+            values, nan=0.0, posinf=2.0 ** 31, neginf=-2.0 ** 31)
+    values = numpy.where(values > 0, values + 0.5, values - 0.5)
+    return numpy.trunc(values).astype(numpy.int64)
+
+
+def unique_rows_map(rows):
+    """Return a map and inverse map to identify unique rows, just like
+    :func:`pyffi.utils.unique_map` does for a generator of hashes:
+    new indices follow the order in which the rows first occur.
+
+    >>> unique_rows_map([[1, 2], [3, 4], [1, 2], [0, 0], [3, 4]])
+    ([0, 1, 0, 2, 1], [0, 1, 3])
+    >>> unique_rows_map(numpy.zeros((3, 0)))
+    ([0, 0, 0], [0])
+
+    :param rows: The rows.
+    :type rows: Two dimensional array of integers.
+    :return: The map from old to new index, and its inverse, as lists.
+    """
+    rows = numpy.asarray(rows)
+    num_rows = rows.shape[0]
+    if num_rows == 0:
+        return [], []
+    if rows.shape[1] == 0:
+        return [0] * num_rows, [0]
+    unique_index, inverse = numpy.unique(
+        rows, axis=0, return_index=True, return_inverse=True)[1:]
+    # renumber unique rows in order of first occurrence
+    order = numpy.argsort(unique_index, kind="stable")
+    rank = numpy.empty_like(order)
+    rank[order] = numpy.arange(len(order))
+    return (rank[inverse.reshape(-1)].tolist(),
+            unique_index[order].tolist())
+
+
+def weld_map(*columns):
+    """Return a map and inverse map to identify unique vertices.
+
+    >>> verts = [(0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (0.0001, 0.0, 0.0)]
+    >>> uvs = [(0.5, 0.5), (0.5, 0.5), (0.5, 0.5)]
+    >>> weld_map((verts, 3), (uvs, 5))
+    ([0, 1, 0], [0, 1])
+    >>> weld_map((verts, 5), (uvs, 5))
+    ([0, 1, 2], [0, 1, 2])
+
+    :param columns: For each kind of vertex data, a two dimensional
+        array with one row per vertex, and its precision (see
+        :func:`quantize`).
+    :return: The map from old to new index, and its inverse, as lists.
+    """
+    num_vertices = len(columns[0][0]) if columns else 0
+    if num_vertices == 0:
+        return [], []
+    return unique_rows_map(numpy.hstack([
+        quantize(values, precision).reshape(num_vertices, -1)
+        for values, precision in columns]))
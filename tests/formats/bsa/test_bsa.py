@@ -0,0 +1,119 @@
+"""Tests for reading and writing bsa archives"""
+
+import io
+import os.path
+import unittest
+
+from nose.tools import assert_equals, assert_true, assert_false, raises
+
+from pyffi.formats.bsa import BsaFormat
+from pyffi.utils.mmapstream import MmapStream
+
+
+class TestBsa(unittest.TestCase):
+
+    file_name = os.path.join(os.path.dirname(__file__), "test.bsa")
+
+    def setUp(self):
+        with open(self.file_name, "rb") as stream:
+            self.raw = stream.read()
+        self.data = BsaFormat.Data()
+        self.data.read(io.BytesIO(self.raw))
+
+    def write_read(self, data):
+        stream = io.BytesIO()
+        data.write(stream)
+        stream.seek(0)
+        result = BsaFormat.Data()
+        result.read(stream)
+        return result
+
+    def test_hash(self):
+        for folder in self.data.folders:
+            assert_equals(
+                BsaFormat.Hash.from_name(folder.name.decode(), 103,
+                                         is_folder=True),
+                folder.name_hash)
+            for file_ in folder.files:
+                assert_equals(
+                    BsaFormat.Hash.from_name(file_.name, 103),
+                    file_.name_hash)
+
+    def test_write_unchanged(self):
+        stream = io.BytesIO()
+        self.data.write(stream)
+        assert_equals(stream.getvalue(), self.raw)
+
+    def test_read_member(self):
+        data = self.data.read_member("test.nif")
+        assert_equals(len(data), 519)
+        assert_true(bytes(data).startswith(b"Gamebryo File Format"))
+        assert_true(self.data.has_member("/TEST.NIF"))
+        assert_false(self.data.has_member("meshes/test.nif"))
+
+    @raises(KeyError)
+    def test_read_missing_member(self):
+        self.data.read_member("missing.nif")
+
+    def test_read_member_mmap(self):
+        with MmapStream(self.file_name) as stream:
+            data = BsaFormat.Data()
+            data.read(stream)
+            view = data.read_member("test.dds")
+            assert_true(isinstance(view, memoryview))
+            assert_equals(view.tobytes(),
+                          self.data.read_member("test.dds"))
+            view.release()
+
+    def test_set_member(self):
+        self.data.set_member("test.nif", b"changed")
+        self.data.set_member("meshes/new.nif", b"new")
+        assert_equals(self.data.get_changed_member_names(),
+                      ["test.nif", "meshes\\new.nif"])
+        data = self.write_read(self.data)
+        assert_equals(data.num_folders, 2)
+        assert_equals(data.num_files, 8)
+        assert_equals(data.read_member("test.nif"), b"changed")
+        assert_equals(data.read_member("meshes\\new.nif"), b"new")
+        assert_equals(data.read_member("test.dds"),
+                      self.data.read_member("test.dds"))
+
+    def test_compressed(self):
+        self.data.archive_flags.is_compressed = 1
+        self.data.set_member("test.txt", b"hello" * 100)
+        data = self.write_read(self.data)
+        assert_equals(data.read_member("test.txt"), b"hello" * 100)
+        assert_equals(data.read_member("test.dds"),
+                      self.data.read_member("test.dds"))
+        assert_true(data.file_flags.has_txt_html_bat_scc)
+        stream = io.BytesIO()
+        data.write(stream)
+        assert_true(b"hello" * 100 not in stream.getvalue())
+
+    def test_embedded_names(self):
+        data = BsaFormat.Data()
+        data.version = 104
+        data.archive_flags.unknown_9 = 1
+        data.set_member("meshes/test.nif", b"nif")
+        data = self.write_read(data)
+        assert_equals(data.read_member("meshes/test.nif"), b"nif")
+        data.archive_flags.unknown_9 = 0
+        data = self.write_read(data)
+        assert_equals(data.read_member("meshes/test.nif"), b"nif")
+
+    def test_morrowind(self):
+        data = BsaFormat.Data()
+        data.version = 0
+        data.set_member("meshes/test.nif", b"nif")
+        data.set_member("textures/test.dds", b"dds")
+        data = self.write_read(data)
+        assert_equals(data.version, 0)
+        assert_equals(sorted(data.get_member_names()),
+                      ["meshes\\test.nif", "textures\\test.dds"])
+        assert_equals(data.read_member("textures/test.dds"), b"dds")
+
+    @raises(ValueError)
+    def test_write_same_stream(self):
+        stream = io.BytesIO(self.raw)
+        self.data.read(stream)
+        self.data.write(stream)
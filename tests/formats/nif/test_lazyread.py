@@ -0,0 +1,119 @@
+import io
+import os.path
+import unittest
+
+from pyffi.formats.nif import NifFormat
+from pyffi.utils.mmapstream import MmapStream
+from nose.tools import assert_equals, assert_true, assert_false
+
+
+class TestLazyRead(unittest.TestCase):
+    """Tests for reading nif files with lazy block decoding"""
+
+    file_name = os.path.join(
+        os.path.dirname(__file__), os.pardir, os.pardir,
+        "spells", "nif", "files", "test_check_tangentspace2.nif")
+
+    def setUp(self):
+        with open(self.file_name, "rb") as stream:
+            self.raw = stream.read()
+        self.data = NifFormat.Data()
+        self.data.lazy = True
+        self.data.read(io.BytesIO(self.raw))
+
+    def is_decoded(self, block):
+        return not hasattr(block, "_lazy_source")
+
+    def test_blocks_decoded_on_access(self):
+        """Blocks are only decoded when used"""
+        assert_equals(len(self.data.blocks), 6)
+        assert_false(any(self.is_decoded(block) for block in self.data.blocks))
+        root = self.data.roots[0]
+        assert_true(isinstance(root, NifFormat.NiNode))
+        assert_equals(root.name, b"Scene Root")
+        assert_true(self.is_decoded(root))
+        assert_equals(sum(self.is_decoded(block)
+                          for block in self.data.blocks), 1)
+        assert_equals(root.children[0].name, b"Plane")
+
+    def test_write_unchanged(self):
+        """Writing without changes gives the original file"""
+        self.data.roots[0].name
+        stream = io.BytesIO()
+        self.data.write(stream)
+        assert_equals(stream.getvalue(), self.raw)
+
+    def test_write_changed_block(self):
+        """Changed blocks are written, other blocks are copied"""
+        self.data.roots[0].translation.x = 2.0
+        stream = io.BytesIO()
+        self.data.write(stream)
+        assert_equals(sum(self.is_decoded(block)
+                          for block in self.data.blocks), 1)
+        stream.seek(0)
+        data = NifFormat.Data()
+        data.read(stream)
+        assert_equals(len(data.blocks), 6)
+        assert_equals(data.roots[0].translation.x, 2.0)
+        assert_equals(data.roots[0].children[0].name, b"Plane")
+
+    def test_write_changed_strings(self):
+        """Changing strings writes the same file as an eager read"""
+        data = NifFormat.Data()
+        data.read(io.BytesIO(self.raw))
+        for block in (data.roots[0], self.data.roots[0]):
+            block.name = b"Changed Root Name"
+        eager_stream = io.BytesIO()
+        data.write(eager_stream)
+        stream = io.BytesIO()
+        self.data.write(stream)
+        assert_equals(stream.getvalue(), eager_stream.getvalue())
+
+    def test_write_changed_links(self):
+        """Changing links decodes all blocks and rebuilds the tree"""
+        root = self.data.roots[0]
+        root.num_children = 0
+        root.children.update_size()
+        stream = io.BytesIO()
+        self.data.write(stream)
+        stream.seek(0)
+        data = NifFormat.Data()
+        data.read(stream)
+        assert_equals(len(data.blocks), 1)
+
+    def test_placeholder_class(self):
+        """Only placeholders decode on missing attributes"""
+        root = self.data.roots[0]
+        assert_true(type(root) is not NifFormat.NiNode)
+        root.name
+        assert_true(type(root) is NifFormat.NiNode)
+        try:
+            root.no_such_field
+        except AttributeError as exc:
+            assert_true("no_such_field" in str(exc))
+        else:
+            assert_true(False)
+        assert_false(hasattr(NifFormat.NiNode(), "_lazy_source"))
+
+    def test_interchangeable(self):
+        """Placeholders compare like the blocks they decode to"""
+        data = NifFormat.Data()
+        data.read(io.BytesIO(self.raw))
+        for block, other in zip(self.data.blocks, data.blocks):
+            if not isinstance(other, (NifFormat.NiProperty,
+                                      NifFormat.NiTriBasedGeomData)):
+                continue
+            assert_true(other.is_interchangeable(block))
+            assert_true(self.is_decoded(block))
+            assert_true(type(block) is type(other))
+
+    def test_memory_mapped_stream(self):
+        """Closing a memory mapped stream unmaps it, even though the
+        data still has blocks to decode"""
+        stream = MmapStream(self.file_name)
+        data = NifFormat.Data()
+        data.lazy = True
+        data.read(stream)
+        stream.close()
+        assert_true(stream._buffer.closed)
+        assert_equals(data.roots[0].children[0].name, b"Plane")
@@ -0,0 +1,67 @@
+import io
+import unittest
+
+from nose.tools import assert_equals, assert_raises, assert_true
+
+from pyffi.formats.nif import NifFormat
+
+
+class TestLinks(unittest.TestCase):
+    """Tests for resolving links and walking the tree of nif data"""
+
+    def setUp(self):
+        self.data = NifFormat.Data(version=0x14000005, user_version=11)
+        self.data.header.endian_type = NifFormat.EndianType.ENDIANLITTLE
+
+    def write_read(self):
+        stream = io.BytesIO()
+        self.data.write(stream)
+        stream.seek(0)
+        data = NifFormat.Data()
+        data.read(stream)
+        return data
+
+    def test_many_links(self):
+        root = NifFormat.NiNode()
+        prop = NifFormat.NiAlphaProperty()
+        for i in range(1000):
+            child = NifFormat.NiNode()
+            child.add_property(prop)
+            root.add_child(child)
+        self.data.roots = [root]
+        data = self.write_read()
+        assert_equals(len(data.blocks), 1002)
+        children = data.roots[0].children
+        assert_equals(len(children), 1000)
+        assert_true(all(child.properties[0] is children[0].properties[0]
+                        for child in children))
+
+    def test_deep_tree(self):
+        """Chains longer than the recursion limit"""
+        root = NifFormat.NiNode()
+        node = root
+        for i in range(1500):
+            child = NifFormat.NiNode()
+            node.add_child(child)
+            node = child
+        self.data.roots = [root]
+        data = self.write_read()
+        assert_equals(len(data.blocks), 1501)
+        assert_equals(len(list(data.roots[0].tree())), 1501)
+        data.roots[0]._validateTree()
+
+    def test_tree(self):
+        root = NifFormat.NiNode()
+        child1 = NifFormat.NiNode()
+        child2 = NifFormat.NiNode()
+        prop = NifFormat.NiAlphaProperty()
+        root.add_child(child1)
+        root.add_child(child2)
+        child1.add_property(prop)
+        child2.add_property(prop)
+        assert_equals(list(root.tree()), [root, child1, prop, child2, prop])
+        assert_equals(list(root.tree(unique=True)),
+                      [root, child1, prop, child2])
+        assert_equals(list(root.tree(block_type=NifFormat.NiProperty)),
+                      [prop, prop])
+        assert_raises(ValueError, root._validateTree)
@@ -0,0 +1,119 @@
+import math
+import unittest
+
+from nose.tools import assert_equals, assert_true
+
+from pyffi.formats.nif import NifFormat
+
+
+def query_mopp(mopp, box):
+    """Triangles whose quantized bounds may intersect box, following the
+    branch, bound, and jump commands of the mopp code.
+    """
+    tris = []
+    starts = [(0, 0)]
+    while starts:
+        i, toffset = starts.pop()
+        while True:
+            code = mopp[i]
+            if 0x10 <= code <= 0x12:
+                if box[code - 0x10][0] <= mopp[i + 1]:
+                    starts.append((i + 4, toffset))
+                if box[code - 0x10][1] >= mopp[i + 2]:
+                    starts.append((i + 4 + mopp[i + 3], toffset))
+                break
+            elif 0x26 <= code <= 0x28:
+                if (box[code - 0x26][1] < mopp[i + 1]
+                        or box[code - 0x26][0] > mopp[i + 2]):
+                    break
+                i += 3
+            elif code == 0x05:
+                i += 2 + mopp[i + 1]
+            elif code == 0x06:
+                i += 3 + mopp[i + 1] * 256 + mopp[i + 2]
+            elif code == 0x09:
+                toffset += mopp[i + 1]
+                i += 2
+            elif code == 0x0A:
+                toffset += mopp[i + 1] * 256 + mopp[i + 2]
+                i += 3
+            elif 0x30 <= code < 0x50:
+                tris.append(code - 0x30 + toffset)
+                break
+            elif code == 0x50:
+                tris.append(mopp[i + 1] + toffset)
+                break
+            elif code == 0x51:
+                tris.append(mopp[i + 1] * 256 + mopp[i + 2] + toffset)
+                break
+            else:
+                raise ValueError("unexpected mopp opcode 0x%02X" % code)
+    return tris
+
+
+class TestMopp(unittest.TestCase):
+    """Tests for generating mopp code"""
+
+    def setUp(self):
+        # a bumpy grid
+        num = 20
+        vertices = [(x, y, 3 * math.sin(0.3 * x) * math.cos(0.2 * y))
+                    for x in range(num + 1) for y in range(num + 1)]
+        triangles = []
+        for x in range(num):
+            for y in range(num):
+                v = x * (num + 1) + y
+                triangles.append((v, v + num + 1, v + 1))
+                triangles.append((v + 1, v + num + 1, v + num + 2))
+        self.mopp = NifFormat.bhkMoppBvTreeShape()
+        self.mopp.shape = NifFormat.bhkPackedNiTriStripsShape()
+        self.mopp.shape.add_shape(
+            triangles, [(0, 0, 1)] * len(triangles), vertices)
+
+    def test_update_mopp_welding(self):
+        self.mopp.update_mopp_welding()
+        ids, tris = self.mopp.parse_mopp()
+        # every byte and every triangle visited exactly once
+        assert_equals(sorted(ids), list(range(self.mopp.mopp_data_size)))
+        assert_equals(sorted(tris), list(range(800)))
+        # triangles at the border have a flat edge
+        assert_equals(
+            self.mopp.shape.data.triangles[0].welding_info & 31, 15)
+
+    def test_query(self):
+        self.mopp.update_mopp_welding()
+        mopp = list(self.mopp.mopp_data)
+        bounds = [(self.mopp._trisfloor[t], self.mopp._trisceil[t])
+                  for t in range(800)]
+        for t in range(0, 800, 37):
+            # a small box inside the triangle's quantized bounds
+            box = [[bounds[t][0][i] + 1, bounds[t][0][i] + 2]
+                   for i in range(3)]
+            tris = query_mopp(mopp, box)
+            assert_true(t in tris)
+            # only few triangles are hit
+            assert_true(len(tris) < 40)
+            # all triangles whose bounds intersect the box are hit
+            assert_true(set(tris) >= set(
+                t2 for t2 in range(800)
+                if all(bounds[t2][0][i] <= box[i][1]
+                       and bounds[t2][1][i] >= box[i][0]
+                       for i in range(3))))
+
+    def test_long_jumps(self):
+        """Subtrees longer than a short jump"""
+        def tree(num):
+            if num == 1:
+                return [[0x26, 0, 1, 0x27, 0, 1, 0x28, 0, 1], [0x30], [], []]
+            return [[], [0x10, 1, 0],
+                    tree(num // 2), tree(num - num // 2)]
+        mopp = self.mopp.mopp_from_tree(tree(16384))
+        assert_true(len(mopp) > 2 * 65536)
+        self.mopp.mopp_data_size = len(mopp)
+        self.mopp.mopp_data.update_size()
+        for i, b in enumerate(mopp):
+            self.mopp.mopp_data[i] = b
+        ids, tris = self.mopp.parse_mopp()
+        assert_equals(sorted(ids), list(range(len(mopp))))
+        assert_equals(tris, [0] * 16384)
+        assert_equals(len(query_mopp(mopp, [[0, 0], [0, 0], [0, 0]])), 16384)
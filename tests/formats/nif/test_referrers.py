@@ -0,0 +1,118 @@
+import collections
+import os.path
+import unittest
+
+from nose.tools import assert_equals, assert_true
+
+from pyffi.formats.nif import NifFormat
+from pyffi.utils.graph import EdgeFilter
+
+
+class TestReferrers(unittest.TestCase):
+    """Tests for the referrer index of nif data"""
+
+    def setUp(self):
+        self.data = NifFormat.Data()
+        self.root = NifFormat.NiNode()
+        self.child = NifFormat.NiNode()
+        self.prop = NifFormat.NiAlphaProperty()
+        self.root.add_child(self.child)
+        self.root.add_property(self.prop)
+        self.child.add_property(self.prop)
+        self.data.roots = [self.root]
+
+    def test_file(self):
+        """Referrers match the links of all blocks"""
+        file_name = os.path.join(
+            os.path.dirname(__file__), os.pardir, os.pardir,
+            "spells", "nif", "files", "test_skincenterradius.nif")
+        with open(file_name, "rb") as stream:
+            self.data.read(stream)
+        num_links = collections.Counter()
+        for block in self.data.blocks:
+            for link in block.get_links(self.data):
+                num_links[link] += 1
+        for block in self.data.blocks:
+            assert_equals(len(self.data.get_referrers(block)),
+                          num_links[block])
+
+    def test_replace(self):
+        newprop = NifFormat.NiAlphaProperty()
+        self.data.replace_global_node(self.prop, newprop)
+        assert_true(self.root.properties[0] is newprop)
+        assert_true(self.child.properties[0] is newprop)
+        assert_equals(self.data.get_referrers(self.prop), [])
+        assert_equals(len(self.data.get_referrers(newprop)), 2)
+        index = self.data._referrer_index
+        self.data.replace_global_node(self.child, None)
+        assert_true(self.root.children[0] is None)
+        # the index is kept up to date, not rebuilt
+        assert_true(self.data._referrer_index is index)
+
+    def test_replace_edge_filter(self):
+        """With an edge filter, the whole tree is visited"""
+        newprop = NifFormat.NiAlphaProperty()
+        self.data.replace_global_node(self.prop, newprop,
+                                      edge_filter=EdgeFilter(None, None))
+        assert_true(self.root.properties[0] is newprop)
+        assert_true(self.child.properties[0] is newprop)
+        assert_true(self.data._referrer_index is None)
+
+    def test_other_trees(self):
+        """Changes to other trees keep the index"""
+        self.data.get_referrers(self.prop)
+        index = self.data._referrer_index
+        other = NifFormat.Data()
+        other.roots = [NifFormat.NiNode()]
+        other.roots[0].add_child(NifFormat.NiNode())
+        other.roots[0].add_property(self.prop)
+        assert_true(self.data._referrer_index is index)
+        assert_equals(len(self.data.get_referrers(self.prop)), 2)
+
+    def test_new_elements(self):
+        """References in new array elements are tracked"""
+        self.data.get_referrers(self.prop)
+        index = self.data._referrer_index
+        node = NifFormat.NiNode()
+        node.add_property(self.prop)
+        self.child.add_child(node)
+        self.child.add_property(NifFormat.NiMaterialProperty())
+        assert_true(self.data._referrer_index is index)
+        assert_equals(len(self.data.get_referrers(self.prop)), 3)
+        assert_equals(self.data.get_referrers(node),
+                      [list.__getitem__(self.child.children, 0)])
+        # removed elements are no longer tracked
+        self.child.num_children = 0
+        self.child.children.update_size()
+        assert_equals(self.data.get_referrers(node), [])
+        assert_equals(len(self.data.get_referrers(self.prop)), 2)
+        # nor are references in removed struct elements
+        seq = NifFormat.NiControllerSequence()
+        self.data.roots.append(seq)
+        interp = NifFormat.NiTransformInterpolator()
+        seq.add_controlled_block().interpolator = interp
+        assert_equals(len(self.data.get_referrers(interp)), 1)
+        seq.num_controlled_blocks = 0
+        seq.controlled_blocks.update_size()
+        assert_equals(self.data.get_referrers(interp), [])
+
+    def test_new_blocks(self):
+        """New blocks are tracked once they are attached"""
+        self.data.get_referrers(self.prop)
+        node = NifFormat.NiNode()
+        node.add_property(self.prop)
+        self.root.add_child(node)
+        assert_equals(len(self.data.get_referrers(self.prop)), 3)
+        # blocks attached through tracked references are tracked
+        other = NifFormat.NiNode()
+        other.add_property(self.prop)
+        assert_equals(len(self.data.get_referrers(self.prop)), 3)
+        index = self.data._referrer_index
+        self.data.replace_global_node(self.child, other)
+        assert_true(self.data._referrer_index is index)
+        # detached blocks are no longer tracked
+        assert_equals(len(self.data.get_referrers(self.prop)), 3)
+        # so are new roots
+        self.data.roots.append(NifFormat.NiNode())
+        self.data.roots[-1].add_property(self.prop)
+        assert_equals(len(self.data.get_referrers(self.prop)), 4)
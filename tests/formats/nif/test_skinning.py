@@ -0,0 +1,146 @@
+import math
+import unittest
+
+from nose.tools import assert_equals, assert_true
+
+import pyffi.utils.skinning
+from pyffi.formats.nif import NifFormat
+
+
+def set_rotation_z(block, angle):
+    """Set the rotation of block to a rotation about the z axis."""
+    block.rotation.set_identity()
+    block.rotation.m_11 = block.rotation.m_22 = math.cos(angle)
+    block.rotation.m_12 = math.sin(angle)
+    block.rotation.m_21 = -math.sin(angle)
+
+
+def reference_skin_deformation(geom):
+    """Skin the vertices one weight at a time."""
+    skininst = geom.skin_instance
+    skindata = skininst.data
+    vertices = [NifFormat.Vector3() for vert in geom.data.vertices]
+    for bone, bonedata in zip(skininst.bones, skindata.bone_list):
+        transform = (bonedata.get_transform()
+                     * bone.get_transform(skininst.skeleton_root)
+                     * skindata.get_transform())
+        for skinweight in bonedata.vertex_weights:
+            vertices[skinweight.index] += skinweight.weight * (
+                geom.data.vertices[skinweight.index] * transform)
+    return vertices
+
+
+class TestSkinning(unittest.TestCase):
+    """Tests for skin deformation and bind positions"""
+
+    def setUp(self):
+        # a branching skeleton
+        self.skelroot = NifFormat.NiNode()
+        self.bones = []
+        parent = self.skelroot
+        for i in range(40):
+            bone = NifFormat.NiNode()
+            bone.name = "Bone%i" % i
+            bone.translation.x = 1.0
+            bone.translation.z = 0.1 * (i % 3)
+            set_rotation_z(bone, 0.05 * i)
+            bone.scale = 1.0 + 0.01 * (i % 5)
+            parent.add_child(bone)
+            self.bones.append(bone)
+            if i % 4 != 3:
+                parent = bone
+        self.geom = self.add_geometry(self.skelroot)
+        self.geom.update_bind_position()
+        self.bind_transforms = [bone.get_transform(self.skelroot)
+                                for bone in self.bones]
+
+    def add_geometry(self, parent):
+        """Add a skinned geometry, with every vertex influenced by two
+        bones."""
+        geom = NifFormat.NiTriShape()
+        geom.translation.y = 2.0
+        geom.data = NifFormat.NiTriShapeData()
+        geom.data.num_vertices = 200
+        geom.data.has_vertices = True
+        geom.data.has_normals = True
+        geom.data.vertices.update_size()
+        geom.data.normals.update_size()
+        for i, (vert, norm) in enumerate(zip(geom.data.vertices,
+                                             geom.data.normals)):
+            vert.x = 0.2 * i
+            vert.y = math.sin(i)
+            vert.z = math.cos(i)
+            norm.z = 1.0
+        geom.skin_instance = NifFormat.NiSkinInstance()
+        geom.skin_instance.data = NifFormat.NiSkinData()
+        geom.skin_instance.skeleton_root = self.skelroot
+        for i, bone in enumerate(self.bones):
+            weights = {}
+            for vert_index in range(200):
+                if vert_index % 40 == i:
+                    weights[vert_index] = 0.75
+                elif (vert_index + 1) % 40 == i:
+                    weights[vert_index] = 0.25
+            geom.add_bone(bone, weights)
+        parent.add_child(geom)
+        return geom
+
+    def assert_vectors(self, vectors, other_vectors):
+        assert_equals(len(vectors), len(other_vectors))
+        for vector, other_vector in zip(vectors, other_vectors):
+            assert_true((vector - other_vector).norm() < 1e-4)
+
+    def assert_bind_position(self):
+        for bone, transform in zip(self.bones, self.bind_transforms):
+            diff = bone.get_transform(self.skelroot) - transform
+            assert_true(diff.sup_norm() < 1e-4)
+
+    def test_transform_table(self):
+        transforms = self.skelroot.get_transform_table()
+        for bone in self.bones + [self.geom]:
+            diff = transforms[bone] - bone.get_transform(self.skelroot)
+            assert_true(diff.sup_norm() < 1e-4)
+
+    def test_get_skin_deformation(self):
+        # in bind position, skinning does not change the vertices
+        vertices, normals = self.geom.get_skin_deformation()
+        self.assert_vectors(vertices, list(self.geom.data.vertices))
+        self.assert_vectors(normals, list(self.geom.data.normals))
+        # move some bones
+        for bone in self.bones[::7]:
+            set_rotation_z(bone, 0.3)
+            bone.translation.y = 0.5
+        vertices, normals = self.geom.get_skin_deformation()
+        self.assert_vectors(vertices, reference_skin_deformation(self.geom))
+        # the pure python implementation gives the same result
+        numpy = pyffi.utils.skinning.numpy
+        pyffi.utils.skinning.numpy = None
+        try:
+            python_vertices, python_normals = self.geom.get_skin_deformation()
+        finally:
+            pyffi.utils.skinning.numpy = numpy
+        self.assert_vectors(vertices, python_vertices)
+        self.assert_vectors(normals, python_normals)
+
+    def test_send_bones_to_bind_position(self):
+        for bone in self.bones[::3]:
+            set_rotation_z(bone, -0.2)
+            bone.translation.y = 0.3
+        assert_true(self.skelroot.send_bones_to_bind_position() < 1e-3)
+        self.assert_bind_position()
+
+    def test_send_geometries_to_bind_position(self):
+        # a second geometry, with bind position set after moving the
+        # whole skeleton
+        set_rotation_z(self.bones[0], 0.4)
+        self.bones[0].translation.y = 3.0
+        geom = self.add_geometry(self.skelroot)
+        geom.update_bind_position()
+        vertices = geom.get_skin_deformation()[0]
+        assert_true(self.skelroot.send_geometries_to_bind_position() < 1e-3)
+        # the geometry was moved, but its skinned position is the same
+        assert_true((geom.data.vertices[0] - vertices[0]).norm() > 0.1)
+        self.assert_vectors(geom.get_skin_deformation()[0], vertices)
+        # both geometries now share the bind position
+        assert_true(self.skelroot.send_bones_to_bind_position() < 1e-3)
+        self.assert_bind_position()
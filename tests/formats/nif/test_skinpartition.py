@@ -1,5 +1,34 @@
 from pyffi.formats.nif import NifFormat
-from nose.tools import assert_equals
+from nose.tools import assert_equals, assert_true
+
+
+def get_skinned_strip(num_quads, skininst_class=NifFormat.NiSkinInstance):
+    """A strip of quads, where each pair of vertices at the same
+    position along the strip is weighted to its own bone and the bone
+    of the next pair. Returns the skeleton root (which holds the shape
+    and the bones) and the shape.
+    """
+    shape = NifFormat.NiTriShape()
+    shape.data = NifFormat.NiTriShapeData()
+    shape.skin_instance = skininst_class()
+    shape.skin_instance.data = NifFormat.NiSkinData()
+    skelroot = NifFormat.NiNode()
+    skelroot.add_child(shape)
+    shape.skin_instance.skeleton_root = skelroot
+    shape.data.num_vertices = 2 * (num_quads + 1)
+    shape.data.vertices.update_size()
+    shape.data.set_triangles(
+        [tri for i in range(0, 2 * num_quads, 2)
+         for tri in ((i, i + 1, i + 2), (i + 1, i + 3, i + 2))])
+    for i in range(num_quads + 1):
+        weights = dict((v, 0.5) for v in range(2 * i - 2, 2 * i + 2)
+                       if 0 <= v < 2 * (num_quads + 1))
+        if i == 0:
+            weights = dict((v, 1.0) for v in weights)
+        bone = NifFormat.NiNode()
+        skelroot.add_child(bone)
+        shape.add_bone(bone, weights)
+    return skelroot, shape
 
 
 class TestSkinPartition:
@@ -76,3 +105,49 @@ class TestSkinPartition:
         part.triangles[5].v_3 = 6
         expected_indices = [(5, 4, 3), (2, 4, 6), (3, 5, 7), (2, 3, 4), (5, 6, 7), (1, 0, 1)]
         assert_equals(list(part.get_mapped_triangles()), expected_indices)
+
+    def test_update_skin_partition(self):
+        """Partitions cover all triangles, within the bone limit"""
+        skelroot, shape = get_skinned_strip(20)
+        shape.update_skin_partition(
+            maxbonesperpartition=4, maxbonespervertex=4, stripify=False,
+            padbones=True)
+        triangles = []
+        for part in shape.get_skin_partition().skin_partition_blocks:
+            assert_equals(part.num_bones, 4)
+            assert_true(len(set(part.bones)) <= 4)
+            for v, bone_indices in zip(part.vertex_map, part.bone_indices):
+                assert_equals(list(bone_indices), sorted(bone_indices))
+            triangles.extend(
+                tuple(sorted(tri)) for tri in part.get_mapped_triangles())
+        assert_equals(sorted(triangles),
+                      sorted(tuple(sorted(tri))
+                             for tri in shape.data.get_triangles()))
+        assert_equals(
+            shape.get_skin_partition().num_skin_partition_blocks, 10)
+
+    def test_update_skin_partition_body_parts(self):
+        """Triangles of different body parts are in different partitions"""
+        skelroot, shape = get_skinned_strip(
+            10, skininst_class=NifFormat.BSDismemberSkinInstance)
+        triangles = list(shape.data.get_triangles())
+        trianglepartmap = [(i // 2) % 2 for i in range(len(triangles))]
+        shape.update_skin_partition(
+            maxbonesperpartition=18, maxbonespervertex=4, stripify=False,
+            triangles=triangles, trianglepartmap=trianglepartmap,
+            maximize_bone_sharing=True)
+        skininst = shape.skin_instance
+        assert_equals(skininst.num_partitions, 2)
+        for bodypart, part in zip(
+            skininst.partitions,
+            shape.get_skin_partition().skin_partition_blocks):
+            assert_equals(
+                sorted(tuple(sorted(tri))
+                       for tri in part.get_mapped_triangles()),
+                sorted(tuple(sorted(tri))
+                       for tri, partindex in zip(triangles, trianglepartmap)
+                       if partindex == bodypart.body_part))
+        # bones are shared
+        assert_equals(
+            [bodypart.part_flag.start_new_boneset
+             for bodypart in skininst.partitions], [1, 0])
@@ -0,0 +1,126 @@
+import io
+import unittest
+
+from nose.tools import assert_equals, assert_raises, assert_true
+
+from pyffi.formats.nif import NifFormat
+
+
+def get_transform(block, relative_to):
+    """Transform of block relative to another block, found by searching
+    the tree."""
+    cache = block._transform_cache
+    block._transform_cache = None
+    try:
+        return block.get_transform(relative_to)
+    finally:
+        block._transform_cache = cache
+
+
+class TestTransformCache(unittest.TestCase):
+    """Tests for the transform cache of nif data"""
+
+    def setUp(self):
+        self.data = NifFormat.Data()
+        self.root = NifFormat.NiNode()
+        self.root.translation.z = 5.0
+        self.nodes = []
+        parent = self.root
+        for i in range(30):
+            node = NifFormat.NiNode()
+            node.translation.x = 1.0
+            node.rotation.m_11 = node.rotation.m_22 = 0.8
+            node.rotation.m_12 = 0.6
+            node.rotation.m_21 = -0.6
+            node.scale = 1.0 + 0.1 * (i % 3)
+            parent.add_child(node)
+            self.nodes.append(node)
+            if i % 5 != 4:
+                parent = node
+        self.data.roots = [self.root]
+        self.cache = self.data.get_transform_cache()
+
+    def assert_transforms(self):
+        for node in self.nodes:
+            for relative_to in [self.root, self.nodes[4]]:
+                if relative_to.find_chain(node):
+                    diff = (node.get_transform(relative_to)
+                            - get_transform(node, relative_to))
+                    assert_true(diff.sup_norm() < 1e-6)
+
+    def test_get_transform(self):
+        self.assert_transforms()
+        assert_true(self.cache.get_parent(self.nodes[5]) is self.nodes[3])
+        assert_true(self.cache.get_parent(self.root) is None)
+        # not an ancestor
+        assert_raises(ValueError,
+                      self.nodes[3].get_transform, self.nodes[5])
+
+    def test_change_transform(self):
+        self.assert_transforms()
+        transform = self.nodes[2].get_transform()
+        transform.set_translation(NifFormat.Vector3())
+        self.nodes[2].set_transform(transform)
+        self.assert_transforms()
+        self.nodes[0].apply_scale(3.0)
+        self.assert_transforms()
+        # fields can also be changed directly
+        self.nodes[0].translation.y = 2.0
+        self.assert_transforms()
+        assert_equals(self.nodes[0].get_transform(self.root).get_translation().y,
+                      2.0)
+        assert_true(self.data.get_transform_cache() is self.cache)
+
+    def test_other_trees(self):
+        """Changes to other trees keep the cache"""
+        other = NifFormat.Data()
+        other.roots = [NifFormat.NiNode()]
+        other.roots[0].add_child(NifFormat.NiNode())
+        other.roots[0].children[0].add_child(self.nodes[3])
+        stream = io.BytesIO()
+        other.write(stream)
+        stream.seek(0)
+        NifFormat.Data().read(stream)
+        assert_true(self.cache.is_valid())
+        assert_true(self.data.get_transform_cache() is self.cache)
+
+    def test_remove(self):
+        self.data.remove_transform_cache()
+        assert_true(all(node._transform_cache is None
+                        for node in [self.root] + self.nodes))
+        self.assert_transforms()
+        assert_true(self.data.get_transform_cache() is not self.cache)
+
+    def test_change_tree(self):
+        self.assert_transforms()
+        self.nodes[3].remove_child(self.nodes[4])
+        assert_true(not self.cache.is_valid())
+        assert_raises(ValueError, self.nodes[4].get_transform, self.root)
+        self.nodes[0].add_child(self.nodes[4])
+        self.cache = self.data.get_transform_cache()
+        assert_true(self.cache.get_parent(self.nodes[4]) is self.nodes[0])
+        self.assert_transforms()
+        self.data.roots = [self.nodes[0]]
+        assert_true(not self.cache.is_valid())
+
+    def test_shared(self):
+        """Blocks with more than one parent follow the chain that
+        find_chain finds."""
+        self.root.add_child(self.nodes[7])
+        self.root.children[0], self.root.children[1] = (
+            self.root.children[1], self.root.children[0])
+        self.cache = self.data.get_transform_cache()
+        assert_true(self.cache.get_parent(self.nodes[7]) is self.root)
+        self.assert_transforms()
+
+    def test_deep_tree(self):
+        """Chains longer than the recursion limit"""
+        node = self.root
+        for i in range(1500):
+            child = NifFormat.NiNode()
+            child.translation.x = 1.0
+            node.add_child(child)
+            node = child
+        self.cache = self.data.get_transform_cache()
+        assert_equals(node.get_transform(self.root).get_translation().x,
+                      1500.0)
@@ -0,0 +1,50 @@
+import io
+import os.path
+import unittest
+
+from nose.tools import assert_equals, assert_raises
+
+from pyffi.formats.nif import NifFormat
+
+
+class TestWrite(unittest.TestCase):
+    """Tests for writing nif files"""
+
+    file_name = os.path.join(
+        os.path.dirname(__file__), os.pardir, os.pardir,
+        "spells", "nif", "files", "test_check_tangentspace2.nif")
+
+    def setUp(self):
+        self.data = NifFormat.Data()
+        with open(self.file_name, "rb") as stream:
+            self.data.read(stream)
+
+    def write(self):
+        stream = io.BytesIO()
+        self.data.write(stream)
+        return stream.getvalue()
+
+    def test_block_sizes(self):
+        """Block sizes are recorded as the blocks are written"""
+        self.data.roots[0].children[0].name = b"A much longer name"
+        self.write()
+        assert_equals(list(self.data.header.block_size),
+                      [block.get_size(self.data)
+                       for block in self.data.blocks])
+
+    def test_strings(self):
+        """String indices refer to the header's string list"""
+        root = self.data.roots[0]
+        root.children[0].name = b"Scene Root"
+        stream = io.BytesIO(self.write())
+        data = NifFormat.Data()
+        data.read(stream)
+        assert_equals(sorted(data.header.strings),
+                      sorted(set(data.header.strings)))
+        assert_equals(data.roots[0].children[0].name, b"Scene Root")
+
+    def test_missing_string(self):
+        self.write()
+        string = NifFormat.string()
+        string.set_value(b"Not in the nif")
+        assert_raises(ValueError, string.write, io.BytesIO(), self.data)
@@ -0,0 +1,60 @@
+"""Tests for reading and writing tga images"""
+
+import io
+import os.path
+import unittest
+
+from nose.tools import assert_equals, assert_true
+
+from pyffi.formats.tga import TgaFormat
+
+
+class TestTga(unittest.TestCase):
+
+    def read(self, name):
+        with open(os.path.join(os.path.dirname(__file__), name), "rb") as stream:
+            raw = stream.read()
+        data = TgaFormat.Data()
+        data.read(io.BytesIO(raw))
+        return data, raw
+
+    def write_read(self, data):
+        stream = io.BytesIO()
+        data.write(stream)
+        stream.seek(0)
+        result = TgaFormat.Data()
+        result.read(stream)
+        return result, stream.getvalue()
+
+    def test_uncompressed(self):
+        data, raw = self.read("test.tga")
+        assert_equals(data.image.pixels.shape, (20, 60, 3))
+        assert_equals(data.image.pixels.tobytes(), raw[18:18 + 3600])
+        result, result_raw = self.write_read(data)
+        assert_equals(result_raw, raw)
+
+    def test_rle(self):
+        data, raw = self.read("test_footer.tga")
+        assert_equals(data.image.pixels.shape, (256, 256, 4))
+        assert_true(data.footer is not None)
+        result, result_raw = self.write_read(data)
+        assert_equals(result_raw, raw)
+        # changed pixels are encoded again
+        data.image.pixels[10, 20] = (1, 2, 3, 4)
+        data.image.pixels[11, :] = 5
+        result, result_raw = self.write_read(data)
+        assert_true((result.image.pixels == data.image.pixels).all())
+
+    def test_encode_rle(self):
+        pixels = bytearray(
+            [1, 2] * 3 + [3, 4, 5, 6] + [7, 8] * 200 + [9, 9] * 2)
+        packets = TgaFormat.Image._encode_rle(memoryview(pixels), 206, 2)
+        decoded = bytearray(len(pixels))
+        assert_equals(
+            TgaFormat.Image._decode_rle(packets, memoryview(decoded), 2),
+            len(packets))
+        assert_equals(decoded, pixels)
+        # runs are split at 128 pixels, and at the end of every row
+        assert_equals(packets[:10], b"\x82\x01\x02\x01\x03\x04\x05\x06\xff\x07")
+        packets = TgaFormat.Image._encode_rle(memoryview(pixels), 4, 2)
+        assert_equals(packets[:7], b"\x82\x01\x02\x00\x03\x04\x00")
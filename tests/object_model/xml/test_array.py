@@ -0,0 +1,211 @@
+import io
+import struct
+import unittest
+
+from nose.tools import assert_equals, assert_true, raises
+
+from pyffi.object_models import FileFormat
+from pyffi.object_models.common import UInt, UShort, Float, ULittle32
+from pyffi.object_models.xml.struct_ import StructBase
+from pyffi.object_models.xml import StructAttribute as Attr
+
+
+class SimpleFormat(object):
+    UInt = UInt
+    UShort = UShort
+    Float = Float
+    ULittle32 = ULittle32
+
+    @staticmethod
+    def name_attribute(name):
+        return name
+
+
+class Vec(StructBase):
+    _attrs = [
+        Attr(SimpleFormat, dict(name='x', type='Float')),
+        Attr(SimpleFormat, dict(name='y', type='Float')),
+        Attr(SimpleFormat, dict(name='i', type='UShort'))]
+
+SimpleFormat.Vec = Vec
+
+
+class Point(StructBase):
+    _attrs = [
+        Attr(SimpleFormat, dict(name='x', type='Float')),
+        Attr(SimpleFormat, dict(name='y', type='Float'))]
+
+SimpleFormat.Point = Point
+
+
+class Mesh(StructBase):
+    _attrs = [
+        Attr(SimpleFormat, dict(name='num', type='UInt')),
+        Attr(SimpleFormat, dict(name='indices', type='UShort', arr1='num')),
+        Attr(SimpleFormat, dict(name='vecs', type='Vec', arr1='num')),
+        Attr(SimpleFormat, dict(name='points', type='Point', arr1='num')),
+        Attr(SimpleFormat, dict(name='rows', type='UShort',
+                                arr1='num', arr2='num')),
+        Attr(SimpleFormat, dict(name='raw', type='ULittle32', arr1='num'))]
+
+SimpleFormat.Mesh = Mesh
+
+
+class TestBulkArray(unittest.TestCase):
+
+    def setUp(self):
+        self.data = FileFormat.Data()
+        self.mesh = Mesh()
+        self.mesh.num = 3
+        for arr in (self.mesh.indices, self.mesh.vecs, self.mesh.points,
+                    self.mesh.rows, self.mesh.raw):
+            arr.update_size()
+        for i in range(3):
+            self.mesh.indices[i] = 10 + i
+            self.mesh.vecs[i].x = i
+            self.mesh.vecs[i].y = -0.5 * i
+            self.mesh.vecs[i].i = 7 * i
+            self.mesh.points[i].x = 0.25 * i
+            self.mesh.points[i].y = 2 + i
+            self.mesh.raw[i] = 100 * i
+            for j in range(3):
+                self.mesh.rows[i][j] = 3 * i + j
+
+    def test_struct_format(self):
+        assert_equals(Vec.get_struct_format(self.data), '<ffH')
+        assert_equals(Mesh.get_struct_format(self.data), None)
+        assert_equals(ULittle32.get_struct_format(self.data), None)
+
+    def test_read_write(self):
+        stream = io.BytesIO()
+        self.mesh.write(stream, self.data)
+        size = 4 + 3 * 2 + 3 * 10 + 3 * 8 + 9 * 2 + 3 * 4
+        assert_equals(stream.tell(), size)
+        assert_equals(self.mesh.get_size(self.data), size)
+        stream.seek(0)
+        mesh = Mesh()
+        mesh.read(stream, self.data)
+        assert_equals(list(mesh.indices), [10, 11, 12])
+        assert_equals([(vec.x, vec.y, vec.i) for vec in mesh.vecs],
+                      [(0, 0, 0), (1, -0.5, 7), (2, -1, 14)])
+        assert_equals([list(row) for row in mesh.rows],
+                      [[0, 1, 2], [3, 4, 5], [6, 7, 8]])
+        assert_equals(list(mesh.raw), [0, 100, 200])
+        assert_equals(mesh.get_hash(self.data),
+                      self.mesh.get_hash(self.data))
+        # elements are still ordinary objects
+        assert_true(isinstance(mesh.vecs[1], Vec))
+        mesh.vecs[1].x = 5
+        assert_equals(mesh.vecs[1].x, 5)
+
+    @raises(struct.error)
+    def test_write_out_of_range(self):
+        self.mesh.vecs[0]._i_value_._value = -1
+        self.mesh.write(io.BytesIO(), self.data)
+
+    @raises(struct.error)
+    def test_read_truncated(self):
+        stream = io.BytesIO()
+        self.mesh.write(stream, self.data)
+        mesh = Mesh()
+        mesh.read(io.BytesIO(stream.getvalue()[:20]), self.data)
+
+    def test_get_attribute_values(self):
+        assert_equals(self.mesh.vecs.get_attribute_values("x", "i"),
+                      [(0, 0), (1, 7), (2, 14)])
+        assert_equals(self.mesh.vecs.get_attribute_values("y"),
+                      [(0,), (-0.5,), (-1,)])
+
+    def test_set_attribute_values(self):
+        self.mesh.vecs.set_attribute_values(
+            ("x", "i"), [(3, 1), (4, 2), (5, 3)])
+        self.mesh.vecs.set_attribute_values(("y",), [(1,), (2,), (3,)])
+        assert_equals([(vec.x, vec.y, vec.i) for vec in self.mesh.vecs],
+                      [(3, 1, 1), (4, 2, 2), (5, 3, 3)])
+
+
+class TestStoredArray(TestBulkArray):
+    """Arrays whose values all have the same type keep them in bulk
+    after reading."""
+
+    def setUp(self):
+        TestBulkArray.setUp(self)
+        self.stream = io.BytesIO()
+        self.mesh.write(self.stream, self.data)
+        self.stream.seek(0)
+        self.mesh = Mesh()
+        self.mesh.read(self.stream, self.data)
+
+    def assert_stored(self, *arrays):
+        for arr in arrays:
+            assert_true(arr._storage is not None)
+            assert_equals(list.__len__(arr), 0)
+
+    def test_read(self):
+        self.assert_stored(self.mesh.indices, self.mesh.points,
+                           *self.mesh.rows)
+        # neither are mixed types, nor types with their own read method
+        assert_true(self.mesh.vecs._storage is None)
+        assert_true(self.mesh.raw._storage is None)
+
+    def test_get_value(self):
+        assert_equals(len(self.mesh.indices), 3)
+        assert_equals(list(self.mesh.indices), [10, 11, 12])
+        assert_equals(self.mesh.indices[-1], 12)
+        assert_true(11 in self.mesh.indices)
+        assert_equals([list(row) for row in self.mesh.rows],
+                      [[0, 1, 2], [3, 4, 5], [6, 7, 8]])
+        assert_equals(len(self.mesh.points), 3)
+        assert_equals(self.mesh.points.get_attribute_values("y", "x"),
+                      [(2, 0), (3, 0.25), (4, 0.5)])
+        self.assert_stored(self.mesh.indices, self.mesh.points,
+                           *self.mesh.rows)
+
+    def test_write(self):
+        stream = io.BytesIO()
+        self.mesh.write(stream, self.data)
+        assert_equals(stream.getvalue(), self.stream.getvalue())
+        assert_equals(self.mesh.get_size(self.data), len(stream.getvalue()))
+        assert_equals(self.mesh.points.get_size(), 24)
+        self.assert_stored(self.mesh.indices, self.mesh.points,
+                           *self.mesh.rows)
+
+    def test_byte_order(self):
+        data = FileFormat.Data()
+        data._byte_order = '>'
+        stream = io.BytesIO()
+        self.mesh.write(stream, data)
+        assert_equals(stream.getvalue()[4:10], b'\x00\x0a\x00\x0b\x00\x0c')
+        stream.seek(0)
+        mesh = Mesh()
+        mesh.read(stream, data)
+        assert_equals(list(mesh.indices), [10, 11, 12])
+        assert_equals(mesh.points.get_attribute_values("x", "y"),
+                      [(0, 2), (0.25, 3), (0.5, 4)])
+
+    def test_raw_list_access(self):
+        # the underlying list is empty until the elements are created
+        assert_equals(list(list.__iter__(self.mesh.indices)), [])
+        elems = list(self.mesh.indices.get_detail_child_nodes())
+        assert_equals([elem.get_value()
+                       for elem in list.__iter__(self.mesh.indices)],
+                      [10, 11, 12])
+        assert_equals(list(list.__iter__(self.mesh.indices)), elems)
+
+    def test_change(self):
+        # elements are created as soon as they are needed
+        self.mesh.indices[1] = 20
+        assert_equals(list(self.mesh.indices), [10, 20, 12])
+        self.mesh.rows[2].append(UShort())
+        assert_equals(list(self.mesh.rows[2]), [6, 7, 8, 0])
+        point = self.mesh.points[1]
+        assert_true(isinstance(point, Point))
+        point.x = 5
+        assert_equals(self.mesh.points[1].x, 5)
+        self.mesh.num = 4
+        self.mesh.points.update_size()
+        assert_equals(self.mesh.points.get_attribute_values("x"),
+                      [(0,), (5,), (0.5,), (0,)])
+        for arr in (self.mesh.indices, self.mesh.points, self.mesh.rows[2]):
+            assert_true(arr._storage is None)
+            assert_equals(list.__len__(arr), len(arr))
@@ -103,4 +103,50 @@ class TestBraces:
 
         s = '  (abc(dd efy 442))xxg'
         start_pos, end_pos = Expression._scan_brackets(s)
-        assert_equals(s[start_pos + 1:end_pos], "abc(dd efy 442)")
\ No newline at end of file
+        assert_equals(s[start_pos + 1:end_pos], "abc(dd efy 442)")
+
+class TestCompiledExpression(unittest.TestCase):
+    """Compare compiled expressions with the expression tree evaluation,
+    on all expressions of nif.xml."""
+
+    def evaluate(self, evaluate, obj):
+        try:
+            return evaluate(obj)
+        except Exception as exc:
+            return exc.__class__
+
+    def check(self, expr, obj):
+        assert_equals(self.evaluate(expr._eval_tree, obj),
+                      self.evaluate(expr.compile(), obj))
+
+    def test_nif_expressions(self):
+        from pyffi.formats.nif import NifFormat
+        num_checked = 0
+        for klass in NifFormat.xml_struct:
+            try:
+                instance = klass()
+            except TypeError:
+                # needs a template or argument
+                continue
+            for attr in klass._attrs:
+                for expr in (attr.cond, attr.arr1, attr.arr2):
+                    if expr is not None:
+                        self.check(expr, instance)
+                        num_checked += 1
+                if attr.vercond is not None:
+                    for version in (0x04000002, 0x14000005, 0x14020007):
+                        for user_version in (0, 11, 12):
+                            data = NifFormat.Data(version, user_version, 34)
+                            self.check(attr.vercond, data)
+                    num_checked += 1
+        assert_true(num_checked > 500)
+
+    def test_map(self):
+        expr = Expression('x && y')
+        assert_equals(expr.eval(self), 'ok')
+        expr.map_(lambda name: 'z' if name == 'y' else name)
+        assert_equals(expr.eval(self), 'mapped')
+
+    x = True
+    y = 'ok'
+    z = 'mapped'
@@ -0,0 +1,83 @@
+import io
+import unittest
+
+from nose.tools import assert_equals, assert_true
+
+from pyffi.object_models import FileFormat
+from pyffi.object_models.common import UInt
+from pyffi.object_models.xml.struct_ import StructBase
+from pyffi.object_models.xml import StructAttribute as Attr
+
+
+class SimpleFormat(object):
+    UInt = UInt
+
+    @staticmethod
+    def name_attribute(name):
+        return name
+
+    @staticmethod
+    def version_number(version_str):
+        return int(version_str)
+
+
+class X(StructBase):
+    _attrs = [
+        Attr(SimpleFormat, dict(name='a', type='UInt')),
+        Attr(SimpleFormat, dict(name='b', type='UInt', ver1='2')),
+        Attr(SimpleFormat, dict(name='c', type='UInt', cond='a == 1')),
+        Attr(SimpleFormat, dict(name='c', type='UInt')),
+        Attr(SimpleFormat, dict(name='c', type='UInt', cond='a == 2')),
+        Attr(SimpleFormat, dict(name='d', type='UInt', userver='3'))]
+
+SimpleFormat.X = X
+
+
+class TestAttributePlan(unittest.TestCase):
+
+    def setUp(self):
+        self.data = FileFormat.Data()
+        self.data.version = 1
+        self.data.user_version = 0
+
+    def test_plan_is_cached(self):
+        plan = X._get_attribute_plan(self.data)
+        assert_true(plan is X._get_attribute_plan(self.data))
+        self.data.version = 2
+        assert_true(plan is not X._get_attribute_plan(self.data))
+
+    def test_plan_filters_versions(self):
+        names = [entry[0].name for entry in X._get_attribute_plan(self.data)]
+        # last 'c' can never be active, 'b' and 'd' are out of range
+        assert_equals(names, ['a', 'c', 'c'])
+        self.data.version = 2
+        self.data.user_version = 3
+        names = [entry[0].name for entry in X._get_attribute_plan(self.data)]
+        assert_equals(names, ['a', 'b', 'c', 'c', 'd'])
+
+    def test_filtered_attribute_list(self):
+        x = X()
+        x.a = 1
+        attrs = list(x._get_filtered_attribute_list(self.data))
+        assert_equals([attr.name for attr in attrs], ['a', 'c'])
+        assert_true(attrs[1] is X._attrs[2])
+        x.a = 2
+        attrs = list(x._get_filtered_attribute_list(self.data))
+        assert_equals([attr.name for attr in attrs], ['a', 'c'])
+        assert_true(attrs[1] is X._attrs[3])
+
+    def test_read_write(self):
+        self.data.version = 2
+        x = X()
+        x.a = 1
+        x.b = 2
+        x.c = 3
+        stream = io.BytesIO()
+        x.write(stream, self.data)
+        assert_equals(stream.tell(), x.get_size(self.data))
+        assert_equals(stream.tell(), 12)
+        stream.seek(0)
+        y = X()
+        y.read(stream, self.data)
+        assert_equals((y.a, y.b, y.c), (1, 2, 3))
+        assert_equals(x.get_hash(self.data), y.get_hash(self.data))
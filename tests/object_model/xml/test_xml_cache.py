@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from nose.tools import assert_equals, assert_true
+
+from pyffi.formats.dds import DdsFormat
+from pyffi.object_models.xml import FileFormat, MetaFileFormat
+from pyffi.object_models.xml.basic import BasicBase
+
+
+def make_dds_format(cache_dir):
+    """Generate a fresh copy of the DDS format classes."""
+    dct = dict(
+        (key, value) for key, value in DdsFormat.__dict__.items()
+        if isinstance(value, staticmethod)
+        or (isinstance(value, type) and issubclass(value, BasicBase)))
+    dct.update(
+        xml_file_name=DdsFormat.xml_file_name,
+        xml_file_path=DdsFormat.xml_file_path,
+        xml_cache_dir=cache_dir)
+    return MetaFileFormat("DdsFormat", (FileFormat,), dct)
+
+
+def describe(fileformat):
+    """Summary of the generated classes, for comparison."""
+    result = []
+    for klass in fileformat.xml_struct:
+        result.append(klass.__name__)
+        for attr in klass._attrs:
+            result.append((attr.name, attr.type_.__name__, attr.default,
+                           str(attr.arr1), str(attr.cond), attr.ver1,
+                           attr.ver2, attr.doc))
+    for klass in fileformat.xml_enum:
+        result.append((klass.__name__, klass._enumkeys, klass._enumvalues))
+    for klass in fileformat.xml_bit_struct:
+        result.append(klass.__name__)
+        for attr in klass._attrs:
+            result.append((attr.name, attr.numbits, attr.doc))
+    result.append(sorted(fileformat.versions.items()))
+    result.append(sorted(fileformat.games.items()))
+    return result
+
+
+class TestXmlCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_cache_is_written_and_used(self):
+        parsed = make_dds_format(self.cache_dir)
+        cache_files = os.listdir(self.cache_dir)
+        assert_equals(len(cache_files), 1)
+        assert_true(cache_files[0].startswith("DdsFormat-"))
+        cached = make_dds_format(self.cache_dir)
+        assert_equals(describe(parsed), describe(cached))
+        # the generated classes work
+        data = DdsFormat.Data()
+        assert_equals(cached.Header().get_size(data),
+                      DdsFormat.Header().get_size(data))
+
+    def test_corrupt_cache(self):
+        parsed = make_dds_format(self.cache_dir)
+        cache_file, = os.listdir(self.cache_dir)
+        with open(os.path.join(self.cache_dir, cache_file), "wb") as stream:
+            stream.write(b"garbage")
+        assert_equals(describe(parsed),
+                      describe(make_dds_format(self.cache_dir)))
+
+    def test_no_cache(self):
+        make_dds_format("")
+        assert_equals(os.listdir(self.cache_dir), [])
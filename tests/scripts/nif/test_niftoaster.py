@@ -1003,17 +1003,6 @@ pyffi.toaster:INFO:      ~~~ bhkCollisionObject [] ~~~
 pyffi.toaster:INFO:        ~~~ bhkRigidBody [] ~~~
 pyffi.toaster:INFO:          ~~~ bhkMoppBvTreeShape [] ~~~
 pyffi.toaster:INFO:            updating mopp
-Mopper. Copyright (c) 2008, NIF File Format Library and Tools.
-All rights reserved.
-<BLANKLINE>
-Options:
-  --help      for usage help
-  --license   for licensing details
-<BLANKLINE>
-Mopper uses havok. Copyright 1999-2008 Havok.com Inc. (and its Licensors).
-All Rights Reserved. See www.havok.com for details.
-<BLANKLINE>
-<BLANKLINE>
 pyffi.toaster:INFO:  writing to temporary file
 pyffi.toaster:INFO:Finished.
 
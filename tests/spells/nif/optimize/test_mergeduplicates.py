@@ -1,10 +1,14 @@
+import unittest
+
 from tests.scripts.nif import call_niftoaster
 
 from . import BaseFileTestCase
 import pyffi
+from pyffi.formats.nif import NifFormat
 from pyffi.spells import Toaster
+import pyffi.spells.nif.optimize
 
-from nose.tools import assert_true, assert_false
+from nose.tools import assert_equal, assert_true, assert_false
 
 
 class TestMergeDuplicatesOptimisation(BaseFileTestCase):
@@ -80,4 +84,29 @@ class TestExplicitMergeDuplicatesGeomOptimisation(BaseFileTestCase):
         spell = pyffi.spells.nif.optimize.SpellMergeDuplicates(data=self.data)
         spell.recurse()
 
-        assert_false(has_duplicates(self.data.roots[0]))
\ No newline at end of file
+        assert_false(has_duplicates(self.data.roots[0]))
+
+class TestMergeDuplicatePropertiesOptimisation(unittest.TestCase):
+
+    def setUp(self):
+        self.data = NifFormat.Data()
+        root = NifFormat.NiNode()
+        for i in range(20):
+            shape = NifFormat.NiTriShape()
+            alpha = NifFormat.NiAlphaProperty()
+            alpha.threshold = i % 2
+            shape.add_property(alpha)
+            material = NifFormat.NiMaterialProperty()
+            material.name = b"Material%i" % i
+            shape.add_property(material)
+            root.add_child(shape)
+        self.data.roots = [root]
+
+    def test_merge_duplicate_properties(self):
+        spell = pyffi.spells.nif.optimize.SpellMergeDuplicates(data=self.data)
+        spell.recurse()
+        assert_false(has_duplicates(self.data.roots[0]))
+        shapes = self.data.roots[0].children
+        assert_equal(len(set(id(shape.properties[0]) for shape in shapes)), 2)
+        # material names are ignored
+        assert_equal(len(set(id(shape.properties[1]) for shape in shapes)), 1)
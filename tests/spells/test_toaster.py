@@ -1,18 +1,53 @@
 """Tests for pyffi."""
+import csv
+import io
+import json
 import tempfile
 import os
 import shutil
 
 import nose.tools
 
+from pyffi.formats.bsa import BsaFormat
 from pyffi.formats.nif import NifFormat
 from pyffi.spells import Toaster
+import pyffi.spells.check
+import pyffi.spells.nif
+
+
+class SpellRenameRoot(pyffi.spells.nif.NifSpell):
+    """Rename the root blocks."""
+    SPELLNAME = "test_rename_root"
+    READONLY = False
+
+    toasted = []
+    """Names of all toasted files."""
+
+    def datainspect(self):
+        return True
+
+    def dataentry(self):
+        self.toasted.append(os.path.basename(self.stream.name))
+        for root in self.data.roots:
+            root.name = b"Renamed"
+        self.changed = True
+        return False
 
 
 class MyToaster(Toaster):
     FILEFORMAT = NifFormat
 
 
+class ReadToaster(Toaster):
+    FILEFORMAT = NifFormat
+    SPELLS = [pyffi.spells.check.SpellRead]
+
+
+class RenameToaster(Toaster):
+    FILEFORMAT = NifFormat
+    SPELLS = [SpellRenameRoot]
+
+
 class TestToaster:
     """Test class for spell base."""
 
@@ -57,6 +92,194 @@ class TestToaster:
         nose.tools.assert_false(toaster.is_admissible_branch_class(NifFormat.NiMaterialProperty))
         nose.tools.assert_true(toaster.is_admissible_branch_class(NifFormat.NiAlphaProperty))
 
+    def test_toaster_parallel_results(self):
+        """Results of worker processes are merged into the toaster"""
+        from pyffi.spells import fake_logger
+        top = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                           'spells', 'nif', 'files')
+        results = []
+        for jobs in (1, 2):
+            toaster = ReadToaster(
+                options={"jobs": jobs, "refresh": 1, "verbose": 0},
+                spellnames=["check_read"], logger=fake_logger)
+            toaster.toast(top)
+            results.append((sorted(toaster.files_done),
+                            sorted(toaster.files_failed)))
+        nose.tools.assert_true(results[0][0])
+        nose.tools.assert_equal(results[0], results[1])
+
+    def test_toaster_archives(self):
+        """Members of archives are toasted, and changed members are
+        written back to the archive
+        """
+        from pyffi.spells import fake_logger
+        top = tempfile.mkdtemp()
+        try:
+            archive_name = os.path.join(top, 'test.bsa')
+            shutil.copy(
+                os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                             'formats', 'bsa', 'test.bsa'),
+                archive_name)
+            toaster = RenameToaster(
+                options={"archives": True, "verbose": 0},
+                spellnames=["test_rename_root"], logger=fake_logger)
+            toaster.toast_archives(top)
+            nose.tools.assert_true(
+                os.path.join(archive_name, 'test.nif') in toaster.files_done)
+            archive = BsaFormat.Data()
+            with open(archive_name, 'rb') as stream:
+                archive.read(stream)
+                nif_stream = io.BytesIO(archive.read_member('test.nif'))
+            data = NifFormat.Data()
+            data.read(nif_stream)
+            nose.tools.assert_equal(data.roots[0].name, b"Renamed")
+        finally:
+            shutil.rmtree(top)
+
+    def test_toaster_cache(self):
+        """Files are only toasted again if their content, the spells,
+        or the options change, or if their output changed
+        """
+        from pyffi.spells import fake_logger
+        top = tempfile.mkdtemp()
+        try:
+            source = os.path.join(top, 'in')
+            dest = os.path.join(top, 'out')
+            os.mkdir(source)
+            files = os.path.join(
+                os.path.dirname(__file__), 'nif', 'files')
+            for name in ('test_vertexcolor.nif', 'test_fix_tangentspace.nif'):
+                shutil.copy(os.path.join(files, name), source)
+
+            def toast(**options):
+                SpellRenameRoot.toasted = []
+                options.update(cache=os.path.join(top, 'cache.sqlite'),
+                               destdir=dest, sourcedir=source,
+                               interactive=False, jobs=1, verbose=0)
+                toaster = RenameToaster(
+                    options=options, spellnames=["test_rename_root"],
+                    logger=fake_logger)
+                toaster.toast(source)
+                return sorted(SpellRenameRoot.toasted), toaster
+
+            toasted, toaster = toast()
+            nose.tools.assert_equal(
+                toasted, ['test_fix_tangentspace.nif', 'test_vertexcolor.nif'])
+            files_done = toaster.files_done
+            toasted, toaster = toast()
+            nose.tools.assert_equal(toasted, [])
+            nose.tools.assert_equal(toaster.files_done, files_done)
+            # changed input
+            with open(os.path.join(source, 'test_vertexcolor.nif'), 'ab') as stream:
+                stream.write(b'\x00')
+            toasted, toaster = toast()
+            nose.tools.assert_equal(toasted, ['test_vertexcolor.nif'])
+            # changed output
+            os.remove(os.path.join(dest, 'test_fix_tangentspace.nif'))
+            toasted, toaster = toast()
+            nose.tools.assert_equal(toasted, ['test_fix_tangentspace.nif'])
+            # changed options
+            toasted, toaster = toast(suffix='_renamed')
+            nose.tools.assert_equal(len(toasted), 2)
+        finally:
+            shutil.rmtree(top)
+
+    def test_toaster_cache_identical_files(self):
+        """Files with the same content are toasted to their own
+        destination
+        """
+        from pyffi.spells import fake_logger
+        top = tempfile.mkdtemp()
+        try:
+            source = os.path.join(top, 'in')
+            dest = os.path.join(top, 'out')
+            files = os.path.join(
+                os.path.dirname(__file__), 'nif', 'files')
+            for name in ('a', 'b'):
+                os.makedirs(os.path.join(source, name))
+            shutil.copy(os.path.join(files, 'test_vertexcolor.nif'),
+                        os.path.join(source, 'a', 'x.nif'))
+            shutil.copy(os.path.join(files, 'test_vertexcolor.nif'),
+                        os.path.join(source, 'b', 'y.nif'))
+
+            def toast(**options):
+                SpellRenameRoot.toasted = []
+                options.update(cache=os.path.join(top, 'cache.sqlite'),
+                               interactive=False, jobs=1, verbose=0)
+                toaster = RenameToaster(
+                    options=options, spellnames=["test_rename_root"],
+                    logger=fake_logger)
+                toaster.toast(source)
+                return sorted(SpellRenameRoot.toasted)
+
+            nose.tools.assert_equal(
+                toast(destdir=dest, sourcedir=source), ['x.nif', 'y.nif'])
+            for name in ('a/x.nif', 'b/y.nif'):
+                nose.tools.assert_true(
+                    os.path.exists(os.path.join(dest, name)))
+            nose.tools.assert_equal(
+                toast(destdir=dest, sourcedir=source), [])
+            # in place
+            nose.tools.assert_equal(toast(), ['x.nif', 'y.nif'])
+            with open(os.path.join(source, 'a', 'x.nif'), 'rb') as stream:
+                x_content = stream.read()
+            with open(os.path.join(source, 'b', 'y.nif'), 'rb') as stream:
+                nose.tools.assert_equal(stream.read(), x_content)
+        finally:
+            shutil.rmtree(top)
+
+    def test_toaster_profile(self):
+        """Profiles of all files are collected from the worker
+        processes, and written as json or csv
+        """
+        from pyffi.spells import fake_logger
+        top = tempfile.mkdtemp()
+        try:
+            source = os.path.join(top, 'in')
+            os.mkdir(source)
+            files = os.path.join(
+                os.path.dirname(__file__), 'nif', 'files')
+            for name in ('test_vertexcolor.nif', 'test_fix_tangentspace.nif'):
+                shutil.copy(os.path.join(files, name), source)
+            for jobs in (1, 2):
+                report = os.path.join(top, 'profile%i.json' % jobs)
+                toaster = RenameToaster(
+                    options={"jobs": jobs, "verbose": 0, "interactive": False,
+                             "destdir": os.path.join(top, 'out'),
+                             "sourcedir": source, "profile": report},
+                    spellnames=["test_rename_root"], logger=fake_logger)
+                toaster.toast(source)
+                with open(report) as stream:
+                    profile = json.load(stream)
+                nose.tools.assert_equal(
+                    sorted(os.path.basename(record["file"])
+                           for record in profile["files"]),
+                    ['test_fix_tangentspace.nif', 'test_vertexcolor.nif'])
+                for record in profile["files"]:
+                    nose.tools.assert_equal(
+                        record["bytes_read"], os.path.getsize(record["file"]))
+                    nose.tools.assert_true(record["bytes_written"] > 0)
+                    nose.tools.assert_true(record["peak_memory"] > 0)
+                    nose.tools.assert_equal(
+                        list(record["spells"]), ["test_rename_root"])
+                totals = profile["totals"]
+                nose.tools.assert_equal(totals["files"], 2)
+                nose.tools.assert_equal(totals["blocks"]["NiNode"][0], 2)
+            report = os.path.join(top, 'profile.csv')
+            toaster = ReadToaster(
+                options={"jobs": 1, "verbose": 0, "profile": report},
+                spellnames=["check_read"], logger=fake_logger)
+            toaster.toast(source)
+            with open(report) as stream:
+                rows = list(csv.DictReader(stream))
+            nose.tools.assert_equal(
+                sorted(set(row["stage"] for row in rows)),
+                ['block', 'links', 'memory', 'read', 'spell', 'write'])
+            nose.tools.assert_true(
+                any(row["name"] == "check_read" for row in rows))
+        finally:
+            shutil.rmtree(top)
+
 
 class TestIniParser:
     """Test the Ini parser"""
@@ -129,6 +352,7 @@ class TestIniParser:
         applypatch: False
         archives: False
         arg:
+        cache:
         createpatch: False
         destdir: ...
         diffcmd:
@@ -140,6 +364,7 @@ class TestIniParser:
         include: []
         inifile:
         interactive: False
+        lazy: False
         jobs: 1
         only: []
         patchcmd:
@@ -27,6 +27,8 @@ import pyffi.utils.quickhull
 import pyffi.utils.inertia
 import pyffi.utils.tangentspace
 import pyffi.utils.mopp
+import pyffi.utils.mmapstream
+import pyffi.utils.weld
 import pyffi.formats.nif
 import pyffi.formats.cgf
 import pyffi.formats.kfm
@@ -0,0 +1,57 @@
+"""Tests for pyffi.utils.mmapstream"""
+
+import io
+import os.path
+import unittest
+
+from nose.tools import assert_equals, assert_true
+
+from pyffi.formats.dds import DdsFormat
+from pyffi.formats.nif import NifFormat
+from pyffi.utils.mmapstream import MmapStream
+
+test_root = os.path.dirname(os.path.dirname(__file__))
+
+
+class TestMmapStream(unittest.TestCase):
+    """Test reading file formats from memory mapped files"""
+
+    def roundtrip(self, fileformat, filename):
+        """Read filename through a MmapStream, and return the data and
+        whether writing it gives back the original file.
+        """
+        with open(filename, "rb") as stream:
+            raw = stream.read()
+        with MmapStream(filename) as stream:
+            data = fileformat.Data()
+            data.read(stream)
+        stream = io.BytesIO()
+        data.write(stream)
+        return data, stream.getvalue() == raw
+
+    def test_nif(self):
+        filename = os.path.join(
+            test_root, "spells", "nif", "files", "test_vertexcolor.nif")
+        data, same = self.roundtrip(NifFormat, filename)
+        assert_true(same)
+
+    def test_dds_pixel_data_not_copied(self):
+        filename = os.path.join(test_root, "formats", "dds", "test.dds")
+        data, same = self.roundtrip(DdsFormat, filename)
+        assert_true(same)
+        assert_true(isinstance(data.pixeldata._value, memoryview))
+        # views are turned into bytes when they are used
+        assert_true(isinstance(data.pixeldata.get_value(), bytes))
+        assert_true(isinstance(data.pixeldata._value, bytes))
+
+    def test_readline_and_seek(self):
+        filename = os.path.join(test_root, "formats", "dds", "test.dds")
+        with open(filename, "rb") as stream:
+            raw = stream.read()
+        with MmapStream(filename) as stream:
+            assert_equals(len(stream), len(raw))
+            assert_equals(stream.readline(3), raw[:3])
+            stream.seek(-10, 2)
+            assert_equals(stream.read(), raw[-10:])
+            assert_equals(stream.read(), b"")
+            assert_equals(stream[4:8].tobytes(), raw[4:8])
@@ -0,0 +1,85 @@
+"""Tests for pyffi.utils.quickhull"""
+
+import math
+import random
+import unittest
+
+from nose.tools import assert_equals, assert_true
+
+import pyffi.utils.quickhull
+from pyffi.utils.inertia import get_mass_center_inertia_polyhedron
+from pyffi.utils.mathutils import vecDistanceTriangle
+from pyffi.utils.quickhull import qhull3d
+
+
+def get_sphere(num_vertices):
+    """Random vertices on the unit sphere."""
+    vertices = []
+    for i in range(num_vertices):
+        z = random.uniform(-1, 1)
+        phi = random.uniform(0, 2 * math.pi)
+        r = math.sqrt(1 - z * z)
+        vertices.append((r * math.cos(phi), r * math.sin(phi), z))
+    return vertices
+
+
+class TestQuickHull(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+        self.vertices = get_sphere(150)
+        self.vertices.extend(
+            (0.5 * random.random(), 0.5 * random.random(), 0.5 * random.random())
+            for i in range(150))
+
+    def assert_hull(self, vertices, triangles, precision):
+        """All vertices lie inside the hull, up to precision, and the
+        hull is closed."""
+        for triangle in triangles:
+            triangle = [vertices[i] for i in triangle]
+            assert_true(max(vecDistanceTriangle(triangle, vert)
+                            for vert in self.vertices)
+                        <= precision + 1e-9)
+        edges = set()
+        for v0, v1, v2 in triangles:
+            edges |= set([(v0, v1), (v1, v2), (v2, v0)])
+        assert_equals(len(edges), 3 * len(triangles))
+        assert_true(all((v1, v0) in edges for v0, v1 in edges))
+
+    def test_sphere(self):
+        vertices, triangles = qhull3d(self.vertices)
+        self.assert_hull(vertices, triangles, 0.0001)
+        assert_equals(len(vertices), 150)
+        assert_equals(len(triangles), 296)
+
+    def test_precision(self):
+        vertices, triangles = qhull3d(self.vertices, precision=0.05)
+        self.assert_hull(vertices, triangles, 0.05)
+        assert_true(len(vertices) < 150)
+
+    def test_lattice(self):
+        """Coplanar and colinear vertices"""
+        self.vertices = [(x, y, z) for x in range(4) for y in range(4)
+                         for z in range(4)]
+        vertices, triangles = qhull3d(self.vertices)
+        self.assert_hull(vertices, triangles, 0.0001)
+        assert_true(all((x, y, z) in vertices for x in (0, 3)
+                        for y in (0, 3) for z in (0, 3)))
+        mass = get_mass_center_inertia_polyhedron(vertices, triangles)[0]
+        assert_true(abs(mass - 27) < 1e-9)
+
+    def test_python(self):
+        """The pure python implementation gives the same hull."""
+        self.vertices = self.vertices[::4]
+        vertices, triangles = qhull3d(self.vertices)
+        numpy = pyffi.utils.quickhull.numpy
+        pyffi.utils.quickhull.numpy = None
+        try:
+            python_vertices, python_triangles = qhull3d(self.vertices)
+        finally:
+            pyffi.utils.quickhull.numpy = numpy
+        assert_equals(sorted(vertices), sorted(python_vertices))
+        mass = get_mass_center_inertia_polyhedron(vertices, triangles)[0]
+        python_mass = get_mass_center_inertia_polyhedron(
+            python_vertices, python_triangles)[0]
+        assert_true(abs(mass - python_mass) < 1e-9)
@@ -0,0 +1,104 @@
+"""Tests for pyffi.utils.tangentspace"""
+
+import math
+import unittest
+
+from nose.tools import assert_equals, assert_true, raises
+
+import pyffi.utils.tangentspace
+from pyffi.utils.tangentspace import getTangentSpace
+
+
+def get_sphere(size):
+    """A uv sphere, with duplicate vertices along the seam."""
+    vertices = []
+    normals = []
+    uvs = []
+    for i in range(size + 1):
+        theta = math.pi * (i + 0.5) / (size + 1)
+        for j in range(size + 1):
+            phi = 2 * math.pi * j / size
+            normal = (math.sin(theta) * math.cos(phi),
+                      math.sin(theta) * math.sin(phi),
+                      math.cos(theta))
+            vertices.append(normal)
+            normals.append(normal)
+            uvs.append((j / size, i / size))
+    triangles = []
+    for i in range(size):
+        for j in range(size):
+            v0 = i * (size + 1) + j
+            v1 = v0 + 1
+            v2 = v0 + size + 1
+            v3 = v2 + 1
+            triangles.append((v0, v1, v2))
+            triangles.append((v1, v3, v2))
+    return vertices, normals, uvs, triangles
+
+
+def dot(vec1, vec2):
+    return sum(x * y for x, y in zip(vec1, vec2))
+
+
+def assert_close(vec1, vec2):
+    assert_true(max(abs(x - y) for x, y in zip(vec1, vec2)) < 1e-6)
+
+
+class TestTangentSpace(unittest.TestCase):
+
+    def setUp(self):
+        self.vertices, self.normals, self.uvs, self.triangles = get_sphere(8)
+        # vertices along the seam share their tangent space
+        size = 8
+        self.groups = [
+            i * (size + 1) + (j % size)
+            for i in range(size + 1) for j in range(size + 1)]
+        # add an unused vertex, which gets an arbitrary tangent space
+        self.vertices.append((0, 0, 0))
+        self.normals.append((1, 0, 0))
+        self.uvs.append((0, 0))
+        self.groups.append(len(self.groups))
+
+    def get_tangent_space(self):
+        return getTangentSpace(
+            vertices=self.vertices, normals=self.normals, uvs=self.uvs,
+            triangles=self.triangles, orientation=True,
+            vertex_groups=self.groups)
+
+    def test_orthonormal(self):
+        tangents, binormals, orientations = self.get_tangent_space()
+        for tan, bin, norm in zip(tangents, binormals, self.normals):
+            for vec in (tan, bin):
+                assert_true(abs(dot(vec, vec) - 1) < 1e-6)
+                assert_true(abs(dot(vec, norm)) < 1e-6)
+            assert_true(abs(dot(tan, bin)) < 1e-6)
+        assert_equals(orientations[-1], 0)
+
+    def test_vertex_groups(self):
+        tangents, binormals, orientations = self.get_tangent_space()
+        for i, group in enumerate(self.groups):
+            if i != group:
+                assert_close(tangents[i], tangents[group])
+                assert_close(binormals[i], binormals[group])
+
+    def test_python(self):
+        """The pure python implementation gives the same result."""
+        result = self.get_tangent_space()
+        numpy = pyffi.utils.tangentspace.numpy
+        pyffi.utils.tangentspace.numpy = None
+        try:
+            python_result = self.get_tangent_space()
+        finally:
+            pyffi.utils.tangentspace.numpy = numpy
+        for vecs, python_vecs in zip(result, python_result):
+            assert_equals(len(vecs), len(python_vecs))
+            for vec, python_vec in zip(vecs, python_vecs):
+                if isinstance(vec, tuple):
+                    assert_close(vec, python_vec)
+                else:
+                    assert_close((vec,), (python_vec,))
+
+    @raises(ValueError)
+    def test_unnormalized_normal(self):
+        self.normals[3] = (0, 0, 2)
+        self.get_tangent_space()
@@ -1,7 +1,7 @@
 """Tests for pyffi.utils.trianglemesh module."""
 
 import nose.tools
-from pyffi.utils.trianglemesh import Face, Mesh, Edge
+from pyffi.utils.trianglemesh import Face, Mesh, Edge, HalfEdgeMesh
 
 
 class TestFace:
@@ -164,4 +164,40 @@ class TestMesh:
         self.m.lock()
         nose.tools.assert_equals(list(f0.get_adjacent_faces(0)), [Face(1, 3, 2)])
         self.m.discard_face(f1)
-        nose.tools.assert_equals(list(f0.get_adjacent_faces(0)), [])
\ No newline at end of file
+        nose.tools.assert_equals(list(f0.get_adjacent_faces(0)), [])
+
+
+class TestHalfEdgeMesh:
+    """Test class to test trianglemesh::HalfEdgeMesh"""
+
+    def test_faces(self):
+        """Faces are rotated, sorted, and without duplicates"""
+        m = HalfEdgeMesh([(3, 1, 2), (0, 1, 2), (2, 0, 1), (5, 5, 6)])
+        nose.tools.assert_equals(len(m), 2)
+        nose.tools.assert_equals(m.get_face_verts(0), (0, 1, 2))
+        nose.tools.assert_equals(m.get_face_verts(1), (1, 2, 3))
+
+    def test_adjacent_faces_like_mesh(self):
+        """Adjacency agrees with Mesh"""
+        faces = [(0, 1, 2), (1, 3, 2), (2, 3, 4), (2, 3, 5), (3, 2, 6)]
+        m = Mesh(faces)
+        hm = HalfEdgeMesh(faces)
+        for face in m.faces:
+            for vi in face.verts:
+                nose.tools.assert_equals(
+                    sorted(hm.get_face_verts(other_face)
+                           for other_face in hm.get_adjacent_faces(
+                               face.index, vi)),
+                    sorted(other_face.verts
+                           for other_face in face.get_adjacent_faces(vi)))
+
+    def test_discard_face(self):
+        m = HalfEdgeMesh([(0, 1, 2), (1, 3, 2), (2, 3, 4)])
+        nose.tools.assert_equals(list(m.get_adjacent_faces(1, 1)), [2])
+        m.discard_face(2)
+        nose.tools.assert_equals(list(m.get_adjacent_faces(1, 1)), [])
+        nose.tools.assert_equals(list(m.get_adjacent_faces(1, 3)), [0])
+
+    @nose.tools.raises(ValueError)
+    def test_get_next_vertex_out_of_bounds(self):
+        HalfEdgeMesh([(0, 1, 2)]).get_next_vertex(0, 10)
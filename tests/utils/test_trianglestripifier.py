@@ -0,0 +1,67 @@
+"""Tests for pyffi.utils.trianglestripifier"""
+
+import random
+import unittest
+
+from nose.tools import assert_equals, assert_true
+
+from pyffi.utils.trianglemesh import HalfEdgeMesh, Mesh
+from pyffi.utils.trianglestripifier import (
+    TriangleStripifier, UnstrippedFaces)
+from pyffi.utils.tristrip import _check_strips
+
+
+def get_grid(size):
+    triangles = []
+    for i in range(size):
+        for j in range(size):
+            v0 = i * (size + 1) + j
+            v1 = v0 + 1
+            v2 = v0 + size + 1
+            v3 = v2 + 1
+            triangles.append((v0, v1, v2))
+            triangles.append((v1, v3, v2))
+    return triangles
+
+
+class TestTriangleStripifier(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+        self.triangles = get_grid(20)
+        random.shuffle(self.triangles)
+
+    def test_grid(self):
+        """A grid is covered by long strips"""
+        strips = TriangleStripifier(
+            HalfEdgeMesh(self.triangles)).find_all_strips()
+        _check_strips(self.triangles, strips)
+        assert_true(len(strips) <= 20)
+
+    def test_mesh(self):
+        """A locked Mesh gives the same strips"""
+        strips = TriangleStripifier(
+            HalfEdgeMesh(self.triangles)).find_all_strips()
+        assert_equals(
+            TriangleStripifier(Mesh(self.triangles)).find_all_strips(),
+            strips)
+
+    def test_non_manifold(self):
+        """Edges shared by more than two faces"""
+        for i in range(20):
+            triangles = [tuple(random.randrange(10) for j in range(3))
+                         for k in range(50)]
+            strips = TriangleStripifier(
+                HalfEdgeMesh(triangles)).find_all_strips()
+            _check_strips(triangles, strips)
+
+    def test_unstripped_faces(self):
+        faces = UnstrippedFaces(100)
+        remaining = list(range(100))
+        for face in random.sample(remaining, 60):
+            faces.discard(face)
+            remaining.remove(face)
+        faces.discard(remaining[0])
+        del remaining[0]
+        assert_equals(len(faces), len(remaining))
+        assert_equals(list(faces), remaining)
@@ -0,0 +1,50 @@
+"""Tests for pyffi.utils.vertex_cache"""
+
+import random
+import unittest
+
+from nose.tools import assert_equals, assert_true
+
+from pyffi.utils.vertex_cache import (
+    Mesh, average_transform_to_vertex_ratio, get_cache_optimized_triangles,
+    get_unique_triangles)
+
+
+def get_grid(size):
+    triangles = []
+    for i in range(size):
+        for j in range(size):
+            v0 = i * (size + 1) + j
+            v1 = v0 + 1
+            v2 = v0 + size + 1
+            v3 = v2 + 1
+            triangles.append((v0, v1, v2))
+            triangles.append((v1, v3, v2))
+    return triangles
+
+
+class TestVertexCache(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+        self.triangles = get_grid(20)
+        random.shuffle(self.triangles)
+
+    def test_all_triangles(self):
+        """All triangles are kept, once"""
+        new_triangles = get_cache_optimized_triangles(self.triangles)
+        assert_equals(sorted(new_triangles),
+                      sorted(get_unique_triangles(self.triangles)))
+
+    def test_atvr(self):
+        """The triangle order is near optimal for a grid"""
+        new_triangles = get_cache_optimized_triangles(self.triangles)
+        assert_true(average_transform_to_vertex_ratio(self.triangles) > 5)
+        assert_true(average_transform_to_vertex_ratio(new_triangles) < 1.35)
+
+    def test_high_valence(self):
+        """Vertices with more triangles than the score table are fine"""
+        fan = [(0, i, i + 1) for i in range(1, 400)]
+        new_triangles = Mesh(fan).get_cache_optimized_triangles()
+        assert_equals(sorted(new_triangles), fan)
+        assert_true(average_transform_to_vertex_ratio(new_triangles) < 1.1)